@@ -0,0 +1,228 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from beartype import beartype
+from beartype.typing import Callable, Optional
+from kubernetes import client
+from kubernetes.client.models import V1ConfigMap, V1ObjectMeta
+from kubernetes.client.rest import ApiException
+
+from . import helpers
+
+__author__ = "Philipp Hellmich"
+__copyright__ = "Arvato Systems GmbH"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+# kubernetes rejects ConfigMaps larger than 1 MiB
+MAX_CONFIG_MAP_BYTES = 1024 * 1024
+
+
+class FileCheckpointStore:
+    """
+    Stores the checkpoint as json in a local file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __str__(self) -> str:
+        return "file {}".format(self.path)
+
+    def load(self) -> Optional[dict]:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, data: dict):
+        # write to a temporary file first, so a kill never leaves a partial file
+        tmp_path = "{}.tmp".format(self.path)
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+
+class ConfigMapCheckpointStore:
+    """
+    Stores the checkpoint as json in a ConfigMap, so it survives pod restarts.
+
+    Only the key is written, so several stores can share one ConfigMap.
+    """
+
+    def __init__(
+        self,
+        api_client: client.ApiClient,
+        namespace: str,
+        name: str,
+        key: str = "checkpoint.json",
+    ):
+        self.api = client.CoreV1Api(api_client)
+        self.namespace = namespace
+        self.name = name
+        self.key = key
+
+    def __str__(self) -> str:
+        return "configmap {}/{}".format(self.namespace, self.name)
+
+    def load(self) -> Optional[dict]:
+        try:
+            config_map = self.api.read_namespaced_config_map(self.name, self.namespace)
+        except ApiException as e:
+            if e.status == 404:
+                return None
+            raise
+        if not config_map.data or self.key not in config_map.data:
+            return None
+        return json.loads(config_map.data[self.key])
+
+    def save(self, data: dict):
+        payload = json.dumps(data)
+        size = len(payload.encode("utf-8"))
+        if size > MAX_CONFIG_MAP_BYTES:
+            raise ValueError(
+                "%s of %s is %s bytes, larger than the ConfigMap limit of %s bytes"
+                % (self.key, self, size, MAX_CONFIG_MAP_BYTES)
+            )
+        try:
+            self.api.patch_namespaced_config_map(
+                self.name, self.namespace, {"data": {self.key: payload}}
+            )
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            config_map = V1ConfigMap(
+                metadata=V1ObjectMeta(name=self.name, namespace=self.namespace),
+                data={self.key: payload},
+            )
+            self.api.create_namespaced_config_map(self.namespace, config_map)
+
+
+class Checkpoint:
+    """
+    Progress of an optimization run: the finished deployments and the stats.
+
+    Finished deployments are written to the store at most every
+    flush_interval_seconds, and on flush(), e.g. on SIGTERM and at the end of
+    the run. A run which was not stopped early is marked as finished with
+    finish(), it is not resumed.
+    """
+
+    def __init__(
+        self,
+        store,
+        flush_interval_seconds: float = 30.0,
+        get_stats: Optional[Callable[[], dict]] = None,
+    ):
+        self.store = store
+        self.flush_interval_seconds = flush_interval_seconds
+        self.get_stats = get_stats
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.started = helpers.create_timestamp()
+        self.completed = {}
+        self.stats = {}
+        self.finished = False
+        self.last_flush = time.monotonic()
+
+    def resume(self, freshness_minutes: int) -> int:
+        """
+        Load the finished deployments of a previous run.
+
+        Deployments finished longer than freshness_minutes ago are optimized
+        again. A finished run is not resumed.
+
+        Args:
+            freshness_minutes (int): Minutes a finished deployment is skipped.
+
+        Returns:
+            int: The number of deployments which will be skipped.
+        """
+        data = self.store.load()
+        if data is None or data.get("finished", False):
+            return 0
+        now = helpers.create_timestamp()
+        oldest = now - timedelta(minutes=freshness_minutes)
+        completed = {
+            key: timestamp
+            for key, timestamp in data.get("completed", {}).items()
+            if datetime.fromisoformat(timestamp) >= oldest
+        }
+        with self.lock:
+            self.completed = completed
+            # the stats only belong to the deployments which are skipped
+            if completed and len(completed) == len(data.get("completed", {})):
+                self.stats = data.get("stats", {})
+                self.started = datetime.fromisoformat(data["started"])
+        return len(completed)
+
+    def is_done(self, key: str) -> bool:
+        with self.lock:
+            return key in self.completed
+
+    def mark_done(self, key: str):
+        with self.lock:
+            self.completed[key] = helpers.create_timestamp().isoformat()
+            due = time.monotonic() - self.last_flush >= self.flush_interval_seconds
+        if due:
+            self.flush()
+
+    def finish(self):
+        """
+        Mark the run as finished and write the checkpoint.
+        """
+        with self.lock:
+            self.finished = True
+        self.flush()
+
+    def as_dict(self) -> dict:
+        stats = self.get_stats() if self.get_stats is not None else {}
+        with self.lock:
+            return {
+                "started": self.started.isoformat(),
+                "updated": helpers.create_timestamp().isoformat(),
+                "finished": self.finished,
+                "completed": dict(self.completed),
+                "stats": stats,
+            }
+
+    def flush(self):
+        """
+        Write the checkpoint to the store, errors are logged.
+        """
+        with self.flush_lock:
+            data = self.as_dict()
+            with self.lock:
+                self.last_flush = time.monotonic()
+            try:
+                self.store.save(data)
+                _logger.debug(
+                    "Wrote checkpoint with %s deployments to %s"
+                    % (len(data["completed"]), self.store)
+                )
+            except Exception as e:
+                _logger.warning("Could not write checkpoint: %s" % str(e))
+
+
+@beartype
+def deployment_key(namespace_name: str, deployment_name: str) -> str:
+    """
+    Get the checkpoint key of a deployment.
+
+    Args:
+        namespace_name (str): The name of the namespace.
+        deployment_name (str): The name of the deployment.
+
+    Returns:
+        str: The key, e.g. "my-namespace/my-deployment".
+
+    Example:
+        key = deployment_key("my-namespace", "my-deployment")
+    """
+    return "{}/{}".format(namespace_name, deployment_name)
@@ -0,0 +1,341 @@
+import heapq
+import logging
+import re
+import threading
+import time
+
+from beartype import beartype
+from beartype.typing import Any, Callable, Optional
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+
+__author__ = "Philipp Hellmich"
+__copyright__ = "Arvato Systems GmbH"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+class WorkQueue:
+    """
+    Delaying work queue with debouncing and per-item exponential backoff.
+
+    An item is handed out at most once at a time. Adding an item again while
+    it waits pushes it back by the debounce delay, adding it while it is being
+    processed queues it again once it is done.
+    """
+
+    def __init__(
+        self,
+        debounce_seconds: float = 300.0,
+        backoff_base_seconds: float = 60.0,
+        backoff_max_seconds: float = 3600.0,
+        max_retries: int = 6,
+    ):
+        self.debounce_seconds = debounce_seconds
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.max_retries = max_retries
+        self.condition = threading.Condition()
+        self.heap = []
+        self.ready_at = {}
+        self.processing = set()
+        self.dirty = {}
+        self.failures = {}
+        self.shutting_down = False
+
+    def __len__(self) -> int:
+        with self.condition:
+            return len(self.ready_at)
+
+    def add(self, key: str, delay: Optional[float] = None):
+        """
+        Add an item which is handed out after delay (default: the debounce delay).
+        """
+        if delay is None:
+            delay = self.debounce_seconds
+        with self.condition:
+            if self.shutting_down:
+                return
+            ready_at = time.monotonic() + delay
+            if key in self.processing:
+                self.dirty[key] = max(self.dirty.get(key, 0), ready_at)
+                return
+            self.ready_at[key] = ready_at
+            heapq.heappush(self.heap, (ready_at, key))
+            self.condition.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Wait for the next ready item.
+
+        Returns:
+            Optional[str]: The item, or None on timeout or shutdown.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while not self.shutting_down:
+                now = time.monotonic()
+                # drop entries which were pushed back by a later add
+                while self.heap and self.ready_at.get(self.heap[0][1]) != (
+                    self.heap[0][0]
+                ):
+                    heapq.heappop(self.heap)
+                if self.heap and self.heap[0][0] <= now:
+                    _, key = heapq.heappop(self.heap)
+                    del self.ready_at[key]
+                    self.processing.add(key)
+                    return key
+                wait = None
+                if self.heap:
+                    wait = self.heap[0][0] - now
+                if deadline is not None:
+                    if deadline <= now:
+                        return None
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                self.condition.wait(wait)
+            return None
+
+    def done(self, key: str):
+        """
+        Mark an item as processed, it is queued again if it was added meanwhile.
+        """
+        with self.condition:
+            self.processing.discard(key)
+            if key in self.dirty:
+                ready_at = self.dirty.pop(key)
+                self.ready_at[key] = ready_at
+                heapq.heappush(self.heap, (ready_at, key))
+                self.condition.notify()
+
+    def retry(self, key: str) -> bool:
+        """
+        Queue a failed item again with exponential backoff.
+
+        Returns:
+            bool: False if the item exceeded max_retries and was dropped.
+        """
+        with self.condition:
+            failures = self.failures.get(key, 0) + 1
+            if failures > self.max_retries:
+                self.failures.pop(key, None)
+                return False
+            self.failures[key] = failures
+        delay = min(
+            self.backoff_max_seconds,
+            self.backoff_base_seconds * 2 ** (failures - 1),
+        )
+        self.add(key, delay)
+        return True
+
+    def forget(self, key: str):
+        """
+        Reset the backoff of an item.
+        """
+        with self.condition:
+            self.failures.pop(key, None)
+
+    def shutdown(self):
+        with self.condition:
+            self.shutting_down = True
+            self.condition.notify_all()
+
+
+class EventHandler:
+    """
+    Decides which deployment and hpa events trigger a re-optimization.
+
+    Triggers are new deployments, large replica changes of deployments without
+    hpa and spec changes of hpas. Objects seen in the initial list (SYNC) are
+    only remembered, they are covered by the periodic sweeps.
+    """
+
+    def __init__(
+        self,
+        queue: WorkQueue,
+        namespace_pattern: str = ".*",
+        deplopyment_pattern: str = ".*",
+        replica_change_ratio: float = 0.5,
+    ):
+        self.queue = queue
+        self.namespace_pattern = namespace_pattern
+        self.deplopyment_pattern = deplopyment_pattern
+        self.replica_change_ratio = replica_change_ratio
+        self.lock = threading.Lock()
+        self.replicas = {}
+        self.hpa_specs = {}
+        self.hpa_targets = {}
+
+    def matches(self, namespace_name: str, deployment_name: str) -> bool:
+        if re.search(self.namespace_pattern, namespace_name) is None:
+            return False
+        return re.search(self.deplopyment_pattern, deployment_name) is not None
+
+    def enqueue(self, key: str, reason: str):
+        _logger.info("Queueing deployment %s: %s" % (key, reason))
+        self.queue.add(key)
+
+    def on_deployment(self, event_type: str, deployment: Any):
+        namespace_name = deployment.metadata.namespace
+        deployment_name = deployment.metadata.name
+        if not self.matches(namespace_name, deployment_name):
+            return
+        key = "{}/{}".format(namespace_name, deployment_name)
+        replicas = deployment.spec.replicas or 0
+
+        with self.lock:
+            if event_type == "DELETED":
+                self.replicas.pop(key, None)
+                self.queue.forget(key)
+                return
+            old_replicas = self.replicas.get(key)
+            self.replicas[key] = replicas
+            has_hpa = key in self.hpa_targets.values()
+
+        if event_type == "SYNC" or replicas == 0:
+            return
+        if old_replicas is None:
+            self.enqueue(key, "new deployment")
+            return
+        if has_hpa or old_replicas == replicas:
+            return
+        ratio = abs(replicas - old_replicas) / max(old_replicas, 1)
+        if ratio >= self.replica_change_ratio:
+            self.enqueue(
+                key, "replicas changed from {} to {}".format(old_replicas, replicas)
+            )
+
+    def on_hpa(self, event_type: str, hpa: Any):
+        target = hpa.spec.scale_target_ref
+        if target.kind != "Deployment":
+            return
+        namespace_name = hpa.metadata.namespace
+        if not self.matches(namespace_name, target.name):
+            return
+        hpa_key = "{}/{}".format(namespace_name, hpa.metadata.name)
+        key = "{}/{}".format(namespace_name, target.name)
+        spec = hpa.spec.to_dict()
+
+        with self.lock:
+            if event_type == "DELETED":
+                self.hpa_specs.pop(hpa_key, None)
+                self.hpa_targets.pop(hpa_key, None)
+            else:
+                old_spec = self.hpa_specs.get(hpa_key)
+                self.hpa_specs[hpa_key] = spec
+                self.hpa_targets[hpa_key] = key
+
+        if event_type == "SYNC":
+            return
+        if event_type == "DELETED":
+            self.enqueue(key, "hpa deleted")
+        elif old_spec is None:
+            self.enqueue(key, "new hpa")
+        elif old_spec != spec:
+            self.enqueue(key, "hpa spec changed")
+
+
+@beartype
+def run_watch(
+    list_func: Callable,
+    handle_event: Callable[[str, Any], None],
+    stop_event: threading.Event,
+    timeout_seconds: int = 300,
+    error_delay_seconds: float = 10.0,
+):
+    """
+    List and watch kubernetes objects until stop_event is set.
+
+    The objects of the initial list are passed as SYNC events. The watch is
+    resumed from the last resource version and the objects are listed again
+    if it expired.
+
+    Args:
+        list_func (Callable): The list function, e.g. AppsV1Api.list_deployment_for_all_namespaces.
+        handle_event (Callable): Called with the event type and the object.
+        stop_event (threading.Event): Set to stop watching.
+        timeout_seconds (int, optional): Seconds after which each watch request is renewed. Default is 300.
+        error_delay_seconds (float, optional): Seconds to wait after an error. Default is 10.0.
+
+    Example:
+        run_watch(apps_api.list_deployment_for_all_namespaces, handler.on_deployment, stop_event)
+    """
+    resource_version = None
+    while not stop_event.is_set():
+        try:
+            if resource_version is None:
+                response = list_func()
+                for item in response.items:
+                    handle_event("SYNC", item)
+                resource_version = response.metadata.resource_version
+
+            w = watch.Watch()
+            for event in w.stream(
+                list_func,
+                resource_version=resource_version,
+                timeout_seconds=timeout_seconds,
+                _request_timeout=timeout_seconds + 30,
+            ):
+                if stop_event.is_set():
+                    w.stop()
+                    break
+                if event["type"] in ["ADDED", "MODIFIED", "DELETED"]:
+                    handle_event(event["type"], event["object"])
+            resource_version = w.resource_version or resource_version
+        except ApiException as e:
+            if e.status == 410:
+                _logger.info("Watch expired, listing again")
+                resource_version = None
+                continue
+            _logger.warning("An error occurred while watching: %s" % str(e))
+            stop_event.wait(error_delay_seconds)
+        except Exception as e:
+            _logger.warning(
+                "An error occurred while watching: %s" % str(e), exc_info=True
+            )
+            stop_event.wait(error_delay_seconds)
+
+
+@beartype
+def run_worker(
+    queue: WorkQueue,
+    process: Callable[[str], Any],
+    stop_event: threading.Event,
+    is_running: Optional[Callable[[], bool]] = None,
+    poll_seconds: float = 1.0,
+):
+    """
+    Process items of the work queue until stop_event is set.
+
+    Failed items are retried with backoff. Items taken while is_running
+    returns False (e.g. not the leader) are dropped.
+
+    Args:
+        queue (WorkQueue): The work queue.
+        process (Callable[[str], Any]): Processes one item, raises on failure.
+        stop_event (threading.Event): Set to stop the worker.
+        is_running (Callable, optional): Returns False if items should be dropped. Default is None.
+        poll_seconds (float, optional): Seconds between checks of stop_event. Default is 1.0.
+
+    Example:
+        run_worker(queue, optimize_deployment_by_key, stop_event)
+    """
+    while not stop_event.is_set():
+        key = queue.get(timeout=poll_seconds)
+        if key is None:
+            continue
+        try:
+            if is_running is not None and not is_running():
+                queue.forget(key)
+                continue
+            process(key)
+            queue.forget(key)
+        except Exception as e:
+            if queue.retry(key):
+                _logger.info("Retrying deployment %s later: %s" % (key, str(e)))
+            else:
+                _logger.warning(
+                    "Giving up on deployment %s: %s" % (key, str(e)), exc_info=True
+                )
+        finally:
+            queue.done(key)
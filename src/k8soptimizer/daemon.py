@@ -0,0 +1,372 @@
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from beartype import beartype
+from beartype.typing import Any, Callable, Iterable, Iterator, Optional
+from kubernetes import client
+from kubernetes.client.models import V1Lease, V1LeaseSpec, V1ObjectMeta
+from kubernetes.client.rest import ApiException
+
+from . import helpers
+
+__author__ = "Philipp Hellmich"
+__copyright__ = "Arvato Systems GmbH"
+__license__ = "MIT"
+
+__domain__ = "arvato-aws.io"
+
+_logger = logging.getLogger(__name__)
+
+SERVICE_ACCOUNT_NAMESPACE_FILE = (
+    "/var/run/secrets/kubernetes.io/serviceaccount/namespace"
+)
+
+
+@beartype
+def get_identity() -> str:
+    """
+    Get a unique identity of this process for leader election.
+
+    Returns:
+        str: The pod name (POD_NAME or hostname) with a random suffix.
+
+    Example:
+        identity = get_identity()
+    """
+    name = os.getenv("POD_NAME", socket.gethostname())
+    return "{}_{}".format(name, uuid.uuid4().hex[:8])
+
+
+@beartype
+def get_current_namespace(default: str = "default") -> str:
+    """
+    Get the namespace this process runs in.
+
+    Args:
+        default (str, optional): The namespace used outside of a cluster. Default is "default".
+
+    Returns:
+        str: The namespace from POD_NAMESPACE, the service account or the default.
+
+    Example:
+        namespace = get_current_namespace()
+    """
+    if os.getenv("POD_NAMESPACE"):
+        return os.getenv("POD_NAMESPACE")
+    try:
+        with open(SERVICE_ACCOUNT_NAMESPACE_FILE) as f:
+            return f.read().strip()
+    except OSError:
+        return default
+
+
+class LeaderElector:
+    """
+    Leader election based on a coordination.k8s.io/v1 Lease.
+
+    The leader renews the lease in a background thread. Other replicas retry to
+    acquire it and take over once the lease of the leader expired.
+    """
+
+    last_run_annotation = "k8soptimizer.{}/last-run".format(__domain__)
+
+    def __init__(
+        self,
+        api_client: client.ApiClient,
+        namespace: str,
+        name: str = "k8soptimizer",
+        identity: Optional[str] = None,
+        lease_duration_seconds: int = 60,
+        renew_interval_seconds: int = 20,
+    ):
+        self.api = client.CoordinationV1Api(api_client)
+        self.namespace = namespace
+        self.name = name
+        self.identity = identity or get_identity()
+        self.lease_duration_seconds = lease_duration_seconds
+        self.renew_interval_seconds = renew_interval_seconds
+        self.lease = None
+        self.lock = threading.Lock()
+        self.leader = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.leader.is_set()
+
+    def is_expired(self, lease: V1Lease) -> bool:
+        if lease.spec.holder_identity is None or lease.spec.renew_time is None:
+            return True
+        duration = lease.spec.lease_duration_seconds or self.lease_duration_seconds
+        return lease.spec.renew_time + timedelta(seconds=duration) < (
+            helpers.create_timestamp()
+        )
+
+    def create_lease(self) -> bool:
+        now = helpers.create_timestamp()
+        lease = V1Lease(
+            metadata=V1ObjectMeta(name=self.name, namespace=self.namespace),
+            spec=V1LeaseSpec(
+                holder_identity=self.identity,
+                lease_duration_seconds=self.lease_duration_seconds,
+                acquire_time=now,
+                renew_time=now,
+                lease_transitions=0,
+            ),
+        )
+        try:
+            self.lease = self.api.create_namespaced_lease(self.namespace, lease)
+        except ApiException as e:
+            if e.status == 409:
+                return False
+            raise
+        return True
+
+    def try_acquire_or_renew(self) -> bool:
+        """
+        Acquire the lease if it is free or expired, or renew it if we hold it.
+
+        Returns:
+            bool: True if this process is the leader, False otherwise.
+        """
+        with self.lock:
+            try:
+                lease = self.api.read_namespaced_lease(self.name, self.namespace)
+            except ApiException as e:
+                if e.status != 404:
+                    raise
+                acquired = self.create_lease()
+                self.set_leader(acquired)
+                return acquired
+
+            holder = lease.spec.holder_identity
+            if holder != self.identity and not self.is_expired(lease):
+                self.set_leader(False)
+                return False
+
+            now = helpers.create_timestamp()
+            if holder != self.identity:
+                lease.spec.acquire_time = now
+                lease.spec.lease_transitions = (lease.spec.lease_transitions or 0) + 1
+            lease.spec.holder_identity = self.identity
+            lease.spec.renew_time = now
+            lease.spec.lease_duration_seconds = self.lease_duration_seconds
+            try:
+                self.lease = self.api.replace_namespaced_lease(
+                    self.name, self.namespace, lease
+                )
+            except ApiException as e:
+                # someone else updated the lease in the meantime
+                if e.status != 409:
+                    raise
+                self.set_leader(False)
+                return False
+            self.set_leader(True)
+            return True
+
+    def set_leader(self, leader: bool):
+        if leader and not self.is_leader:
+            _logger.info("Acquired leader lease: %s" % self.name)
+            self.leader.set()
+        elif not leader and self.is_leader:
+            _logger.warning("Lost leader lease: %s" % self.name)
+            self.leader.clear()
+
+    def get_last_run(self) -> Optional[datetime]:
+        """
+        Get the time of the last optimization run recorded in the lease by any leader.
+
+        Returns:
+            Optional[datetime]: The time of the last run, or None if unknown.
+        """
+        with self.lock:
+            if self.lease is None or not self.lease.metadata.annotations:
+                return None
+            value = self.lease.metadata.annotations.get(self.last_run_annotation)
+        if value is None:
+            return None
+        return datetime.fromisoformat(value)
+
+    def record_run(self, timestamp: datetime):
+        """
+        Record the time of an optimization run in the lease, so a new leader
+        continues with the same schedule.
+
+        Args:
+            timestamp (datetime): The start time of the run.
+        """
+        with self.lock:
+            if self.lease is None or not self.is_leader:
+                return
+            if self.lease.metadata.annotations is None:
+                self.lease.metadata.annotations = {}
+            self.lease.metadata.annotations[self.last_run_annotation] = (
+                timestamp.isoformat()
+            )
+            try:
+                self.lease = self.api.replace_namespaced_lease(
+                    self.name, self.namespace, self.lease
+                )
+            except ApiException as e:
+                _logger.warning("Could not record last run in lease: %s" % str(e))
+
+    def release(self):
+        """
+        Give up the lease so another replica can take over immediately.
+        """
+        with self.lock:
+            if self.lease is None or not self.is_leader:
+                return
+            self.lease.spec.holder_identity = None
+            self.lease.spec.renew_time = None
+            try:
+                self.api.replace_namespaced_lease(self.name, self.namespace, self.lease)
+            except ApiException as e:
+                _logger.warning("Could not release lease: %s" % str(e))
+            self.leader.clear()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.try_acquire_or_renew()
+            except Exception as e:
+                _logger.warning(
+                    "An error occurred during leader election: %s" % str(e),
+                    exc_info=True,
+                )
+                self.set_leader(False)
+            self.stop_event.wait(self.renew_interval_seconds)
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.run, name="k8soptimizer-leader-election", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.release()
+
+
+@beartype
+def take_while(items: Iterable[Any], is_running: Callable[[], bool]) -> Iterator[Any]:
+    """
+    Iterate over items until is_running returns False.
+
+    Args:
+        items (Iterable): The items.
+        is_running (Callable[[], bool]): Checked before each item.
+
+    Returns:
+        Iterator: The items until is_running returned False.
+
+    Example:
+        for deployment in take_while(deployments, lambda: elector.is_leader):
+            optimize_deployment(deployment)
+    """
+    for item in items:
+        if not is_running():
+            _logger.warning("Stopping run early")
+            return
+        yield item
+
+
+@beartype
+def next_run_time(
+    last_run: Optional[datetime], interval_minutes: int, now: datetime
+) -> datetime:
+    """
+    Calculate the time of the next optimization run.
+
+    Args:
+        last_run (Optional[datetime]): The time of the last run, or None if there was none.
+        interval_minutes (int): The minutes between two runs.
+        now (datetime): The current time.
+
+    Returns:
+        datetime: The time of the next run, now if it is overdue.
+
+    Example:
+        next_run = next_run_time(last_run, 240, helpers.create_timestamp())
+    """
+    if last_run is None:
+        return now
+    return max(now, last_run + timedelta(minutes=interval_minutes))
+
+
+@beartype
+def run_daemon(
+    run_cycle: Callable[[Callable[[], bool]], None],
+    interval_minutes: int,
+    elector: Optional[LeaderElector] = None,
+    stop_event: Optional[threading.Event] = None,
+    poll_seconds: float = 10.0,
+):
+    """
+    Run optimization cycles on a fixed interval until stop_event is set.
+
+    With an elector only the leader runs cycles. The cycle gets a callable
+    which returns False once the cycle should stop early (lost leadership or
+    shutdown).
+
+    Args:
+        run_cycle (Callable): Runs one optimization cycle.
+        interval_minutes (int): The minutes between the start of two cycles.
+        elector (Optional[LeaderElector], optional): The leader election, None to always run. Default is None.
+        stop_event (Optional[threading.Event], optional): Set to stop the daemon. Default is None.
+        poll_seconds (float, optional): Seconds between checks for leadership and the schedule. Default is 10.0.
+
+    Example:
+        run_daemon(lambda is_running: optimize(is_running), 240, elector)
+    """
+    if stop_event is None:
+        stop_event = threading.Event()
+
+    def is_running() -> bool:
+        if stop_event.is_set():
+            return False
+        return elector is None or elector.is_leader
+
+    last_run = None
+    if elector is not None:
+        elector.start()
+    try:
+        while not stop_event.is_set():
+            if elector is not None:
+                if not elector.is_leader:
+                    stop_event.wait(poll_seconds)
+                    continue
+                last_run = elector.get_last_run() or last_run
+
+            now = helpers.create_timestamp()
+            next_run = next_run_time(last_run, interval_minutes, now)
+            if next_run > now:
+                wait_seconds = min(poll_seconds, (next_run - now).total_seconds())
+                stop_event.wait(wait_seconds)
+                continue
+
+            _logger.info("Starting optimization cycle")
+            last_run = now
+            if elector is not None:
+                elector.record_run(now)
+            try:
+                run_cycle(is_running)
+            except Exception as e:
+                _logger.warning(
+                    "An error occurred during the optimization cycle: %s" % str(e),
+                    exc_info=True,
+                )
+            _logger.info(
+                "Finished optimization cycle, next cycle at %s"
+                % (last_run + timedelta(minutes=interval_minutes)).isoformat()
+            )
+    finally:
+        if elector is not None:
+            elector.stop()
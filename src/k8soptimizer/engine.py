@@ -0,0 +1,390 @@
+import warnings
+
+import numpy as np
+from beartype import beartype
+from beartype.typing import Tuple, Union
+
+__author__ = "Philipp Hellmich"
+__copyright__ = "Arvato Systems GmbH"
+__license__ = "MIT"
+
+# fractional parts this close to .5 may round differently than round() after scaling
+_TIE_TOLERANCE = 1e-6
+
+# hours per week, the slots of a usage profile
+WEEK_HOURS = 7 * 24
+
+
+@beartype
+def round_decimals(values: np.ndarray, decimals: int) -> np.ndarray:
+    """
+    Round to decimals like the builtin round().
+
+    np.round scales by 10**decimals first, which can push values close to a
+    tie to the other side. Those few values are rounded with round() instead.
+
+    Args:
+        values (np.ndarray): The values.
+        decimals (int): The number of decimals.
+
+    Returns:
+        np.ndarray: The rounded values as float64.
+
+    Example:
+        rounded = round_decimals(np.array([2.675, 0.1234]), 3)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    scaled = values * 10**decimals
+    rounded = np.rint(scaled) / 10**decimals
+    ties = np.abs(scaled - np.floor(scaled) - 0.5) < _TIE_TOLERANCE
+    for i in np.flatnonzero(ties):
+        rounded.flat[i] = round(float(values.flat[i]), decimals)
+    return rounded
+
+
+@beartype
+def cpu_requests(
+    history: np.ndarray,
+    trend: np.ndarray,
+    target_replicas: np.ndarray,
+    nodejs: np.ndarray,
+    min_cpu: Union[int, float],
+    max_cpu: Union[int, float],
+    ratio: Union[int, float],
+    max_cpu_nodejs: Union[int, float],
+) -> np.ndarray:
+    """
+    Compute the CPU requests of many containers, see main.compute_cpu_requests.
+
+    Args:
+        history (np.ndarray): The CPU usage quantiles of all pods in cores.
+        trend (np.ndarray): The CPU trend ratios.
+        target_replicas (np.ndarray): The target replica counts.
+        nodejs (np.ndarray): True for Node.js containers.
+        min_cpu (float): The minimum CPU requests in cores.
+        max_cpu (float): The maximum CPU requests in cores.
+        ratio (float): The CPU request ratio.
+        max_cpu_nodejs (float): The maximum CPU requests of Node.js containers.
+
+    Returns:
+        np.ndarray: The CPU requests in cores.
+
+    Example:
+        cpu = cpu_requests(history, trend, replicas, nodejs, 0.01, 16.0, 1.0, 1.0)
+    """
+    new_cpu = history / target_replicas * trend * ratio
+    new_cpu = round_decimals(np.maximum(min_cpu, np.minimum(max_cpu, new_cpu)), 3)
+    return np.where(nodejs, np.minimum(max_cpu_nodejs, new_cpu), new_cpu)
+
+
+@beartype
+def saturation_boost(
+    saturation: np.ndarray,
+    threshold: Union[int, float],
+    max_ratio: Union[int, float],
+) -> np.ndarray:
+    """
+    Get the factors the requests of many containers are raised by, see
+    main.get_throttling_boost and main.get_pressure_boost.
+
+    Args:
+        saturation (np.ndarray): The ratios of throttled cfs periods or of stalled time.
+        threshold (float): The ratio above which the requests are raised.
+        max_ratio (float): The maximum factor.
+
+    Returns:
+        np.ndarray: The factors, 1.0 for containers which are not saturated.
+
+    Example:
+        boost = saturation_boost(throttling, 0.1, 1.5)
+    """
+    return np.where(saturation > threshold, np.minimum(1 + saturation, max_ratio), 1.0)
+
+
+@beartype
+def memory_bytes(
+    history: np.ndarray,
+    trend: np.ndarray,
+    oom_killed: np.ndarray,
+    oom_ratio: Union[int, float],
+    min_memory: int,
+    max_memory: int,
+    ratio: Union[int, float],
+) -> np.ndarray:
+    """
+    Compute the memory requests or limits of many containers.
+
+    See main.compute_memory_requests (oom_ratio 1.5) and
+    main.compute_memory_limits (oom_ratio 2).
+
+    Args:
+        history (np.ndarray): The memory usage quantiles in bytes.
+        trend (np.ndarray): The memory trend ratios.
+        oom_killed (np.ndarray): The counts of OOM events.
+        oom_ratio (float): The factor applied after OOM events.
+        min_memory (int): The minimum in bytes.
+        max_memory (int): The maximum in bytes.
+        ratio (float): The memory request or limit ratio.
+
+    Returns:
+        np.ndarray: The memory in bytes as int64.
+
+    Example:
+        memory = memory_bytes(history, trend, oom_killed, 1.5, 16 * 1024**2, 16 * 1024**3, 1.5)
+    """
+    factor = np.where(oom_killed > 0, float(oom_ratio), 1.0)
+    new_memory = history * trend * factor * ratio
+    new_memory = np.maximum(min_memory, np.minimum(max_memory, new_memory))
+    return np.rint(new_memory).astype(np.int64)
+
+
+@beartype
+def significant_changes(
+    old: np.ndarray, new: np.ndarray, change_threshold: Union[int, float]
+) -> np.ndarray:
+    """
+    Check which changes are above the change threshold, see main.is_significant_change.
+
+    Args:
+        old (np.ndarray): The old values.
+        new (np.ndarray): The new values.
+        change_threshold (float): The relative change threshold.
+
+    Returns:
+        np.ndarray: True where the change is applied.
+
+    Example:
+        changed = significant_changes(np.array([0.5]), np.array([0.6]), 0.1)
+    """
+    diff = np.rint(((new / old) - 1) * 100)
+    return np.abs(diff) >= change_threshold * 100
+
+
+@beartype
+def apply_changes(
+    old: np.ndarray, new: np.ndarray, change_threshold: Union[int, float]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Keep the old values where the change is below the change threshold.
+
+    Args:
+        old (np.ndarray): The old values.
+        new (np.ndarray): The new values.
+        change_threshold (float): The relative change threshold.
+
+    Returns:
+        np.ndarray: The resulting values.
+        np.ndarray: True where the value changed.
+
+    Example:
+        values, changed = apply_changes(old_cpu, new_cpu, 0.1)
+    """
+    changed = significant_changes(old, new, change_threshold)
+    return np.where(changed, new, old), changed
+
+
+@beartype
+def seasonal_trend(
+    current: np.ndarray,
+    previous: np.ndarray,
+    min_ratio: Union[int, float],
+    max_ratio: Union[int, float],
+) -> np.ndarray:
+    """
+    Compute the trends of many containers as median of the ratios to previous weeks.
+
+    With one previous week this is the ratio of main.calculate_cpu_trend.
+    Missing or zero weeks are ignored, so one anomalous or missing week
+    does not change the trend much.
+
+    Args:
+        current (np.ndarray): The usage of today, one value per container.
+        previous (np.ndarray): The usage of the previous weeks, one row per container.
+        min_ratio (float): The minimum trend ratio.
+        max_ratio (float): The maximum trend ratio.
+
+    Returns:
+        np.ndarray: The trend ratios, NaN where no previous week has usage.
+
+    Example:
+        trend = seasonal_trend(np.array([1.2]), np.array([[1.0, 1.1, 3.0]]), 0.5, 1.5)
+    """
+    previous = np.where(previous > 0, previous, np.nan)
+    ratios = current[:, np.newaxis] / previous
+    valid = np.any(~np.isnan(ratios), axis=1)
+    median = np.full(len(current), np.nan)
+    if np.any(valid):
+        median[valid] = np.nanmedian(ratios[valid], axis=1)
+    trend = np.clip(round_decimals(median, 3), min_ratio, max_ratio)
+    return np.where(valid, trend, np.nan)
+
+
+@beartype
+def holt_winters(
+    series: np.ndarray,
+    periods: Tuple[int, ...],
+    horizon: int,
+    alpha: float = 0.3,
+    beta: float = 0.02,
+    gamma: float = 0.1,
+) -> np.ndarray:
+    """
+    Forecast many series with additive Holt-Winters smoothing and several seasons.
+
+    Each series has a level, a trend and one additive seasonal component per
+    period, e.g. daily and weekly. All series are smoothed together, one
+    time step at a time. Missing samples (NaN) are replaced by the
+    one-step forecast.
+
+    Args:
+        series (np.ndarray): The samples, one row per series and one column per time step.
+        periods (tuple): The season lengths in time steps, e.g. (24, 168) for hourly samples.
+        horizon (int): The number of time steps to forecast.
+        alpha (float, optional): The smoothing factor of the level. Default is 0.3.
+        beta (float, optional): The smoothing factor of the trend. Default is 0.02.
+        gamma (float, optional): The smoothing factor of the seasons. Default is 0.1.
+
+    Returns:
+        np.ndarray: The forecasts, one row per series and one column per future time step.
+
+    Example:
+        forecast = holt_winters(usage, (24, 168), 4)
+    """
+    series = np.atleast_2d(np.asarray(series, dtype=np.float64))
+    rows, steps = series.shape
+    period = max(periods)
+    first = series[:, :period]
+    level = np.nanmean(first, axis=1)
+    level = np.where(np.isnan(level), 0.0, level)
+    trend = np.zeros(rows)
+    if steps >= 2 * period:
+        # the change between the means of the first two longest seasons
+        second = np.nanmean(series[:, period : 2 * period], axis=1)
+        trend = np.where(np.isnan(second), 0.0, (second - level) / period)
+    level = level - trend * (first.shape[1] - 1) / 2
+
+    # each season starts with the mean deviation left by the shorter seasons
+    seasons = []
+    residual = (
+        first - level[:, np.newaxis] - trend[:, np.newaxis] * np.arange(first.shape[1])
+    )
+    for period in sorted(periods):
+        season = np.zeros((rows, period))
+        for phase in range(min(period, residual.shape[1])):
+            values = residual[:, phase::period]
+            counts = np.sum(~np.isnan(values), axis=1)
+            sums = np.nansum(values, axis=1)
+            season[:, phase] = np.where(counts > 0, sums / np.maximum(counts, 1), 0.0)
+        phases = np.arange(residual.shape[1]) % period
+        residual = residual - season[:, phases]
+        seasons.append(season)
+
+    for t in range(steps):
+        current = [season[:, t % season.shape[1]] for season in seasons]
+        seasonal = np.sum(current, axis=0)
+        y = series[:, t]
+        y = np.where(np.isnan(y), level + trend + seasonal, y)
+        new_level = alpha * (y - seasonal) + (1 - alpha) * (level + trend)
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        for season, value in zip(seasons, current):
+            others = seasonal - value
+            season[:, t % season.shape[1]] = (
+                gamma * (y - new_level - others) + (1 - gamma) * value
+            )
+        level = new_level
+
+    forecast = np.empty((rows, horizon))
+    for h in range(horizon):
+        t = steps + h
+        forecast[:, h] = level + (h + 1) * trend
+        for season in seasons:
+            forecast[:, h] += season[:, t % season.shape[1]]
+    return forecast
+
+
+@beartype
+def hourly_profile(
+    times: np.ndarray, values: np.ndarray, quantile: float = 1.0
+) -> np.ndarray:
+    """
+    Get the usage profile of many series by weekday and hour of day (UTC).
+
+    Args:
+        times (np.ndarray): The unix timestamps of the time steps.
+        values (np.ndarray): The samples, one row per series and one column per time step.
+        quantile (float, optional): The quantile of the samples of each hour of the week. Default is 1.0.
+
+    Returns:
+        np.ndarray: The profiles, shape (rows, 7, 24) with Monday first, NaN for hours without samples.
+
+    Example:
+        profile = hourly_profile(times, usage, 0.95)
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    hours = np.floor(np.asarray(times, dtype=np.float64) / 3600).astype(np.int64)
+    # 1970-01-01 was a Thursday
+    slots = (hours + 3 * 24) % WEEK_HOURS
+    profile = np.full((values.shape[0], WEEK_HOURS), np.nan)
+    with warnings.catch_warnings():
+        # hours without samples stay NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        for slot in np.unique(slots):
+            profile[:, slot] = np.nanquantile(
+                values[:, slots == slot], quantile, axis=1
+            )
+    return profile.reshape(-1, 7, 24)
+
+
+@beartype
+def peak_hours(profiles: np.ndarray, peak_ratio: Union[int, float]) -> np.ndarray:
+    """
+    Find the hours whose usage is above peak_ratio times the median hour.
+
+    Args:
+        profiles (np.ndarray): The profiles, one row per series and one column per hour.
+        peak_ratio (float): The ratio to the median usage of a peak hour.
+
+    Returns:
+        np.ndarray: True for the peak hours.
+
+    Example:
+        peaks = peak_hours(profile.reshape(len(profile), -1), 1.5)
+    """
+    profiles = np.atleast_2d(profiles)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        median = np.nanmedian(profiles, axis=1)
+    return np.nan_to_num(profiles, nan=-np.inf) > peak_ratio * median[:, np.newaxis]
+
+
+@beartype
+def peak_windows(peaks: np.ndarray) -> list:
+    """
+    Get the consecutive peak hours of a week as windows.
+
+    Args:
+        peaks (np.ndarray): True for the peak hours of the week, see peak_hours.
+
+    Returns:
+        list: The (start, end) hours of the week of each window, end is
+        exclusive and greater than WEEK_HOURS for windows wrapping into the
+        next week.
+
+    Example:
+        windows = peak_windows(peak_hours(profiles, 1.5)[0])
+    """
+    peaks = np.asarray(peaks, dtype=bool)
+    if peaks.all():
+        return [(0, len(peaks))]
+    # start at an off-peak hour, so no window is split at the end of the week
+    offset = int(np.argmin(peaks))
+    windows = []
+    start = None
+    for hour in range(offset, offset + len(peaks) + 1):
+        if peaks[hour % len(peaks)]:
+            if start is None:
+                start = hour
+        elif start is not None:
+            windows.append((start % len(peaks), start % len(peaks) + hour - start))
+            start = None
+    return sorted(windows)
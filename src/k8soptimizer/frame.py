@@ -0,0 +1,258 @@
+import os
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+from beartype import beartype
+from beartype.typing import Iterable, Optional, Tuple, Union
+
+__author__ = "Philipp Hellmich"
+__copyright__ = "Arvato Systems GmbH"
+__license__ = "MIT"
+
+KEY_LABELS = ("namespace", "workload", "workload_type", "container")
+
+
+class MetricFrame:
+    """
+    Columnar store of container metrics.
+
+    Each (namespace, workload, workload_type, container) is interned into an
+    integer row id and each metric is a float64 column indexed by that id.
+    Missing values are NaN. Columns can be handed to the vectorized engine
+    without copying.
+    """
+
+    def __init__(self, columns: Iterable[str] = (), capacity: int = 64):
+        self.lock = threading.Lock()
+        self.ids = {}
+        self.keys = []
+        self.capacity = capacity
+        self.columns = {}
+        for name in columns:
+            self.add_column(name)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: Tuple[str, str, str, str]) -> bool:
+        return key in self.ids
+
+    def add_column(self, name: str):
+        with self.lock:
+            if name not in self.columns:
+                self.columns[name] = np.full(self.capacity, np.nan)
+
+    def intern(self, key: Tuple[str, str, str, str]) -> int:
+        """
+        Get the row id of a container, a new row is added for unknown containers.
+        """
+        with self.lock:
+            row = self.ids.get(key)
+            if row is not None:
+                return row
+            row = len(self.keys)
+            if row == self.capacity:
+                self.capacity *= 2
+                for name, values in self.columns.items():
+                    grown = np.full(self.capacity, np.nan)
+                    grown[:row] = values[:row]
+                    self.columns[name] = grown
+            self.ids[key] = row
+            self.keys.append(key)
+            return row
+
+    def id_of(self, key: Tuple[str, str, str, str]) -> Optional[int]:
+        return self.ids.get(key)
+
+    def set(self, row: int, name: str, value: Union[int, float]):
+        self.add_column(name)
+        with self.lock:
+            self.columns[name][row] = value
+
+    def get(self, row: int, name: str) -> Optional[float]:
+        with self.lock:
+            if name not in self.columns:
+                return None
+            value = self.columns[name][row]
+        if np.isnan(value):
+            return None
+        return float(value)
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Get a column as a view of one value per row, NaN where it is missing.
+        """
+        self.add_column(name)
+        with self.lock:
+            return self.columns[name][: len(self.keys)]
+
+    def row(self, key: Tuple[str, str, str, str]) -> Optional[dict]:
+        """
+        Get the values of a container by column, None for unknown containers.
+        """
+        row = self.ids.get(key)
+        if row is None:
+            return None
+        with self.lock:
+            return {
+                name: float(values[row])
+                for name, values in self.columns.items()
+                if not np.isnan(values[row])
+            }
+
+    def add_results(
+        self,
+        results: list,
+        column: Optional[str] = None,
+        column_label: Optional[str] = None,
+        **labels,
+    ) -> int:
+        """
+        Add the results of an instant prometheus query.
+
+        Args:
+            results (list): The results, j["data"]["result"] of the response.
+            column (Optional[str], optional): The column of the values. Default is None.
+            column_label (Optional[str], optional): The label holding the column name, used if column is None. Default is None.
+            **labels: Values of key labels which are not part of the results, e.g. namespace="my-namespace".
+
+        Returns:
+            int: The number of values added.
+
+        Example:
+            frame.add_results(j["data"]["result"], column="cpu", workload_type="deployment")
+        """
+        for result in results:
+            metric = result["metric"]
+            key = tuple(metric.get(label, labels.get(label)) for label in KEY_LABELS)
+            name = column if column is not None else metric[column_label]
+            self.set(self.intern(key), name, float(result["value"][1]))
+        return len(results)
+
+    def share(self, path: Optional[str] = None) -> "SharedFrame":
+        """
+        Copy the columns into shared memory, or a memory-mapped file if path is set.
+
+        Worker processes attach the returned SharedFrame to read the same
+        columns without copying. The creator has to unlink it once the
+        workers are done.
+
+        Args:
+            path (Optional[str], optional): The file of the columns, shared memory if None. Default is None.
+
+        Returns:
+            SharedFrame: The picklable handle of the shared columns.
+
+        Example:
+            shared = frame.share()
+            executor.submit(work, shared)
+        """
+        with self.lock:
+            names = list(self.columns)
+            keys = list(self.keys)
+            shared = SharedFrame(keys, names, path=path)
+            shape = (len(names), len(keys))
+            if not keys or not names:
+                return shared
+            if path is None:
+                shared.memory = shared_memory.SharedMemory(
+                    create=True,
+                    size=np.dtype(np.float64).itemsize * shape[0] * shape[1],
+                )
+                shared.name = shared.memory.name
+                block = np.ndarray(shape, dtype=np.float64, buffer=shared.memory.buf)
+            else:
+                block = np.memmap(path, dtype=np.float64, mode="w+", shape=shape)
+            for i, name in enumerate(names):
+                block[i] = self.columns[name][: len(keys)]
+            if path is not None:
+                block.flush()
+            del block
+        return shared
+
+
+class SharedFrame:
+    """
+    Handle of MetricFrame columns in shared memory or a memory-mapped file.
+
+    Only the keys, the column names and the location of the columns are
+    pickled, the values stay in place.
+    """
+
+    def __init__(
+        self,
+        keys: list,
+        columns: list,
+        name: Optional[str] = None,
+        path: Optional[str] = None,
+    ):
+        self.keys = keys
+        self.columns = columns
+        self.name = name
+        self.path = path
+        self.memory = None
+
+    def __getstate__(self) -> dict:
+        state = dict(self.__dict__)
+        state["memory"] = None
+        return state
+
+    def attach(self) -> MetricFrame:
+        """
+        Get a MetricFrame whose columns are read-only views of the shared values.
+
+        Rows added later are copied out of the shared values on the next grow.
+        """
+        metric_frame = MetricFrame(self.columns, capacity=max(len(self.keys), 1))
+        metric_frame.keys = list(self.keys)
+        metric_frame.ids = {key: row for row, key in enumerate(self.keys)}
+        shape = (len(self.columns), len(self.keys))
+        if not self.keys or not self.columns:
+            return metric_frame
+        if self.path is None:
+            # the memory has to stay open as long as the frame uses it
+            metric_frame.memory = shared_memory.SharedMemory(name=self.name)
+            block = np.ndarray(shape, dtype=np.float64, buffer=metric_frame.memory.buf)
+            block.setflags(write=False)
+        else:
+            block = np.memmap(self.path, dtype=np.float64, mode="r", shape=shape)
+        for i, name in enumerate(self.columns):
+            metric_frame.columns[name] = block[i]
+        return metric_frame
+
+    def unlink(self):
+        """
+        Free the shared values, called by the creator once no worker needs them.
+        """
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+        elif self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+@beartype
+def container_key(
+    namespace_name: str,
+    workload: str,
+    container_name: str,
+    workload_type: str = "deployment",
+) -> Tuple[str, str, str, str]:
+    """
+    Get the key of a container in a MetricFrame.
+
+    Args:
+        namespace_name (str): The name of the namespace.
+        workload (str): The name of the workload.
+        container_name (str): The name of the container.
+        workload_type (str, optional): The type of workload. Default is "deployment".
+
+    Returns:
+        tuple: The key, (namespace, workload, workload_type, container).
+
+    Example:
+        key = container_key("my-namespace", "my-deployment", "my-container")
+    """
+    return (namespace_name, workload, workload_type, container_name)
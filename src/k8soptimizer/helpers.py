@@ -1,4 +1,5 @@
 import argparse
+import hashlib
 import re
 from datetime import datetime, timezone
 
@@ -196,3 +197,43 @@ def valid_k8s_name_arg(name: str) -> str:
     if is_valid_k8s_name(name):
         return name
     raise argparse.ArgumentTypeError(f"'{name}' is not a valid k8s object name")
+
+
+@beartype
+def get_shard(key: str, shard_count: int) -> int:
+    """
+    Assign a key to a shard by rendezvous (highest random weight) hashing.
+
+    The assignment is stable across processes and runs, and changing the
+    shard count only moves the keys of the added or removed shards.
+
+    Args:
+        key (str): The key, e.g. a namespace name or "namespace/deployment".
+        shard_count (int): The number of shards.
+
+    Returns:
+        int: The shard index between 0 and shard_count - 1.
+
+    Example:
+        shard_index = get_shard("my-namespace", 4)
+    """
+    if shard_count < 1:
+        raise ValueError("Invalid shard count: {}".format(shard_count))
+    if shard_count == 1:
+        return 0
+    weights = [
+        hashlib.sha256("{}:{}".format(shard, key).encode()).digest()
+        for shard in range(shard_count)
+    ]
+    return weights.index(max(weights))
+
+
+@beartype
+def shard_arg(value: str) -> int:
+    try:
+        shard = int(value)
+    except ValueError:
+        shard = -1
+    if shard < 0:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a valid shard number")
+    return shard
@@ -21,27 +21,57 @@ References:
 """
 
 import argparse
+import contextvars
 import json
 import logging
+import math
+import multiprocessing
 import os
 import re
+import signal
+import socket
 import sys
+import tempfile
+import threading
 import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from contextlib import contextmanager
 
+import numpy as np
 import requests
 from beartype import beartype
-from beartype.typing import Optional, Tuple
+from beartype.typing import Callable, Iterable, Iterator, Optional, Tuple, Union
 from kubernetes import client, config
 from kubernetes.client.models import (
     V1Container,
     V1Deployment,
     V1DeploymentList,
+    V1EnvVar,
     V1NamespaceList,
     V2HorizontalPodAutoscaler,
 )
+from kubernetes.client.rest import ApiException
 from pythonjsonlogger import jsonlogger
-
-from . import __version__, helpers
+from urllib3.connection import HTTPConnection
+
+from . import (
+    __version__,
+    checkpoint,
+    controller,
+    daemon,
+    engine,
+    frame,
+    helpers,
+    pipeline,
+    sketch,
+    store,
+)
 
 __author__ = "Philipp Hellmich"
 __copyright__ = "Arvato Systems GmbH"
@@ -97,6 +127,25 @@ MAX_CPU_REQUEST = float(
 MAX_CPU_REQUEST_NODEJS = 1.0
 CPU_REQUEST_RATIO = float(os.getenv("CPU_REQUEST_RATIO", 1.0))
 
+# raise the cpu requests of containers throttled in more than the threshold of cfs periods
+CPU_THROTTLING_MODE = os.getenv("CPU_THROTTLING_MODE", "false").lower() in [
+    "true",
+    "1",
+    "yes",
+]
+CPU_THROTTLING_THRESHOLD = float(os.getenv("CPU_THROTTLING_THRESHOLD", 0.1))
+CPU_THROTTLING_MAX_RATIO = float(os.getenv("CPU_THROTTLING_MAX_RATIO", 1.5))
+
+# raise the requests of containers stalled on cpu or memory for more than the threshold of time (cgroup PSI)
+PSI_MODE = os.getenv("PSI_MODE", "false").lower() in ["true", "1", "yes"]
+PSI_THRESHOLD = float(os.getenv("PSI_THRESHOLD", 0.1))
+PSI_MAX_RATIO = float(os.getenv("PSI_MAX_RATIO", 1.5))
+
+# remove, keep or ratio (limits are CPU_LIMIT_RATIO times the requests)
+CPU_LIMITS_POLICY = os.getenv("CPU_LIMITS_POLICY", "remove").lower()
+CPU_LIMITS_POLICIES = ["remove", "keep", "ratio"]
+CPU_LIMIT_RATIO = float(os.getenv("CPU_LIMIT_RATIO", 2.0))
+
 MIN_MEMORY_REQUEST = int(
     helpers.convert_memory_request_to_bytes(os.getenv("MIN_MEMORY_REQUEST", "16Mi"))
 )
@@ -120,19 +169,155 @@ TREND_OFFSET_MINUTES = int(os.getenv("TREND_OFFSET_MINUTES", (60 * 24 * 7)))
 TREND_MAX_RATIO = float(os.getenv("TREND_MAX_RATIO", 1.5))
 TREND_MIN_RATIO = float(os.getenv("TREND_MIN_RATIO", 0.5))
 TREND_QUANTILE_OVER_TIME = float(os.getenv("TREND_QUANTILE_OVER_TIME", 0.8))
+# number of previous weeks today is compared with, the median ratio is the trend
+TREND_WEEKS = int(os.getenv("TREND_WEEKS", 4))
+
+# size the requests from a Holt-Winters forecast instead of the trend ratio
+FORECAST_MODE = os.getenv("FORECAST_MODE", "false").lower() in ["true", "1", "yes"]
+FORECAST_WEEKS = int(os.getenv("FORECAST_WEEKS", 2))
+FORECAST_STEP_MINUTES = int(os.getenv("FORECAST_STEP_MINUTES", 60))
+FORECAST_HORIZON_MINUTES = int(os.getenv("FORECAST_HORIZON_MINUTES", 60 * 4))
+
+# recommend peak and off-peak requests from hour of the week usage profiles
+PROFILE_MODE = os.getenv("PROFILE_MODE", "false").lower() in ["true", "1", "yes"]
+PROFILE_WEEKS = int(os.getenv("PROFILE_WEEKS", 2))
+PROFILE_QUANTILE_OVER_TIME = float(os.getenv("PROFILE_QUANTILE_OVER_TIME", 0.95))
+PROFILE_PEAK_RATIO = float(os.getenv("PROFILE_PEAK_RATIO", 1.5))
+PROFILE_FILE = os.getenv("PROFILE_FILE", "")
+
+# keep the usage samples in local files and only fetch new samples each run
+SERIES_STORE_DIR = os.getenv("SERIES_STORE_DIR", "")
+SERIES_STORE_STEP_SECONDS = int(os.getenv("SERIES_STORE_STEP_SECONDS", 60))
+SERIES_STORE_RETENTION_MINUTES = int(
+    os.getenv(
+        "SERIES_STORE_RETENTION_MINUTES",
+        max(
+            DEFAULT_LOOKBACK_MINUTES + DEFAULT_OFFSET_MINUTES,
+            TREND_LOOKBOOK_MINUTES + TREND_OFFSET_MINUTES * TREND_WEEKS,
+        ),
+    )
+)
+# samples synced this long ago are still used, newer ones are not fetched
+SERIES_STORE_MAX_AGE_SECONDS = int(os.getenv("SERIES_STORE_MAX_AGE_SECONDS", 900))
+# the metrics kept in the store and the range fetched per query
+SERIES_STORE_METRICS = [
+    "kube_workload_container_resource_usage_cpu_cores_sum",
+    "kube_workload_container_resource_usage_memory_bytes_avg",
+    "kube_workload_container_resource_usage_memory_bytes_max",
+]
+SERIES_STORE_CHUNK_MINUTES = 6 * 60
+
+# keep decaying quantile sketches of the same metrics in a file or ConfigMap
+SKETCH_FILE = os.getenv("SKETCH_FILE", "")
+SKETCH_CONFIGMAP = os.getenv("SKETCH_CONFIGMAP", "")
+SKETCH_HALF_LIFE_MINUTES = int(
+    os.getenv("SKETCH_HALF_LIFE_MINUTES", DEFAULT_LOOKBACK_MINUTES)
+)
+SKETCH_RELATIVE_ACCURACY = float(os.getenv("SKETCH_RELATIVE_ACCURACY", 0.01))
+# compute the requests from decaying usage histograms instead of a fixed window
+HISTOGRAM_FILE = os.getenv("HISTOGRAM_FILE", "")
+HISTOGRAM_CONFIGMAP = os.getenv("HISTOGRAM_CONFIGMAP", "")
+HISTOGRAM_HALF_LIFE_MINUTES = int(os.getenv("HISTOGRAM_HALF_LIFE_MINUTES", 24 * 60))
 
 DELAY_BETWEEN_UPDATES = float(os.getenv("DELAY_BETWEEN_UPDATES", 0.0))
 
+# number of deployments optimized in parallel
+WORKERS = int(os.getenv("WORKERS", 1))
+# number of processes the namespaces are spread across
+PROCESSES = int(os.getenv("PROCESSES", 1))
+# fetch the usage bounds once and share them with the processes (none, shm, mmap)
+SHARED_METRICS_MODE = os.getenv("SHARED_METRICS_MODE", "none")
+
+# split the work across several instances by consistent hashing
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", 0))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 1))
+SHARD_BY = os.getenv("SHARD_BY", "namespace")
+STATS_FILE = os.getenv("STATS_FILE", "")
+
+# optimize several clusters concurrently, comma separated context=prometheus_url pairs
+CLUSTERS = os.getenv("CLUSTERS", "")
+
+# stop starting new deployments after the time budget, biggest savings first
+TIME_BUDGET_MINUTES = float(os.getenv("TIME_BUDGET_MINUTES", 0))
+# cost of one GiB of memory relative to one cpu core when ranking savings
+SAVINGS_MEMORY_GIB_WEIGHT = float(os.getenv("SAVINGS_MEMORY_GIB_WEIGHT", 0.125))
+
+# runtime name and the prometheus metric which signals it, checked in order
+RUNTIME_DETECTORS = os.getenv(
+    "RUNTIME_DETECTORS", "nodejs=nodejs_version_info,jvm=jvm_info,go=go_info"
+)
+
+# adjust runtime env vars (GOMAXPROCS, GOMEMLIMIT, NODE_OPTIONS, JAVA_TOOL_OPTIONS)
+# to the new resources
+RUNTIME_TUNING_MODE = os.getenv("RUNTIME_TUNING_MODE", "false").lower() in [
+    "true",
+    "1",
+    "yes",
+]
+RUNTIME_TUNING_HEAP_RATIO = float(os.getenv("RUNTIME_TUNING_HEAP_RATIO", 0.75))
+RUNTIME_TUNING_GOMEMLIMIT_RATIO = float(
+    os.getenv("RUNTIME_TUNING_GOMEMLIMIT_RATIO", 0.9)
+)
+
+# screen containers with one batched query per namespace before the detailed queries
+TWO_TIER_MODE = os.getenv("TWO_TIER_MODE", "false").lower() in ["true", "1", "yes"]
+
+# checkpoint the progress of a run and resume it after an interruption
+CHECKPOINT_FILE = os.getenv("CHECKPOINT_FILE", "")
+CHECKPOINT_CONFIGMAP = os.getenv("CHECKPOINT_CONFIGMAP", "")
+CHECKPOINT_NAMESPACE = os.getenv("CHECKPOINT_NAMESPACE", daemon.get_current_namespace())
+CHECKPOINT_INTERVAL_SECONDS = float(os.getenv("CHECKPOINT_INTERVAL_SECONDS", 30))
+RESUME_MODE = os.getenv("RESUME_MODE", "false").lower() in ["true", "1", "yes"]
+RESUME_FRESHNESS_MINUTES = int(os.getenv("RESUME_FRESHNESS_MINUTES", 60 * 4))
+
+# staged discover -> fetch -> compute -> apply pipeline
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "false").lower() in ["true", "1", "yes"]
+PIPELINE_DISCOVER_WORKERS = int(os.getenv("PIPELINE_DISCOVER_WORKERS", 2))
+PIPELINE_FETCH_WORKERS = int(os.getenv("PIPELINE_FETCH_WORKERS", 8))
+PIPELINE_COMPUTE_WORKERS = int(os.getenv("PIPELINE_COMPUTE_WORKERS", 1))
+PIPELINE_APPLY_WORKERS = int(os.getenv("PIPELINE_APPLY_WORKERS", 2))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 16))
+
+# long-running controller mode
+DAEMON_MODE = os.getenv("DAEMON_MODE", "false").lower() in ["true", "1", "yes"]
+DAEMON_INTERVAL_MINUTES = int(os.getenv("DAEMON_INTERVAL_MINUTES", 60 * 4))
+LEADER_ELECTION_ENABLED = os.getenv("LEADER_ELECTION_ENABLED", "true").lower() in [
+    "true",
+    "1",
+    "yes",
+]
+LEADER_ELECTION_NAMESPACE = os.getenv(
+    "LEADER_ELECTION_NAMESPACE", daemon.get_current_namespace()
+)
+LEADER_ELECTION_LEASE_NAME = os.getenv("LEADER_ELECTION_LEASE_NAME", "k8soptimizer")
+LEADER_ELECTION_LEASE_DURATION_SECONDS = int(
+    os.getenv("LEADER_ELECTION_LEASE_DURATION_SECONDS", 60)
+)
+LEADER_ELECTION_RENEW_SECONDS = int(os.getenv("LEADER_ELECTION_RENEW_SECONDS", 20))
+
+# event driven re-optimization in daemon mode
+WATCH_MODE = os.getenv("WATCH_MODE", "false").lower() in ["true", "1", "yes"]
+WATCH_WORKERS = int(os.getenv("WATCH_WORKERS", 2))
+WATCH_DEBOUNCE_SECONDS = float(os.getenv("WATCH_DEBOUNCE_SECONDS", 300))
+WATCH_BACKOFF_BASE_SECONDS = float(os.getenv("WATCH_BACKOFF_BASE_SECONDS", 60))
+WATCH_BACKOFF_MAX_SECONDS = float(os.getenv("WATCH_BACKOFF_MAX_SECONDS", 3600))
+WATCH_MAX_RETRIES = int(os.getenv("WATCH_MAX_RETRIES", 6))
+WATCH_REPLICA_CHANGE_RATIO = float(os.getenv("WATCH_REPLICA_CHANGE_RATIO", 0.5))
+WATCH_TIMEOUT_SECONDS = int(os.getenv("WATCH_TIMEOUT_SECONDS", 300))
+
+# kubernetes api client
+K8S_CONNECTION_POOL_MAXSIZE = int(os.getenv("K8S_CONNECTION_POOL_MAXSIZE", 10))
+K8S_CONNECT_TIMEOUT = float(os.getenv("K8S_CONNECT_TIMEOUT", 5.0))
+K8S_READ_TIMEOUT = float(os.getenv("K8S_READ_TIMEOUT", 60.0))
+K8S_QPS = float(os.getenv("K8S_QPS", 20.0))
+K8S_BURST = int(os.getenv("K8S_BURST", 40))
+K8S_KEEP_ALIVE = os.getenv("K8S_KEEP_ALIVE", "true").lower() in ["true", "1", "yes"]
+
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
 
-stats = {}
-stats["old_cpu_sum"] = 0
-stats["new_cpu_sum"] = 0
-stats["old_memory_sum"] = 0
-stats["new_memory_sum"] = 0
-stats["old_memory_limits_sum"] = 0
-stats["new_memory_limits_sum"] = 0
+_api_client = None
+_api_client_lock = threading.Lock()
 
 # ---- Python API ----
 # The functions defined in this section can be imported by users in their
@@ -142,17 +327,24 @@ stats["new_memory_limits_sum"] = 0
 
 
 class AppFilter(logging.Filter):
+    """
+    Adds the logging context (namespace, deployment, ...) of the current thread
+    to each log record, see set_log_context.
+    """
+
     extra = {}
+    context = threading.local()
 
     def __init__(self, extra={}):
         self.extra = extra
         super(AppFilter, self).__init__()
 
     def filter(self, record):
-        for key, value in self.extra.items():
+        extra = getattr(self.context, "extra", self.extra)
+        for key, value in extra.items():
             record.__setattr__(key, value)
         for key in list(record.__dict__.keys()):
-            if key not in self.extra and key not in [
+            if key not in extra and key not in [
                 "name",
                 "msg",
                 "args",
@@ -178,6 +370,388 @@ class AppFilter(logging.Filter):
         return True
 
 
+_logger.addFilter(AppFilter())
+
+
+def set_log_context(extra: dict):
+    """
+    Set the logging context for all following log records of the current thread.
+
+    Args:
+        extra (dict): The fields added to each log record.
+
+    Example:
+        set_log_context({"namespace": "my-namespace", "deployment": "my-deployment"})
+    """
+    AppFilter.context.extra = extra
+
+
+class Stats:
+    """
+    Thread-safe summary of the old and new resources of all optimized containers.
+    """
+
+    keys = [
+        "old_cpu_sum",
+        "new_cpu_sum",
+        "old_memory_sum",
+        "new_memory_sum",
+        "old_memory_limits_sum",
+        "new_memory_limits_sum",
+    ]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = dict.fromkeys(self.keys, 0)
+
+    def __getitem__(self, key):
+        with self.lock:
+            return self.values[key]
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.values[key] = value
+
+    def add(self, key: str, value):
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def merge(self, values: dict):
+        with self.lock:
+            for key, value in values.items():
+                self.values[key] = self.values.get(key, 0) + value
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return dict(self.values)
+
+    def reset(self):
+        with self.lock:
+            self.values = dict.fromkeys(self.keys, 0)
+
+
+class Settings:
+    """
+    Settings of an optimizer.
+
+    Settings which are not overridden are read from the module constants, so
+    they follow the environment variables.
+    """
+
+    names = [
+        "PROMETHEUS_URL",
+        "MIN_CPU_REQUEST",
+        "MAX_CPU_REQUEST",
+        "MAX_CPU_REQUEST_NODEJS",
+        "CPU_REQUEST_RATIO",
+        "CPU_THROTTLING_MODE",
+        "CPU_THROTTLING_THRESHOLD",
+        "CPU_THROTTLING_MAX_RATIO",
+        "CPU_LIMITS_POLICY",
+        "CPU_LIMIT_RATIO",
+        "PSI_MODE",
+        "PSI_THRESHOLD",
+        "PSI_MAX_RATIO",
+        "MIN_MEMORY_REQUEST",
+        "MAX_MEMORY_REQUEST",
+        "MEMORY_REQUEST_RATIO",
+        "MEMORY_LIMIT_RATIO",
+        "MIN_MEMORY_LIMIT",
+        "MAX_MEMORY_LIMIT",
+        "CHANGE_THRESHOLD",
+        "DEFAULT_QUANTILE_OVER_TIME_STATIC_CPU",
+        "DEFAULT_QUANTILE_OVER_TIME_HPA_CPU",
+        "DEFAULT_QUANTILE_OVER_TIME_STATIC_MEMORY",
+        "DEFAULT_QUANTILE_OVER_TIME_HPA_MEMORY",
+        "HPA_TARGET_REPLICAS_RATIO",
+        "TREND_MAX_RATIO",
+        "TREND_MIN_RATIO",
+        "RUNTIME_DETECTORS",
+        "RUNTIME_TUNING_MODE",
+        "RUNTIME_TUNING_HEAP_RATIO",
+        "RUNTIME_TUNING_GOMEMLIMIT_RATIO",
+        "SERIES_STORE_DIR",
+        "SKETCH_FILE",
+        "SKETCH_CONFIGMAP",
+        "SKETCH_HALF_LIFE_MINUTES",
+        "SKETCH_RELATIVE_ACCURACY",
+        "HISTOGRAM_FILE",
+        "HISTOGRAM_CONFIGMAP",
+        "HISTOGRAM_HALF_LIFE_MINUTES",
+        "FORECAST_MODE",
+        "PROFILE_MODE",
+        "PROFILE_PEAK_RATIO",
+    ]
+
+    def __init__(self, **overrides):
+        unknown = sorted(set(overrides) - set(self.names))
+        if unknown:
+            raise ValueError("Unknown settings: {}".format(", ".join(unknown)))
+        self.overrides = overrides
+
+    def __getattr__(self, name: str):
+        overrides = self.__dict__.get("overrides", {})
+        if name in overrides:
+            return overrides[name]
+        if name in self.names:
+            return globals()[name]
+        raise AttributeError(name)
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.names}
+
+
+class OptimizerState:
+    """
+    Settings, kubernetes client, caches and stats of one optimizer.
+
+    Module functions use the state of the optimizer active in the current
+    context (see activate_state), or the default state of the module.
+    """
+
+    def __init__(
+        self,
+        settings: Optional[Settings] = None,
+        api_client: Optional[client.ApiClient] = None,
+    ):
+        self.settings = settings if settings is not None else Settings()
+        self.api_client = api_client
+        self.stats = Stats()
+        self.usage_bounds = UsageBoundsCache()
+        self.usage_profiles = UsageProfileCache()
+        self.runtime_index = RuntimeIndex(
+            parse_runtime_detectors(self.settings.RUNTIME_DETECTORS)
+        )
+        self.sketches = sketch.SketchSet(
+            self.settings.SKETCH_HALF_LIFE_MINUTES * 60,
+            self.settings.SKETCH_RELATIVE_ACCURACY,
+        )
+        self.histograms = sketch.SketchSet(
+            self.settings.HISTOGRAM_HALF_LIFE_MINUTES * 60,
+            self.settings.SKETCH_RELATIVE_ACCURACY,
+        )
+
+
+_state = contextvars.ContextVar("k8soptimizer_state", default=None)
+_default_settings = Settings()
+
+
+@beartype
+def settings() -> Settings:
+    """
+    Get the settings of the active optimizer, or the module settings.
+
+    Returns:
+        Settings: The settings.
+
+    Example:
+        min_cpu = settings().MIN_CPU_REQUEST
+    """
+    state = _state.get()
+    if state is None:
+        return _default_settings
+    return state.settings
+
+
+@contextmanager
+def activate_state(state: OptimizerState):
+    """
+    Use the settings, client, caches and stats of state in the current context.
+
+    Threads started with run_in_context inherit the state.
+
+    Example:
+        with activate_state(OptimizerState(Settings(CHANGE_THRESHOLD=0.2))):
+            optimize_deployment(deployment)
+    """
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+def run_in_context(func: Callable) -> Callable:
+    """
+    Wrap func to run in a copy of the current context, e.g. in another thread.
+
+    Example:
+        threading.Thread(target=run_in_context(worker)).start()
+    """
+    context = contextvars.copy_context()
+
+    def wrapper(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+
+    return wrapper
+
+
+class StateLocal:
+    """
+    Forwards to an attribute of the active optimizer state, e.g. its stats.
+
+    Outside of an optimizer the default object is used.
+    """
+
+    def __init__(self, name: str, default):
+        self._name = name
+        self._default = default
+
+    def _target(self):
+        state = _state.get()
+        if state is None:
+            return self._default
+        return getattr(state, self._name)
+
+    def __getattr__(self, name: str):
+        return getattr(self._target(), name)
+
+    def __getitem__(self, key):
+        return self._target()[key]
+
+    def __len__(self) -> int:
+        return len(self._target())
+
+    def __setitem__(self, key, value):
+        self._target()[key] = value
+
+
+stats = StateLocal("stats", Stats())
+
+
+class RateLimiter:
+    """
+    Token bucket limiting requests to a steady rate (qps) with a given burst.
+
+    A qps of 0 or less disables the limit.
+    """
+
+    def __init__(self, qps: float = K8S_QPS, burst: int = K8S_BURST):
+        self.qps = qps
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.qps <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.last) * self.qps
+                )
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.qps
+            time.sleep(wait)
+
+
+class RateLimitedRESTClient:
+    """
+    Wrapper around the kubernetes REST client which applies a rate limit and a
+    default request timeout to every request.
+    """
+
+    def __init__(self, rest_client, rate_limiter: RateLimiter, request_timeout=None):
+        self.rest_client = rest_client
+        self.rate_limiter = rate_limiter
+        self.request_timeout = request_timeout
+
+    def request(self, *args, **kwargs):
+        if kwargs.get("_request_timeout") is None:
+            kwargs["_request_timeout"] = self.request_timeout
+        self.rate_limiter.acquire()
+        return self.rest_client.request(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.rest_client, name)
+
+
+@beartype
+def create_api_client(
+    pool_maxsize: int = K8S_CONNECTION_POOL_MAXSIZE,
+    connect_timeout: float = K8S_CONNECT_TIMEOUT,
+    read_timeout: float = K8S_READ_TIMEOUT,
+    qps: float = K8S_QPS,
+    burst: int = K8S_BURST,
+    keep_alive: bool = K8S_KEEP_ALIVE,
+    configuration: Optional[client.Configuration] = None,
+) -> client.ApiClient:
+    """
+    Create a kubernetes api client with a tuned connection pool.
+
+    Args:
+        pool_maxsize (int, optional): Maximum number of pooled connections. Default is K8S_CONNECTION_POOL_MAXSIZE.
+        connect_timeout (float, optional): Connect timeout in seconds. Default is K8S_CONNECT_TIMEOUT.
+        read_timeout (float, optional): Read timeout in seconds. Default is K8S_READ_TIMEOUT.
+        qps (float, optional): Sustained requests per second. Default is K8S_QPS.
+        burst (int, optional): Number of requests allowed above qps in a burst. Default is K8S_BURST.
+        keep_alive (bool, optional): Enable tcp keep-alive on pooled connections. Default is K8S_KEEP_ALIVE.
+        configuration (Optional[client.Configuration], optional): The cluster configuration, a copy of the default if None. Default is None.
+
+    Returns:
+        client.ApiClient: The configured api client.
+
+    Example:
+        api_client = create_api_client(pool_maxsize=20, qps=50, burst=100)
+    """
+    if configuration is None:
+        configuration = client.Configuration.get_default_copy()
+    configuration.connection_pool_maxsize = pool_maxsize
+    if keep_alive:
+        configuration.socket_options = HTTPConnection.default_socket_options + [
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        ]
+    api_client = client.ApiClient(configuration)
+    api_client.rest_client = RateLimitedRESTClient(
+        api_client.rest_client,
+        RateLimiter(qps, burst),
+        (connect_timeout, read_timeout),
+    )
+    return api_client
+
+
+def get_api_client() -> client.ApiClient:
+    """
+    Get the kubernetes api client shared by all api wrappers of this run.
+
+    The client of the active optimizer state is used if it has one.
+
+    Returns:
+        client.ApiClient: The shared api client.
+
+    Example:
+        core_api = client.CoreV1Api(get_api_client())
+    """
+    state = _state.get()
+    if state is not None and state.api_client is not None:
+        return state.api_client
+    global _api_client
+    with _api_client_lock:
+        if _api_client is None:
+            _api_client = create_api_client()
+        return _api_client
+
+
+def reset_api_client():
+    """
+    Close the shared kubernetes api client, the next call to get_api_client creates a new one.
+
+    Example:
+        config.load_incluster_config()
+        reset_api_client()
+    """
+    global _api_client
+    with _api_client_lock:
+        if _api_client is not None:
+            _api_client.close()
+        _api_client = None
+
+
 @beartype
 def query_prometheus(query: str) -> dict:
     """
@@ -196,7 +770,9 @@ def query_prometheus(query: str) -> dict:
         response = query_prometheus('sum(rate(http_requests_total{job="api"}[5m]))')
     """
     _logger.debug("Query to prometheus: %s", query)
-    response = requests.get(PROMETHEUS_URL + "/api/v1/query", params={"query": query})
+    response = requests.get(
+        settings().PROMETHEUS_URL + "/api/v1/query", params={"query": query}
+    )
     j = json.loads(response.text)
     _logger.debug("Response from prometheus: %s", j)
     if "data" not in j:
@@ -207,134 +783,485 @@ def query_prometheus(query: str) -> dict:
 
 
 @beartype
-def verify_prometheus_connection() -> bool:
+def query_prometheus_range(
+    query: str,
+    start: Union[int, float],
+    end: Union[int, float],
+    step_seconds: int,
+) -> dict:
     """
-    Verify connection to the Prometheus API.
+    Query the samples of a range from the Prometheus API.
+
+    Args:
+        query (str): The Prometheus query string.
+        start (float): The start of the range as unix timestamp.
+        end (float): The end of the range as unix timestamp.
+        step_seconds (int): The resolution of the samples.
 
     Returns:
-        bool: True if the connection is successful, False otherwise.
+        dict: The JSON response from the Prometheus API, a matrix of samples.
 
     Raises:
-        RuntimeError: If the response is missing expected data fields or the connection fails.
+        RuntimeError: If the response is missing expected data fields.
 
     Example:
-        connection_successful = verify_prometheus_connection()
+        response = query_prometheus_range("up", time.time() - 3600, time.time(), 60)
     """
-    response = requests.get(PROMETHEUS_URL + "/api/v1/status/buildinfo")
+    _logger.debug("Range query to prometheus: %s", query)
+    response = requests.get(
+        settings().PROMETHEUS_URL + "/api/v1/query_range",
+        params={"query": query, "start": start, "end": end, "step": step_seconds},
+    )
     j = json.loads(response.text)
-    _logger.debug(j)
-    if "status" not in j:
-        raise RuntimeError("Got invalid results request: {}".format(response.text))
-    if j["status"] == "success":
-        return True
-    raise RuntimeError("Connection to prometheus api failed")
+    if "data" not in j:
+        raise RuntimeError("Got invalid results from query: {}".format(query))
+    if "result" not in j["data"]:
+        raise RuntimeError("Got invalid results from query: {}".format(query))
+    return j
 
 
-@beartype
-def verify_kubernetes_connection() -> bool:
-    """
-    Verify connection to the Kubernetes API.
+_series_stores = {}
+_series_stores_lock = threading.Lock()
 
-    Returns:
-        bool: True if the connection is successful, False otherwise.
 
-    Raises:
-        RuntimeError: If the connection to the Kubernetes API fails or if there is a configuration error.
+def get_series_store() -> Optional[store.SeriesStore]:
+    """
+    Get the local series store of the active optimizer, None if SERIES_STORE_DIR is not set.
+    """
+    directory = settings().SERIES_STORE_DIR
+    if not directory:
+        return None
+    with _series_stores_lock:
+        if directory not in _series_stores:
+            _series_stores[directory] = store.SeriesStore(directory)
+        return _series_stores[directory]
+
+
+def iter_range_results(
+    metric: str, start: Union[int, float], end: Union[int, float], selector: str = ""
+) -> Iterator[tuple]:
+    """
+    Query the samples of a metric between start and end in chunks of SERIES_STORE_CHUNK_MINUTES.
 
-    Example:
-        connection_successful = verify_kubernetes_connection()
+    Args:
+        metric (str): The metric.
+        start (float): The start of the range as unix timestamp.
+        end (float): The end of the range as unix timestamp.
+        selector (str, optional): A label selector of the metric, e.g. '{namespace=~"app-.*"}'. Default is "".
+
+    Yields:
+        tuple: The start and end of the chunk and its results, j["data"]["result"].
     """
-    if CLUSTER_RUN_MODE:
-        config.load_incluster_config()
-    else:
-        config.load_kube_config()
-    client.ApisApi().get_api_versions_with_http_info()
-    return True
+    while start < end:
+        chunk_end = min(end, start + SERIES_STORE_CHUNK_MINUTES * 60)
+        j = query_prometheus_range(
+            metric + selector, start, chunk_end, SERIES_STORE_STEP_SECONDS
+        )
+        yield start, chunk_end, j["data"]["result"]
+        start = chunk_end
 
 
 @beartype
-def get_max_cpu_cores_per_runtime(runtime: str) -> int:
+def get_namespace_selector(namespace_pattern: str = ".*") -> str:
     """
-    Get the maximum number of CPU cores allowed per runtime.
+    Get a label selector of the namespaces matching a pattern like re.search.
 
     Args:
-        runtime (str): The name of the runtime.
+        namespace_pattern (str, optional): A regular expression pattern to filter namespaces. Default is ".*".
 
     Returns:
-        int: The maximum number of CPU cores.
+        str: The selector, empty if all namespaces match.
 
     Example:
-        max_cores = get_max_cpu_cores_per_runtime("nodejs")
+        selector = get_namespace_selector("^app-")  # {namespace=~".*(?:^app-).*"}
     """
-    if runtime == "nodejs":
-        return 1
-    return 100
+    if namespace_pattern in ["", ".*"]:
+        return ""
+    # prometheus anchors the regular expression, re.search does not
+    pattern = ".*(?:{}).*".format(namespace_pattern)
+    return '{{namespace=~"{}"}}'.format(
+        pattern.replace("\\", "\\\\").replace('"', '\\"')
+    )
 
 
-@beartype
-def format_offset_minutes(offset_minutes: int) -> str:
+def sync_series_store(
+    now: Optional[float] = None,
+    namespace_pattern: str = ".*",
+    shard_index: int = SHARD_INDEX,
+    shard_count: int = SHARD_COUNT,
+    shard_by: str = SHARD_BY,
+) -> int:
     """
-    Get the offset minutes as a string for Prometheus queries.
+    Fetch the samples newer than the last sync into the series store and drop expired ones.
+
+    The first sync fetches SERIES_STORE_RETENTION_MINUTES, later syncs only
+    the time since the previous sync. Only the samples of the matching
+    namespaces of the shard of this instance are kept.
 
     Args:
-        offset_minutes (int): The offset minutes.
+        now (Optional[float], optional): The current unix timestamp. Default is None.
+        namespace_pattern (str, optional): A regular expression pattern to filter namespaces. Default is ".*".
+        shard_index (int, optional): The shard of this instance. Default is SHARD_INDEX.
+        shard_count (int, optional): The number of shards. Default is SHARD_COUNT.
+        shard_by (str, optional): "namespace" or "deployment". Default is SHARD_BY.
 
     Returns:
-        str: The offset minutes as a string.
+        int: The number of samples fetched.
 
     Example:
-        offset_minutes_str = get_offset_minutes_str(5)
+        sync_series_store()
     """
-    if offset_minutes == 0:
-        return ""
-    return "offset {}m".format(offset_minutes)
+    series_store = get_series_store()
+    if series_store is None:
+        return 0
+    if now is None:
+        now = time.time()
+    oldest = now - SERIES_STORE_RETENTION_MINUTES * 60
+    selector = get_namespace_selector(namespace_pattern)
+    count = 0
+    for metric in SERIES_STORE_METRICS:
+        start = max(series_store.last_timestamp(metric) or oldest, oldest)
+        try:
+            for chunk_start, chunk_end, results in iter_range_results(
+                metric, start, now, selector
+            ):
+                results = [
+                    result
+                    for result in results
+                    if re.search(
+                        namespace_pattern, result["metric"].get("namespace", "")
+                    )
+                    and in_shard(
+                        result["metric"].get("namespace", ""),
+                        result["metric"].get("workload", ""),
+                        shard_index,
+                        shard_count,
+                        shard_by,
+                    )
+                ]
+                count += series_store.append(metric, results, chunk_start, chunk_end)
+            series_store.compact(metric, oldest)
+        except Exception as e:
+            _logger.warning("Could not sync series store %s: %s" % (metric, str(e)))
+    _logger.info("Fetched %s samples into the series store %s" % (count, series_store))
+    return count
 
 
 @beartype
-def get_number_of_samples_from_history(
-    namespace: str,
-    workload: str,
-    workload_type: str = "deployment",
-    lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
-    offset_minutes: int = DEFAULT_OFFSET_MINUTES,
-) -> int:
+def query_series_store(
+    metric: str,
+    key: Tuple[str, str, str, str],
+    lookback_minutes: int,
+    offset_minutes: int,
+    quantile_over_time: float,
+) -> Optional[float]:
     """
-    Get the CPU cores usage history for a specific container.
+    Get quantile_over_time of a container from the series store.
 
     Args:
-        namespace (str): The name of the Kubernetes namespace.
-        workload (str): The name of the workload (e.g., myapp).
-        workload_type (str, optional): The type of workload. Default is "deployment".
-        lookback_minutes (int, optional): The number of minutes to look back in time for the query. Default is DEFAULT_LOOKBACK_MINUTES.
-        offset_minutes (int, optional): The offset in minutes for the query. Default is DEFAULT_OFFSET_MINUTES.
+        metric (str): The metric.
+        key (tuple): The container, see frame.container_key.
+        lookback_minutes (int): The number of minutes to look back in time.
+        offset_minutes (int): The offset in minutes.
+        quantile_over_time (float): The quantile.
 
     Returns:
-        float: The number of samples from prometheus.
-
-    Raises:
-        RuntimeError: If no data is found for the Prometheus query.
+        Optional[float]: The quantile, None if the store does not hold the range.
 
     Example:
-        samples = get_number_of_samples_from_history("my-namespace", "my-deployment")
+        cpu = query_series_store(metric, frame.container_key("my-namespace", "my-deployment", "my-container"), 240, 0, 0.95)
     """
-    query = 'max by (namespace,workload,workload_type) (count_over_time(kube_workload_container_resource_usage_cpu_cores_avg{{namespace="{namespace}", workload="{workload}", workload_type="{workload_type}"}}[{lookback_minutes}m] {offset_minutes_str}))'.format(
-        namespace=namespace,
-        workload=workload,
-        workload_type=workload_type,
-        lookback_minutes=lookback_minutes,
-        offset_minutes_str=format_offset_minutes(offset_minutes),
-    )
-    j = query_prometheus(query)
+    series_store = get_series_store()
+    if series_store is None or metric not in SERIES_STORE_METRICS:
+        return None
+    end = time.time() - offset_minutes * 60
+    start = end - lookback_minutes * 60
+    if not series_store.covers(metric, start, end - SERIES_STORE_MAX_AGE_SECONDS):
+        return None
+    return series_store.quantile(metric, key, start, end, quantile_over_time)
+
+
+sketches = StateLocal(
+    "sketches",
+    sketch.SketchSet(SKETCH_HALF_LIFE_MINUTES * 60, SKETCH_RELATIVE_ACCURACY),
+)
 
-    if j["data"]["result"] == []:
-        raise RuntimeError("No data found for prometheus query: {}".format(query))
-    return int(j["data"]["result"][0]["value"][1])
 
+histograms = StateLocal(
+    "histograms",
+    sketch.SketchSet(HISTOGRAM_HALF_LIFE_MINUTES * 60, SKETCH_RELATIVE_ACCURACY),
+)
 
-# FIXME not used anymore
-@beartype
-def get_max_pods_per_deployment_history(
-    namespace_name: str,
+
+def create_sketch_store(path: str, configmap_name: str, key: str):
+    """
+    Create the store of a sketch set, None if it is not kept.
+
+    Args:
+        path (str): The file of the sketches, e.g. SKETCH_FILE.
+        configmap_name (str): The ConfigMap of the sketches if path is empty, e.g. SKETCH_CONFIGMAP.
+        key (str): The key of the sketches in the ConfigMap.
+
+    Returns:
+        The store, a checkpoint.FileCheckpointStore or checkpoint.ConfigMapCheckpointStore.
+    """
+    if path:
+        return checkpoint.FileCheckpointStore(path)
+    if configmap_name:
+        return checkpoint.ConfigMapCheckpointStore(
+            get_api_client(), CHECKPOINT_NAMESPACE, configmap_name, key
+        )
+    return None
+
+
+def get_sketch_store():
+    return create_sketch_store(
+        settings().SKETCH_FILE, settings().SKETCH_CONFIGMAP, "sketches.json"
+    )
+
+
+def get_histogram_store():
+    return create_sketch_store(
+        settings().HISTOGRAM_FILE, settings().HISTOGRAM_CONFIGMAP, "histograms.json"
+    )
+
+
+def update_sketch_set(
+    sketch_set: sketch.SketchSet, sketch_store, now: Optional[float] = None
+) -> int:
+    """
+    Add the samples since the previous update to a sketch set and save it.
+
+    The sketches are decayed to now first, the first update fetches four
+    half-lives.
+
+    Args:
+        sketch_set (sketch.SketchSet): The sketches, e.g. sketches or histograms.
+        sketch_store: The store of the sketches, see create_sketch_store.
+        now (Optional[float], optional): The current unix timestamp. Default is None.
+
+    Returns:
+        int: The number of samples added.
+
+    Example:
+        update_sketch_set(sketches, get_sketch_store())
+    """
+    if now is None:
+        now = time.time()
+    if not sketch_set.loaded:
+        try:
+            sketch_set.restore(sketch_store.load())
+        except Exception as e:
+            _logger.warning("Could not load sketches: %s" % str(e))
+            sketch_set.restore(None)
+    start = max(sketch_set.updated or 0, now - 4 * sketch_set.half_life_seconds)
+    sketch_set.advance(now)
+    count = 0
+    for metric in SERIES_STORE_METRICS:
+        try:
+            for _, _, results in iter_range_results(metric, start, now):
+                sketch_set.add_results(metric, results, frame.KEY_LABELS, now)
+                count += sum(len(result["values"]) for result in results)
+        except Exception as e:
+            _logger.warning("Could not update sketches %s: %s" % (metric, str(e)))
+    try:
+        sketch_store.save(sketch_set.as_dict())
+    except Exception as e:
+        _logger.error("Could not write sketches: %s" % str(e))
+    _logger.info(
+        "Added %s samples to %s sketches in %s" % (count, len(sketch_set), sketch_store)
+    )
+    return count
+
+
+def update_sketches(now: Optional[float] = None) -> int:
+    """
+    Update the quantile sketches, decaying with SKETCH_HALF_LIFE_MINUTES, if they are kept.
+    """
+    sketch_store = get_sketch_store()
+    if sketch_store is None:
+        return 0
+    return update_sketch_set(sketches, sketch_store, now)
+
+
+def update_histograms(now: Optional[float] = None) -> int:
+    """
+    Update the usage histograms, decaying with HISTOGRAM_HALF_LIFE_MINUTES, if they are kept.
+    """
+    histogram_store = get_histogram_store()
+    if histogram_store is None:
+        return 0
+    return update_sketch_set(histograms, histogram_store, now)
+
+
+@beartype
+def query_sketches(
+    metric: str,
+    key: Tuple[str, str, str, str],
+    lookback_minutes: int,
+    offset_minutes: int,
+    quantile_over_time: float,
+) -> Optional[float]:
+    """
+    Get a quantile of the recent usage of a container from its sketch.
+
+    The sketches decay with SKETCH_HALF_LIFE_MINUTES instead of covering an
+    exact window, so only windows ending now are answered.
+
+    Args:
+        metric (str): The metric.
+        key (tuple): The container, see frame.container_key.
+        lookback_minutes (int): The number of minutes to look back in time.
+        offset_minutes (int): The offset in minutes.
+        quantile_over_time (float): The quantile.
+
+    Returns:
+        Optional[float]: The quantile, None if there is no current sketch.
+
+    Example:
+        cpu = query_sketches(metric, frame.container_key("my-namespace", "my-deployment", "my-container"), 240, 0, 0.95)
+    """
+    if offset_minutes != 0 or metric not in SERIES_STORE_METRICS:
+        return None
+    if sketches.updated is None or not (
+        settings().SKETCH_FILE or settings().SKETCH_CONFIGMAP
+    ):
+        return None
+    if time.time() - sketches.updated > lookback_minutes * 60:
+        return None
+    return sketches.quantile(metric, key, quantile_over_time)
+
+
+@beartype
+def verify_prometheus_connection() -> bool:
+    """
+    Verify connection to the Prometheus API.
+
+    Returns:
+        bool: True if the connection is successful, False otherwise.
+
+    Raises:
+        RuntimeError: If the response is missing expected data fields or the connection fails.
+
+    Example:
+        connection_successful = verify_prometheus_connection()
+    """
+    response = requests.get(settings().PROMETHEUS_URL + "/api/v1/status/buildinfo")
+    j = json.loads(response.text)
+    _logger.debug(j)
+    if "status" not in j:
+        raise RuntimeError("Got invalid results request: {}".format(response.text))
+    if j["status"] == "success":
+        return True
+    raise RuntimeError("Connection to prometheus api failed")
+
+
+@beartype
+def verify_kubernetes_connection() -> bool:
+    """
+    Verify connection to the Kubernetes API.
+
+    Returns:
+        bool: True if the connection is successful, False otherwise.
+
+    Raises:
+        RuntimeError: If the connection to the Kubernetes API fails or if there is a configuration error.
+
+    Example:
+        connection_successful = verify_kubernetes_connection()
+    """
+    if CLUSTER_RUN_MODE:
+        config.load_incluster_config()
+    else:
+        config.load_kube_config()
+    reset_api_client()
+    client.ApisApi(get_api_client()).get_api_versions_with_http_info()
+    return True
+
+
+@beartype
+def get_max_cpu_cores_per_runtime(runtime: str) -> int:
+    """
+    Get the maximum number of CPU cores allowed per runtime.
+
+    Args:
+        runtime (str): The name of the runtime.
+
+    Returns:
+        int: The maximum number of CPU cores.
+
+    Example:
+        max_cores = get_max_cpu_cores_per_runtime("nodejs")
+    """
+    if runtime == "nodejs":
+        return 1
+    return 100
+
+
+@beartype
+def format_offset_minutes(offset_minutes: int) -> str:
+    """
+    Get the offset minutes as a string for Prometheus queries.
+
+    Args:
+        offset_minutes (int): The offset minutes.
+
+    Returns:
+        str: The offset minutes as a string.
+
+    Example:
+        offset_minutes_str = get_offset_minutes_str(5)
+    """
+    if offset_minutes == 0:
+        return ""
+    return "offset {}m".format(offset_minutes)
+
+
+@beartype
+def get_number_of_samples_from_history(
+    namespace: str,
+    workload: str,
+    workload_type: str = "deployment",
+    lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
+    offset_minutes: int = DEFAULT_OFFSET_MINUTES,
+) -> int:
+    """
+    Get the CPU cores usage history for a specific container.
+
+    Args:
+        namespace (str): The name of the Kubernetes namespace.
+        workload (str): The name of the workload (e.g., myapp).
+        workload_type (str, optional): The type of workload. Default is "deployment".
+        lookback_minutes (int, optional): The number of minutes to look back in time for the query. Default is DEFAULT_LOOKBACK_MINUTES.
+        offset_minutes (int, optional): The offset in minutes for the query. Default is DEFAULT_OFFSET_MINUTES.
+
+    Returns:
+        float: The number of samples from prometheus.
+
+    Raises:
+        RuntimeError: If no data is found for the Prometheus query.
+
+    Example:
+        samples = get_number_of_samples_from_history("my-namespace", "my-deployment")
+    """
+    query = 'max by (namespace,workload,workload_type) (count_over_time(kube_workload_container_resource_usage_cpu_cores_avg{{namespace="{namespace}", workload="{workload}", workload_type="{workload_type}"}}[{lookback_minutes}m] {offset_minutes_str}))'.format(
+        namespace=namespace,
+        workload=workload,
+        workload_type=workload_type,
+        lookback_minutes=lookback_minutes,
+        offset_minutes_str=format_offset_minutes(offset_minutes),
+    )
+    j = query_prometheus(query)
+
+    if j["data"]["result"] == []:
+        raise RuntimeError("No data found for prometheus query: {}".format(query))
+    return int(j["data"]["result"][0]["value"][1])
+
+
+# FIXME not used anymore
+@beartype
+def get_max_pods_per_deployment_history(
+    namespace_name: str,
     deployment_name: str,
     lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
     offset_minutes: int = DEFAULT_OFFSET_MINUTES,
@@ -407,6 +1334,17 @@ def get_cpu_cores_usage_history(
     Example:
         cpu_usage = get_cpu_cores_usage_history("my-namespace", "my-deployment", "my-container")
     """
+    key = frame.container_key(namespace, workload, container, workload_type)
+    value = query_series_store(
+        metric, key, lookback_minutes, offset_minutes, quantile_over_time
+    )
+    if value is None:
+        value = query_sketches(
+            metric, key, lookback_minutes, offset_minutes, quantile_over_time
+        )
+    if value is not None:
+        return value
+
     query = 'quantile_over_time({quantile_over_time}, {metric}{{namespace="{namespace}", workload="{workload}", workload_type="{workload_type}", container="{container}"}}[{lookback_minutes}m] {offset_minutes_str})'.format(
         quantile_over_time=quantile_over_time,
         metric=metric,
@@ -458,6 +1396,17 @@ def get_memory_bytes_usage_history(
     Example:
         memory_usage = get_memory_bytes_usage_history("my-namespace", "my-deployment", "my-container")
     """
+    key = frame.container_key(namespace, workload, container, workload_type)
+    value = query_series_store(
+        metric, key, lookback_minutes, offset_minutes, quantile_over_time
+    )
+    if value is None:
+        value = query_sketches(
+            metric, key, lookback_minutes, offset_minutes, quantile_over_time
+        )
+    if value is not None:
+        return value
+
     query = 'quantile_over_time({quantile_over_time}, {metric}{{namespace="{namespace}", workload="{workload}", workload_type="{workload_type}", container="{container}"}}[{lookback_minutes}m] {offset_minutes_str})'.format(
         quantile_over_time=quantile_over_time,
         metric=metric,
@@ -475,6 +1424,68 @@ def get_memory_bytes_usage_history(
     return float(j["data"]["result"][0]["value"][1])
 
 
+@beartype
+def get_usage_history(
+    namespace: str,
+    workload: str,
+    container: str,
+    workload_type: str = "deployment",
+    lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
+    offset_minutes: int = DEFAULT_OFFSET_MINUTES,
+    quantile_over_time: float = DEFAULT_QUANTILE_OVER_TIME,
+    metric: str = "kube_workload_container_resource_usage_cpu_cores_sum",
+) -> float:
+    """
+    Get the usage a container's requests and limits are computed from.
+
+    With HISTOGRAM_FILE or HISTOGRAM_CONFIGMAP set, the quantile comes from
+    the decaying usage histogram of the container, otherwise (and for
+    containers without a histogram) from the window of lookback_minutes.
+
+    Args:
+        namespace (str): The name of the Kubernetes namespace.
+        workload (str): The name of the workload (e.g., myapp).
+        container (str): The name of the container.
+        workload_type (str, optional): The type of workload. Default is "deployment".
+        lookback_minutes (int, optional): The number of minutes to look back in time for the query. Default is DEFAULT_LOOKBACK_MINUTES.
+        offset_minutes (int, optional): The offset in minutes for the query. Default is DEFAULT_OFFSET_MINUTES.
+        quantile_over_time (float, optional): The quantile value for the query. Default is DEFAULT_QUANTILE_OVER_TIME.
+        metric (str, optional): The cpu or memory metric. Default is "kube_workload_container_resource_usage_cpu_cores_sum".
+
+    Returns:
+        float: The usage in cores or bytes.
+
+    Example:
+        cpu_usage = get_usage_history("my-namespace", "my-deployment", "my-container")
+    """
+    if histograms.updated is not None and (
+        settings().HISTOGRAM_FILE or settings().HISTOGRAM_CONFIGMAP
+    ):
+        value = histograms.quantile(
+            metric,
+            frame.container_key(namespace, workload, container, workload_type),
+            quantile_over_time,
+        )
+        if value is not None:
+            return value
+    if "_cpu_" in metric:
+        get_history = get_cpu_cores_usage_history
+    else:
+        get_history = get_memory_bytes_usage_history
+    return float(
+        get_history(
+            namespace,
+            workload,
+            container,
+            workload_type,
+            lookback_minutes,
+            offset_minutes,
+            quantile_over_time,
+            metric,
+        )
+    )
+
+
 @beartype
 def discover_container_runtime(
     namespace: str, workload: str, container: str, workload_type: str = "deployment"
@@ -494,58 +1505,278 @@ def discover_container_runtime(
     Example:
         runtime = discover_container_runtime("my-namespace", "my-deployment", "my-container")
     """
-    if is_nodejs_container(namespace, workload, container, workload_type):
-        return "nodejs"
-    return None
+    indexed = runtime_index.loaded and runtime_index.contains(
+        namespace, workload, container, workload_type
+    )
+    if indexed:
+        return runtime_index.get(namespace, workload, container, workload_type)
+    found = None
+    for runtime, metric in runtime_index.detectors:
+        if has_runtime_signal(metric, namespace, workload, container, workload_type):
+            found = runtime
+            break
+    if runtime_index.loaded:
+        # e.g. a deployment created after the index was loaded in --watch mode
+        runtime_index.add(namespace, workload, container, workload_type, found)
+    return found
 
 
 @beartype
-def get_hpa_for_deployment(
-    namespace_name: str, deployment_name: str
-) -> Optional[V2HorizontalPodAutoscaler]:
+def parse_runtime_detectors(value: str) -> list:
     """
-    Get the Horizontal Pod Autoscaler (HPA) associated with a specific deployment.
+    Parse the runtime detectors from a comma separated list of runtime=metric pairs.
 
     Args:
-        namespace_name (str): The name of the Kubernetes namespace.
-        deployment_name (str): The name of the deployment.
+        value (str): The detectors, e.g. "nodejs=nodejs_version_info,jvm=jvm_info".
 
     Returns:
-        Optional[V2HorizontalPodAutoscaler]: The HPA object if found, or None if not found.
+        list: The (runtime, metric) pairs in the given order.
+
+    Raises:
+        ValueError: If a pair is invalid.
 
     Example:
-        hpa = get_hpa_for_deployment("my-namespace", "my-deployment")
+        detectors = parse_runtime_detectors("nodejs=nodejs_version_info,go=go_info")
     """
-    autoscaling_api = client.AutoscalingV2Api()
-    _logger.debug("Listing HPA for namespace: %s" % namespace_name)
-    for hpa in autoscaling_api.list_namespaced_horizontal_pod_autoscaler(
-        namespace=namespace_name
-    ).items:
-        _logger.debug(hpa)
-        if hpa.spec.scale_target_ref.kind != "Deployment":
-            continue
-        if hpa.spec.scale_target_ref.name != deployment_name:
+    detectors = []
+    for pair in value.split(","):
+        if pair.strip() == "":
             continue
-        return hpa
-    return None
+        runtime, _, metric = pair.partition("=")
+        if runtime.strip() == "" or metric.strip() == "":
+            raise ValueError("Invalid runtime detector: {}".format(pair))
+        detectors.append((runtime.strip(), metric.strip()))
+    return detectors
 
 
 @beartype
-def is_hpa_enabled_for_deployment(namespace_name: str, deployment_name: str) -> bool:
+def parse_clusters(value: str) -> list:
     """
-    Check if Horizontal Pod Autoscaling (HPA) is enabled for a specific deployment.
+    Parse the clusters from a comma separated list of context=prometheus_url pairs.
 
     Args:
-        namespace_name (str): The name of the Kubernetes namespace.
-        deployment_name (str): The name of the deployment.
+        value (str): The clusters, e.g. "prod=http://prometheus.prod:9090,dev=http://prometheus.dev:9090".
 
     Returns:
-        bool: True if HPA is enabled, False otherwise.
+        list: The (context, prometheus_url) pairs in the given order.
+
+    Raises:
+        ValueError: If a pair is invalid or a context is given twice.
 
     Example:
-        hpa_enabled = is_hpa_enabled_for_deployment("my-namespace", "my-deployment")
+        clusters = parse_clusters("prod=http://prometheus.prod:9090")
     """
-    return get_hpa_for_deployment(namespace_name, deployment_name) is not None
+    clusters = []
+    for pair in value.split(","):
+        if pair.strip() == "":
+            continue
+        context, _, prometheus_url = pair.partition("=")
+        if context.strip() == "" or prometheus_url.strip() == "":
+            raise ValueError("Invalid cluster: {}".format(pair))
+        if context.strip() in [c for c, _ in clusters]:
+            raise ValueError("Cluster found twice: {}".format(context.strip()))
+        clusters.append((context.strip(), prometheus_url.strip()))
+    return clusters
+
+
+class RuntimeIndex:
+    """
+    Runtimes of all containers in the cluster, detected once per run.
+
+    Each detector is a (runtime, metric) pair. A container has the runtime of
+    the first detector whose metric is exposed by one of its pods. Containers
+    without a runtime are indexed with None, so containers missing from the
+    index, e.g. of new deployments, can be detected one by one.
+    """
+
+    # every container of a pod exposes this metric
+    CONTAINERS_METRIC = "kube_pod_container_info"
+
+    def __init__(self, detectors: list):
+        self.detectors = detectors
+        self.lock = threading.Lock()
+        self.runtimes = {}
+        self.loaded = False
+
+    def load(self):
+        """
+        Run one cluster-wide query per detector and index the results.
+
+        The index is only marked as loaded if all queries succeeded.
+        """
+        runtimes = {}
+        failed = False
+        detectors = [(None, self.CONTAINERS_METRIC)] + list(reversed(self.detectors))
+        for runtime, metric in detectors:
+            query = "group by (namespace, workload, workload_type, container) ({metric} * on(namespace,pod) group_left(workload, workload_type) namespace_workload_pod:kube_pod_owner:relabel)".format(
+                metric=metric
+            )
+            try:
+                j = query_prometheus(query)
+            except Exception as e:
+                _logger.warning("Could not detect runtime %s: %s" % (runtime, str(e)))
+                failed = True
+                continue
+            for result in j["data"]["result"]:
+                labels = result["metric"]
+                key = (
+                    labels.get("namespace"),
+                    labels.get("workload"),
+                    labels.get("workload_type"),
+                    labels.get("container"),
+                )
+                # earlier detectors win, so they are applied last
+                runtimes[key] = runtime
+        with self.lock:
+            self.runtimes = runtimes
+            self.loaded = not failed
+        _logger.info(
+            "Detected the runtime of %s containers"
+            % sum(runtime is not None for runtime in runtimes.values())
+        )
+
+    def get(
+        self,
+        namespace: str,
+        workload: str,
+        container: str,
+        workload_type: str = "deployment",
+    ) -> Optional[str]:
+        with self.lock:
+            return self.runtimes.get((namespace, workload, workload_type, container))
+
+    def contains(
+        self,
+        namespace: str,
+        workload: str,
+        container: str,
+        workload_type: str = "deployment",
+    ) -> bool:
+        with self.lock:
+            return (namespace, workload, workload_type, container) in self.runtimes
+
+    def add(
+        self,
+        namespace: str,
+        workload: str,
+        container: str,
+        workload_type: str,
+        runtime: Optional[str],
+    ):
+        with self.lock:
+            self.runtimes[(namespace, workload, workload_type, container)] = runtime
+
+    def restore(self, runtimes: dict, loaded: bool = True):
+        """
+        Use runtimes detected elsewhere, e.g. by the parent process.
+
+        An index which failed to load elsewhere stays unloaded, so missing
+        containers are still detected one by one.
+        """
+        with self.lock:
+            self.runtimes = dict(runtimes)
+            self.loaded = loaded
+
+    def reset(self):
+        with self.lock:
+            self.runtimes = {}
+            self.loaded = False
+
+
+runtime_index = StateLocal(
+    "runtime_index", RuntimeIndex(parse_runtime_detectors(RUNTIME_DETECTORS))
+)
+
+
+@beartype
+def has_runtime_signal(
+    metric: str,
+    namespace: str,
+    workload: str,
+    container: str,
+    workload_type: str = "deployment",
+) -> bool:
+    """
+    Check if a container exposes the metric of a runtime, e.g. nodejs_version_info.
+
+    Args:
+        metric (str): The metric signaling the runtime.
+        namespace (str): The name of the Kubernetes namespace.
+        workload (str): The name of the workload (e.g., myapp).
+        container (str): The name of the container.
+        workload_type (str, optional): The type of workload. Default is "deployment".
+
+    Returns:
+        bool: True if the container exposes the metric, False otherwise.
+
+    Example:
+        is_jvm = has_runtime_signal("jvm_info", "my-namespace", "my-workload", "my-container")
+    """
+    query = 'count({metric}{{container="{container}"}} * on(namespace,pod) group_left(workload, workload_type) namespace_workload_pod:kube_pod_owner:relabel{{workload="{workload}", workload_type="{workload_type}", namespace="{namespace}"}}) by (namespace, workload, workload_type, container)'.format(
+        metric=metric,
+        namespace=namespace,
+        workload=workload,
+        workload_type=workload_type,
+        container=container,
+    )
+    j = query_prometheus(query)
+
+    if j["data"]["result"] == []:
+        return False
+
+    if float(j["data"]["result"][0]["value"][1]) > 0:
+        return True
+
+    return False
+
+
+@beartype
+def get_hpa_for_deployment(
+    namespace_name: str, deployment_name: str
+) -> Optional[V2HorizontalPodAutoscaler]:
+    """
+    Get the Horizontal Pod Autoscaler (HPA) associated with a specific deployment.
+
+    Args:
+        namespace_name (str): The name of the Kubernetes namespace.
+        deployment_name (str): The name of the deployment.
+
+    Returns:
+        Optional[V2HorizontalPodAutoscaler]: The HPA object if found, or None if not found.
+
+    Example:
+        hpa = get_hpa_for_deployment("my-namespace", "my-deployment")
+    """
+    autoscaling_api = client.AutoscalingV2Api(get_api_client())
+    _logger.debug("Listing HPA for namespace: %s" % namespace_name)
+    for hpa in autoscaling_api.list_namespaced_horizontal_pod_autoscaler(
+        namespace=namespace_name
+    ).items:
+        _logger.debug(hpa)
+        if hpa.spec.scale_target_ref.kind != "Deployment":
+            continue
+        if hpa.spec.scale_target_ref.name != deployment_name:
+            continue
+        return hpa
+    return None
+
+
+@beartype
+def is_hpa_enabled_for_deployment(namespace_name: str, deployment_name: str) -> bool:
+    """
+    Check if Horizontal Pod Autoscaling (HPA) is enabled for a specific deployment.
+
+    Args:
+        namespace_name (str): The name of the Kubernetes namespace.
+        deployment_name (str): The name of the deployment.
+
+    Returns:
+        bool: True if HPA is enabled, False otherwise.
+
+    Example:
+        hpa_enabled = is_hpa_enabled_for_deployment("my-namespace", "my-deployment")
+    """
+    return get_hpa_for_deployment(namespace_name, deployment_name) is not None
 
 
 @beartype
@@ -565,8 +1796,8 @@ def calculate_quantile_over_time(namespace_name: str, deployment_name: str) -> d
         target_ratios = calculate_hpa_target_ratio("my-namespace", "my-deployment")
     """
 
-    target_quantile_cpu = DEFAULT_QUANTILE_OVER_TIME_STATIC_CPU
-    target_quantile_memory = DEFAULT_QUANTILE_OVER_TIME_STATIC_MEMORY
+    target_quantile_cpu = settings().DEFAULT_QUANTILE_OVER_TIME_STATIC_CPU
+    target_quantile_memory = settings().DEFAULT_QUANTILE_OVER_TIME_STATIC_MEMORY
 
     hpa = get_hpa_for_deployment(namespace_name, deployment_name)
     if hpa is None:
@@ -580,9 +1811,9 @@ def calculate_quantile_over_time(namespace_name: str, deployment_name: str) -> d
         if metric.type != "Resource":
             continue
         if metric.resource.name == "cpu":
-            target_quantile_cpu = DEFAULT_QUANTILE_OVER_TIME_HPA_CPU
+            target_quantile_cpu = settings().DEFAULT_QUANTILE_OVER_TIME_HPA_CPU
         if metric.resource.name == "memory":
-            target_quantile_memory = DEFAULT_QUANTILE_OVER_TIME_HPA_MEMORY
+            target_quantile_memory = settings().DEFAULT_QUANTILE_OVER_TIME_HPA_MEMORY
 
     return {"cpu": float(target_quantile_cpu), "memory": float(target_quantile_memory)}
 
@@ -609,7 +1840,7 @@ def calculate_target_replicas(deployment: V1Deployment) -> int:
         _logger.debug("Hpa not found for: %s" % deployment.metadata.name)
         return deployment.spec.replicas
 
-    target_replicas = hpa.spec.max_replicas * HPA_TARGET_REPLICAS_RATIO
+    target_replicas = hpa.spec.max_replicas * settings().HPA_TARGET_REPLICAS_RATIO
 
     _logger.debug("Target replicas before limits: %s" % target_replicas)
     _logger.debug("Hpa min replicas: %s" % hpa.spec.min_replicas)
@@ -623,6 +1854,115 @@ def calculate_target_replicas(deployment: V1Deployment) -> int:
     )
 
 
+@beartype
+def get_usage_trend_history(
+    namespace: str,
+    workload: str,
+    container: str,
+    workload_type: str,
+    metric: str,
+    lookback_minutes: int = TREND_LOOKBOOK_MINUTES,
+    period_minutes: int = TREND_OFFSET_MINUTES,
+    quantile_over_time: float = TREND_QUANTILE_OVER_TIME,
+    weeks: int = TREND_WEEKS,
+) -> np.ndarray:
+    """
+    Get the usage of today and of the same window in previous weeks with one range query.
+
+    The range query evaluates quantile_over_time once per period, from
+    weeks periods ago until now. The series store is used if it holds all
+    windows.
+
+    Args:
+        namespace (str): The name of the Kubernetes namespace.
+        workload (str): The name of the workload (e.g., myapp).
+        container (str): The name of the container.
+        workload_type (str): The type of workload (e.g., deployment,daemonset,statefulset).
+        metric (str): The metric used for the query.
+        lookback_minutes (int, optional): The length of each window in minutes. Default is TREND_LOOKBOOK_MINUTES.
+        period_minutes (int, optional): The minutes between the windows. Default is TREND_OFFSET_MINUTES.
+        quantile_over_time (float, optional): The quantile value for the query. Default is TREND_QUANTILE_OVER_TIME.
+        weeks (int, optional): The number of previous windows. Default is TREND_WEEKS.
+
+    Returns:
+        np.ndarray: The usage of today followed by the previous weeks, NaN where there is no data.
+
+    Raises:
+        RuntimeError: If no data is found for today.
+
+    Example:
+        history = get_usage_trend_history("my-namespace", "my-deployment", "my-container", "deployment", "kube_workload_container_resource_usage_cpu_cores_sum")
+    """
+    history = np.full(weeks + 1, np.nan)
+    key = frame.container_key(namespace, workload, container, workload_type)
+    # the oldest week first, the store often does not reach back that far
+    for week in reversed(range(weeks + 1)):
+        value = query_series_store(
+            metric,
+            key,
+            lookback_minutes,
+            week * period_minutes,
+            quantile_over_time,
+        )
+        if value is None:
+            break
+        history[week] = value
+    else:
+        return history
+
+    query = 'quantile_over_time({quantile_over_time}, {metric}{{namespace="{namespace}", workload="{workload}", workload_type="{workload_type}", container="{container}"}}[{lookback_minutes}m])'.format(
+        quantile_over_time=quantile_over_time,
+        metric=metric,
+        namespace=namespace,
+        workload=workload,
+        workload_type=workload_type,
+        container=container,
+        lookback_minutes=lookback_minutes,
+    )
+    end = time.time()
+    step_seconds = period_minutes * 60
+    j = query_prometheus_range(query, end - weeks * step_seconds, end, step_seconds)
+
+    history = np.full(weeks + 1, np.nan)
+    for result in j["data"]["result"]:
+        for timestamp, value in result["values"]:
+            week = int(round((end - float(timestamp)) / step_seconds))
+            if 0 <= week <= weeks:
+                history[week] = float(value)
+    if np.isnan(history[0]):
+        raise RuntimeError("No data found for prometheus query: {}".format(query))
+    return history
+
+
+@beartype
+def limit_trend(history: np.ndarray) -> float:
+    """
+    Get the trend of a usage history, see engine.seasonal_trend.
+
+    Args:
+        history (np.ndarray): The usage of today followed by the previous weeks.
+
+    Returns:
+        float: The trend ratio limited to TREND_MIN_RATIO and TREND_MAX_RATIO.
+
+    Raises:
+        RuntimeError: If there is no usage in any previous week.
+
+    Example:
+        trend = limit_trend(np.array([1.2, 1.0, 1.1]))
+    """
+    cfg = settings()
+    trend = engine.seasonal_trend(
+        history[:1], history[np.newaxis, 1:], cfg.TREND_MIN_RATIO, cfg.TREND_MAX_RATIO
+    )[0]
+    if np.isnan(trend):
+        raise RuntimeError("No usage found in the previous weeks")
+
+    _logger.debug("Trend limited: %s" % trend)
+
+    return float(trend)
+
+
 @beartype
 def calculate_cpu_trend(
     namespace_name: str,
@@ -632,6 +1972,7 @@ def calculate_cpu_trend(
     lookback_minutes: int = TREND_LOOKBOOK_MINUTES,
     offset_minutes: int = TREND_OFFSET_MINUTES,
     quantile_over_time: float = TREND_QUANTILE_OVER_TIME,
+    weeks: int = TREND_WEEKS,
 ) -> float:
     """
     Calculate the CPU requests for a specific container based on historical data compared to today
@@ -644,6 +1985,7 @@ def calculate_cpu_trend(
         lookback_minutes (int, optional): The number of minutes to look back in time for the query. Default is DEFAULT_LOOKBACK_MINUTES.
         offset_minutes (int, optional): The offset in minutes for the query. Default is DEFAULT_OFFSET_MINUTES.
         quantile_over_time (float, optional): The quantile value for the query. Default is DEFAULT_QUANTILE_OVER_TIME.
+        weeks (int, optional): The number of previous weeks compared with today. Default is TREND_WEEKS.
 
     Returns:
         float: The calculated CPU requests.
@@ -652,39 +1994,21 @@ def calculate_cpu_trend(
         cpu_requests = calculate_cpu_trend("my-namespace", "my-workload", "deployment", "my-container", 1.5, 60)
     """
 
-    cpu_today = get_cpu_cores_usage_history(
+    history = get_usage_trend_history(
         namespace_name,
         workload,
         container_name,
         workload_type,
-        lookback_minutes,
-        0,
-        quantile_over_time,
         "kube_workload_container_resource_usage_cpu_cores_sum",
-    )
-
-    cpu_weekago = get_cpu_cores_usage_history(
-        namespace_name,
-        workload,
-        container_name,
-        workload_type,
         lookback_minutes,
         offset_minutes,
         quantile_over_time,
-        "kube_workload_container_resource_usage_cpu_cores_sum",
-    )
-
-    trend = round(cpu_today / cpu_weekago, 3)
-
-    _logger.debug("CPU trend raw: %s" % trend)
-
-    trend = max(
-        TREND_MIN_RATIO, min(TREND_MAX_RATIO, round(cpu_today / cpu_weekago, 3))
+        weeks,
     )
 
-    _logger.debug("CPU trend limited: %s" % trend)
+    _logger.debug("CPU trend history: %s" % history.tolist())
 
-    return float(trend)
+    return limit_trend(history)
 
 
 @beartype
@@ -720,7 +2044,7 @@ def calculate_cpu_requests(
 
     trend = calculate_cpu_trend(namespace_name, workload, workload_type, container_name)
 
-    history = get_cpu_cores_usage_history(
+    history = get_usage_history(
         namespace_name,
         workload,
         container_name,
@@ -731,105 +2055,273 @@ def calculate_cpu_requests(
         "kube_workload_container_resource_usage_cpu_cores_sum",
     )
 
+    runtime = discover_container_runtime(
+        namespace_name, workload, container_name, workload_type
+    )
+
+    return compute_cpu_requests(
+        history,
+        trend,
+        target_replicas,
+        runtime,
+        get_cpu_throttling(namespace_name, workload, container_name, workload_type),
+        get_container_pressure(
+            namespace_name, workload, container_name, workload_type, "cpu"
+        ),
+    )
+
+
+@beartype
+def compute_cpu_requests(
+    history: Union[int, float],
+    trend: Union[int, float] = 1.0,
+    target_replicas: int = 1,
+    runtime: Optional[str] = None,
+    throttling: Union[int, float] = 0.0,
+    pressure: Union[int, float] = 0.0,
+) -> float:
+    """
+    Compute the CPU requests from the CPU usage history and trend.
+
+    Throttled or cpu stalled containers get more requests, the higher of
+    both boosts applies.
+
+    Args:
+        history (float): The CPU usage quantile of all pods in cores.
+        trend (float, optional): The CPU trend ratio. Default is 1.0.
+        target_replicas (int, optional): The target replica count. Default is 1.
+        runtime (Optional[str], optional): The container runtime. Default is None.
+        throttling (float, optional): The ratio of throttled cfs periods. Default is 0.0.
+        pressure (float, optional): The ratio of time stalled on cpu. Default is 0.0.
+
+    Returns:
+        float: The CPU requests in cores.
+
+    Example:
+        cpu_requests = compute_cpu_requests(2.0, 1.1, 4, "nodejs", 0.3)
+    """
     _logger.debug("CPU trend: %s" % trend)
     _logger.debug("CPU history: %s" % history)
+    _logger.debug("CPU throttling: %s" % throttling)
+    _logger.debug("CPU pressure: %s" % pressure)
 
+    cfg = settings()
+    boost = max(get_throttling_boost(throttling), get_pressure_boost(pressure))
     new_cpu = round(
         max(
-            MIN_CPU_REQUEST,
+            cfg.MIN_CPU_REQUEST,
             min(
-                MAX_CPU_REQUEST,
-                history / target_replicas * trend * CPU_REQUEST_RATIO,
+                cfg.MAX_CPU_REQUEST,
+                history / target_replicas * (trend * boost) * cfg.CPU_REQUEST_RATIO,
             ),
         ),
         3,
     )
-    runtime = discover_container_runtime(
-        namespace_name, workload, container_name, workload_type
-    )
     _logger.debug("Runtime: %s" % runtime)
     if runtime == "nodejs":
-        new_cpu = min(MAX_CPU_REQUEST_NODEJS, new_cpu)
+        new_cpu = min(cfg.MAX_CPU_REQUEST_NODEJS, new_cpu)
 
     return float(new_cpu)
 
 
 @beartype
-def calculate_memory_trend(
+def get_throttling_boost(throttling: Union[int, float]) -> float:
+    """
+    Get the factor the cpu requests of a throttled container are raised by.
+
+    The usage of a throttled container is capped by its cpu limits, so the
+    usage quantiles underestimate its demand. Containers throttled in more
+    than CPU_THROTTLING_THRESHOLD of the cfs periods get 1 + throttling
+    times the requests, at most CPU_THROTTLING_MAX_RATIO.
+
+    Args:
+        throttling (float): The ratio of throttled cfs periods.
+
+    Returns:
+        float: The factor, 1.0 for containers which are not throttled.
+
+    Example:
+        boost = get_throttling_boost(0.3)
+    """
+    cfg = settings()
+    if throttling <= cfg.CPU_THROTTLING_THRESHOLD:
+        return 1.0
+    return float(min(1 + throttling, cfg.CPU_THROTTLING_MAX_RATIO))
+
+
+@beartype
+def get_cpu_throttling(
     namespace_name: str,
     workload: str,
-    workload_type: str,
     container_name: str,
-    lookback_minutes: int = TREND_LOOKBOOK_MINUTES,
-    offset_minutes: int = TREND_OFFSET_MINUTES,
-    quantile_over_time: float = TREND_QUANTILE_OVER_TIME,
-):
+    workload_type: str = "deployment",
+) -> float:
     """
-    Calculate the memory requests for a specific container based on historical data, target ratio, and OOM history.
+    Get the ratio of throttled cfs periods of a container from the batched namespace query.
 
     Args:
         namespace_name (str): The name of the Kubernetes namespace.
         workload (str): The name of the workload (e.g., myapp).
-        workload_type (str): The type of workload (e.g., deployment,daemonset,statefulset).
         container_name (str): The name of the container.
-        lookback_minutes (int, optional): The number of minutes to look back in time for the query. Default is DEFAULT_LOOKBACK_MINUTES.
-        offset_minutes (int, optional): The offset in minutes for the query. Default is DEFAULT_OFFSET_MINUTES.
-        quantile_over_time (float, optional): The quantile value for the query. Default is DEFAULT_QUANTILE_OVER_TIME.
+        workload_type (str, optional): The type of workload. Default is "deployment".
 
     Returns:
-        int: The calculated memory requests in bytes.
+        float: The ratio of throttled periods, 0.0 if unknown or CPU_THROTTLING_MODE is off.
 
     Example:
-        memory_requests = calculate_memory_requests("my-namespace", "my-workload", "deployment", "my-container", 1.5, 60)
+        throttling = get_cpu_throttling("my-namespace", "my-workload", "my-container")
     """
-
-    memory_today = get_memory_bytes_usage_history(
-        namespace_name,
-        workload,
-        container_name,
-        workload_type,
-        lookback_minutes,
-        0,
-        quantile_over_time,
-        "kube_workload_container_resource_usage_memory_bytes_avg",
+    if not settings().CPU_THROTTLING_MODE:
+        return 0.0
+    throttling = get_usage_bound(
+        namespace_name, workload, container_name, workload_type, "cpu_throttling"
     )
+    return 0.0 if throttling is None else throttling
 
-    memory_weekago = get_memory_bytes_usage_history(
-        namespace_name,
-        workload,
-        container_name,
-        workload_type,
-        lookback_minutes,
-        offset_minutes,
-        quantile_over_time,
-        "kube_workload_container_resource_usage_memory_bytes_avg",
-    )
 
-    trend = round(memory_today / memory_weekago, 3)
+@beartype
+def get_pressure_boost(pressure: Union[int, float]) -> float:
+    """
+    Get the factor the requests of a container under pressure are raised by.
 
-    _logger.debug("Memory trend raw: %s" % trend)
+    Usage quantiles do not show the time a container waits for cpu or for
+    memory reclaim. Containers stalled for more than PSI_THRESHOLD of the
+    time get 1 + pressure times the requests, at most PSI_MAX_RATIO.
 
-    trend = max(
-        TREND_MIN_RATIO, min(TREND_MAX_RATIO, round(memory_today / memory_weekago, 3))
-    )
+    Args:
+        pressure (float): The ratio of time some tasks of the container were stalled.
 
-    _logger.debug("Memory trend limited: %s" % trend)
+    Returns:
+        float: The factor, 1.0 for containers which are not under pressure.
 
-    return float(trend)
+    Example:
+        boost = get_pressure_boost(0.2)
+    """
+    cfg = settings()
+    if pressure <= cfg.PSI_THRESHOLD:
+        return 1.0
+    return float(min(1 + pressure, cfg.PSI_MAX_RATIO))
 
 
 @beartype
-def calculate_memory_requests(
+def get_container_pressure(
     namespace_name: str,
     workload: str,
-    workload_type: str,
     container_name: str,
-    target_replicas: int = 1,
-    lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
-    offset_minutes: int = DEFAULT_LOOKBACK_MINUTES,
-    quantile_over_time: float = DEFAULT_QUANTILE_OVER_TIME,
-):
-    """
+    workload_type: str = "deployment",
+    resource: str = "memory",
+) -> float:
+    """
+    Get the ratio of time a container was stalled on cpu or memory from the batched namespace query.
+
+    Args:
+        namespace_name (str): The name of the Kubernetes namespace.
+        workload (str): The name of the workload (e.g., myapp).
+        container_name (str): The name of the container.
+        workload_type (str, optional): The type of workload. Default is "deployment".
+        resource (str, optional): The resource, cpu or memory. Default is "memory".
+
+    Returns:
+        float: The ratio of stalled time, 0.0 if unknown or PSI_MODE is off.
+
+    Example:
+        pressure = get_container_pressure("my-namespace", "my-workload", "my-container", "deployment", "memory")
+    """
+    if not settings().PSI_MODE:
+        return 0.0
+    pressure = get_usage_bound(
+        namespace_name,
+        workload,
+        container_name,
+        workload_type,
+        "{}_pressure".format(resource),
+    )
+    return 0.0 if pressure is None else pressure
+
+
+@beartype
+def get_usage_bound(
+    namespace_name: str,
+    workload: str,
+    container_name: str,
+    workload_type: str,
+    series: str,
+) -> Optional[float]:
+    """
+    Get a series of a container from the batched namespace query, see get_namespace_usage_bounds.
+
+    Returns:
+        Optional[float]: The value, None if it is unknown.
+    """
+    metric_frame = usage_bounds.get(namespace_name)
+    row = metric_frame.id_of(
+        frame.container_key(namespace_name, workload, container_name, workload_type)
+    )
+    if row is None:
+        return None
+    return metric_frame.get(row, series)
+
+
+@beartype
+def calculate_memory_trend(
+    namespace_name: str,
+    workload: str,
+    workload_type: str,
+    container_name: str,
+    lookback_minutes: int = TREND_LOOKBOOK_MINUTES,
+    offset_minutes: int = TREND_OFFSET_MINUTES,
+    quantile_over_time: float = TREND_QUANTILE_OVER_TIME,
+    weeks: int = TREND_WEEKS,
+):
+    """
+    Calculate the memory requests for a specific container based on historical data, target ratio, and OOM history.
+
+    Args:
+        namespace_name (str): The name of the Kubernetes namespace.
+        workload (str): The name of the workload (e.g., myapp).
+        workload_type (str): The type of workload (e.g., deployment,daemonset,statefulset).
+        container_name (str): The name of the container.
+        lookback_minutes (int, optional): The number of minutes to look back in time for the query. Default is DEFAULT_LOOKBACK_MINUTES.
+        offset_minutes (int, optional): The offset in minutes for the query. Default is DEFAULT_OFFSET_MINUTES.
+        quantile_over_time (float, optional): The quantile value for the query. Default is DEFAULT_QUANTILE_OVER_TIME.
+        weeks (int, optional): The number of previous weeks compared with today. Default is TREND_WEEKS.
+
+    Returns:
+        int: The calculated memory requests in bytes.
+
+    Example:
+        memory_requests = calculate_memory_requests("my-namespace", "my-workload", "deployment", "my-container", 1.5, 60)
+    """
+
+    history = get_usage_trend_history(
+        namespace_name,
+        workload,
+        container_name,
+        workload_type,
+        "kube_workload_container_resource_usage_memory_bytes_avg",
+        lookback_minutes,
+        offset_minutes,
+        quantile_over_time,
+        weeks,
+    )
+
+    _logger.debug("Memory trend history: %s" % history.tolist())
+
+    return limit_trend(history)
+
+
+@beartype
+def calculate_memory_requests(
+    namespace_name: str,
+    workload: str,
+    workload_type: str,
+    container_name: str,
+    target_replicas: int = 1,
+    lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
+    offset_minutes: int = DEFAULT_LOOKBACK_MINUTES,
+    quantile_over_time: float = DEFAULT_QUANTILE_OVER_TIME,
+):
+    """
     Calculate the memory requests for a specific container based on historical data, target ratio, and OOM history.
 
     Args:
@@ -848,21 +2340,17 @@ def calculate_memory_requests(
     Example:
         memory_requests = calculate_memory_requests("my-namespace", "my-workload", "deployment", "my-container", 1.5, 60)
     """
-    oom_ratio = 1
-    if (
-        get_oom_killed_history(
-            namespace_name, workload, container_name, workload_type, lookback_minutes
-        )
-        > 0
-    ):
+    oom_killed = get_oom_killed_history(
+        namespace_name, workload, container_name, workload_type, lookback_minutes
+    )
+    if oom_killed > 0:
         quantile_over_time = 0.99
-        oom_ratio = 1.5
 
     trend = calculate_memory_trend(
         namespace_name, workload, workload_type, container_name
     )
 
-    history = get_memory_bytes_usage_history(
+    history = get_usage_history(
         namespace_name,
         workload,
         container_name,
@@ -873,12 +2361,47 @@ def calculate_memory_requests(
         "kube_workload_container_resource_usage_memory_bytes_avg",
     )
 
+    pressure = get_container_pressure(
+        namespace_name, workload, container_name, workload_type, "memory"
+    )
+
+    return compute_memory_requests(history, trend, oom_killed, pressure)
+
+
+@beartype
+def compute_memory_requests(
+    history: Union[int, float],
+    trend: Union[int, float] = 1.0,
+    oom_killed: int = 0,
+    pressure: Union[int, float] = 0.0,
+) -> int:
+    """
+    Compute the memory requests from the memory usage history, trend and OOM history.
+
+    Args:
+        history (float): The memory usage quantile in bytes.
+        trend (float, optional): The memory trend ratio. Default is 1.0.
+        oom_killed (int, optional): The count of OOM events. Default is 0.
+        pressure (float, optional): The ratio of time stalled on memory. Default is 0.0.
+
+    Returns:
+        int: The memory requests in bytes.
+
+    Example:
+        memory_requests = compute_memory_requests(1024**3, 1.1, 0)
+    """
+    oom_ratio = 1
+    if oom_killed > 0:
+        oom_ratio = 1.5
+    boost = get_pressure_boost(pressure)
+
+    cfg = settings()
     new_memory = round(
         max(
-            MIN_MEMORY_REQUEST,
+            cfg.MIN_MEMORY_REQUEST,
             min(
-                MAX_MEMORY_REQUEST,
-                history * trend * oom_ratio * MEMORY_REQUEST_RATIO,
+                cfg.MAX_MEMORY_REQUEST,
+                history * (trend * boost) * oom_ratio * cfg.MEMORY_REQUEST_RATIO,
             ),
         )
     )
@@ -916,21 +2439,17 @@ def calculate_memory_limits(
     Example:
         memory_limits = calculate_memory_limits("my-namespace", "my-workload", "deployment", "my-container", 2048)
     """
-    oom_ratio = 1
-    if (
-        get_oom_killed_history(
-            namespace_name, workload, container_name, workload_type, lookback_minutes
-        )
-        > 0
-    ):
+    oom_killed = get_oom_killed_history(
+        namespace_name, workload, container_name, workload_type, lookback_minutes
+    )
+    if oom_killed > 0:
         quantile_over_time = 0.99
-        oom_ratio = 2
 
     trend = calculate_memory_trend(
         namespace_name, workload, workload_type, container_name
     )
 
-    history = get_memory_bytes_usage_history(
+    history = get_usage_history(
         namespace_name,
         workload,
         container_name,
@@ -941,123 +2460,1171 @@ def calculate_memory_limits(
         "kube_workload_container_resource_usage_memory_bytes_max",
     )
 
-    new_memory = round(
-        max(
-            MIN_MEMORY_LIMIT,
-            min(
-                MAX_MEMORY_LIMIT,
-                history * trend * oom_ratio * MEMORY_LIMIT_RATIO,
-            ),
-        )
+    pressure = get_container_pressure(
+        namespace_name, workload, container_name, workload_type, "memory"
     )
 
-    return int(new_memory)
+    return compute_memory_limits(history, trend, oom_killed, pressure)
 
 
 @beartype
-def get_namespaces(namespace_pattern: str = ".*") -> V1NamespaceList:
+def compute_memory_limits(
+    history: Union[int, float],
+    trend: Union[int, float] = 1.0,
+    oom_killed: int = 0,
+    pressure: Union[int, float] = 0.0,
+) -> int:
     """
-    Get a list of Kubernetes namespaces that match the specified pattern.
+    Compute the memory limits from the memory usage history, trend and OOM history.
 
     Args:
-        namespace_pattern (str, optional): A regular expression pattern to filter namespaces. Default is ".*".
+        history (float): The maximum memory usage quantile in bytes.
+        trend (float, optional): The memory trend ratio. Default is 1.0.
+        oom_killed (int, optional): The count of OOM events. Default is 0.
+        pressure (float, optional): The ratio of time stalled on memory. Default is 0.0.
 
     Returns:
-        V1NamespaceList: A list of namespaces.
+        int: The memory limits in bytes.
 
     Example:
-        namespaces = get_namespaces("my-namespace.*")
+        memory_limits = compute_memory_limits(1024**3, 1.1, 0)
     """
-    core_api = client.CoreV1Api()
-    resp_ns = core_api.list_namespace(watch=False)
-    items = []
-
-    for namespace in resp_ns.items:
-        _logger.debug(namespace)
-        namespace_name = namespace.metadata.name
-
-        x = re.search(namespace_pattern, namespace_name)
-        if x is None:
-            _logger.debug(
-                "Skipping namespace due to NAMESPACE_PATTERN: %s" % namespace_name
-            )
-            continue
+    oom_ratio = 1
+    if oom_killed > 0:
+        oom_ratio = 2
+    boost = get_pressure_boost(pressure)
 
-        items.append(namespace)
+    cfg = settings()
+    new_memory = round(
+        max(
+            cfg.MIN_MEMORY_LIMIT,
+            min(
+                cfg.MAX_MEMORY_LIMIT,
+                history * (trend * boost) * oom_ratio * cfg.MEMORY_LIMIT_RATIO,
+            ),
+        )
+    )
 
-    return V1NamespaceList(items=items)
+    return int(new_memory)
 
 
 @beartype
-def get_deployments(
-    namespace_name: str, deplopyment_pattern: str = ".*", only_running: bool = True
-) -> V1DeploymentList:
+def fetch_container_metrics(
+    namespace_name: str,
+    workload: str,
+    workload_type: str,
+    container_name: str,
+    lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
+    offset_minutes: int = DEFAULT_OFFSET_MINUTES,
+    quantile_over_time_cpu: float = DEFAULT_QUANTILE_OVER_TIME,
+    quantile_over_time_memory: float = DEFAULT_QUANTILE_OVER_TIME,
+) -> dict:
     """
-    Get a list of Kubernetes deployments in a specific namespace that match the specified pattern.
+    Fetch all prometheus metrics needed to compute the resources of a container.
+
+    This runs the same queries as calculate_cpu_requests, calculate_memory_requests
+    and calculate_memory_limits, but the OOM history and memory trend are only
+    fetched once.
 
     Args:
         namespace_name (str): The name of the Kubernetes namespace.
-        deplopyment_pattern (str, optional): A regular expression pattern to filter deployments. Default is ".*".
-        only_running (bool, optional): Flag to include only running deployments. Default is True.
+        workload (str): The name of the workload (e.g., myapp).
+        workload_type (str): The type of workload (e.g., deployment,daemonset,statefulset).
+        container_name (str): The name of the container.
+        lookback_minutes (int, optional): The number of minutes to look back in time for the query. Default is DEFAULT_LOOKBACK_MINUTES.
+        offset_minutes (int, optional): The offset in minutes for the query. Default is DEFAULT_OFFSET_MINUTES.
+        quantile_over_time_cpu (float, optional): The quantile value for the cpu query. Default is DEFAULT_QUANTILE_OVER_TIME.
+        quantile_over_time_memory (float, optional): The quantile value for the memory query. Default is DEFAULT_QUANTILE_OVER_TIME.
 
     Returns:
-        V1DeploymentList: A list of deployments.
+        dict: The metrics, see compute_container_resources.
 
     Example:
-        deployments = get_deployments("my-namespace", "my-deployment.*", only_running=True)
+        metrics = fetch_container_metrics("my-namespace", "my-workload", "deployment", "my-container")
     """
-    apis_api = client.AppsV1Api()
-    resp_deploy = apis_api.list_namespaced_deployment(namespace=namespace_name)
-    items = []
-    for deployment in resp_deploy.items:
-        _logger.debug(deployment)
-        deployment_name = deployment.metadata.name
-
-        x = re.search(deplopyment_pattern, deployment_name)
-        if x is None:
-            _logger.debug(
-                "Skipping deployment due to DEPLOYMENT_PATTERN: %s" % deployment_name
-            )
-            continue
-
-        if only_running and deployment.spec.replicas == 0:
-            _logger.debug(
-                "Skipping deployment due to zero replicas: %s" % deployment_name
-            )
-            continue
-
-        items.append(deployment)
+    metrics = {}
+    metrics["runtime"] = discover_container_runtime(
+        namespace_name, workload, container_name, workload_type
+    )
+    metrics["oom_killed"] = get_oom_killed_history(
+        namespace_name, workload, container_name, workload_type, lookback_minutes
+    )
+    if metrics["oom_killed"] > 0:
+        quantile_over_time_memory = 0.99
+    metrics["cpu_throttling"] = get_cpu_throttling(
+        namespace_name, workload, container_name, workload_type
+    )
+    for resource in ["cpu", "memory"]:
+        metrics["{}_pressure".format(resource)] = get_container_pressure(
+            namespace_name, workload, container_name, workload_type, resource
+        )
 
-    return V1DeploymentList(items=items)
+    if settings().FORECAST_MODE:
+        forecast = forecast_container_usage(
+            namespace_name,
+            workload,
+            container_name,
+            workload_type,
+            [
+                (
+                    "kube_workload_container_resource_usage_cpu_cores_sum",
+                    quantile_over_time_cpu,
+                ),
+                (
+                    "kube_workload_container_resource_usage_memory_bytes_avg",
+                    quantile_over_time_memory,
+                ),
+                ("kube_workload_container_resource_usage_memory_bytes_max", 0.99),
+            ],
+        )
+        if forecast is not None:
+            # the forecast already includes growth and seasonality
+            metrics["cpu_trend"] = 1.0
+            metrics["memory_trend"] = 1.0
+            metrics["cpu_history"] = forecast[0]
+            metrics["memory_history"] = forecast[1]
+            metrics["memory_limits_history"] = forecast[2]
+            return metrics
+
+    metrics["cpu_trend"] = calculate_cpu_trend(
+        namespace_name, workload, workload_type, container_name
+    )
+    metrics["cpu_history"] = get_usage_history(
+        namespace_name,
+        workload,
+        container_name,
+        workload_type,
+        lookback_minutes,
+        offset_minutes,
+        quantile_over_time_cpu,
+        "kube_workload_container_resource_usage_cpu_cores_sum",
+    )
+    metrics["memory_trend"] = calculate_memory_trend(
+        namespace_name, workload, workload_type, container_name
+    )
+    metrics["memory_history"] = get_usage_history(
+        namespace_name,
+        workload,
+        container_name,
+        workload_type,
+        lookback_minutes,
+        offset_minutes,
+        quantile_over_time_memory,
+        "kube_workload_container_resource_usage_memory_bytes_avg",
+    )
+    metrics["memory_limits_history"] = get_usage_history(
+        namespace_name,
+        workload,
+        container_name,
+        workload_type,
+        lookback_minutes,
+        offset_minutes,
+        0.99,
+        "kube_workload_container_resource_usage_memory_bytes_max",
+    )
+    return metrics
 
 
 @beartype
-def get_oom_killed_history(
-    namespace: str,
+def forecast_container_usage(
+    namespace_name: str,
     workload: str,
-    container: str,
-    workload_type: str = "deployment",
-    lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
-) -> int:
+    container_name: str,
+    workload_type: str,
+    series: list,
+    weeks: int = FORECAST_WEEKS,
+    step_minutes: int = FORECAST_STEP_MINUTES,
+    horizon_minutes: int = FORECAST_HORIZON_MINUTES,
+) -> Optional[list]:
     """
-    Get the count of out-of-memory (OOM) events for a specific container based on historical data.
+    Forecast the peak usage of a container over the next horizon_minutes.
+
+    The usage series are fetched with one range query, one quantile per
+    step, and forecast together with engine.holt_winters using a daily and
+    a weekly season.
 
     Args:
-        namespace (str): The name of the Kubernetes namespace.
+        namespace_name (str): The name of the Kubernetes namespace.
         workload (str): The name of the workload (e.g., myapp).
-        container (str): The name of the container.
-        workload_type (str, optional): The type of workload. Default is "deployment".
-        lookback_minutes (int, optional): The number of minutes to look back in time for the query. Default is DEFAULT_LOOKBACK_MINUTES.
+        container_name (str): The name of the container.
+        workload_type (str): The type of workload (e.g., deployment,daemonset,statefulset).
+        series (list): The (metric, quantile) pairs to forecast.
+        weeks (int, optional): The number of weeks the model is fitted to. Default is FORECAST_WEEKS.
+        step_minutes (int, optional): The minutes per time step. Default is FORECAST_STEP_MINUTES.
+        horizon_minutes (int, optional): The minutes to forecast. Default is FORECAST_HORIZON_MINUTES.
 
     Returns:
-        int: The count of OOM events.
+        Optional[list]: The forecast peak per series, None if a series has less than two days of samples.
 
     Example:
-        oom_count = get_oom_killed_history("my-namespace", "my-workload", "my-container", "deployment", 60)
+        cpu, memory = forecast_container_usage("my-namespace", "my-workload", "my-container", "deployment", [(cpu_metric, 0.95), (memory_metric, 0.95)])
     """
-    query = 'sum_over_time(kube_workload_container_resource_usage_memory_oom_killed{{namespace="{namespace}", workload="{workload}", workload_type="{workload_type}", container="{container}"}}[{lookback_minutes}m])'.format(
-        namespace=namespace,
-        workload=workload,
+    queries = []
+    for i, (metric, quantile) in enumerate(series):
+        queries.append(
+            'label_replace(quantile_over_time({quantile}, {metric}{{namespace="{namespace}", workload="{workload}", workload_type="{workload_type}", container="{container}"}}[{step}m]), "series", "{i}", "", "")'.format(
+                quantile=quantile,
+                metric=metric,
+                namespace=namespace_name,
+                workload=workload,
+                workload_type=workload_type,
+                container=container_name,
+                step=step_minutes,
+                i=i,
+            )
+        )
+    step_seconds = step_minutes * 60
+    steps = weeks * 7 * 24 * 60 // step_minutes
+    end = time.time()
+    start = end - (steps - 1) * step_seconds
+    j = query_prometheus_range(" or ".join(queries), start, end, step_seconds)
+
+    values = np.full((len(series), steps), np.nan)
+    for result in j["data"]["result"]:
+        row = int(result["metric"]["series"])
+        for timestamp, value in result["values"]:
+            column = int(round((float(timestamp) - start) / step_seconds))
+            if 0 <= column < steps:
+                values[row, column] = float(value)
+
+    daily = 24 * 60 // step_minutes
+    if np.any(np.sum(~np.isnan(values), axis=1) < 2 * daily):
+        _logger.debug("Not enough samples to forecast the usage")
+        return None
+    forecast = engine.holt_winters(
+        values, (daily, 7 * daily), max(1, math.ceil(horizon_minutes / step_minutes))
+    )
+    peaks = np.maximum(np.max(forecast, axis=1), 0.0)
+    if not np.all(np.isfinite(peaks)):
+        return None
+    _logger.debug("Forecast peaks: %s" % peaks.tolist())
+    return peaks.tolist()
+
+
+@beartype
+def compute_container_resources(metrics: dict, target_replicas: int = 1) -> dict:
+    """
+    Compute the new resources of a container from metrics fetched with fetch_container_metrics.
+
+    Args:
+        metrics (dict): The container metrics.
+        target_replicas (int, optional): The target replica count. Default is 1.
+
+    Returns:
+        dict: The new cpu requests (cores), memory requests and memory limits (bytes).
+
+    Example:
+        resources = compute_container_resources(metrics, 4)
+    """
+    return {
+        "cpu": compute_cpu_requests(
+            metrics["cpu_history"],
+            metrics["cpu_trend"],
+            target_replicas,
+            metrics["runtime"],
+            metrics.get("cpu_throttling", 0.0),
+            metrics.get("cpu_pressure", 0.0),
+        ),
+        "memory": compute_memory_requests(
+            metrics["memory_history"],
+            metrics["memory_trend"],
+            metrics["oom_killed"],
+            metrics.get("memory_pressure", 0.0),
+        ),
+        "memory_limits": compute_memory_limits(
+            metrics["memory_limits_history"],
+            metrics["memory_trend"],
+            metrics["oom_killed"],
+            metrics.get("memory_pressure", 0.0),
+        ),
+    }
+
+
+@beartype
+def compute_resources_batch(
+    metrics: list, target_replicas: list, containers: list
+) -> dict:
+    """
+    Compute the new resources of many containers at once with the vectorized engine.
+
+    The results match compute_container_resources and the change threshold
+    checks of optimize_container_cpu_requests,
+    optimize_container_memory_requests and optimize_container_memory_limits
+    for every container.
+
+    Args:
+        metrics (list): The metrics of each container from fetch_container_metrics.
+        target_replicas (list): The target replica count of each container.
+        containers (list): The Kubernetes container objects.
+
+    Returns:
+        dict: Arrays of the resulting cpu requests (cores), memory requests and memory limits (bytes),
+              the "changed_cpu", "changed_memory" and "changed_memory_limits" flags, and the
+              "computed_cpu", "computed_memory" and "computed_memory_limits" values before the change threshold.
+
+    Example:
+        resources = compute_resources_batch([metrics], [4], [container])
+    """
+    columns = {
+        key: np.array([m[key] for m in metrics], dtype=np.float64)
+        for key in [
+            "cpu_history",
+            "cpu_trend",
+            "memory_history",
+            "memory_trend",
+            "memory_limits_history",
+        ]
+    }
+    oom_killed = np.array([m["oom_killed"] for m in metrics], dtype=np.int64)
+    nodejs = np.array([m["runtime"] == "nodejs" for m in metrics], dtype=bool)
+    saturation = {
+        key: np.array([m.get(key, 0.0) for m in metrics], dtype=np.float64)
+        for key in ["cpu_throttling", "cpu_pressure", "memory_pressure"]
+    }
+
+    cfg = settings()
+    cpu_boost = np.maximum(
+        engine.saturation_boost(
+            saturation["cpu_throttling"],
+            cfg.CPU_THROTTLING_THRESHOLD,
+            cfg.CPU_THROTTLING_MAX_RATIO,
+        ),
+        engine.saturation_boost(
+            saturation["cpu_pressure"], cfg.PSI_THRESHOLD, cfg.PSI_MAX_RATIO
+        ),
+    )
+    memory_boost = engine.saturation_boost(
+        saturation["memory_pressure"], cfg.PSI_THRESHOLD, cfg.PSI_MAX_RATIO
+    )
+    new_cpu = engine.cpu_requests(
+        columns["cpu_history"],
+        columns["cpu_trend"] * cpu_boost,
+        np.array(target_replicas, dtype=np.int64),
+        nodejs,
+        cfg.MIN_CPU_REQUEST,
+        cfg.MAX_CPU_REQUEST,
+        cfg.CPU_REQUEST_RATIO,
+        cfg.MAX_CPU_REQUEST_NODEJS,
+    )
+    new_memory = engine.memory_bytes(
+        columns["memory_history"],
+        columns["memory_trend"] * memory_boost,
+        oom_killed,
+        1.5,
+        cfg.MIN_MEMORY_REQUEST,
+        cfg.MAX_MEMORY_REQUEST,
+        cfg.MEMORY_REQUEST_RATIO,
+    )
+    new_memory_limits = engine.memory_bytes(
+        columns["memory_limits_history"],
+        columns["memory_trend"] * memory_boost,
+        oom_killed,
+        2,
+        cfg.MIN_MEMORY_LIMIT,
+        cfg.MAX_MEMORY_LIMIT,
+        cfg.MEMORY_LIMIT_RATIO,
+    )
+
+    old_cpu = np.array(
+        [get_cpu_requests_from_container(c) for c in containers], dtype=np.float64
+    )
+    old_memory = np.array(
+        [get_memory_requests_from_container(c) for c in containers], dtype=np.int64
+    )
+    old_memory_limits = np.array(
+        [get_memory_limits_from_container(c) for c in containers], dtype=np.int64
+    )
+
+    result = {}
+    for name, old, new in [
+        ("cpu", old_cpu, new_cpu),
+        ("memory", old_memory, new_memory),
+        ("memory_limits", old_memory_limits, new_memory_limits),
+    ]:
+        result[name], result["changed_" + name] = engine.apply_changes(
+            old, new, cfg.CHANGE_THRESHOLD
+        )
+        result["computed_" + name] = new
+    return result
+
+
+@beartype
+def get_namespace_usage_bounds(
+    namespace_name: str,
+    workload_type: str = "deployment",
+    lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
+    offset_minutes: int = DEFAULT_OFFSET_MINUTES,
+    metric_frame: Optional[frame.MetricFrame] = None,
+) -> frame.MetricFrame:
+    """
+    Get the usage series of all containers in a namespace with one batched query.
+
+    The query returns the histories for every quantile a container may use
+    (static, hpa and after OOM kills) and the trend series, each tagged with a
+    "series" label.
+
+    Args:
+        namespace_name (str): The name of the Kubernetes namespace.
+        workload_type (str, optional): The type of workload. Default is "deployment".
+        lookback_minutes (int, optional): The number of minutes to look back in time for the query. Default is DEFAULT_LOOKBACK_MINUTES.
+        offset_minutes (int, optional): The offset in minutes for the query. Default is DEFAULT_OFFSET_MINUTES.
+        metric_frame (Optional[frame.MetricFrame], optional): The frame to add the series to, a new one if None. Default is None.
+
+    Returns:
+        frame.MetricFrame: The series as columns, e.g. "cpu_0.95", "cpu_today", ...
+
+    Example:
+        bounds = get_namespace_usage_bounds("my-namespace")
+    """
+    cpu_metric = "kube_workload_container_resource_usage_cpu_cores_sum"
+    memory_metric = "kube_workload_container_resource_usage_memory_bytes_avg"
+    memory_max_metric = "kube_workload_container_resource_usage_memory_bytes_max"
+
+    series = {}
+    cfg = settings()
+    for quantile in [
+        cfg.DEFAULT_QUANTILE_OVER_TIME_STATIC_CPU,
+        cfg.DEFAULT_QUANTILE_OVER_TIME_HPA_CPU,
+    ]:
+        series["cpu_{}".format(quantile)] = (
+            cpu_metric,
+            quantile,
+            lookback_minutes,
+            offset_minutes,
+        )
+    for quantile in [
+        cfg.DEFAULT_QUANTILE_OVER_TIME_STATIC_MEMORY,
+        cfg.DEFAULT_QUANTILE_OVER_TIME_HPA_MEMORY,
+        0.99,
+    ]:
+        series["memory_{}".format(quantile)] = (
+            memory_metric,
+            quantile,
+            lookback_minutes,
+            offset_minutes,
+        )
+    series["memory_limits"] = (
+        memory_max_metric,
+        0.99,
+        lookback_minutes,
+        offset_minutes,
+    )
+    for name, metric in [("cpu", cpu_metric), ("memory", memory_metric)]:
+        series["{}_today".format(name)] = (
+            metric,
+            TREND_QUANTILE_OVER_TIME,
+            TREND_LOOKBOOK_MINUTES,
+            0,
+        )
+        for week in range(1, TREND_WEEKS + 1):
+            series[get_trend_series_name(name, week)] = (
+                metric,
+                TREND_QUANTILE_OVER_TIME,
+                TREND_LOOKBOOK_MINUTES,
+                TREND_OFFSET_MINUTES * week,
+            )
+
+    queries = []
+    for name, (metric, quantile, lookback, offset) in series.items():
+        queries.append(
+            'label_replace(max by (workload, container) (quantile_over_time({quantile}, {metric}{{namespace="{namespace}", workload_type="{workload_type}"}}[{lookback}m] {offset_str})), "series", "{name}", "", "")'.format(
+                quantile=quantile,
+                metric=metric,
+                namespace=namespace_name,
+                workload_type=workload_type,
+                lookback=lookback,
+                offset_str=format_offset_minutes(offset),
+                name=name,
+            )
+        )
+    if settings().CPU_THROTTLING_MODE:
+        queries.append(
+            get_cpu_throttling_query(
+                namespace_name, workload_type, lookback_minutes, offset_minutes
+            )
+        )
+    if settings().PSI_MODE:
+        for resource in ["cpu", "memory"]:
+            queries.append(
+                get_pressure_query(
+                    namespace_name,
+                    resource,
+                    workload_type,
+                    lookback_minutes,
+                    offset_minutes,
+                )
+            )
+    j = query_prometheus(" or ".join(queries))
+
+    if metric_frame is None:
+        metric_frame = frame.MetricFrame()
+    metric_frame.add_results(
+        j["data"]["result"],
+        column_label="series",
+        namespace=namespace_name,
+        workload_type=workload_type,
+    )
+    return metric_frame
+
+
+@beartype
+def get_trend_series_name(resource: str, week: int) -> str:
+    """
+    Get the name of the trend series of a previous week in get_namespace_usage_bounds.
+
+    Example:
+        name = get_trend_series_name("cpu", 2)  # cpu_weekago_2
+    """
+    if week == 1:
+        return "{}_weekago".format(resource)
+    return "{}_weekago_{}".format(resource, week)
+
+
+@beartype
+def get_cpu_throttling_query(
+    namespace_name: str,
+    workload_type: str = "deployment",
+    lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
+    offset_minutes: int = DEFAULT_OFFSET_MINUTES,
+) -> str:
+    """
+    Get the query of the ratio of throttled cfs periods of all containers in a namespace.
+
+    The result has a "series" label "cpu_throttling", see get_namespace_usage_bounds.
+
+    Example:
+        query = get_cpu_throttling_query("my-namespace")
+    """
+    rates = []
+    for metric in [
+        "container_cpu_cfs_throttled_periods_total",
+        "container_cpu_cfs_periods_total",
+    ]:
+        rates.append(
+            'sum by (workload, container) (rate({metric}{{namespace="{namespace}", container!=""}}[{lookback}m] {offset_str}) * on(namespace,pod) group_left(workload) namespace_workload_pod:kube_pod_owner:relabel{{namespace="{namespace}", workload_type="{workload_type}"}})'.format(
+                metric=metric,
+                namespace=namespace_name,
+                workload_type=workload_type,
+                lookback=lookback_minutes,
+                offset_str=format_offset_minutes(offset_minutes),
+            )
+        )
+    return 'label_replace({} / {}, "series", "cpu_throttling", "", "")'.format(*rates)
+
+
+@beartype
+def get_pressure_query(
+    namespace_name: str,
+    resource: str,
+    workload_type: str = "deployment",
+    lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
+    offset_minutes: int = DEFAULT_OFFSET_MINUTES,
+) -> str:
+    """
+    Get the query of the ratio of time the containers of a namespace were stalled on a resource.
+
+    The ratio is the rate of the "some" stall time of the cgroup PSI metrics
+    of cAdvisor, the highest of all pods of a workload. The result has a
+    "series" label "<resource>_pressure", see get_namespace_usage_bounds.
+
+    Example:
+        query = get_pressure_query("my-namespace", "memory")
+    """
+    rate = 'rate(container_pressure_{resource}_waiting_seconds_total{{namespace="{namespace}", container!=""}}[{lookback}m] {offset_str})'.format(
+        resource=resource,
+        namespace=namespace_name,
+        lookback=lookback_minutes,
+        offset_str=format_offset_minutes(offset_minutes),
+    )
+    return 'label_replace(max by (workload, container) ({rate} * on(namespace,pod) group_left(workload) namespace_workload_pod:kube_pod_owner:relabel{{namespace="{namespace}", workload_type="{workload_type}"}}), "series", "{resource}_pressure", "", "")'.format(
+        rate=rate,
+        namespace=namespace_name,
+        workload_type=workload_type,
+        resource=resource,
+    )
+
+
+@beartype
+def is_significant_change(
+    old: Union[int, float],
+    new: Union[int, float],
+    change_threshold: Optional[float] = None,
+) -> bool:
+    """
+    Check if a change of a resource is above the change threshold.
+
+    Args:
+        old (float): The old value.
+        new (float): The new value.
+        change_threshold (Optional[float], optional): The relative change threshold. Default is None, the CHANGE_THRESHOLD setting.
+
+    Returns:
+        bool: True if the change is applied, the same rule as in optimize_container_cpu_requests.
+
+    Example:
+        changed = is_significant_change(0.5, 0.6)
+    """
+    if change_threshold is None:
+        change_threshold = settings().CHANGE_THRESHOLD
+    return abs(round(((new / old) - 1) * 100)) >= change_threshold * 100
+
+
+@beartype
+def screen_container(
+    container: V1Container,
+    series: Optional[dict],
+    target_replicas: int = 1,
+    quantile_over_time: Optional[dict] = None,
+) -> bool:
+    """
+    Check if the detailed evaluation of a container could change its resources (coarse pass).
+
+    The trend and the history are known from the batched namespace query, only
+    the runtime and the OOM kills are unknown. The new resources are bracketed
+    by computing them for both cases. Containers whose bracket stays within the
+    change threshold are skipped.
+
+    Args:
+        container (V1Container): The Kubernetes container object.
+        series (Optional[dict]): The series of the container from get_namespace_usage_bounds.
+        target_replicas (int, optional): The target replica count. Default is 1.
+        quantile_over_time (Optional[dict], optional): The cpu and memory quantiles of the deployment. Default is None.
+
+    Returns:
+        bool: True if the container needs the detailed evaluation, False if it would not change.
+
+    Example:
+        if screen_container(container, bounds.row(container_key("my-namespace", "my-deployment", "my-container")), 2):
+            metrics = fetch_container_metrics(...)
+    """
+    cfg = settings()
+    if quantile_over_time is None:
+        quantile_over_time = {
+            "cpu": cfg.DEFAULT_QUANTILE_OVER_TIME_STATIC_CPU,
+            "memory": cfg.DEFAULT_QUANTILE_OVER_TIME_STATIC_MEMORY,
+        }
+    if get_cpu_limits(container, get_cpu_requests_from_container(container)) != (
+        get_cpu_limits(container)
+    ):
+        return True
+    # the history of these modes is not part of the batched namespace query
+    if cfg.FORECAST_MODE or (
+        histograms.updated is not None
+        and (cfg.HISTOGRAM_FILE or cfg.HISTOGRAM_CONFIGMAP)
+    ):
+        return True
+    required = [
+        "cpu_{}".format(quantile_over_time["cpu"]),
+        "memory_{}".format(quantile_over_time["memory"]),
+        "memory_0.99",
+        "memory_limits",
+        "cpu_today",
+        "memory_today",
+    ]
+    if series is None or any(name not in series for name in required):
+        return True
+
+    trends = []
+    for resource in ["cpu", "memory"]:
+        # the same median over the previous weeks as calculate_cpu_trend
+        previous = [
+            series.get(get_trend_series_name(resource, week), np.nan)
+            for week in range(1, TREND_WEEKS + 1)
+        ]
+        trend = engine.seasonal_trend(
+            np.array([series["{}_today".format(resource)]]),
+            np.array([previous]),
+            cfg.TREND_MIN_RATIO,
+            cfg.TREND_MAX_RATIO,
+        )[0]
+        if np.isnan(trend):
+            return True
+        trends.append(float(trend))
+    cpu_trend, memory_trend = trends
+    cpu_history = series["cpu_{}".format(quantile_over_time["cpu"])]
+    memory_history = series["memory_{}".format(quantile_over_time["memory"])]
+    throttling = series.get("cpu_throttling", 0.0)
+    cpu_pressure = series.get("cpu_pressure", 0.0)
+    memory_pressure = series.get("memory_pressure", 0.0)
+
+    brackets = [
+        (
+            get_cpu_requests_from_container(container),
+            compute_cpu_requests(
+                cpu_history,
+                cpu_trend,
+                target_replicas,
+                "nodejs",
+                throttling,
+                cpu_pressure,
+            ),
+            compute_cpu_requests(
+                cpu_history, cpu_trend, target_replicas, None, throttling, cpu_pressure
+            ),
+        ),
+        (
+            get_memory_requests_from_container(container),
+            compute_memory_requests(memory_history, memory_trend, 0, memory_pressure),
+            compute_memory_requests(
+                series["memory_0.99"], memory_trend, 1, memory_pressure
+            ),
+        ),
+        (
+            get_memory_limits_from_container(container),
+            compute_memory_limits(
+                series["memory_limits"], memory_trend, 0, memory_pressure
+            ),
+            compute_memory_limits(
+                series["memory_limits"], memory_trend, 1, memory_pressure
+            ),
+        ),
+    ]
+    for old, low, high in brackets:
+        # the new value grows with the history, so the bounds decide
+        if is_significant_change(old, min(low, high)) or is_significant_change(
+            old, max(low, high)
+        ):
+            return True
+    return False
+
+
+class UsageBoundsCache:
+    """
+    Caches the batched usage series of each namespace for one run.
+
+    The series of all namespaces are kept in one MetricFrame, each namespace
+    is queried on first use.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.namespace_locks = {}
+        self.loaded = set()
+        self.frame = frame.MetricFrame()
+
+    def get(self, namespace_name: str) -> frame.MetricFrame:
+        with self.lock:
+            namespace_lock = self.namespace_locks.setdefault(
+                namespace_name, threading.Lock()
+            )
+            metric_frame = self.frame
+        with namespace_lock:
+            if namespace_name not in self.loaded:
+                try:
+                    get_namespace_usage_bounds(
+                        namespace_name, metric_frame=metric_frame
+                    )
+                except Exception as e:
+                    _logger.warning(
+                        "Could not get usage bounds of namespace %s: %s"
+                        % (namespace_name, str(e))
+                    )
+                self.loaded.add(namespace_name)
+            return metric_frame
+
+    def attach(self, shared: frame.SharedFrame, namespaces: list):
+        """
+        Use usage series shared by another process for the given namespaces.
+        """
+        with self.lock:
+            self.namespace_locks = {}
+            self.loaded = set(namespaces)
+            self.frame = shared.attach()
+
+    def reset(self):
+        with self.lock:
+            self.namespace_locks = {}
+            self.loaded = set()
+            self.frame = frame.MetricFrame()
+
+
+usage_bounds = StateLocal("usage_bounds", UsageBoundsCache())
+
+
+class UsageProfileCache:
+    """
+    Caches the usage profiles of each namespace and the schedule recommendations of one run.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.namespace_locks = {}
+        self.profiles = {}
+        self.schedules = []
+
+    def get(self, namespace_name: str, workload_type: str = "deployment") -> dict:
+        with self.lock:
+            namespace_lock = self.namespace_locks.setdefault(
+                (namespace_name, workload_type), threading.Lock()
+            )
+        with namespace_lock:
+            if (namespace_name, workload_type) not in self.profiles:
+                try:
+                    profiles = get_namespace_usage_profiles(
+                        namespace_name, workload_type
+                    )
+                except Exception as e:
+                    _logger.warning(
+                        "Could not get usage profiles of namespace %s: %s"
+                        % (namespace_name, str(e))
+                    )
+                    profiles = {}
+                self.profiles[(namespace_name, workload_type)] = profiles
+            return self.profiles[(namespace_name, workload_type)]
+
+    def add_schedule(self, schedule: dict):
+        with self.lock:
+            self.schedules.append(schedule)
+
+    def get_schedules(self) -> list:
+        with self.lock:
+            return list(self.schedules)
+
+    def reset(self):
+        with self.lock:
+            self.namespace_locks = {}
+            self.profiles = {}
+            self.schedules = []
+
+
+usage_profiles = StateLocal("usage_profiles", UsageProfileCache())
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+@beartype
+def get_namespace_usage_profiles(
+    namespace_name: str,
+    workload_type: str = "deployment",
+    weeks: int = PROFILE_WEEKS,
+    quantile_over_time: float = PROFILE_QUANTILE_OVER_TIME,
+) -> dict:
+    """
+    Get the usage profiles of all containers in a namespace with one range query.
+
+    The usage quantile of each hour of the last weeks is fetched and the
+    profile is the highest quantile of each hour of the week.
+
+    Args:
+        namespace_name (str): The name of the Kubernetes namespace.
+        workload_type (str, optional): The type of workload. Default is "deployment".
+        weeks (int, optional): The number of weeks of usage. Default is PROFILE_WEEKS.
+        quantile_over_time (float, optional): The quantile of each hour. Default is PROFILE_QUANTILE_OVER_TIME.
+
+    Returns:
+        dict: The profiles by container key, arrays of shape (2, 7, 24) with the cpu cores and memory bytes by weekday (Monday first) and hour (UTC).
+
+    Example:
+        profiles = get_namespace_usage_profiles("my-namespace")
+    """
+    queries = []
+    for name, metric in [
+        ("cpu", "kube_workload_container_resource_usage_cpu_cores_sum"),
+        ("memory", "kube_workload_container_resource_usage_memory_bytes_avg"),
+    ]:
+        queries.append(
+            'label_replace(max by (workload, container) (quantile_over_time({quantile}, {metric}{{namespace="{namespace}", workload_type="{workload_type}"}}[1h])), "series", "{name}", "", "")'.format(
+                quantile=quantile_over_time,
+                metric=metric,
+                namespace=namespace_name,
+                workload_type=workload_type,
+                name=name,
+            )
+        )
+    end = math.floor(time.time() / 3600) * 3600
+    start = end - weeks * engine.WEEK_HOURS * 3600
+    j = query_prometheus_range(" or ".join(queries), start, end, 3600)
+
+    times = np.arange(start, end + 1, 3600)
+    values = {}
+    for result in j["data"]["result"]:
+        metric = result["metric"]
+        key = frame.container_key(
+            namespace_name, metric["workload"], metric["container"], workload_type
+        )
+        if key not in values:
+            values[key] = np.full((2, len(times)), np.nan)
+        row = 0 if metric["series"] == "cpu" else 1
+        for timestamp, value in result["values"]:
+            values[key][row, int(round((float(timestamp) - start) / 3600))] = float(
+                value
+            )
+    if not values:
+        return {}
+    keys = list(values)
+    # the sample at a full hour is the usage of the hour before
+    profiles = engine.hourly_profile(
+        times - 3600, np.concatenate([values[key] for key in keys])
+    )
+    return dict(zip(keys, profiles.reshape(len(keys), 2, 7, 24)))
+
+
+@beartype
+def format_week_hour(hour: int) -> str:
+    """
+    Format an hour of the week, e.g. "Mon 08:00".
+    """
+    hour = hour % engine.WEEK_HOURS
+    return "{} {:02d}:00".format(WEEKDAYS[hour // 24], hour % 24)
+
+
+@beartype
+def recommend_profile_requests(
+    profile: np.ndarray,
+    hours: np.ndarray,
+    target_replicas: int = 1,
+    runtime: Optional[str] = None,
+) -> Optional[dict]:
+    """
+    Compute the requests for the highest usage in the given hours of a profile.
+
+    Returns:
+        Optional[dict]: The cpu and memory requests, None if the hours have no samples.
+    """
+    usage = profile[:, hours]
+    if np.isnan(usage).all(axis=1).any():
+        return None
+    return {
+        "cpu": compute_cpu_requests(
+            float(np.nanmax(usage[0])), 1.0, target_replicas, runtime
+        ),
+        "memory": compute_memory_requests(float(np.nanmax(usage[1]))),
+    }
+
+
+@beartype
+def recommend_schedule(
+    namespace_name: str,
+    workload: str,
+    container_name: str,
+    workload_type: str = "deployment",
+    target_replicas: int = 1,
+    runtime: Optional[str] = None,
+) -> Optional[dict]:
+    """
+    Recommend requests for the peak and the off-peak hours of a container.
+
+    Peak hours use more than PROFILE_PEAK_RATIO times the cpu or memory of
+    the median hour of the week. Consecutive peak hours form the windows of
+    a scheduled scaling, the off-peak requests apply outside of them.
+
+    Args:
+        namespace_name (str): The name of the Kubernetes namespace.
+        workload (str): The name of the workload (e.g., myapp).
+        container_name (str): The name of the container.
+        workload_type (str, optional): The type of workload. Default is "deployment".
+        target_replicas (int, optional): The target replica count. Default is 1.
+        runtime (Optional[str], optional): The container runtime. Default is None.
+
+    Returns:
+        Optional[dict]: The peak and off-peak requests and the peak windows, None without a profile.
+
+    Example:
+        schedule = recommend_schedule("my-namespace", "my-workload", "my-container")
+    """
+    profile = usage_profiles.get(namespace_name, workload_type).get(
+        frame.container_key(namespace_name, workload, container_name, workload_type)
+    )
+    if profile is None:
+        return None
+    profile = profile.reshape(2, engine.WEEK_HOURS)
+    peak = recommend_profile_requests(
+        profile, np.arange(engine.WEEK_HOURS), target_replicas, runtime
+    )
+    if peak is None:
+        return None
+    peaks = engine.peak_hours(profile, settings().PROFILE_PEAK_RATIO).any(axis=0)
+    windows = []
+    for start, end in engine.peak_windows(peaks):
+        window = recommend_profile_requests(
+            profile,
+            np.arange(start, end) % engine.WEEK_HOURS,
+            target_replicas,
+            runtime,
+        )
+        if window is None:
+            _logger.debug(
+                "No samples in the peak window %s - %s of container %s"
+                % (format_week_hour(start), format_week_hour(end), container_name)
+            )
+            continue
+        window["start"] = format_week_hour(start)
+        window["end"] = format_week_hour(end)
+        windows.append(window)
+    return {
+        "namespace": namespace_name,
+        "workload": workload,
+        "workload_type": workload_type,
+        "container": container_name,
+        "peak": peak,
+        "off_peak": recommend_profile_requests(
+            profile, np.flatnonzero(~peaks), target_replicas, runtime
+        ),
+        "windows": windows,
+    }
+
+
+def report_schedule(
+    namespace_name: str,
+    workload: str,
+    container_name: str,
+    workload_type: str = "deployment",
+    target_replicas: int = 1,
+    runtime: Optional[str] = None,
+):
+    """
+    Log the schedule recommendation of a container and keep it for the profile file.
+    """
+    schedule = recommend_schedule(
+        namespace_name,
+        workload,
+        container_name,
+        workload_type,
+        target_replicas,
+        runtime,
+    )
+    if schedule is None:
+        _logger.debug("No usage profile of container %s" % container_name)
+        return
+    usage_profiles.add_schedule(schedule)
+    if schedule["off_peak"] is None or not schedule["windows"]:
+        _logger.info("No peak hours of container %s" % container_name)
+        return
+    _logger.info(
+        "Schedule recommendation of container %s: cpu %sm / %sm, memory %sMi / %sMi (peak / off-peak), peak hours %s"
+        % (
+            container_name,
+            round(schedule["peak"]["cpu"] * 1000),
+            round(schedule["off_peak"]["cpu"] * 1000),
+            round(schedule["peak"]["memory"] / 1024 / 1024),
+            round(schedule["off_peak"]["memory"] / 1024 / 1024),
+            ", ".join(
+                "{} - {}".format(window["start"], window["end"])
+                for window in schedule["windows"]
+            ),
+        )
+    )
+
+
+def write_profile_file(path: str, schedules: Optional[list] = None):
+    """
+    Write the schedule recommendations of this run as json.
+
+    Args:
+        path (str): The file to write.
+        schedules (Optional[list], optional): The schedules to write, the schedules of this run if None. Default is None.
+    """
+    if schedules is None:
+        schedules = usage_profiles.get_schedules()
+    with open(path, "w") as f:
+        json.dump(schedules, f)
+    _logger.info("Wrote schedule recommendations to %s" % path)
+
+
+@beartype
+def get_namespaces(namespace_pattern: str = ".*") -> V1NamespaceList:
+    """
+    Get a list of Kubernetes namespaces that match the specified pattern.
+
+    Args:
+        namespace_pattern (str, optional): A regular expression pattern to filter namespaces. Default is ".*".
+
+    Returns:
+        V1NamespaceList: A list of namespaces.
+
+    Example:
+        namespaces = get_namespaces("my-namespace.*")
+    """
+    core_api = client.CoreV1Api(get_api_client())
+    resp_ns = core_api.list_namespace(watch=False)
+    items = []
+
+    for namespace in resp_ns.items:
+        _logger.debug(namespace)
+        namespace_name = namespace.metadata.name
+
+        x = re.search(namespace_pattern, namespace_name)
+        if x is None:
+            _logger.debug(
+                "Skipping namespace due to NAMESPACE_PATTERN: %s" % namespace_name
+            )
+            continue
+
+        items.append(namespace)
+
+    return V1NamespaceList(items=items)
+
+
+@beartype
+def get_deployments(
+    namespace_name: str, deplopyment_pattern: str = ".*", only_running: bool = True
+) -> V1DeploymentList:
+    """
+    Get a list of Kubernetes deployments in a specific namespace that match the specified pattern.
+
+    Args:
+        namespace_name (str): The name of the Kubernetes namespace.
+        deplopyment_pattern (str, optional): A regular expression pattern to filter deployments. Default is ".*".
+        only_running (bool, optional): Flag to include only running deployments. Default is True.
+
+    Returns:
+        V1DeploymentList: A list of deployments.
+
+    Example:
+        deployments = get_deployments("my-namespace", "my-deployment.*", only_running=True)
+    """
+    apis_api = client.AppsV1Api(get_api_client())
+    resp_deploy = apis_api.list_namespaced_deployment(namespace=namespace_name)
+    items = []
+    for deployment in resp_deploy.items:
+        _logger.debug(deployment)
+        deployment_name = deployment.metadata.name
+
+        x = re.search(deplopyment_pattern, deployment_name)
+        if x is None:
+            _logger.debug(
+                "Skipping deployment due to DEPLOYMENT_PATTERN: %s" % deployment_name
+            )
+            continue
+
+        if only_running and deployment.spec.replicas == 0:
+            _logger.debug(
+                "Skipping deployment due to zero replicas: %s" % deployment_name
+            )
+            continue
+
+        items.append(deployment)
+
+    return V1DeploymentList(items=items)
+
+
+@beartype
+def get_oom_killed_history(
+    namespace: str,
+    workload: str,
+    container: str,
+    workload_type: str = "deployment",
+    lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
+) -> int:
+    """
+    Get the count of out-of-memory (OOM) events for a specific container based on historical data.
+
+    Args:
+        namespace (str): The name of the Kubernetes namespace.
+        workload (str): The name of the workload (e.g., myapp).
+        container (str): The name of the container.
+        workload_type (str, optional): The type of workload. Default is "deployment".
+        lookback_minutes (int, optional): The number of minutes to look back in time for the query. Default is DEFAULT_LOOKBACK_MINUTES.
+
+    Returns:
+        int: The count of OOM events.
+
+    Example:
+        oom_count = get_oom_killed_history("my-namespace", "my-workload", "my-container", "deployment", 60)
+    """
+    query = 'sum_over_time(kube_workload_container_resource_usage_memory_oom_killed{{namespace="{namespace}", workload="{workload}", workload_type="{workload_type}", container="{container}"}}[{lookback_minutes}m])'.format(
+        namespace=namespace,
+        workload=workload,
         workload_type=workload_type,
         container=container,
         lookback_minutes=lookback_minutes,
@@ -1092,21 +3659,9 @@ def is_nodejs_container(
     Example:
         is_nodejs = is_nodejs_container("my-namespace", "my-workload", "my-container", "deployment")
     """
-    query = 'count(nodejs_version_info{{container="{container}"}} * on(namespace,pod) group_left(workload, workload_type) namespace_workload_pod:kube_pod_owner:relabel{{workload="{workload}", workload_type="{workload_type}", namespace="{namespace}"}}) by (namespace, workload, workload_type, container)'.format(
-        namespace=namespace,
-        workload=workload,
-        workload_type=workload_type,
-        container=container,
+    return has_runtime_signal(
+        "nodejs_version_info", namespace, workload, container, workload_type
     )
-    j = query_prometheus(query)
-
-    if j["data"]["result"] == []:
-        return False
-
-    if float(j["data"]["result"][0]["value"][1]) > 0:
-        return True
-
-    return False
 
 
 @beartype
@@ -1145,6 +3700,7 @@ def optimize_deployment(
     lookback_minutes=DEFAULT_LOOKBACK_MINUTES,
     offset_minutes=DEFAULT_OFFSET_MINUTES,
     dry_run=True,
+    two_tier=TWO_TIER_MODE,
 ) -> V1Deployment:
     """
     Optimize the resources (CPU and memory) for containers in a deployment.
@@ -1153,6 +3709,7 @@ def optimize_deployment(
         deployment (V1Deployment): The Kubernetes deployment object to be optimized.
         dry_run (bool, optional): If True, the optimization changes will be simulated (dry-run mode).
                                  If False, the changes will be applied. Default is True.
+        two_tier (bool, optional): If True, containers which can not change are skipped early. Default is TWO_TIER_MODE.
 
     Returns:
         V1Deployment: The optimized Kubernetes deployment object.
@@ -1161,19 +3718,63 @@ def optimize_deployment(
         deployment = get_deployment_by_name("my-namespace", "my-deployment")
         optimized_deployment = optimize_deployment(deployment, dry_run=True)
     """
-    apis_api = client.AppsV1Api()
+    work = prepare_deployment(
+        deployment,
+        container_pattern,
+        lookback_minutes,
+        offset_minutes,
+        # the forecast is only part of the prefetched metrics
+        fetch_metrics=settings().FORECAST_MODE,
+        two_tier=two_tier,
+    )
+    if work is None:
+        return deployment
+    compute_deployment(work)
+    apply_deployment(work, dry_run)
+    return deployment
+
+
+@beartype
+def prepare_deployment(
+    deployment: V1Deployment,
+    container_pattern: str = CONTAINER_PATTERN,
+    lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
+    offset_minutes: int = DEFAULT_OFFSET_MINUTES,
+    fetch_metrics: bool = True,
+    two_tier: bool = TWO_TIER_MODE,
+) -> Optional[dict]:
+    """
+    Collect everything needed to optimize a deployment (fetch stage).
+
+    Args:
+        deployment (V1Deployment): The Kubernetes deployment object to be optimized.
+        container_pattern (str, optional): A regular expression pattern to filter containers. Default is CONTAINER_PATTERN.
+        lookback_minutes (int, optional): The number of minutes to look back in time for the query. Default is DEFAULT_LOOKBACK_MINUTES.
+        offset_minutes (int, optional): The offset in minutes for the query. Default is DEFAULT_OFFSET_MINUTES.
+        fetch_metrics (bool, optional): If True, the container metrics are fetched from prometheus now,
+                                        otherwise they are fetched while computing. Default is True.
+        two_tier (bool, optional): If True, containers which can not change according to the
+                                   batched namespace query are skipped. Default is TWO_TIER_MODE.
+
+    Returns:
+        Optional[dict]: The work item for compute_deployment, or None if the deployment is skipped.
+
+    Example:
+        work = prepare_deployment(deployment)
+        compute_deployment(work)
+        apply_deployment(work, dry_run=True)
+    """
     namespace_name = deployment.metadata.namespace
     deployment_name = deployment.metadata.name
 
     extra = {"namespace": namespace_name, "deployment": deployment_name}
-    _logger.addFilter(AppFilter(extra))
-    # _logger = logging.LoggerAdapter(_logger, extra)
+    set_log_context(extra)
 
     _logger.info("Optimizing deployment: %s" % deployment_name)
 
     if deployment.spec.replicas == 0:
         _logger.warn("Skipping deployment due to zero replicas: %s" % deployment_name)
-        return deployment
+        return None
 
     old_resources = get_resources_from_deployment(deployment)
     lookback_minutes = DEFAULT_LOOKBACK_MINUTES
@@ -1191,7 +3792,11 @@ def optimize_deployment(
     _logger.debug(
         "target_quantile_over_time memory: %s" % target_quantile_over_time["memory"]
     )
-    changed = False
+
+    bounds = usage_bounds.get(namespace_name) if two_tier else None
+
+    containers = {}
+    skipped = []
     for i, container in enumerate(deployment.spec.template.spec.containers):
         container_name = container.name
         extra = {
@@ -1199,7 +3804,7 @@ def optimize_deployment(
             "deployment": deployment_name,
             "container": container_name,
         }
-        _logger.addFilter(AppFilter(extra))
+        set_log_context(extra)
 
         _logger.debug("Filtering containers using pattern: %s" % container_pattern)
         x = re.search(container_pattern, container_name)
@@ -1209,50 +3814,185 @@ def optimize_deployment(
             )
             continue
 
+        if bounds is not None and not screen_container(
+            container,
+            bounds.row(
+                frame.container_key(namespace_name, deployment_name, container_name)
+            ),
+            target_replicas,
+            target_quantile_over_time,
+        ):
+            _logger.info(
+                "Skipping container as the change is below CHANGE_THRESHOLD: %s"
+                % container_name
+            )
+            skipped.append(i)
+            continue
+
+        metrics = None
+        if fetch_metrics:
+            metrics = fetch_container_metrics(
+                namespace_name,
+                deployment_name,
+                "deployment",
+                container_name,
+                lookback_minutes,
+                offset_minutes,
+                target_quantile_over_time["cpu"],
+                target_quantile_over_time["memory"],
+            )
+        containers[i] = metrics
+
+    extra = {"namespace": namespace_name, "deployment": deployment_name}
+    set_log_context(extra)
+
+    return {
+        "deployment": deployment,
+        "old_resources": old_resources,
+        "target_replicas": target_replicas,
+        "quantile_over_time": target_quantile_over_time,
+        "lookback_minutes": lookback_minutes,
+        "offset_minutes": offset_minutes,
+        "containers": containers,
+        "skipped": skipped,
+        "changed": False,
+    }
+
+
+@beartype
+def compute_deployment(work: dict) -> bool:
+    """
+    Compute the new resources of all containers of a deployment (compute stage).
+
+    The containers of the deployment are updated in place.
+
+    Args:
+        work (dict): The work item returned by prepare_deployment.
+
+    Returns:
+        bool: True if any container was changed, False otherwise.
+
+    Example:
+        changed = compute_deployment(prepare_deployment(deployment))
+    """
+    deployment = work["deployment"]
+    namespace_name = deployment.metadata.namespace
+    deployment_name = deployment.metadata.name
+
+    target_replicas = work["target_replicas"]
+    for i in work.get("skipped", []):
+        container = deployment.spec.template.spec.containers[i]
+        old_cpu = get_cpu_requests_from_container(container)
+        old_memory = get_memory_requests_from_container(container)
+        old_memory_limit = get_memory_limits_from_container(container)
+        for name, value in [
+            ("cpu_sum", old_cpu),
+            ("memory_sum", old_memory),
+            ("memory_limits_sum", old_memory_limit),
+        ]:
+            stats.add("old_" + name, value * target_replicas)
+            stats.add("new_" + name, value * target_replicas)
+
+    # compute the prefetched containers at once with the vectorized engine
+    prefetched = [i for i, metrics in work["containers"].items() if metrics is not None]
+    computed = {}
+    if prefetched:
+        batch = compute_resources_batch(
+            [work["containers"][i] for i in prefetched],
+            [target_replicas] * len(prefetched),
+            [deployment.spec.template.spec.containers[i] for i in prefetched],
+        )
+        for j, i in enumerate(prefetched):
+            computed[i] = {
+                name: batch["computed_" + name][j]
+                for name in ["cpu", "memory", "memory_limits"]
+            }
+
+    changed = False
+    for i, metrics in work["containers"].items():
+        container = deployment.spec.template.spec.containers[i]
+        if i in computed:
+            metrics = dict(metrics, resources=computed[i])
+        extra = {
+            "namespace": namespace_name,
+            "deployment": deployment_name,
+            "container": container.name,
+        }
+        set_log_context(extra)
+
         container_new, changed_container = optimize_container(
             namespace_name,
             deployment_name,
             container,
             "deployment",
-            target_quantile_over_time["cpu"],
-            target_quantile_over_time["memory"],
-            target_replicas,
-            lookback_minutes,
-            offset_minutes,
+            work["quantile_over_time"]["cpu"],
+            work["quantile_over_time"]["memory"],
+            work["target_replicas"],
+            work["lookback_minutes"],
+            work["offset_minutes"],
+            metrics,
         )
         if changed_container:
             changed = True
         deployment.spec.template.spec.containers[i] = container_new
 
     extra = {"namespace": namespace_name, "deployment": deployment_name}
-    _logger.addFilter(AppFilter(extra))
-
-    if changed:
-        deployment.metadata.annotations[
-            "k8soptimizer.{}/old-resources".format(__domain__)
-        ] = json.dumps(old_resources)
-        deployment.metadata.annotations[
-            "k8soptimizer.{}/last-update".format(__domain__)
-        ] = helpers.create_timestamp()
-
-        # Apply the changes
-        if dry_run is True:
-            _logger.info("Updating (dry-run) deployment: %s" % deployment_name)
-            apis_api.patch_namespaced_deployment(
-                deployment_name,
-                namespace_name,
-                deployment,
-                pretty=True,
-                dry_run="All",
-            )
-        else:
-            _logger.info("Updating deployment: %s" % deployment_name)
-            apis_api.patch_namespaced_deployment(
-                deployment_name, namespace_name, deployment, pretty=True
-            )
-    else:
+    set_log_context(extra)
+
+    work["changed"] = changed
+    return changed
+
+
+@beartype
+def apply_deployment(work: dict, dry_run: bool = True) -> bool:
+    """
+    Patch a deployment if its resources were changed (apply stage).
+
+    Args:
+        work (dict): The work item after compute_deployment.
+        dry_run (bool, optional): If True, the changes will be simulated. Default is True.
+
+    Returns:
+        bool: True if the deployment was patched, False otherwise.
+
+    Example:
+        apply_deployment(work, dry_run=False)
+    """
+    apis_api = client.AppsV1Api(get_api_client())
+    deployment = work["deployment"]
+    namespace_name = deployment.metadata.namespace
+    deployment_name = deployment.metadata.name
+
+    extra = {"namespace": namespace_name, "deployment": deployment_name}
+    set_log_context(extra)
+
+    if not work["changed"]:
         _logger.info("Nothing changed deployment: %s" % deployment_name)
-    return deployment
+        return False
+
+    deployment.metadata.annotations[
+        "k8soptimizer.{}/old-resources".format(__domain__)
+    ] = json.dumps(work["old_resources"])
+    deployment.metadata.annotations[
+        "k8soptimizer.{}/last-update".format(__domain__)
+    ] = helpers.create_timestamp()
+
+    # Apply the changes
+    if dry_run is True:
+        _logger.info("Updating (dry-run) deployment: %s" % deployment_name)
+        apis_api.patch_namespaced_deployment(
+            deployment_name,
+            namespace_name,
+            deployment,
+            pretty=True,
+            dry_run="All",
+        )
+    else:
+        _logger.info("Updating deployment: %s" % deployment_name)
+        apis_api.patch_namespaced_deployment(
+            deployment_name, namespace_name, deployment, pretty=True
+        )
+    return True
 
 
 @beartype
@@ -1266,6 +4006,7 @@ def optimize_container(
     target_repliacs: int = 1,
     lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
     offset_minutes: int = DEFAULT_OFFSET_MINUTES,
+    metrics: Optional[dict] = None,
 ) -> Tuple[V1Container, bool]:
     """
     Optimize resources (CPU and memory) for a container.
@@ -1279,6 +4020,7 @@ def optimize_container(
         quantile_over_time_memory (float, optional): The quantile value for the query. Default is DEFAULT_QUANTILE_OVER_TIME.
         lookback_minutes (int, optional): The number of minutes to look back in time for the query. Default is DEFAULT_LOOKBACK_MINUTES.
         offset_minutes (int, optional): The offset in minutes for the query. Default is DEFAULT_OFFSET_MINUTES.
+        metrics (Optional[dict], optional): Metrics from fetch_container_metrics, if None they are queried now. Default is None.
 
     Returns:
         V1Container: The optimized Kubernetes container object.
@@ -1305,6 +4047,7 @@ def optimize_container(
         lookback_minutes,
         offset_minutes,
         quantile_over_time_cpu,
+        metrics,
     )
     old_memory = get_memory_requests_from_container(container)
     new_memory, changed_memory = optimize_container_memory_requests(
@@ -1316,6 +4059,7 @@ def optimize_container(
         lookback_minutes,
         offset_minutes,
         quantile_over_time_memory,
+        metrics,
     )
     old_memory_limit = get_memory_limits_from_container(container)
     new_memory_limit, changed_memory_limit = optimize_container_memory_limits(
@@ -1326,47 +4070,329 @@ def optimize_container(
         target_repliacs,
         lookback_minutes,
         offset_minutes,
+        metrics,
     )
 
     if changed_cpu:
-        stats["new_cpu_sum"] += new_cpu * target_repliacs
+        stats.add("new_cpu_sum", new_cpu * target_repliacs)
     else:
-        stats["new_cpu_sum"] += old_cpu * target_repliacs
+        stats.add("new_cpu_sum", old_cpu * target_repliacs)
 
     if changed_memory:
-        stats["new_memory_sum"] += new_memory * target_repliacs
+        stats.add("new_memory_sum", new_memory * target_repliacs)
     else:
-        stats["new_memory_sum"] += old_memory * target_repliacs
+        stats.add("new_memory_sum", old_memory * target_repliacs)
 
     if changed_memory_limit:
-        stats["new_memory_limits_sum"] += new_memory_limit * target_repliacs
+        stats.add("new_memory_limits_sum", new_memory_limit * target_repliacs)
     else:
-        stats["new_memory_limits_sum"] += old_memory_limit * target_repliacs
+        stats.add("new_memory_limits_sum", old_memory_limit * target_repliacs)
 
-    stats["old_cpu_sum"] += old_cpu * target_repliacs
-    stats["old_memory_sum"] += old_memory * target_repliacs
-    stats["old_memory_limits_sum"] += old_memory_limit * target_repliacs
+    stats.add("old_cpu_sum", old_cpu * target_repliacs)
+    stats.add("old_memory_sum", old_memory * target_repliacs)
+    stats.add("old_memory_limits_sum", old_memory_limit * target_repliacs)
 
     container.resources.requests["cpu"] = str(round(new_cpu * 1000)) + "m"
-    if "cpu" in container.resources.limits:
-        del container.resources.limits["cpu"]
-        changed_cpu_limit = True
-    else:
-        changed_cpu_limit = False
+    changed_cpu_limit = set_cpu_limits(container, get_cpu_limits(container, new_cpu))
     container.resources.requests["memory"] = str(round(new_memory / 1024 / 1024)) + "Mi"
     container.resources.limits["memory"] = (
         str(round(new_memory_limit / 1024 / 1024)) + "Mi"
     )
 
+    if settings().PROFILE_MODE:
+        report_schedule(
+            namespace_name,
+            workload,
+            container_name,
+            workload_type,
+            target_repliacs,
+            metrics["runtime"] if metrics is not None else None,
+        )
+
+    changed_env = False
+    if settings().RUNTIME_TUNING_MODE and (changed_cpu or changed_memory_limit):
+        if metrics is not None:
+            runtime = metrics["runtime"]
+        else:
+            runtime = discover_container_runtime(
+                namespace_name, workload, container_name, workload_type
+            )
+        changed_env = tune_container_runtime(
+            container, runtime, new_cpu, new_memory_limit
+        )
+
     _logger.debug(
-        [changed_cpu, changed_cpu_limit, changed_memory, changed_memory_limit]
+        [
+            changed_cpu,
+            changed_cpu_limit,
+            changed_memory,
+            changed_memory_limit,
+            changed_env,
+        ]
     )
 
     return container, any(
-        [changed_cpu, changed_cpu_limit, changed_memory, changed_memory_limit]
+        [
+            changed_cpu,
+            changed_cpu_limit,
+            changed_memory,
+            changed_memory_limit,
+            changed_env,
+        ]
     )
 
 
+@beartype
+def get_cpu_limits(
+    container: V1Container, cpu_requests: Optional[Union[int, float]] = None
+) -> Optional[str]:
+    """
+    Get the cpu limits of a container, as they are or as set by CPU_LIMITS_POLICY for new requests.
+
+    Kept limits are raised to the new requests if they are lower.
+
+    Args:
+        container (V1Container): The Kubernetes container object.
+        cpu_requests (Optional[float], optional): The new cpu requests in cores, the current limits if None. Default is None.
+
+    Returns:
+        Optional[str]: The cpu limits, None without limits.
+
+    Raises:
+        ValueError: If CPU_LIMITS_POLICY is not remove, keep or ratio.
+
+    Example:
+        limits = get_cpu_limits(container, 0.5)
+    """
+    limits = None
+    if container.resources is not None:
+        limits = (container.resources.limits or {}).get("cpu")
+    if limits is not None:
+        limits = str(round(helpers.convert_cpu_request_to_cores(limits) * 1000)) + "m"
+    if cpu_requests is None:
+        return limits
+    cfg = settings()
+    if cfg.CPU_LIMITS_POLICY == "remove":
+        return None
+    if cfg.CPU_LIMITS_POLICY == "keep":
+        # limits below the requests are rejected, e.g. after a throttling boost
+        if (
+            limits is not None
+            and helpers.convert_cpu_request_to_cores(limits) < cpu_requests
+        ):
+            return str(round(cpu_requests * 1000)) + "m"
+        return limits
+    if cfg.CPU_LIMITS_POLICY == "ratio":
+        return str(round(cpu_requests * cfg.CPU_LIMIT_RATIO * 1000)) + "m"
+    raise ValueError("Invalid cpu limits policy: {}".format(cfg.CPU_LIMITS_POLICY))
+
+
+@beartype
+def set_cpu_limits(container: V1Container, limits: Optional[str]) -> bool:
+    """
+    Set or remove the cpu limits of a container.
+
+    Args:
+        container (V1Container): The Kubernetes container object.
+        limits (Optional[str]): The cpu limits, None to remove them.
+
+    Returns:
+        bool: True if the limits were changed, False otherwise.
+
+    Example:
+        changed = set_cpu_limits(container, "1000m")
+    """
+    if limits == get_cpu_limits(container):
+        return False
+    if container.resources.limits is None:
+        container.resources.limits = {}
+    if limits is None:
+        del container.resources.limits["cpu"]
+        _logger.info("CPU limits removed")
+    else:
+        container.resources.limits["cpu"] = limits
+        _logger.info("CPU limits change: %s" % limits)
+    return True
+
+
+@beartype
+def set_container_env(container: V1Container, name: str, value: str) -> bool:
+    """
+    Set an env var of a container, env vars from a reference are left alone.
+
+    Args:
+        container (V1Container): The Kubernetes container object.
+        name (str): The name of the env var.
+        value (str): The new value.
+
+    Returns:
+        bool: True if the env var was changed, False otherwise.
+
+    Example:
+        changed = set_container_env(container, "GOMAXPROCS", "2")
+    """
+    if container.env is None:
+        container.env = []
+    for env in container.env:
+        if env.name != name:
+            continue
+        if env.value_from is not None:
+            _logger.info("Skipping env var %s set from a reference" % name)
+            return False
+        if env.value == value:
+            return False
+        _logger.info("Env var change: {}: {} -> {}".format(name, env.value, value))
+        env.value = value
+        return True
+    _logger.info("Env var change: {}: -> {}".format(name, value))
+    container.env.append(V1EnvVar(name=name, value=value))
+    return True
+
+
+@beartype
+def replace_options(options: Optional[str], prefixes: list, new_options: list) -> str:
+    """
+    Replace the options starting with one of the prefixes in a space separated option string.
+
+    Args:
+        options (Optional[str]): The current options, e.g. "--max-old-space-size=512 --enable-source-maps".
+        prefixes (list): The prefixes of the options to replace.
+        new_options (list): The options to append.
+
+    Returns:
+        str: The new options.
+
+    Example:
+        options = replace_options("-Xmx1g -Dfoo=bar", ["-Xmx"], ["-Xmx512m"])
+    """
+    kept = [
+        option
+        for option in (options or "").split()
+        if not any(option.startswith(prefix) for prefix in prefixes)
+    ]
+    return " ".join(kept + new_options)
+
+
+@beartype
+def convert_jvm_size_to_bytes(size: str) -> Optional[int]:
+    """
+    Convert a JVM memory size, e.g. of -Xms, to bytes.
+
+    Args:
+        size (str): The size with an optional k, m, g or t suffix, e.g. "512m".
+
+    Returns:
+        Optional[int]: The size in bytes, None if it is not a valid size.
+
+    Example:
+        size = convert_jvm_size_to_bytes("2g")  # 2147483648
+    """
+    x = re.fullmatch(r"(\d+)([kKmMgGtT]?)", size)
+    if x is None:
+        return None
+    exponent = {"": 0, "k": 1, "m": 2, "g": 3, "t": 4}[x.group(2).lower()]
+    return int(x.group(1)) * 1024**exponent
+
+
+@beartype
+def cap_jvm_initial_heap(options: str, heap_mib: int) -> str:
+    """
+    Lower an initial heap size (-Xms) above the new maximum heap size to it.
+
+    The JVM does not start with an initial heap larger than -Xmx.
+
+    Args:
+        options (str): The JVM options, e.g. of JAVA_TOOL_OPTIONS.
+        heap_mib (int): The new maximum heap size in MiB.
+
+    Returns:
+        str: The options with the capped initial heap size.
+
+    Example:
+        options = cap_jvm_initial_heap("-Xms2g -Xmx1024m", 1024)  # -Xms1024m -Xmx1024m
+    """
+    capped = []
+    for option in options.split():
+        if option.startswith("-Xms"):
+            size = convert_jvm_size_to_bytes(option[len("-Xms") :])
+            if size is None or size > heap_mib * 1024**2:
+                option = "-Xms{}m".format(heap_mib)
+        capped.append(option)
+    return " ".join(capped)
+
+
+@beartype
+def get_container_env(container: V1Container, name: str) -> Optional[str]:
+    for env in container.env or []:
+        if env.name == name:
+            return env.value
+    return None
+
+
+@beartype
+def tune_container_runtime(
+    container: V1Container,
+    runtime: Optional[str],
+    cpu_requests: Union[int, float],
+    memory_limits: int,
+) -> bool:
+    """
+    Size the runtime of a container to its new resources with env vars.
+
+    Go gets GOMAXPROCS and GOMEMLIMIT, Node.js the old space size in
+    NODE_OPTIONS and the JVM the heap size and processor count in
+    JAVA_TOOL_OPTIONS. Other options in NODE_OPTIONS and JAVA_TOOL_OPTIONS
+    are kept, an initial heap size above the new heap size is lowered to it.
+
+    Args:
+        container (V1Container): The Kubernetes container object.
+        runtime (Optional[str]): The runtime from discover_container_runtime.
+        cpu_requests (float): The new cpu requests in cores.
+        memory_limits (int): The new memory limits in bytes.
+
+    Returns:
+        bool: True if an env var was changed, False otherwise.
+
+    Example:
+        changed = tune_container_runtime(container, "go", 0.5, 512 * 1024**2)
+    """
+    processors = str(max(1, math.ceil(cpu_requests)))
+    cfg = settings()
+    heap_mib = max(1, round(memory_limits * cfg.RUNTIME_TUNING_HEAP_RATIO / 1024**2))
+
+    if runtime == "go":
+        gomemlimit_mib = max(
+            1, round(memory_limits * cfg.RUNTIME_TUNING_GOMEMLIMIT_RATIO / 1024**2)
+        )
+        changed_procs = set_container_env(container, "GOMAXPROCS", processors)
+        changed_memory = set_container_env(
+            container, "GOMEMLIMIT", "{}MiB".format(gomemlimit_mib)
+        )
+        return changed_procs or changed_memory
+
+    if runtime == "nodejs":
+        options = replace_options(
+            get_container_env(container, "NODE_OPTIONS"),
+            ["--max-old-space-size"],
+            ["--max-old-space-size={}".format(heap_mib)],
+        )
+        return set_container_env(container, "NODE_OPTIONS", options)
+
+    if runtime == "jvm":
+        options = replace_options(
+            get_container_env(container, "JAVA_TOOL_OPTIONS"),
+            ["-Xmx", "-XX:MaxRAMPercentage", "-XX:ActiveProcessorCount"],
+            [
+                "-Xmx{}m".format(heap_mib),
+                "-XX:ActiveProcessorCount={}".format(processors),
+            ],
+        )
+        options = cap_jvm_initial_heap(options, heap_mib)
+        return set_container_env(container, "JAVA_TOOL_OPTIONS", options)
+
+    return False
+
+
 @beartype
 def get_cpu_requests_from_container(container: V1Container) -> float:
     """
@@ -1449,6 +4475,7 @@ def optimize_container_cpu_requests(
     lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
     offset_minutes: int = DEFAULT_OFFSET_MINUTES,
     quantile_over_time: float = DEFAULT_QUANTILE_OVER_TIME,
+    metrics: Optional[dict] = None,
 ) -> Tuple[float, bool]:
     """
     Optimize CPU requests for a Kubernetes container.
@@ -1460,6 +4487,7 @@ def optimize_container_cpu_requests(
         workload_type (str, optional): The type of workload. Defaults to "deployment".
         target_ratio (float, optional): The target ratio for CPU optimization. Defaults to 1.
         lookback_minutes (int, optional): The number of minutes to look back for resource usage data. Defaults to DEFAULT_LOOKBACK_MINUTES.
+        metrics (Optional[dict], optional): Metrics from fetch_container_metrics, if None they are queried now. Defaults to None.
 
     Returns:
         float: The new CPU request in cores.
@@ -1483,20 +4511,33 @@ def optimize_container_cpu_requests(
         _logger.info("Could not read old CPU requests aassuming it is 0.001")
         old_cpu = 0.001
 
-    new_cpu = calculate_cpu_requests(
-        namespace_name,
-        workload,
-        workload_type,
-        container_name,
-        target_replicas,
-        lookback_minutes,
-        offset_minutes,
-        quantile_over_time,
-    )
+    if metrics is None:
+        new_cpu = calculate_cpu_requests(
+            namespace_name,
+            workload,
+            workload_type,
+            container_name,
+            target_replicas,
+            lookback_minutes,
+            offset_minutes,
+            quantile_over_time,
+        )
+    elif "resources" in metrics:
+        # computed for the whole deployment, see compute_deployment
+        new_cpu = metrics["resources"]["cpu"]
+    else:
+        new_cpu = compute_cpu_requests(
+            metrics["cpu_history"],
+            metrics["cpu_trend"],
+            target_replicas,
+            metrics["runtime"],
+            metrics.get("cpu_throttling", 0.0),
+            metrics.get("cpu_pressure", 0.0),
+        )
     _logger.debug("New cpu request: %s", new_cpu)
 
     diff_cpu = round(((new_cpu / old_cpu) - 1) * 100)
-    change_too_small = abs(diff_cpu) < CHANGE_THRESHOLD * 100
+    change_too_small = abs(diff_cpu) < settings().CHANGE_THRESHOLD * 100
 
     if change_too_small:
         _logger.info("CPU requests change is too small: {}%".format(diff_cpu))
@@ -1523,6 +4564,7 @@ def optimize_container_memory_requests(
     lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
     offset_minutes: int = DEFAULT_OFFSET_MINUTES,
     quantile_over_time: float = DEFAULT_QUANTILE_OVER_TIME,
+    metrics: Optional[dict] = None,
 ) -> Tuple[int, bool]:
     """
     Optimize memory requests for a Kubernetes container.
@@ -1535,6 +4577,7 @@ def optimize_container_memory_requests(
         target_ratio (float, optional): The target ratio for memory optimization. Defaults to 1.
         lookback_minutes (int, optional): The number of minutes to look back for resource usage data. Defaults to DEFAULT_LOOKBACK_MINUTES.
         offset_minutes (int, optional): The number of minutes to look back for resource usage data. Defaults to offset_minutes.
+        metrics (Optional[dict], optional): Metrics from fetch_container_metrics, if None they are queried now. Defaults to None.
 
     Returns:
         int: The new memory request in bytes.
@@ -1558,20 +4601,30 @@ def optimize_container_memory_requests(
         _logger.info("Could not read old meory requests aassuming it is 1")
         old_memory = 1
 
-    new_memory = calculate_memory_requests(
-        namespace_name,
-        workload,
-        workload_type,
-        container_name,
-        target_replicas,
-        lookback_minutes,
-        offset_minutes,
-        quantile_over_time,
-    )
+    if metrics is None:
+        new_memory = calculate_memory_requests(
+            namespace_name,
+            workload,
+            workload_type,
+            container_name,
+            target_replicas,
+            lookback_minutes,
+            offset_minutes,
+            quantile_over_time,
+        )
+    elif "resources" in metrics:
+        new_memory = metrics["resources"]["memory"]
+    else:
+        new_memory = compute_memory_requests(
+            metrics["memory_history"],
+            metrics["memory_trend"],
+            metrics["oom_killed"],
+            metrics.get("memory_pressure", 0.0),
+        )
     _logger.debug("New memory request: %s", new_memory)
 
     diff_memory = round(((new_memory / old_memory) - 1) * 100)
-    change_too_small = abs(diff_memory) < CHANGE_THRESHOLD * 100
+    change_too_small = abs(diff_memory) < settings().CHANGE_THRESHOLD * 100
 
     if change_too_small:
         _logger.info("Memory request change is too small: {}%".format(diff_memory))
@@ -1596,6 +4649,7 @@ def optimize_container_memory_limits(
     target_replicas: int = 1,
     lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
     offset_minutes: int = DEFAULT_OFFSET_MINUTES,
+    metrics: Optional[dict] = None,
 ) -> Tuple[int, bool]:
     """
     Optimize memory limits for a Kubernetes container.
@@ -1606,6 +4660,7 @@ def optimize_container_memory_limits(
         container (V1Container): The Kubernetes container object.
         workload_type (str, optional): The type of workload. Defaults to "deployment".
         new_memory (int, optional): The new memory request in bytes. Defaults to MIN_MEMORY_REQUEST.
+        metrics (Optional[dict], optional): Metrics from fetch_container_metrics, if None they are queried now. Defaults to None.
 
     Returns:
         int: The new memory limit in bytes.
@@ -1629,20 +4684,30 @@ def optimize_container_memory_limits(
         _logger.info("Could not read old meory limits aassuming it is 1")
         old_memory_limit = 1
 
-    new_memory_limit = calculate_memory_limits(
-        namespace_name,
-        workload,
-        workload_type,
-        container_name,
-        target_replicas,
-        lookback_minutes,
-        offset_minutes,
-    )
+    if metrics is None:
+        new_memory_limit = calculate_memory_limits(
+            namespace_name,
+            workload,
+            workload_type,
+            container_name,
+            target_replicas,
+            lookback_minutes,
+            offset_minutes,
+        )
+    elif "resources" in metrics:
+        new_memory_limit = metrics["resources"]["memory_limits"]
+    else:
+        new_memory_limit = compute_memory_limits(
+            metrics["memory_limits_history"],
+            metrics["memory_trend"],
+            metrics["oom_killed"],
+            metrics.get("memory_pressure", 0.0),
+        )
 
     _logger.debug("New memory linmit: %s", new_memory_limit)
     diff_memory_limit = round(((new_memory_limit / old_memory_limit) - 1) * 100)
 
-    change_too_small = abs(diff_memory_limit) < CHANGE_THRESHOLD * 100
+    change_too_small = abs(diff_memory_limit) < settings().CHANGE_THRESHOLD * 100
 
     if change_too_small:
         _logger.info("Memory limit change is too small: {}%".format(diff_memory_limit))
@@ -1659,46 +4724,857 @@ def optimize_container_memory_limits(
     return int(new_memory_limit), not change_too_small
 
 
-def print_stats():
-    if stats["old_cpu_sum"] > 0 and stats["new_cpu_sum"] > 0:
-        diff_cpu_sum = round(((stats["new_cpu_sum"] / stats["old_cpu_sum"]) - 1) * 100)
+@beartype
+def get_usage_by_container(
+    metric: str,
+    lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
+    quantile_over_time: float = DEFAULT_QUANTILE_OVER_TIME,
+    workload_type: str = "deployment",
+    metric_frame: Optional[frame.MetricFrame] = None,
+    column: str = "usage",
+) -> frame.MetricFrame:
+    """
+    Get the recent usage of all containers in the cluster with one query.
+
+    Args:
+        metric (str): The usage metric, e.g. "kube_workload_container_resource_usage_cpu_cores_avg".
+        lookback_minutes (int, optional): The number of minutes to look back in time for the query. Default is DEFAULT_LOOKBACK_MINUTES.
+        quantile_over_time (float, optional): The quantile value for the query. Default is DEFAULT_QUANTILE_OVER_TIME.
+        workload_type (str, optional): The type of workload. Default is "deployment".
+        metric_frame (Optional[frame.MetricFrame], optional): The frame to add the usage to, a new one if None. Default is None.
+        column (str, optional): The column of the usage. Default is "usage".
+
+    Returns:
+        frame.MetricFrame: The usage of each container.
+
+    Example:
+        usage = get_usage_by_container("kube_workload_container_resource_usage_cpu_cores_avg", column="cpu")
+    """
+    query = 'max by (namespace, workload, container) (quantile_over_time({quantile_over_time}, {metric}{{workload_type="{workload_type}"}}[{lookback_minutes}m]))'.format(
+        quantile_over_time=quantile_over_time,
+        metric=metric,
+        workload_type=workload_type,
+        lookback_minutes=lookback_minutes,
+    )
+    j = query_prometheus(query)
+
+    if metric_frame is None:
+        metric_frame = frame.MetricFrame()
+    metric_frame.add_results(
+        j["data"]["result"], column=column, workload_type=workload_type
+    )
+    return metric_frame
+
+
+@beartype
+def estimate_deployment_savings(
+    deployment: V1Deployment,
+    usage: frame.MetricFrame,
+    memory_gib_weight: float = SAVINGS_MEMORY_GIB_WEIGHT,
+) -> float:
+    """
+    Estimate the savings of optimizing a deployment from its requests and recent usage.
+
+    The savings are the requests minus the usage of all replicas, in cpu cores
+    plus the memory in GiB weighted by memory_gib_weight. Containers without
+    usage data are not counted.
+
+    Args:
+        deployment (V1Deployment): The Kubernetes deployment object.
+        usage (frame.MetricFrame): The recent usage with the columns "cpu" (cores) and "memory" (bytes).
+        memory_gib_weight (float, optional): Cost of one GiB relative to one cpu core. Default is SAVINGS_MEMORY_GIB_WEIGHT.
+
+    Returns:
+        float: The estimated savings, negative if the deployment is under-provisioned.
+
+    Example:
+        savings = estimate_deployment_savings(deployment, usage)
+    """
+    replicas = deployment.spec.replicas or 0
+    savings = 0.0
+    for container in deployment.spec.template.spec.containers:
+        row = usage.id_of(
+            frame.container_key(
+                deployment.metadata.namespace, deployment.metadata.name, container.name
+            )
+        )
+        if row is None:
+            continue
+        cpu = usage.get(row, "cpu")
+        if cpu is not None:
+            savings += get_cpu_requests_from_container(container) - cpu
+        memory = usage.get(row, "memory")
+        if memory is not None:
+            savings += (
+                (get_memory_requests_from_container(container) - memory)
+                / 1024**3
+                * memory_gib_weight
+            )
+    return savings * replicas
+
+
+def rank_deployments_by_savings(
+    deployments: Iterable[V1Deployment],
+    lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
+) -> list:
+    """
+    Sort deployments by their estimated savings, biggest savings first.
+
+    The usage of all containers is fetched with one cluster-wide query per
+    resource instead of the detailed per container queries.
+
+    Args:
+        deployments (Iterable[V1Deployment]): The deployments to sort.
+        lookback_minutes (int, optional): The number of minutes of recent usage. Default is DEFAULT_LOOKBACK_MINUTES.
+
+    Returns:
+        list: The deployments in descending order of estimated savings.
+
+    Example:
+        deployments = rank_deployments_by_savings(iter_deployments("my-namespace.*"))
+    """
+    usage = frame.MetricFrame(["cpu", "memory"])
+    get_usage_by_container(
+        "kube_workload_container_resource_usage_cpu_cores_avg",
+        lookback_minutes,
+        metric_frame=usage,
+        column="cpu",
+    )
+    get_usage_by_container(
+        "kube_workload_container_resource_usage_memory_bytes_max",
+        lookback_minutes,
+        metric_frame=usage,
+        column="memory",
+    )
+    savings = [
+        (estimate_deployment_savings(deployment, usage), deployment)
+        for deployment in deployments
+    ]
+    savings.sort(key=lambda item: item[0], reverse=True)
+    for value, deployment in savings[:10]:
+        _logger.debug(
+            "Estimated savings of %s/%s: %s"
+            % (deployment.metadata.namespace, deployment.metadata.name, value)
+        )
+    return [deployment for _, deployment in savings]
+
+
+@beartype
+def in_shard(
+    namespace_name: str,
+    deployment_name: Optional[str] = None,
+    shard_index: int = SHARD_INDEX,
+    shard_count: int = SHARD_COUNT,
+    shard_by: str = SHARD_BY,
+) -> bool:
+    """
+    Check if a namespace or deployment belongs to the given shard.
+
+    With shard_by "namespace" whole namespaces are assigned to shards, with
+    "deployment" the single deployments. A namespace is in every shard when
+    sharding by deployment (deployment_name is None).
+
+    Args:
+        namespace_name (str): The name of the namespace.
+        deployment_name (str, optional): The name of the deployment. Default is None.
+        shard_index (int, optional): The shard of this instance. Default is SHARD_INDEX.
+        shard_count (int, optional): The number of shards. Default is SHARD_COUNT.
+        shard_by (str, optional): "namespace" or "deployment". Default is SHARD_BY.
+
+    Returns:
+        bool: True if the namespace or deployment belongs to the shard.
+
+    Raises:
+        ValueError: If shard_by is invalid.
+
+    Example:
+        if in_shard("my-namespace", shard_index=0, shard_count=4):
+            optimize_namespace("my-namespace")
+    """
+    if shard_count <= 1:
+        return True
+    if shard_by == "namespace":
+        key = namespace_name
+    elif shard_by == "deployment":
+        if deployment_name is None:
+            return True
+        key = "{}/{}".format(namespace_name, deployment_name)
+    else:
+        raise ValueError("Invalid shard_by. Use 'namespace' or 'deployment'.")
+    return helpers.get_shard(key, shard_count) == shard_index
+
+
+def filter_shard(
+    deployments: Iterable[V1Deployment],
+    shard_index: int = SHARD_INDEX,
+    shard_count: int = SHARD_COUNT,
+    shard_by: str = SHARD_BY,
+) -> list:
+    if shard_count <= 1:
+        return list(deployments)
+    return [
+        deployment
+        for deployment in deployments
+        if in_shard(
+            deployment.metadata.namespace,
+            deployment.metadata.name,
+            shard_index,
+            shard_count,
+            shard_by,
+        )
+    ]
+
+
+def iter_deployments(
+    namespace_pattern: str = ".*",
+    deplopyment_pattern: str = ".*",
+    shard_index: int = SHARD_INDEX,
+    shard_count: int = SHARD_COUNT,
+    shard_by: str = SHARD_BY,
+) -> Iterator[V1Deployment]:
+    """
+    Iterate over all deployments in all namespaces matching the specified patterns.
+
+    Only the namespaces or deployments of the given shard are returned, so
+    several instances can split the work without coordination.
+
+    Args:
+        namespace_pattern (str, optional): A regular expression pattern to filter namespaces. Default is ".*".
+        deplopyment_pattern (str, optional): A regular expression pattern to filter deployments. Default is ".*".
+        shard_index (int, optional): The shard of this instance. Default is SHARD_INDEX.
+        shard_count (int, optional): The number of shards. Default is SHARD_COUNT.
+        shard_by (str, optional): "namespace" or "deployment". Default is SHARD_BY.
+
+    Returns:
+        Iterator[V1Deployment]: The deployments, namespace by namespace.
+
+    Example:
+        for deployment in iter_deployments("my-namespace.*"):
+            optimize_deployment(deployment)
+    """
+    shard = (shard_index, shard_count, shard_by)
+    for namespace in get_namespaces(namespace_pattern).items:
+        if not in_shard(namespace.metadata.name, None, *shard):
+            continue
+        extra = {"namespace": namespace.metadata.name}
+        set_log_context(extra)
+        for deployment in filter_shard(
+            get_deployments(namespace.metadata.name, deplopyment_pattern).items,
+            *shard,
+        ):
+            yield deployment
+
+
+def optimize_deployment_safe(
+    deployment: V1Deployment,
+    container_pattern: str = CONTAINER_PATTERN,
+    lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
+    offset_minutes: int = DEFAULT_OFFSET_MINUTES,
+    dry_run: bool = True,
+    two_tier: bool = TWO_TIER_MODE,
+) -> bool:
+    """
+    Optimize a deployment and log errors instead of raising them.
+
+    Returns:
+        bool: True if the deployment was optimized without errors, False otherwise.
+
+    Example:
+        ok = optimize_deployment_safe(deployment, dry_run=True)
+    """
+    try:
+        optimize_deployment(
+            deployment,
+            container_pattern,
+            lookback_minutes,
+            offset_minutes,
+            dry_run,
+            two_tier,
+        )
+        time.sleep(DELAY_BETWEEN_UPDATES)
+        return True
+    except Exception as e:
+        _logger.warning(
+            "An error occurred while optimizing the deployment: %s" % str(e),
+            exc_info=True,
+        )
+        return False
+    finally:
+        set_log_context({})
+
+
+@beartype
+def optimize_deployment_by_key(
+    key: str,
+    container_pattern: str = CONTAINER_PATTERN,
+    lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
+    offset_minutes: int = DEFAULT_OFFSET_MINUTES,
+    dry_run: bool = True,
+):
+    """
+    Read a deployment by its "namespace/name" key and optimize it.
+
+    Errors are raised, so the work queue can retry the deployment with backoff.
+
+    Args:
+        key (str): The namespace and name of the deployment, e.g. "my-namespace/my-deployment".
+        container_pattern (str, optional): A regular expression pattern to filter containers. Default is CONTAINER_PATTERN.
+        lookback_minutes (int, optional): The number of minutes to look back in time for the query. Default is DEFAULT_LOOKBACK_MINUTES.
+        offset_minutes (int, optional): The offset in minutes for the query. Default is DEFAULT_OFFSET_MINUTES.
+        dry_run (bool, optional): If True, the changes will be simulated. Default is True.
+
+    Example:
+        optimize_deployment_by_key("my-namespace/my-deployment", dry_run=True)
+    """
+    namespace_name, deployment_name = key.split("/", 1)
+    try:
+        try:
+            deployment = client.AppsV1Api(get_api_client()).read_namespaced_deployment(
+                deployment_name, namespace_name
+            )
+        except ApiException as e:
+            if e.status == 404:
+                _logger.info("Deployment %s was deleted" % key)
+                return
+            raise
+        set_log_context({"namespace": namespace_name})
+        optimize_deployment(
+            deployment,
+            container_pattern,
+            lookback_minutes,
+            offset_minutes,
+            dry_run,
+            # the namespace bounds are only cached for a periodic run
+            two_tier=False,
+        )
+    finally:
+        set_log_context({})
+
+
+def get_deployment_key(deployment: V1Deployment) -> str:
+    return checkpoint.deployment_key(
+        deployment.metadata.namespace, deployment.metadata.name
+    )
+
+
+def skip_finished(
+    deployments: Iterable[V1Deployment], progress: checkpoint.Checkpoint
+) -> Iterator[V1Deployment]:
+    for deployment in deployments:
+        if progress.is_done(get_deployment_key(deployment)):
+            _logger.debug("Skipping finished deployment: %s" % deployment.metadata.name)
+            continue
+        yield deployment
+
+
+def optimize_deployments(
+    deployments: Iterable[V1Deployment],
+    container_pattern: str = CONTAINER_PATTERN,
+    lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
+    offset_minutes: int = DEFAULT_OFFSET_MINUTES,
+    dry_run: bool = True,
+    workers: int = WORKERS,
+    progress: Optional[checkpoint.Checkpoint] = None,
+    two_tier: bool = TWO_TIER_MODE,
+) -> int:
+    """
+    Optimize deployments, in parallel when more than one worker is used.
+
+    The number of deployments waiting for a worker is bounded, so deployments
+    are only listed as fast as they are optimized.
+
+    Args:
+        deployments (Iterable[V1Deployment]): The deployments to optimize.
+        container_pattern (str, optional): A regular expression pattern to filter containers. Default is CONTAINER_PATTERN.
+        lookback_minutes (int, optional): The number of minutes to look back in time for the query. Default is DEFAULT_LOOKBACK_MINUTES.
+        offset_minutes (int, optional): The offset in minutes for the query. Default is DEFAULT_OFFSET_MINUTES.
+        dry_run (bool, optional): If True, the changes will be simulated. Default is True.
+        workers (int, optional): The number of worker threads. Default is WORKERS.
+        progress (checkpoint.Checkpoint, optional): Skips finished deployments and records optimized ones. Default is None.
+        two_tier (bool, optional): If True, containers which can not change are skipped early. Default is TWO_TIER_MODE.
+
+    Returns:
+        int: The number of deployments which failed to optimize.
+
+    Example:
+        errors = optimize_deployments(iter_deployments("my-namespace"), workers=8)
+    """
+    args = (container_pattern, lookback_minutes, offset_minutes, dry_run, two_tier)
+    errors = 0
+
+    if progress is not None:
+        deployments = skip_finished(deployments, progress)
+
+    def optimize(deployment):
+        ok = optimize_deployment_safe(deployment, *args)
+        if ok and progress is not None:
+            progress.mark_done(get_deployment_key(deployment))
+        return ok
+
+    if workers <= 1:
+        for deployment in deployments:
+            if not optimize(deployment):
+                errors += 1
+        return errors
+
+    with ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="k8soptimizer"
+    ) as executor:
+        pending = set()
+        for deployment in deployments:
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                errors += sum(1 for future in done if not future.result())
+            pending.add(executor.submit(run_in_context(optimize), deployment))
+        errors += sum(1 for future in as_completed(pending) if not future.result())
+    return errors
+
+
+def optimize_deployments_pipeline(
+    namespace_pattern: str = ".*",
+    deplopyment_pattern: str = ".*",
+    container_pattern: str = CONTAINER_PATTERN,
+    lookback_minutes: int = DEFAULT_LOOKBACK_MINUTES,
+    offset_minutes: int = DEFAULT_OFFSET_MINUTES,
+    dry_run: bool = True,
+    discover_workers: int = PIPELINE_DISCOVER_WORKERS,
+    fetch_workers: int = PIPELINE_FETCH_WORKERS,
+    compute_workers: int = PIPELINE_COMPUTE_WORKERS,
+    apply_workers: int = PIPELINE_APPLY_WORKERS,
+    queue_size: int = PIPELINE_QUEUE_SIZE,
+    is_running: Optional[Callable[[], bool]] = None,
+    shard_index: int = SHARD_INDEX,
+    shard_count: int = SHARD_COUNT,
+    shard_by: str = SHARD_BY,
+    progress: Optional[checkpoint.Checkpoint] = None,
+    deployments: Optional[Iterable[V1Deployment]] = None,
+    two_tier: bool = TWO_TIER_MODE,
+) -> list:
+    """
+    Optimize deployments in a discover -> fetch -> compute -> apply pipeline.
+
+    Each stage has its own worker threads and the stages are connected by
+    bounded queues, so listing deployments and querying prometheus overlaps
+    with patching.
+
+    Args:
+        namespace_pattern (str, optional): A regular expression pattern to filter namespaces. Default is ".*".
+        deplopyment_pattern (str, optional): A regular expression pattern to filter deployments. Default is ".*".
+        container_pattern (str, optional): A regular expression pattern to filter containers. Default is CONTAINER_PATTERN.
+        lookback_minutes (int, optional): The number of minutes to look back in time for the query. Default is DEFAULT_LOOKBACK_MINUTES.
+        offset_minutes (int, optional): The offset in minutes for the query. Default is DEFAULT_OFFSET_MINUTES.
+        dry_run (bool, optional): If True, the changes will be simulated. Default is True.
+        discover_workers (int, optional): Threads listing deployments per namespace. Default is PIPELINE_DISCOVER_WORKERS.
+        fetch_workers (int, optional): Threads querying kubernetes and prometheus. Default is PIPELINE_FETCH_WORKERS.
+        compute_workers (int, optional): Threads computing new resources. Default is PIPELINE_COMPUTE_WORKERS.
+        apply_workers (int, optional): Threads patching deployments. Default is PIPELINE_APPLY_WORKERS.
+        queue_size (int, optional): The maximum number of items waiting for each stage. Default is PIPELINE_QUEUE_SIZE.
+        is_running (Callable, optional): Returns False once no more namespaces should be started. Default is None.
+        shard_index (int, optional): The shard of this instance. Default is SHARD_INDEX.
+        shard_count (int, optional): The number of shards. Default is SHARD_COUNT.
+        shard_by (str, optional): "namespace" or "deployment". Default is SHARD_BY.
+        progress (checkpoint.Checkpoint, optional): Skips finished deployments and records optimized ones. Default is None.
+        deployments (Iterable[V1Deployment], optional): Optimize these deployments in order instead of discovering them. Default is None.
+        two_tier (bool, optional): If True, containers which can not change are skipped early. Default is TWO_TIER_MODE.
+
+    Returns:
+        list: The pipeline.StageStats of each stage.
+
+    Example:
+        stage_stats = optimize_deployments_pipeline("my-namespace.*", fetch_workers=16)
+    """
+
+    shard = (shard_index, shard_count, shard_by)
+
+    def discover(namespace):
+        set_log_context({"namespace": namespace.metadata.name})
+        deployments = filter_shard(
+            get_deployments(namespace.metadata.name, deplopyment_pattern).items,
+            *shard,
+        )
+        if progress is not None:
+            deployments = list(skip_finished(deployments, progress))
+        return deployments
+
+    def fetch(deployment):
+        work = prepare_deployment(
+            deployment,
+            container_pattern,
+            lookback_minutes,
+            offset_minutes,
+            two_tier=two_tier,
+        )
+        if work is None and progress is not None:
+            progress.mark_done(get_deployment_key(deployment))
+        return work
+
+    def compute(work):
+        compute_deployment(work)
+        return work
+
+    def apply(work):
+        if apply_deployment(work, dry_run):
+            time.sleep(DELAY_BETWEEN_UPDATES)
+        if progress is not None:
+            progress.mark_done(get_deployment_key(work["deployment"]))
+        return work
+
+    stages = [
+        pipeline.Stage("fetch", fetch, fetch_workers),
+        pipeline.Stage("compute", compute, compute_workers),
+        pipeline.Stage("apply", apply, apply_workers),
+    ]
+    if deployments is not None:
+        items = deployments
+        if progress is not None:
+            items = skip_finished(items, progress)
+    else:
+        stages.insert(
+            0, pipeline.Stage("discover", discover, discover_workers, fan_out=True)
+        )
+        items = [
+            namespace
+            for namespace in get_namespaces(namespace_pattern).items
+            if in_shard(namespace.metadata.name, None, *shard)
+        ]
+    if is_running is not None:
+        items = daemon.take_while(items, is_running)
+    return pipeline.Pipeline(stages, queue_size).run(items)
+
+
+def init_worker_process(
+    loglevel: str,
+    logformat: str,
+    runtimes: dict,
+    runtimes_loaded: bool,
+    shared_bounds: Optional[frame.SharedFrame] = None,
+    namespaces: Optional[list] = None,
+):
+    """
+    Set up a worker process of optimize_namespaces_processes.
+
+    Each worker process has its own kubernetes client and caches, the
+    runtimes detected by the parent are reused and the sketches and
+    histograms saved by the parent are loaded.
+
+    Args:
+        loglevel (str): The log level.
+        logformat (str): The log format, "txt" or "json".
+        runtimes (dict): The runtimes of the parent's runtime index.
+        runtimes_loaded (bool): If the parent's runtime index was loaded completely.
+        shared_bounds (Optional[frame.SharedFrame], optional): The usage bounds fetched by the parent. Default is None.
+        namespaces (Optional[list], optional): The namespaces of the shared usage bounds. Default is None.
+    """
+    setup_logging(loglevel, logformat)
+    verify_kubernetes_connection()
+    runtime_index.restore(runtimes, runtimes_loaded)
+    for sketch_set, sketch_store in [
+        (sketches, get_sketch_store()),
+        (histograms, get_histogram_store()),
+    ]:
+        if sketch_store is not None:
+            sketch_set.restore(sketch_store.load())
+    if shared_bounds is not None:
+        usage_bounds.attach(shared_bounds, namespaces)
+
+
+def share_usage_bounds(
+    namespaces: list,
+    workers: int = WORKERS,
+    mode: str = SHARED_METRICS_MODE,
+    two_tier: bool = TWO_TIER_MODE,
+) -> Optional[frame.SharedFrame]:
+    """
+    Fetch the usage bounds of all namespaces once and share them with other processes.
+
+    The usage bounds are only read with two_tier, CPU_THROTTLING_MODE or
+    PSI_MODE, otherwise nothing is shared.
+
+    Args:
+        namespaces (list): The names of the namespaces.
+        workers (int, optional): The number of namespaces fetched in parallel. Default is WORKERS.
+        mode (str, optional): "shm" for shared memory, "mmap" for a memory-mapped file, "none" to not share. Default is SHARED_METRICS_MODE.
+        two_tier (bool, optional): If True, the containers are screened with the usage bounds. Default is TWO_TIER_MODE.
+
+    Returns:
+        Optional[frame.SharedFrame]: The shared usage bounds, None if mode is "none" or they are not used.
+
+    Example:
+        shared = share_usage_bounds(["my-namespace"], mode="shm")
+    """
+    if mode not in ["none", "shm", "mmap"]:
+        raise ValueError("Invalid shared metrics mode: %s" % mode)
+    if mode == "none":
+        return None
+    if not (two_tier or settings().CPU_THROTTLING_MODE or settings().PSI_MODE):
+        _logger.warning(
+            "Not sharing the usage bounds (%s), they are only used with two tier, "
+            "cpu throttling or psi mode" % mode
+        )
+        return None
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        list(executor.map(run_in_context(usage_bounds.get), namespaces))
+    path = None
+    if mode == "mmap":
+        fd, path = tempfile.mkstemp(prefix="k8soptimizer-", suffix=".bounds")
+        os.close(fd)
+    shared = usage_bounds.frame.share(path)
+    _logger.info(
+        "Shared the usage bounds of %s containers (%s)" % (len(shared.keys), mode)
+    )
+    return shared
+
+
+def optimize_namespace_process(
+    args, namespace_name: str, deplopyment_pattern: str, container_pattern: str
+) -> dict:
+    """
+    Optimize the matching deployments of one namespace in a worker process.
+
+    Args:
+        args (:obj:`argparse.Namespace`): command line parameters namespace
+        namespace_name (str): The name of the namespace.
+        deplopyment_pattern (str): A regular expression pattern to filter deployments.
+        container_pattern (str): A regular expression pattern to filter containers.
+
+    Returns:
+        dict: The stats of the namespace.
+        list: The schedule recommendations of the namespace.
+    """
+    stats.reset()
+    usage_profiles.reset()
+    namespace_pattern = "^{}$".format(re.escape(namespace_name))
+    shard = (args.shard_index, args.shard_count, args.shard_by)
+    if args.pipeline:
+        optimize_deployments_pipeline(
+            namespace_pattern,
+            deplopyment_pattern,
+            container_pattern,
+            args.lookback_minutes,
+            args.offsett_minutes,
+            args.dry_run,
+            shard_index=shard[0],
+            shard_count=shard[1],
+            shard_by=shard[2],
+            two_tier=args.two_tier,
+        )
+    else:
+        optimize_deployments(
+            iter_deployments(namespace_pattern, deplopyment_pattern, *shard),
+            container_pattern,
+            args.lookback_minutes,
+            args.offsett_minutes,
+            args.dry_run,
+            args.workers,
+            two_tier=args.two_tier,
+        )
+    return stats.as_dict(), usage_profiles.get_schedules()
+
+
+def optimize_namespaces_processes(
+    args,
+    namespace_pattern: str,
+    deplopyment_pattern: str,
+    container_pattern: str,
+    is_running: Optional[Callable[[], bool]] = None,
+) -> int:
+    """
+    Spread the matching namespaces across a pool of worker processes.
+
+    Each namespace is one task, so busy processes take fewer namespaces.
+    The stats and schedule recommendations of the tasks are merged into
+    those of this process.
+
+    Args:
+        args (:obj:`argparse.Namespace`): command line parameters namespace
+        namespace_pattern (str): A regular expression pattern to filter namespaces.
+        deplopyment_pattern (str): A regular expression pattern to filter deployments.
+        container_pattern (str): A regular expression pattern to filter containers.
+        is_running (Callable, optional): returns False once no new namespaces should be started
+
+    Returns:
+        int: The number of namespaces which failed to optimize.
+    """
+    shard = (args.shard_index, args.shard_count, args.shard_by)
+    namespaces = [
+        namespace.metadata.name
+        for namespace in get_namespaces(namespace_pattern).items
+        if in_shard(namespace.metadata.name, None, *shard)
+    ]
+    _logger.info(
+        "Optimizing %s namespaces with %s processes" % (len(namespaces), args.processes)
+    )
+    errors = 0
+    shared_bounds = share_usage_bounds(
+        namespaces, args.workers, args.shared_metrics_mode, args.two_tier
+    )
+
+    def collect(futures):
+        nonlocal errors
+        for future in futures:
+            try:
+                values, schedules = future.result()
+                stats.merge(values)
+                for schedule in schedules:
+                    usage_profiles.add_schedule(schedule)
+            except Exception as e:
+                errors += 1
+                _logger.error("Optimizing namespace failed: %s" % str(e))
+
+    try:
+        with ProcessPoolExecutor(
+            max_workers=args.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker_process,
+            initargs=(
+                args.loglevel,
+                args.logformat,
+                runtime_index.runtimes,
+                runtime_index.loaded,
+                shared_bounds,
+                namespaces,
+            ),
+        ) as executor:
+            pending = set()
+            for namespace_name in namespaces:
+                if is_running is not None and not is_running():
+                    break
+                if len(pending) >= args.processes * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending.add(
+                    executor.submit(
+                        optimize_namespace_process,
+                        args,
+                        namespace_name,
+                        deplopyment_pattern,
+                        container_pattern,
+                    )
+                )
+            collect(as_completed(pending))
+    finally:
+        if shared_bounds is not None:
+            shared_bounds.unlink()
+    return errors
+
+
+def print_pipeline_stats(stage_stats: list):
+    for stats_item in stage_stats:
+        _logger.info(pipeline.format_stage_stats(stats_item))
+
+
+def print_stats(values: Optional[dict] = None):
+    """
+    Log the summary of the old and new resources.
+
+    Args:
+        values (Optional[dict], optional): The stats to log, the stats of this run if None. Default is None.
+    """
+    if values is None:
+        values = stats.as_dict()
+    if values["old_cpu_sum"] > 0 and values["new_cpu_sum"] > 0:
+        diff_cpu_sum = round(
+            ((values["new_cpu_sum"] / values["old_cpu_sum"]) - 1) * 100
+        )
 
         _logger.info(
             "Summary cpu requests change: {} -> {} ({}%)".format(
-                str(round(stats["old_cpu_sum"] * 1000)) + "m",
-                str(round(stats["new_cpu_sum"] * 1000)) + "m",
+                str(round(values["old_cpu_sum"] * 1000)) + "m",
+                str(round(values["new_cpu_sum"] * 1000)) + "m",
                 diff_cpu_sum,
             )
         )
 
-    if stats["old_memory_sum"] > 0 and stats["new_memory_sum"] > 0:
+    if values["old_memory_sum"] > 0 and values["new_memory_sum"] > 0:
         diff_memory_sum = round(
-            ((stats["new_memory_sum"] / stats["old_memory_sum"]) - 1) * 100
+            ((values["new_memory_sum"] / values["old_memory_sum"]) - 1) * 100
         )
 
         _logger.info(
             "Summary memory requests change: {} -> {} ({}%)".format(
-                str(round(stats["old_memory_sum"] / 1024 / 1024)) + "Mi",
-                str(round(stats["new_memory_sum"] / 1024 / 1024)) + "Mi",
+                str(round(values["old_memory_sum"] / 1024 / 1024)) + "Mi",
+                str(round(values["new_memory_sum"] / 1024 / 1024)) + "Mi",
                 diff_memory_sum,
             )
         )
 
-    if stats["old_memory_limits_sum"] > 0 and stats["new_memory_limits_sum"] > 0:
+    if values["old_memory_limits_sum"] > 0 and values["new_memory_limits_sum"] > 0:
         diff_memory_limits_sum = round(
-            ((stats["new_memory_limits_sum"] / stats["old_memory_limits_sum"]) - 1)
+            ((values["new_memory_limits_sum"] / values["old_memory_limits_sum"]) - 1)
             * 100
         )
 
         _logger.info(
             "Summary memory limits change: {} -> {} ({}%)".format(
-                str(round(stats["old_memory_limits_sum"] / 1024 / 1024)) + "Mi",
-                str(round(stats["new_memory_limits_sum"] / 1024 / 1024)) + "Mi",
+                str(round(values["old_memory_limits_sum"] / 1024 / 1024)) + "Mi",
+                str(round(values["new_memory_limits_sum"] / 1024 / 1024)) + "Mi",
                 diff_memory_limits_sum,
             )
         )
 
 
+def write_stats_file(
+    path: str,
+    shard_index: int = SHARD_INDEX,
+    shard_count: int = SHARD_COUNT,
+    values: Optional[dict] = None,
+):
+    """
+    Write the stats of this run as json, so the stats of several shards can be merged.
+
+    Args:
+        path (str): The path of the stats file.
+        shard_index (int, optional): The shard of this instance. Default is SHARD_INDEX.
+        shard_count (int, optional): The number of shards. Default is SHARD_COUNT.
+        values (Optional[dict], optional): The stats to write, the stats of this run if None. Default is None.
+
+    Example:
+        write_stats_file("/tmp/stats-0.json", 0, 4)
+    """
+    data = {
+        "shard_index": shard_index,
+        "shard_count": shard_count,
+        "stats": stats.as_dict() if values is None else values,
+    }
+    with open(path, "w") as f:
+        json.dump(data, f)
+    _logger.info("Wrote stats to %s" % path)
+
+
+def merge_stats_files(paths: list) -> dict:
+    """
+    Merge the stats files of several shards into the global stats.
+
+    Args:
+        paths (list): The paths of the stats files.
+
+    Returns:
+        dict: The merged stats.
+
+    Raises:
+        ValueError: If a shard is missing or contained twice.
+
+    Example:
+        merge_stats_files(["/tmp/stats-0.json", "/tmp/stats-1.json"])
+        print_stats()
+    """
+    shards = set()
+    shard_count = None
+    for path in paths:
+        with open(path) as f:
+            data = json.load(f)
+        if data["shard_index"] in shards:
+            raise ValueError("Shard {} found twice".format(data["shard_index"]))
+        shards.add(data["shard_index"])
+        shard_count = data["shard_count"]
+        stats.merge(data["stats"])
+    if shard_count is not None and len(shards) != shard_count:
+        _logger.warning(
+            "Merged %s of %s shards: %s" % (len(shards), shard_count, sorted(shards))
+        )
+    return stats.as_dict()
+
+
 # ---- CLI ----
 # The functions defined in this section are wrappers around the main Python
 # API allowing them to be called directly from the terminal as a CLI
@@ -1765,6 +5641,167 @@ def parse_args(args):
         dest="dry_run",
     )
 
+    parser.add_argument(
+        "--workers",
+        action="store",
+        default=WORKERS,
+        type=int,
+        help="Set the number of deployments optimized in parallel.",
+        dest="workers",
+    )
+
+    parser.add_argument(
+        "--processes",
+        action="store",
+        default=PROCESSES,
+        type=int,
+        help="Set the number of processes the namespaces are spread across.",
+        dest="processes",
+    )
+
+    parser.add_argument(
+        "--shared-metrics-mode",
+        action="store",
+        default=SHARED_METRICS_MODE,
+        choices=["none", "shm", "mmap"],
+        help="Fetch the usage bounds once and share them with the processes.",
+        dest="shared_metrics_mode",
+    )
+
+    parser.add_argument(
+        "--shard-index",
+        action="store",
+        default=SHARD_INDEX,
+        type=helpers.shard_arg,
+        help="Set the shard optimized by this instance (0 to shard count - 1).",
+        dest="shard_index",
+    )
+
+    parser.add_argument(
+        "--shard-count",
+        action="store",
+        default=SHARD_COUNT,
+        type=helpers.shard_arg,
+        help="Set the number of instances splitting the work.",
+        dest="shard_count",
+    )
+
+    parser.add_argument(
+        "--shard-by",
+        action="store",
+        default=SHARD_BY,
+        choices=["namespace", "deployment"],
+        help="Assign whole namespaces or single deployments to shards.",
+        dest="shard_by",
+    )
+
+    parser.add_argument(
+        "--stats-file",
+        action="store",
+        default=STATS_FILE,
+        help="Write the stats of the run as json to this file.",
+        dest="stats_file",
+    )
+
+    parser.add_argument(
+        "--profile-file",
+        action="store",
+        default=PROFILE_FILE,
+        help="Write the schedule recommendations of the run as json to this file.",
+        dest="profile_file",
+    )
+
+    parser.add_argument(
+        "--clusters",
+        action="store",
+        default=CLUSTERS,
+        help="Optimize several clusters concurrently, comma separated context=prometheus_url pairs of the kubeconfig.",
+        dest="clusters",
+    )
+
+    parser.add_argument(
+        "--merge-stats",
+        action="store",
+        nargs="+",
+        help="Merge and print the stats files of several shards and exit.",
+        dest="merge_stats",
+    )
+
+    parser.add_argument(
+        "--checkpoint-file",
+        action="store",
+        default=CHECKPOINT_FILE,
+        help="Write the progress of the run to this file.",
+        dest="checkpoint_file",
+    )
+
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        default=RESUME_MODE,
+        help="Skip deployments finished by a previous interrupted run.",
+        dest="resume",
+    )
+
+    parser.add_argument(
+        "--resume-freshness-minutes",
+        action="store",
+        default=RESUME_FRESHNESS_MINUTES,
+        type=int,
+        help="Set the minutes a finished deployment is skipped with --resume.",
+        dest="resume_freshness_minutes",
+    )
+
+    parser.add_argument(
+        "--time-budget",
+        action="store",
+        default=TIME_BUDGET_MINUTES,
+        type=float,
+        help="Set the minutes after which no more deployments are started, biggest savings first (0 for no budget).",
+        dest="time_budget_minutes",
+    )
+
+    parser.add_argument(
+        "--two-tier",
+        action="store_true",
+        default=TWO_TIER_MODE,
+        help="Skip the detailed queries of containers which can not change.",
+        dest="two_tier",
+    )
+
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        default=PIPELINE_MODE,
+        help="Optimize deployments in a discover, fetch, compute and apply pipeline.",
+        dest="pipeline",
+    )
+
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        default=DAEMON_MODE,
+        help="Stay resident and optimize on a fixed interval.",
+        dest="daemon",
+    )
+
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        default=WATCH_MODE,
+        help="Also re-optimize deployments on events (implies --daemon).",
+        dest="watch",
+    )
+
+    parser.add_argument(
+        "--interval-minutes",
+        action="store",
+        default=DAEMON_INTERVAL_MINUTES,
+        type=int,
+        help="Set the minutes between two optimization cycles in daemon mode.",
+        dest="interval_minutes",
+    )
+
     group_ns = parser.add_mutually_exclusive_group()
     group_ns.add_argument(
         "-n",
@@ -1819,7 +5856,28 @@ def parse_args(args):
         type=helpers.valid_regex_arg,
     )
 
-    return parser.parse_args(args)
+    parsed_args = parser.parse_args(args)
+    if parsed_args.shard_count < 1:
+        parser.error("--shard-count must be at least 1")
+    if parsed_args.shard_index >= parsed_args.shard_count:
+        parser.error("--shard-index must be lower than --shard-count")
+    try:
+        parsed_args.clusters = parse_clusters(parsed_args.clusters)
+    except ValueError as e:
+        parser.error(str(e))
+    if parsed_args.clusters and parsed_args.watch:
+        parser.error("--watch is not supported with --clusters")
+    if parsed_args.processes < 1:
+        parser.error("--processes must be at least 1")
+    if CPU_LIMITS_POLICY not in CPU_LIMITS_POLICIES:
+        parser.error(
+            "CPU_LIMITS_POLICY must be one of {}".format(", ".join(CPU_LIMITS_POLICIES))
+        )
+    if CPU_LIMIT_RATIO < 1:
+        parser.error("CPU_LIMIT_RATIO must be at least 1")
+    if parsed_args.clusters and parsed_args.processes > 1:
+        parser.error("--processes is not supported with --clusters")
+    return parsed_args
 
 
 def setup_logging(loglevel: str = "info", logformat: str = "json"):
@@ -1855,6 +5913,543 @@ def setup_logging(loglevel: str = "info", logformat: str = "json"):
     logger.setLevel(loglevel.upper())
 
 
+def within_time_budget(
+    budget_minutes: float, is_running: Optional[Callable[[], bool]] = None
+) -> Callable[[], bool]:
+    """Get a callable which returns False once the time budget is used up
+
+    Args:
+      budget_minutes (float): the time budget in minutes, starting now
+      is_running (Callable, optional): also return False once this returns False
+    """
+    deadline = time.monotonic() + budget_minutes * 60
+
+    def check() -> bool:
+        if is_running is not None and not is_running():
+            return False
+        if time.monotonic() >= deadline:
+            _logger.warning(
+                "Time budget of %s minutes used up, skipping the remaining deployments"
+                % budget_minutes
+            )
+            return False
+        return True
+
+    return check
+
+
+def run_optimization(
+    args,
+    namespace_pattern: str,
+    deplopyment_pattern: str,
+    container_pattern: str,
+    is_running: Optional[Callable[[], bool]] = None,
+    progress: Optional[checkpoint.Checkpoint] = None,
+) -> bool:
+    """Optimize all matching deployments once and print the summary
+
+    Args:
+      args (:obj:`argparse.Namespace`): command line parameters namespace
+      is_running (Callable, optional): returns False once the run should stop early
+      progress (checkpoint.Checkpoint, optional): checkpoint of the run
+
+    Returns:
+      bool: True if the run was not stopped early
+    """
+    deployments = None
+    stage_stats = None
+    usage_bounds.reset()
+    usage_profiles.reset()
+    runtime_index.load()
+    sync_series_store(
+        namespace_pattern=namespace_pattern,
+        shard_index=args.shard_index,
+        shard_count=args.shard_count,
+        shard_by=args.shard_by,
+    )
+    update_sketches()
+    update_histograms()
+    if args.time_budget_minutes > 0:
+        deployments = rank_deployments_by_savings(
+            iter_deployments(
+                namespace_pattern,
+                deplopyment_pattern,
+                args.shard_index,
+                args.shard_count,
+                args.shard_by,
+            ),
+            args.lookback_minutes,
+        )
+        _logger.info(
+            "Ranked %s deployments by estimated savings, time budget %s minutes"
+            % (len(deployments), args.time_budget_minutes)
+        )
+        is_running = within_time_budget(args.time_budget_minutes, is_running)
+
+    processes = args.processes > 1
+    if processes and (deployments is not None or progress is not None):
+        _logger.warning(
+            "Processes are not supported with a time budget or checkpoint, using threads"
+        )
+        processes = False
+
+    if processes:
+        optimize_namespaces_processes(
+            args, namespace_pattern, deplopyment_pattern, container_pattern, is_running
+        )
+    elif args.pipeline:
+        stage_stats = optimize_deployments_pipeline(
+            namespace_pattern,
+            deplopyment_pattern,
+            container_pattern,
+            args.lookback_minutes,
+            args.offsett_minutes,
+            args.dry_run,
+            is_running=is_running,
+            shard_index=args.shard_index,
+            shard_count=args.shard_count,
+            shard_by=args.shard_by,
+            progress=progress,
+            deployments=deployments,
+            two_tier=args.two_tier,
+        )
+    else:
+        if deployments is None:
+            deployments = iter_deployments(
+                namespace_pattern,
+                deplopyment_pattern,
+                args.shard_index,
+                args.shard_count,
+                args.shard_by,
+            )
+        if is_running is not None:
+            deployments = daemon.take_while(deployments, is_running)
+        optimize_deployments(
+            deployments,
+            container_pattern,
+            args.lookback_minutes,
+            args.offsett_minutes,
+            args.dry_run,
+            args.workers,
+            progress,
+            args.two_tier,
+        )
+
+    extra = {}
+    set_log_context(extra)
+
+    print_stats()
+    if stage_stats is not None:
+        print_pipeline_stats(stage_stats)
+    if args.stats_file:
+        write_stats_file(args.stats_file, args.shard_index, args.shard_count)
+    if args.profile_file:
+        write_profile_file(args.profile_file)
+    return is_running is None or is_running()
+
+
+def create_checkpoint(args) -> Optional[checkpoint.Checkpoint]:
+    """Create the checkpoint of the run, resuming a previous one with --resume
+
+    Args:
+      args (:obj:`argparse.Namespace`): command line parameters namespace
+
+    Returns:
+      checkpoint.Checkpoint: the checkpoint, None if no checkpoint is configured
+    """
+    if args.checkpoint_file:
+        store = checkpoint.FileCheckpointStore(args.checkpoint_file)
+    elif CHECKPOINT_CONFIGMAP:
+        store = checkpoint.ConfigMapCheckpointStore(
+            get_api_client(), CHECKPOINT_NAMESPACE, CHECKPOINT_CONFIGMAP
+        )
+    else:
+        if args.resume:
+            _logger.warning("Ignoring --resume without a checkpoint")
+        return None
+
+    progress = checkpoint.Checkpoint(
+        store, CHECKPOINT_INTERVAL_SECONDS, get_stats=stats.as_dict
+    )
+    _logger.info("Using checkpoint: %s" % store)
+    if args.resume:
+        skipped = progress.resume(args.resume_freshness_minutes)
+        stats.merge(progress.stats)
+        _logger.info(
+            "Resuming run, skipping %s deployments finished in the last %s minutes"
+            % (skipped, args.resume_freshness_minutes)
+        )
+    return progress
+
+
+@beartype
+def create_cluster_state(context: str, prometheus_url: str) -> OptimizerState:
+    """
+    Create the optimizer state of a cluster with its own api client and rate limit.
+
+    Args:
+        context (str): The kubeconfig context of the cluster.
+        prometheus_url (str): The url of the prometheus of the cluster.
+
+    Returns:
+        OptimizerState: The state with the client, caches and stats of the cluster.
+
+    Example:
+        state = create_cluster_state("prod", "http://prometheus.prod:9090")
+    """
+    configuration = client.Configuration()
+    config.load_kube_config(context=context, client_configuration=configuration)
+    overrides = {"PROMETHEUS_URL": prometheus_url}
+    if settings().SERIES_STORE_DIR:
+        # each cluster keeps its samples in its own directory
+        overrides["SERIES_STORE_DIR"] = os.path.join(
+            settings().SERIES_STORE_DIR, context
+        )
+    for name in ["SKETCH_FILE", "HISTOGRAM_FILE"]:
+        if getattr(settings(), name):
+            overrides[name] = "{}.{}".format(getattr(settings(), name), context)
+    return OptimizerState(
+        Settings(**overrides),
+        create_api_client(configuration=configuration),
+    )
+
+
+def run_cluster(
+    args,
+    context: str,
+    state: OptimizerState,
+    namespace_pattern: str,
+    deplopyment_pattern: str,
+    container_pattern: str,
+    is_running: Optional[Callable[[], bool]] = None,
+) -> Optional[dict]:
+    """Optimize all matching deployments of one cluster once
+
+    Args:
+      args (:obj:`argparse.Namespace`): command line parameters namespace
+      context (str): the kubeconfig context of the cluster
+      state (OptimizerState): the client, caches and stats of the cluster
+      is_running (Callable, optional): returns False once the run should stop early
+
+    Returns:
+      Optional[dict]: the stats of the cluster, None if the run failed
+    """
+    with activate_state(state):
+        set_log_context({"cluster": context})
+        try:
+            client.ApisApi(get_api_client()).get_api_versions_with_http_info()
+            verify_prometheus_connection()
+            stats.reset()
+            run_optimization(
+                args,
+                namespace_pattern,
+                deplopyment_pattern,
+                container_pattern,
+                is_running,
+            )
+            return stats.as_dict()
+        except Exception as e:
+            _logger.error(
+                "Optimizing cluster %s failed: %s" % (context, str(e)), exc_info=True
+            )
+            return None
+
+
+def run_clusters(
+    args,
+    states: dict,
+    namespace_pattern: str,
+    deplopyment_pattern: str,
+    container_pattern: str,
+    is_running: Optional[Callable[[], bool]] = None,
+) -> dict:
+    """Optimize several clusters concurrently and print their summaries
+
+    Each cluster uses its own api client, rate limit, caches and stats. The
+    stats of all successful clusters are summed into an aggregate summary, and
+    the schedule recommendations of all clusters are written to one profile file.
+
+    Args:
+      args (:obj:`argparse.Namespace`): command line parameters namespace
+      states (dict): the OptimizerState of each kubeconfig context
+      is_running (Callable, optional): returns False once the runs should stop early
+
+    Returns:
+      dict: the stats of each cluster, None for failed clusters
+    """
+    cluster_args = argparse.Namespace(**vars(args))
+    # only the aggregate is written
+    cluster_args.stats_file = ""
+    cluster_args.profile_file = ""
+
+    with ThreadPoolExecutor(
+        max_workers=max(1, len(states)), thread_name_prefix="k8soptimizer-cluster"
+    ) as executor:
+        futures = {
+            context: executor.submit(
+                run_cluster,
+                cluster_args,
+                context,
+                state,
+                namespace_pattern,
+                deplopyment_pattern,
+                container_pattern,
+                is_running,
+            )
+            for context, state in states.items()
+        }
+        results = {context: future.result() for context, future in futures.items()}
+
+    aggregate = Stats()
+    for context, values in results.items():
+        set_log_context({"cluster": context})
+        if values is None:
+            _logger.warning("No summary for failed cluster %s" % context)
+            continue
+        _logger.info("Summary of cluster %s" % context)
+        print_stats(values)
+        aggregate.merge(values)
+
+    set_log_context({})
+    failed = [context for context, values in results.items() if values is None]
+    _logger.info(
+        "Optimized %s of %s clusters" % (len(results) - len(failed), len(results))
+    )
+    _logger.info("Summary of all clusters")
+    print_stats(aggregate.as_dict())
+    if args.stats_file:
+        write_stats_file(
+            args.stats_file, args.shard_index, args.shard_count, aggregate.as_dict()
+        )
+    if args.profile_file:
+        schedules = []
+        for context, state in states.items():
+            with activate_state(state):
+                schedules.extend(
+                    dict(schedule, cluster=context)
+                    for schedule in usage_profiles.get_schedules()
+                )
+        write_profile_file(args.profile_file, schedules)
+    return results
+
+
+def run_once(
+    args, namespace_pattern: str, deplopyment_pattern: str, container_pattern: str
+):
+    """Optimize all matching deployments once with checkpointing
+
+    On SIGTERM the run stops after the deployments in progress and the
+    checkpoint is written, so a later run with --resume continues there.
+
+    Args:
+      args (:obj:`argparse.Namespace`): command line parameters namespace
+    """
+    if args.clusters:
+        if args.checkpoint_file or args.resume:
+            _logger.warning("Checkpoints are not supported with several clusters")
+        states = {
+            context: create_cluster_state(context, prometheus_url)
+            for context, prometheus_url in args.clusters
+        }
+        run_clusters(
+            args, states, namespace_pattern, deplopyment_pattern, container_pattern
+        )
+        return
+
+    progress = create_checkpoint(args)
+    if progress is None:
+        run_optimization(
+            args, namespace_pattern, deplopyment_pattern, container_pattern
+        )
+        return
+
+    stop_event = threading.Event()
+
+    def stop(signum, frame):
+        # no locks here, the main thread may hold the checkpoint locks
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        finished = run_optimization(
+            args,
+            namespace_pattern,
+            deplopyment_pattern,
+            container_pattern,
+            lambda: not stop_event.is_set(),
+            progress,
+        )
+        if finished:
+            progress.finish()
+        else:
+            _logger.info("Run stopped early, writing checkpoint")
+    finally:
+        progress.flush()
+
+
+def run_daemon(
+    args, namespace_pattern: str, deplopyment_pattern: str, container_pattern: str
+):
+    """Stay resident and optimize all matching deployments on a fixed interval
+
+    The kubernetes api client and its connection pool are kept between the
+    cycles. With leader election only one replica optimizes at a time.
+
+    Args:
+      args (:obj:`argparse.Namespace`): command line parameters namespace
+    """
+    stop_event = threading.Event()
+
+    def stop(signum, frame):
+        _logger.info("Received signal %s, stopping daemon" % signum)
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    elector = None
+    if LEADER_ELECTION_ENABLED:
+        elector = daemon.LeaderElector(
+            get_api_client(),
+            LEADER_ELECTION_NAMESPACE,
+            LEADER_ELECTION_LEASE_NAME,
+            lease_duration_seconds=LEADER_ELECTION_LEASE_DURATION_SECONDS,
+            renew_interval_seconds=LEADER_ELECTION_RENEW_SECONDS,
+        )
+        _logger.info("Using leader election identity: %s" % elector.identity)
+
+    # the clients and caches of the clusters are kept between the cycles
+    states = {
+        context: create_cluster_state(context, prometheus_url)
+        for context, prometheus_url in args.clusters
+    }
+
+    def run_cycle(is_running):
+        if states:
+            run_clusters(
+                args,
+                states,
+                namespace_pattern,
+                deplopyment_pattern,
+                container_pattern,
+                is_running,
+            )
+            return
+        stats.reset()
+        run_optimization(
+            args, namespace_pattern, deplopyment_pattern, container_pattern, is_running
+        )
+
+    work_queue = None
+    threads = []
+    if args.watch:
+        work_queue, threads = start_watch(
+            args,
+            namespace_pattern,
+            deplopyment_pattern,
+            container_pattern,
+            stop_event,
+            lambda: elector is None or elector.is_leader,
+        )
+
+    try:
+        daemon.run_daemon(run_cycle, args.interval_minutes, elector, stop_event)
+    finally:
+        stop_event.set()
+        if work_queue is not None:
+            work_queue.shutdown()
+        for thread in threads:
+            thread.join(timeout=1)
+
+
+def start_watch(
+    args,
+    namespace_pattern: str,
+    deplopyment_pattern: str,
+    container_pattern: str,
+    stop_event: threading.Event,
+    is_running: Optional[Callable[[], bool]] = None,
+) -> Tuple[controller.WorkQueue, list]:
+    """Watch deployments and hpas and re-optimize changed deployments individually
+
+    Args:
+      args (:obj:`argparse.Namespace`): command line parameters namespace
+      stop_event (threading.Event): set to stop the watches and workers
+      is_running (Callable, optional): returns False while events should be dropped
+
+    Returns:
+      Tuple[controller.WorkQueue, list]: the work queue and the started threads
+    """
+    work_queue = controller.WorkQueue(
+        debounce_seconds=WATCH_DEBOUNCE_SECONDS,
+        backoff_base_seconds=WATCH_BACKOFF_BASE_SECONDS,
+        backoff_max_seconds=WATCH_BACKOFF_MAX_SECONDS,
+        max_retries=WATCH_MAX_RETRIES,
+    )
+    handler = controller.EventHandler(
+        work_queue,
+        namespace_pattern,
+        deplopyment_pattern,
+        WATCH_REPLICA_CHANGE_RATIO,
+    )
+
+    def process(key):
+        optimize_deployment_by_key(
+            key,
+            container_pattern,
+            args.lookback_minutes,
+            args.offsett_minutes,
+            args.dry_run,
+        )
+
+    api_client = get_api_client()
+    targets = [
+        (
+            "watch-hpas",
+            controller.run_watch,
+            (
+                client.AutoscalingV2Api(
+                    api_client
+                ).list_horizontal_pod_autoscaler_for_all_namespaces,
+                handler.on_hpa,
+                stop_event,
+                WATCH_TIMEOUT_SECONDS,
+            ),
+        ),
+        (
+            "watch-deployments",
+            controller.run_watch,
+            (
+                client.AppsV1Api(api_client).list_deployment_for_all_namespaces,
+                handler.on_deployment,
+                stop_event,
+                WATCH_TIMEOUT_SECONDS,
+            ),
+        ),
+    ]
+    for i in range(max(1, WATCH_WORKERS)):
+        targets.append(
+            (
+                "watch-worker-{}".format(i),
+                controller.run_worker,
+                (work_queue, process, stop_event, is_running),
+            )
+        )
+
+    threads = []
+    for name, target, target_args in targets:
+        thread = threading.Thread(
+            target=run_in_context(target),
+            args=target_args,
+            name="k8soptimizer-{}".format(name),
+            daemon=True,
+        )
+        thread.start()
+        threads.append(thread)
+    return work_queue, threads
+
+
 def main(args):
     """Wrapper allowing :func:`fib` to be called with string arguments in a CLI fashion
 
@@ -1868,11 +6463,24 @@ def main(args):
     args = parse_args(args)
     setup_logging(args.loglevel, args.logformat)
     extra = {}
-    _logger.addFilter(AppFilter(extra))
+    set_log_context(extra)
     _logger.info("Starting k8soptimizer...")
 
-    verify_kubernetes_connection()
-    verify_prometheus_connection()
+    if args.merge_stats:
+        merge_stats_files(args.merge_stats)
+        print_stats()
+        return
+
+    if args.clusters:
+        _logger.info(
+            "Using clusters: %s" % ", ".join(context for context, _ in args.clusters)
+        )
+        # the home cluster is only needed for the leader election
+        if args.daemon and LEADER_ELECTION_ENABLED:
+            verify_kubernetes_connection()
+    else:
+        verify_kubernetes_connection()
+        verify_prometheus_connection()
 
     namespace_pattern = args.namespace_pattern
     if args.namespace is not None:
@@ -1892,6 +6500,23 @@ def main(args):
     _logger.info("Using lookback_minutes: %s" % lookback_minutes)
     _logger.info("Using offset_minutes: %s" % offset_minutes)
     _logger.info("Using dry_run: %s" % args.dry_run)
+    _logger.info("Using workers: %s" % args.workers)
+    if args.time_budget_minutes > 0:
+        _logger.info("Using time budget minutes: %s" % args.time_budget_minutes)
+    if args.shard_count > 1:
+        _logger.info(
+            "Using shard: %s of %s by %s"
+            % (args.shard_index, args.shard_count, args.shard_by)
+        )
+    _logger.info("Using pipeline: %s" % args.pipeline)
+    _logger.info("Using two tier: %s" % args.two_tier)
+    if args.watch:
+        args.daemon = True
+    _logger.info("Using daemon: %s" % args.daemon)
+    _logger.info("Using watch: %s" % args.watch)
+    if args.daemon:
+        _logger.info("Using interval minutes: %s" % args.interval_minutes)
+        _logger.info("Using leader election: %s" % LEADER_ELECTION_ENABLED)
     _logger.info("Using cpu request min cores: %s" % MIN_CPU_REQUEST)
     _logger.info("Using cpu request max cores: %s" % MAX_CPU_REQUEST)
     _logger.info("Using cpu request ratio: %s" % CPU_REQUEST_RATIO)
@@ -1902,32 +6527,14 @@ def main(args):
     _logger.info("Using memory limit max: %s" % MAX_MEMORY_LIMIT)
     _logger.info("Using memory limit ratio: %s" % MEMORY_LIMIT_RATIO)
     _logger.info("Using hpa target replicas ratio: %s" % HPA_TARGET_REPLICAS_RATIO)
+    _logger.info("Using k8s connection pool maxsize: %s" % K8S_CONNECTION_POOL_MAXSIZE)
+    _logger.info("Using k8s qps: %s" % K8S_QPS)
+    _logger.info("Using k8s burst: %s" % K8S_BURST)
 
-    for namespace in get_namespaces(namespace_pattern).items:
-        extra = {"namespace": namespace.metadata.name}
-        _logger.addFilter(AppFilter(extra))
-        for deployment in get_deployments(
-            namespace.metadata.name, deplopyment_pattern
-        ).items:
-            try:
-                optimize_deployment(
-                    deployment,
-                    container_pattern,
-                    lookback_minutes,
-                    offset_minutes,
-                    args.dry_run,
-                )
-                time.sleep(DELAY_BETWEEN_UPDATES)
-            except Exception as e:
-                _logger.warning(
-                    "An error occurred while optimizing the deployment: %s" % str(e),
-                    exc_info=True,
-                )
-
-    extra = {}
-    _logger.addFilter(AppFilter(extra))
-
-    print_stats()
+    if args.daemon:
+        run_daemon(args, namespace_pattern, deplopyment_pattern, container_pattern)
+    else:
+        run_once(args, namespace_pattern, deplopyment_pattern, container_pattern)
 
     _logger.info("Finished k8soptimizer")
 
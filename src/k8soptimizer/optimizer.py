@@ -0,0 +1,87 @@
+from contextlib import contextmanager
+
+from beartype.typing import Any, Callable, Iterable, Optional
+from kubernetes import client
+from kubernetes.client.models import V1Deployment
+
+from . import main
+
+__author__ = "Philipp Hellmich"
+__copyright__ = "Arvato Systems GmbH"
+__license__ = "MIT"
+
+
+class Optimizer:
+    """
+    Optimizes deployments with its own settings, kubernetes client, caches and stats.
+
+    The methods run the functions of k8soptimizer.main with the state of this
+    optimizer, including the threads they start. Several optimizers can run
+    at the same time in one process, e.g. one per cluster or per policy.
+
+    Example:
+        optimizer = Optimizer(main.Settings(CHANGE_THRESHOLD=0.2), api_client)
+        optimizer.optimize_deployments(deployments, dry_run=True)
+        print(optimizer.stats.as_dict())
+    """
+
+    def __init__(
+        self,
+        settings: Optional[main.Settings] = None,
+        api_client: Optional[client.ApiClient] = None,
+    ):
+        self.state = main.OptimizerState(settings, api_client)
+
+    @property
+    def settings(self) -> main.Settings:
+        return self.state.settings
+
+    @property
+    def stats(self) -> main.Stats:
+        return self.state.stats
+
+    @contextmanager
+    def activate(self):
+        """
+        Use the state of this optimizer for all k8soptimizer.main calls in the block.
+        """
+        with main.activate_state(self.state):
+            yield self
+
+    def call(self, func: Callable, *args, **kwargs) -> Any:
+        with self.activate():
+            return func(*args, **kwargs)
+
+    def optimize_deployment(self, deployment: V1Deployment, **kwargs) -> V1Deployment:
+        return self.call(main.optimize_deployment, deployment, **kwargs)
+
+    def optimize_deployments(
+        self, deployments: Iterable[V1Deployment], **kwargs
+    ) -> int:
+        return self.call(main.optimize_deployments, deployments, **kwargs)
+
+    def optimize_deployments_pipeline(self, **kwargs) -> list:
+        return self.call(main.optimize_deployments_pipeline, **kwargs)
+
+    def run(
+        self,
+        args,
+        namespace_pattern: str,
+        deplopyment_pattern: str,
+        container_pattern: str,
+        **kwargs
+    ):
+        """
+        Optimize all matching deployments once, see main.run_optimization.
+
+        The stats are reset before the run.
+        """
+        self.stats.reset()
+        self.call(
+            main.run_optimization,
+            args,
+            namespace_pattern,
+            deplopyment_pattern,
+            container_pattern,
+            **kwargs
+        )
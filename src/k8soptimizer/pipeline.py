@@ -0,0 +1,227 @@
+import contextvars
+import logging
+import queue
+import threading
+import time
+
+from beartype import beartype
+from beartype.typing import Any, Callable, Iterable, List
+
+__author__ = "Philipp Hellmich"
+__copyright__ = "Arvato Systems GmbH"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+# marks the end of the input of a stage worker
+_DONE = object()
+
+
+class StageStats:
+    """
+    Throughput and queue depth of a single pipeline stage.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.emitted = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.started = None
+        self.finished = None
+        self.queue_depth_max = 0
+        self.queue_depth_sum = 0
+        self.queue_depth_samples = 0
+
+    def sample_queue_depth(self, depth: int):
+        with self.lock:
+            self.queue_depth_max = max(self.queue_depth_max, depth)
+            self.queue_depth_sum += depth
+            self.queue_depth_samples += 1
+
+    def record(self, seconds: float, emitted: int, error: bool = False):
+        with self.lock:
+            self.processed += 1
+            self.emitted += emitted
+            self.busy_seconds += seconds
+            if error:
+                self.errors += 1
+
+    @property
+    def elapsed_seconds(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def throughput(self) -> float:
+        if self.elapsed_seconds <= 0:
+            return 0.0
+        return self.processed / self.elapsed_seconds
+
+    @property
+    def queue_depth_avg(self) -> float:
+        if self.queue_depth_samples == 0:
+            return 0.0
+        return self.queue_depth_sum / self.queue_depth_samples
+
+    def as_dict(self) -> dict:
+        return {
+            "stage": self.name,
+            "processed": self.processed,
+            "emitted": self.emitted,
+            "errors": self.errors,
+            "elapsed_seconds": round(self.elapsed_seconds, 3),
+            "busy_seconds": round(self.busy_seconds, 3),
+            "throughput": round(self.throughput, 3),
+            "queue_depth_max": self.queue_depth_max,
+            "queue_depth_avg": round(self.queue_depth_avg, 3),
+        }
+
+
+class Stage:
+    """
+    A pipeline stage running func on each item with a number of worker threads.
+
+    func returns the item passed to the next stage or None to drop the item.
+    With fan_out, func returns an iterable of items for the next stage instead.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Any], Any],
+        workers: int = 1,
+        fan_out: bool = False,
+    ):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.fan_out = fan_out
+        self.stats = StageStats(name)
+
+
+class Pipeline:
+    """
+    Runs items through stages connected by bounded queues.
+
+    Each stage has its own worker threads, so a slow stage only blocks the
+    stages before it once its input queue is full.
+    """
+
+    def __init__(self, stages: List[Stage], queue_size: int = 16):
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage")
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in stages]
+        self.remaining_workers = [stage.workers for stage in stages]
+        self.lock = threading.Lock()
+
+    def put(self, index: int, item: Any):
+        self.queues[index].put(item)
+        self.stages[index].stats.sample_queue_depth(self.queues[index].qsize())
+
+    def finish_worker(self, index: int):
+        with self.lock:
+            self.remaining_workers[index] -= 1
+            last = self.remaining_workers[index] == 0
+        if not last:
+            return
+        self.stages[index].stats.finished = time.monotonic()
+        if index + 1 < len(self.stages):
+            for _ in range(self.stages[index + 1].workers):
+                self.queues[index + 1].put(_DONE)
+
+    def work(self, index: int):
+        stage = self.stages[index]
+        last_stage = index + 1 == len(self.stages)
+        while True:
+            item = self.queues[index].get()
+            if item is _DONE:
+                break
+            start = time.monotonic()
+            emitted = 0
+            error = False
+            try:
+                result = stage.func(item)
+                if result is not None:
+                    results = result if stage.fan_out else [result]
+                    for result_item in results:
+                        emitted += 1
+                        if not last_stage:
+                            self.put(index + 1, result_item)
+            except Exception as e:
+                error = True
+                _logger.warning(
+                    "An error occurred in pipeline stage %s: %s" % (stage.name, str(e)),
+                    exc_info=True,
+                )
+            stage.stats.record(time.monotonic() - start, emitted, error)
+        self.finish_worker(index)
+
+    def run(self, items: Iterable[Any]) -> List[StageStats]:
+        """
+        Run all items through the pipeline and wait until the last stage is done.
+
+        Args:
+            items (Iterable[Any]): The input items of the first stage.
+
+        Returns:
+            List[StageStats]: The statistics of each stage.
+        """
+        threads = []
+        now = time.monotonic()
+        for index, stage in enumerate(self.stages):
+            stage.stats.started = now
+            for i in range(stage.workers):
+                # each worker runs in a copy of the caller's context
+                thread = threading.Thread(
+                    target=contextvars.copy_context().run,
+                    args=(self.work, index),
+                    name="k8soptimizer-{}-{}".format(stage.name, i),
+                    daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+
+        try:
+            for item in items:
+                self.put(0, item)
+        finally:
+            for _ in range(self.stages[0].workers):
+                self.queues[0].put(_DONE)
+
+        for thread in threads:
+            thread.join()
+
+        return [stage.stats for stage in self.stages]
+
+
+@beartype
+def format_stage_stats(stage_stats: StageStats) -> str:
+    """
+    Format the statistics of a pipeline stage for logging.
+
+    Args:
+        stage_stats (StageStats): The statistics of the stage.
+
+    Returns:
+        str: The formatted statistics.
+
+    Example:
+        _logger.info(format_stage_stats(stage.stats))
+    """
+    values = stage_stats.as_dict()
+    return "Stage {}: {} processed, {} emitted, {} errors, {} items/s, busy {}s of {}s, queue depth max {} avg {}".format(
+        values["stage"],
+        values["processed"],
+        values["emitted"],
+        values["errors"],
+        values["throughput"],
+        values["busy_seconds"],
+        values["elapsed_seconds"],
+        values["queue_depth_max"],
+        values["queue_depth_avg"],
+    )
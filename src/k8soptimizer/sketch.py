@@ -0,0 +1,246 @@
+import math
+import threading
+
+from beartype import beartype
+from beartype.typing import Optional, Tuple, Union
+
+__author__ = "Philipp Hellmich"
+__copyright__ = "Arvato Systems GmbH"
+__license__ = "MIT"
+
+# values below are counted as zero, e.g. idle cpu
+MIN_VALUE = 1e-9
+
+# sketches with a smaller count are dropped, e.g. of deleted containers
+MIN_SKETCH_COUNT = 1e-3
+
+
+class DDSketch:
+    """
+    Mergeable quantile sketch with a relative error guarantee (DDSketch).
+
+    Values are counted in logarithmic bins, so each quantile is within
+    relative_accuracy of the exact value. Counts are floats, which allows
+    weighted values and decaying old values.
+
+    Example:
+        sketch = DDSketch(0.01)
+        sketch.add(0.25)
+        sketch.quantile(0.95)
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 512):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0.0
+        self.count = 0.0
+
+    def add(self, value: float, weight: float = 1.0):
+        if value <= MIN_VALUE:
+            self.zero_count += weight
+        else:
+            index = math.ceil(math.log(value) / self.log_gamma)
+            self.bins[index] = self.bins.get(index, 0.0) + weight
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        self.count += weight
+
+    def _collapse(self):
+        # merge the lowest bins, the high quantiles stay accurate
+        indexes = sorted(self.bins)
+        excess = indexes[: len(indexes) - self.max_bins + 1]
+        target = indexes[len(excess)]
+        for index in excess:
+            self.bins[target] += self.bins.pop(index)
+
+    def merge(self, other: "DDSketch"):
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0.0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        while len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def decay(self, factor: float):
+        """
+        Multiply all counts by factor, e.g. 0.5 after one half-life.
+        """
+        self.bins = {
+            index: count * factor
+            for index, count in self.bins.items()
+            if count * factor > MIN_VALUE
+        }
+        self.zero_count *= factor
+        self.count = self.zero_count + sum(self.bins.values())
+
+    def quantile(self, quantile: float) -> Optional[float]:
+        """
+        Get the quantile, None if the sketch is empty.
+        """
+        if self.count <= 0:
+            return None
+        rank = quantile * self.count
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                return 2 * self.gamma**index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def as_dict(self) -> dict:
+        return {
+            "zero": self.zero_count,
+            "bins": {str(index): count for index, count in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dict(
+        cls, data: dict, relative_accuracy: float = 0.01, max_bins: int = 512
+    ) -> "DDSketch":
+        sketch = cls(relative_accuracy, max_bins)
+        sketch.bins = {int(index): count for index, count in data["bins"].items()}
+        sketch.zero_count = data["zero"]
+        sketch.count = sketch.zero_count + sum(sketch.bins.values())
+        return sketch
+
+
+class SketchSet:
+    """
+    Decaying quantile sketches of the usage of all containers, by metric.
+
+    A sample of age t has the weight 0.5 ** (t / half_life_seconds), so the
+    sketches follow the recent usage without keeping any samples.
+    """
+
+    def __init__(
+        self, half_life_seconds: Union[int, float], relative_accuracy: float = 0.01
+    ):
+        self.half_life_seconds = half_life_seconds
+        self.relative_accuracy = relative_accuracy
+        self.lock = threading.Lock()
+        self.sketches = {}
+        self.updated = None
+        self.loaded = False
+
+    def __len__(self) -> int:
+        with self.lock:
+            return sum(len(sketches) for sketches in self.sketches.values())
+
+    def add_results(
+        self,
+        metric: str,
+        results: list,
+        labels: Tuple[str, ...],
+        now: Union[int, float],
+    ):
+        """
+        Add the samples of a prometheus range query, weighted by their age at now.
+
+        Args:
+            metric (str): The name of the metric.
+            results (list): The results, j["data"]["result"] of the response.
+            labels (tuple): The labels of the key of a container.
+            now (float): The unix timestamp the weights are relative to.
+        """
+        with self.lock:
+            sketches = self.sketches.setdefault(metric, {})
+            for result in results:
+                key = tuple(result["metric"].get(label) for label in labels)
+                sketch = sketches.get(key)
+                if sketch is None:
+                    sketch = sketches[key] = DDSketch(self.relative_accuracy)
+                for timestamp, value in result["values"]:
+                    sketch.add(
+                        float(value),
+                        decay_factor(now - float(timestamp), self.half_life_seconds),
+                    )
+
+    def advance(self, now: Union[int, float]):
+        """
+        Decay all sketches to now, before adding samples weighted relative to now.
+
+        Sketches which decayed to about zero are removed, so the sketches of
+        deleted containers do not pile up.
+        """
+        with self.lock:
+            if self.updated is not None and now > self.updated:
+                factor = decay_factor(now - self.updated, self.half_life_seconds)
+                for metric, sketches in self.sketches.items():
+                    for sketch in sketches.values():
+                        sketch.decay(factor)
+                    self.sketches[metric] = {
+                        key: sketch
+                        for key, sketch in sketches.items()
+                        if sketch.count >= MIN_SKETCH_COUNT
+                    }
+            self.updated = now
+
+    def quantile(self, metric: str, key: tuple, quantile: float) -> Optional[float]:
+        with self.lock:
+            sketch = self.sketches.get(metric, {}).get(key)
+            if sketch is None:
+                return None
+            return sketch.quantile(quantile)
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {
+                "updated": self.updated,
+                "relative_accuracy": self.relative_accuracy,
+                "sketches": {
+                    metric: [
+                        [list(key), sketch.as_dict()]
+                        for key, sketch in sketches.items()
+                    ]
+                    for metric, sketches in self.sketches.items()
+                },
+            }
+
+    def restore(self, data: Optional[dict]):
+        """
+        Use the sketches of a previous run, see as_dict.
+        """
+        with self.lock:
+            self.loaded = True
+            if data is None:
+                return
+            self.updated = data["updated"]
+            self.relative_accuracy = data["relative_accuracy"]
+            self.sketches = {
+                metric: {
+                    tuple(key): DDSketch.from_dict(sketch, self.relative_accuracy)
+                    for key, sketch in sketches
+                }
+                for metric, sketches in data["sketches"].items()
+            }
+
+    def reset(self):
+        with self.lock:
+            self.sketches = {}
+            self.updated = None
+            self.loaded = False
+
+
+@beartype
+def decay_factor(
+    age_seconds: Union[int, float], half_life_seconds: Union[int, float]
+) -> float:
+    """
+    Get the weight of a sample of the given age.
+
+    Args:
+        age_seconds (float): The age of the sample.
+        half_life_seconds (float): The age at which a sample has half the weight.
+
+    Returns:
+        float: The weight between 0 and 1.
+
+    Example:
+        weight = decay_factor(3600, 4 * 3600)
+    """
+    return 0.5 ** (max(age_seconds, 0) / half_life_seconds)
@@ -0,0 +1,310 @@
+import json
+import os
+import threading
+
+import numpy as np
+from beartype.typing import Optional, Tuple, Union
+
+__author__ = "Philipp Hellmich"
+__copyright__ = "Arvato Systems GmbH"
+__license__ = "MIT"
+
+RECORD = np.dtype([("series", "<i4"), ("time", "<f8"), ("value", "<f8")])
+
+# a run of consecutive records of one series in the data file
+SEGMENT = np.dtype([("series", "<i4"), ("offset", "<i8"), ("count", "<i8")])
+
+KEY_LABELS = ("namespace", "workload", "workload_type", "container")
+
+# compact only once this many seconds of samples are expired, not on every sync
+COMPACT_SLACK_SECONDS = 24 * 3600
+
+
+class SeriesStore:
+    """
+    Local append-only store of the samples of container metrics.
+
+    Each metric has a data file of (series id, time, value) records, which
+    is read memory-mapped, a json index of the series keys and the covered
+    time range, and a segment file with the position of the records of each
+    series in the data file. Samples are only appended in time order and
+    each append adds one segment per series, so the samples of a series are
+    read from its segments in order without sorting the records.
+
+    Example:
+        series_store = SeriesStore("/var/lib/k8soptimizer")
+        series_store.append("my_metric", j["data"]["result"], start, end)
+        series_store.quantile("my_metric", key, start, end, 0.95)
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.indexes = {}
+        self.views = {}
+
+    def __str__(self) -> str:
+        return "directory {}".format(self.directory)
+
+    def data_path(self, metric: str) -> str:
+        return os.path.join(self.directory, "{}.series".format(metric))
+
+    def index_path(self, metric: str) -> str:
+        return os.path.join(self.directory, "{}.json".format(metric))
+
+    def segments_path(self, metric: str) -> str:
+        return os.path.join(self.directory, "{}.segments".format(metric))
+
+    def _index(self, metric: str) -> dict:
+        index = self.indexes.get(metric)
+        if index is None:
+            try:
+                with open(self.index_path(metric)) as f:
+                    index = json.load(f)
+            except FileNotFoundError:
+                index = {"series": [], "start": None, "last": None}
+            index["ids"] = {
+                tuple(key): series_id for series_id, key in enumerate(index["series"])
+            }
+            self.indexes[metric] = index
+        return index
+
+    def _save_index(self, metric: str, index: dict):
+        data = {key: index[key] for key in ["series", "start", "last"]}
+        # write to a temporary file first, so a kill never leaves a partial file
+        tmp_path = "{}.tmp".format(self.index_path(metric))
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.index_path(metric))
+
+    def _save_segments(self, metric: str, segments: np.ndarray):
+        tmp_path = "{}.tmp".format(self.segments_path(metric))
+        with open(tmp_path, "wb") as f:
+            f.write(segments.tobytes())
+        os.replace(tmp_path, self.segments_path(metric))
+
+    def _segments(self, metric: str, records: np.ndarray) -> np.ndarray:
+        """
+        Read the segments of the records, rebuilt if they do not match the data file.
+        """
+        try:
+            segments = np.fromfile(self.segments_path(metric), dtype=SEGMENT)
+        except FileNotFoundError:
+            segments = np.empty(0, dtype=SEGMENT)
+        if len(segments) > 0:
+            covered = segments["offset"][-1] + segments["count"][-1]
+        else:
+            covered = 0
+        if covered != len(records):
+            # e.g. a store of an older version or a kill between the writes
+            segments = find_segments(np.asarray(records["series"]))
+            self._save_segments(metric, segments)
+        return segments
+
+    def _view(self, metric: str) -> Optional[tuple]:
+        """
+        Get the records, their segments by series id and the first segment of each id.
+        """
+        try:
+            size = os.path.getsize(self.data_path(metric))
+        except FileNotFoundError:
+            return None
+        if size < RECORD.itemsize:
+            return None
+        view = self.views.get(metric)
+        if view is not None and view[0] == size:
+            return view[1:]
+        records = np.memmap(
+            self.data_path(metric),
+            dtype=RECORD,
+            mode="r",
+            shape=(size // RECORD.itemsize,),
+        )
+        segments = self._segments(metric, records)
+        segments = segments[np.argsort(segments["series"], kind="stable")]
+        positions = np.searchsorted(
+            segments["series"],
+            np.arange(len(self._index(metric)["series"]) + 1),
+        )
+        self.views[metric] = (size, records, segments, positions)
+        return records, segments, positions
+
+    def last_timestamp(self, metric: str) -> Optional[float]:
+        """
+        Get the time up to which the samples of metric are stored.
+        """
+        with self.lock:
+            return self._index(metric)["last"]
+
+    def covers(
+        self, metric: str, start: Union[int, float], end: Union[int, float]
+    ) -> bool:
+        """
+        Check if the samples between start and end are stored.
+        """
+        with self.lock:
+            index = self._index(metric)
+            if index["start"] is None or index["last"] is None:
+                return False
+            return index["start"] <= start and index["last"] >= end
+
+    def append(
+        self,
+        metric: str,
+        results: list,
+        start: Union[int, float],
+        end: Union[int, float],
+    ) -> int:
+        """
+        Append the samples of a prometheus range query.
+
+        Args:
+            metric (str): The name of the metric.
+            results (list): The results, j["data"]["result"] of the response.
+            start (float): The start of the queried range as unix timestamp.
+            end (float): The end of the queried range as unix timestamp.
+
+        Returns:
+            int: The number of samples appended.
+        """
+        with self.lock:
+            index = self._index(metric)
+            if index["last"] is not None and start <= index["last"]:
+                results = [
+                    dict(
+                        result,
+                        values=[v for v in result["values"] if v[0] > index["last"]],
+                    )
+                    for result in results
+                ]
+            count = sum(len(result["values"]) for result in results)
+            records = np.empty(count, dtype=RECORD)
+            i = 0
+            for result in results:
+                if not result["values"]:
+                    continue
+                metric_labels = result["metric"]
+                key = tuple(metric_labels.get(label) for label in KEY_LABELS)
+                series_id = index["ids"].get(key)
+                if series_id is None:
+                    series_id = len(index["series"])
+                    index["series"].append(list(key))
+                    index["ids"][key] = series_id
+                values = np.array(result["values"], dtype=np.float64).reshape(-1, 2)
+                records["series"][i : i + len(values)] = series_id
+                records["time"][i : i + len(values)] = values[:, 0]
+                records["value"][i : i + len(values)] = values[:, 1]
+                i += len(values)
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.data_path(metric), "ab") as f:
+                offset = f.tell() // RECORD.itemsize
+                f.write(records.tobytes())
+            with open(self.segments_path(metric), "ab") as f:
+                f.write(find_segments(records["series"], offset).tobytes())
+            if index["start"] is None:
+                index["start"] = start
+            index["last"] = max(end, index["last"] or end)
+            self._save_index(metric, index)
+            return count
+
+    def samples(
+        self,
+        metric: str,
+        key: Tuple[str, str, str, str],
+        start: Union[int, float],
+        end: Union[int, float],
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the times and values of a series between start (exclusive) and end.
+        """
+        with self.lock:
+            series_id = self._index(metric)["ids"].get(key)
+            view = self._view(metric)
+            if series_id is None or view is None:
+                return np.empty(0), np.empty(0)
+            records, segments, positions = view
+            found = np.concatenate(
+                [records[0:0]]
+                + [
+                    records[segment["offset"] : segment["offset"] + segment["count"]]
+                    for segment in segments[
+                        positions[series_id] : positions[series_id + 1]
+                    ]
+                ]
+            )
+        window = (found["time"] > start) & (found["time"] <= end)
+        return found["time"][window], found["value"][window]
+
+    def quantile(
+        self,
+        metric: str,
+        key: Tuple[str, str, str, str],
+        start: Union[int, float],
+        end: Union[int, float],
+        quantile: float,
+    ) -> Optional[float]:
+        """
+        Get the quantile of a series between start and end like quantile_over_time.
+
+        Returns:
+            Optional[float]: The quantile, None if there are no samples.
+        """
+        _, values = self.samples(metric, key, start, end)
+        if len(values) == 0:
+            return None
+        return float(np.quantile(values, quantile))
+
+    def compact(self, metric: str, before: Union[int, float]) -> int:
+        """
+        Drop the samples older than before, once enough of them are expired.
+
+        Returns:
+            int: The number of samples dropped.
+        """
+        with self.lock:
+            index = self._index(metric)
+            if (
+                index["start"] is None
+                or index["start"] > before - COMPACT_SLACK_SECONDS
+            ):
+                return 0
+            view = self._view(metric)
+            if view is None:
+                return 0
+            records = view[0]
+            kept = np.array(records[records["time"] > before])
+            dropped = len(records) - len(kept)
+            tmp_path = "{}.tmp".format(self.data_path(metric))
+            with open(tmp_path, "wb") as f:
+                f.write(kept.tobytes())
+            self.views.pop(metric, None)
+            del view, records
+            os.replace(tmp_path, self.data_path(metric))
+            self._save_segments(metric, find_segments(kept["series"]))
+            index["start"] = before
+            self._save_index(metric, index)
+            return dropped
+
+
+def find_segments(series: np.ndarray, offset: int = 0) -> np.ndarray:
+    """
+    Get the runs of consecutive records with the same series id.
+
+    Args:
+        series (np.ndarray): The series ids of the records.
+        offset (int, optional): The position of the first record in the data file. Default is 0.
+
+    Returns:
+        np.ndarray: The segments, see SEGMENT.
+
+    Example:
+        segments = find_segments(records["series"], 1024)
+    """
+    if len(series) == 0:
+        return np.empty(0, dtype=SEGMENT)
+    starts = np.concatenate(([0], np.flatnonzero(series[1:] != series[:-1]) + 1))
+    segments = np.empty(len(starts), dtype=SEGMENT)
+    segments["series"] = series[starts]
+    segments["offset"] = starts + offset
+    segments["count"] = np.diff(np.append(starts, len(series)))
+    return segments
@@ -0,0 +1,134 @@
+import json
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+import pytest
+from kubernetes import client
+from kubernetes.client.models import V1ConfigMap, V1ObjectMeta
+from kubernetes.client.rest import ApiException
+
+import k8soptimizer.checkpoint as checkpoint
+import k8soptimizer.helpers as helpers
+
+__author__ = "Philipp Hellmich"
+__copyright__ = "Arvato Systems GmbH"
+__license__ = "MIT"
+
+
+def test_deployment_key():
+    assert checkpoint.deployment_key("default", "app") == "default/app"
+
+
+def test_file_checkpoint_store(tmp_path):
+    store = checkpoint.FileCheckpointStore(str(tmp_path / "checkpoint.json"))
+
+    assert store.load() is None
+
+    store.save({"completed": {"default/app": "2023-09-07T12:00:00+00:00"}})
+
+    assert store.load() == {"completed": {"default/app": "2023-09-07T12:00:00+00:00"}}
+    assert not (tmp_path / "checkpoint.json.tmp").exists()
+
+
+@patch("k8soptimizer.checkpoint.client.CoreV1Api.create_namespaced_config_map")
+@patch("k8soptimizer.checkpoint.client.CoreV1Api.patch_namespaced_config_map")
+@patch("k8soptimizer.checkpoint.client.CoreV1Api.read_namespaced_config_map")
+def test_config_map_checkpoint_store(mock_func1, mock_func2, mock_func3):
+    store = checkpoint.ConfigMapCheckpointStore(
+        client.ApiClient(), "default", "k8soptimizer-checkpoint"
+    )
+
+    mock_func1.side_effect = ApiException(status=404)
+    assert store.load() is None
+
+    mock_func1.side_effect = None
+    mock_func1.return_value = V1ConfigMap(
+        metadata=V1ObjectMeta(name="k8soptimizer-checkpoint"),
+        data={"checkpoint.json": json.dumps({"completed": {}})},
+    )
+    assert store.load() == {"completed": {}}
+
+    # only the key is patched, other keys of the ConfigMap are kept
+    store.save({"completed": {}})
+    body = mock_func2.call_args[0][2]
+    assert body == {"data": {"checkpoint.json": json.dumps({"completed": {}})}}
+    mock_func3.assert_not_called()
+
+    mock_func2.side_effect = ApiException(status=404)
+    store.save({"completed": {}})
+    mock_func3.assert_called_once()
+    config_map = mock_func3.call_args[0][1]
+    assert json.loads(config_map.data["checkpoint.json"]) == {"completed": {}}
+
+    with pytest.raises(ValueError):
+        store.save({"completed": {"x": "y" * checkpoint.MAX_CONFIG_MAP_BYTES}})
+
+
+def test_checkpoint_resume():
+    now = helpers.create_timestamp()
+    store = MagicMock()
+    store.load.return_value = data = {
+        "started": (now - timedelta(hours=1)).isoformat(),
+        "completed": {
+            "default/app1": (now - timedelta(minutes=30)).isoformat(),
+            "default/app2": (now - timedelta(minutes=10)).isoformat(),
+        },
+        "stats": {"old_cpu_sum": 2},
+    }
+    progress = checkpoint.Checkpoint(store)
+
+    assert progress.resume(60) == 2
+    assert progress.is_done("default/app1")
+    assert progress.stats == {"old_cpu_sum": 2}
+
+    # stale entries are optimized again and the stats are not reused
+    progress = checkpoint.Checkpoint(store)
+    assert progress.resume(20) == 1
+    assert not progress.is_done("default/app1")
+    assert progress.is_done("default/app2")
+    assert progress.stats == {}
+
+    store.load.return_value = None
+    progress = checkpoint.Checkpoint(store)
+    assert progress.resume(60) == 0
+
+    # a finished run starts over
+    store.load.return_value = dict(data, finished=True)
+    progress = checkpoint.Checkpoint(store)
+    assert progress.resume(60) == 0
+    assert not progress.is_done("default/app1")
+
+
+def test_checkpoint_finish():
+    store = MagicMock()
+    progress = checkpoint.Checkpoint(store, flush_interval_seconds=3600)
+    progress.mark_done("default/app1")
+
+    progress.finish()
+
+    data = store.save.call_args[0][0]
+    assert data["finished"] is True
+    assert list(data["completed"]) == ["default/app1"]
+
+
+def test_checkpoint_flush():
+    store = MagicMock()
+    progress = checkpoint.Checkpoint(
+        store, flush_interval_seconds=3600, get_stats=lambda: {"old_cpu_sum": 1}
+    )
+
+    progress.mark_done("default/app1")
+    store.save.assert_not_called()
+
+    progress.flush()
+    data = store.save.call_args[0][0]
+    assert list(data["completed"]) == ["default/app1"]
+    assert data["stats"] == {"old_cpu_sum": 1}
+
+    progress.flush_interval_seconds = 0
+    progress.mark_done("default/app2")
+    assert store.save.call_count == 2
+
+    # errors while writing are only logged
+    store.save.side_effect = OSError("No space left on device")
+    progress.flush()
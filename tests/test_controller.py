@@ -0,0 +1,245 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from kubernetes.client.models import (
+    V1Deployment,
+    V1DeploymentSpec,
+    V1LabelSelector,
+    V1ObjectMeta,
+    V1PodTemplateSpec,
+    V2CrossVersionObjectReference,
+    V2HorizontalPodAutoscaler,
+    V2HorizontalPodAutoscalerSpec,
+)
+from kubernetes.client.rest import ApiException
+
+import k8soptimizer.controller as controller
+
+__author__ = "Philipp Hellmich"
+__copyright__ = "Arvato Systems GmbH"
+__license__ = "MIT"
+
+
+def create_deployment(name, namespace="default", replicas=1):
+    return V1Deployment(
+        metadata=V1ObjectMeta(name=name, namespace=namespace),
+        spec=V1DeploymentSpec(
+            replicas=replicas,
+            selector=V1LabelSelector(match_labels={"app": name}),
+            template=V1PodTemplateSpec(),
+        ),
+    )
+
+
+def create_hpa(name, target, namespace="default", max_replicas=4):
+    return V2HorizontalPodAutoscaler(
+        metadata=V1ObjectMeta(name=name, namespace=namespace),
+        spec=V2HorizontalPodAutoscalerSpec(
+            max_replicas=max_replicas,
+            scale_target_ref=V2CrossVersionObjectReference(
+                api_version="apps/v1", kind="Deployment", name=target
+            ),
+        ),
+    )
+
+
+def test_work_queue_debounce():
+    queue = controller.WorkQueue(debounce_seconds=0.05)
+    queue.add("default/app")
+    queue.add("default/app")
+
+    assert len(queue) == 1
+    assert queue.get(timeout=0.01) is None
+    assert queue.get(timeout=1) == "default/app"
+    assert queue.get(timeout=0.1) is None
+
+
+def test_work_queue_processing():
+    queue = controller.WorkQueue(debounce_seconds=0)
+    queue.add("default/app")
+    key = queue.get(timeout=1)
+
+    # added while processing, handed out again once done
+    queue.add(key)
+    assert queue.get(timeout=0.05) is None
+    queue.done(key)
+    assert queue.get(timeout=1) == key
+
+
+def test_work_queue_retry():
+    queue = controller.WorkQueue(
+        debounce_seconds=0,
+        backoff_base_seconds=0.01,
+        backoff_max_seconds=0.02,
+        max_retries=2,
+    )
+    queue.add("default/app")
+    key = queue.get(timeout=1)
+
+    assert queue.retry(key) is True
+    assert queue.failures[key] == 1
+    queue.done(key)
+    assert queue.get(timeout=1) == key
+
+    assert queue.retry(key) is True
+    queue.done(key)
+    assert queue.get(timeout=1) == key
+
+    assert queue.retry(key) is False
+    queue.done(key)
+    assert queue.get(timeout=0.1) is None
+    assert key not in queue.failures
+
+
+def test_work_queue_shutdown():
+    queue = controller.WorkQueue()
+    queue.shutdown()
+    queue.add("default/app")
+
+    assert queue.get() is None
+
+
+def test_event_handler_deployment():
+    queue = MagicMock()
+    handler = controller.EventHandler(queue, deplopyment_pattern="^app")
+
+    handler.on_deployment("SYNC", create_deployment("app1", replicas=4))
+    handler.on_deployment("ADDED", create_deployment("other"))
+    queue.add.assert_not_called()
+
+    handler.on_deployment("ADDED", create_deployment("app2"))
+    queue.add.assert_called_once_with("default/app2")
+    queue.add.reset_mock()
+
+    handler.on_deployment("MODIFIED", create_deployment("app1", replicas=4))
+    handler.on_deployment("MODIFIED", create_deployment("app1", replicas=5))
+    queue.add.assert_not_called()
+
+    handler.on_deployment("MODIFIED", create_deployment("app1", replicas=8))
+    queue.add.assert_called_once_with("default/app1")
+    queue.add.reset_mock()
+
+    handler.on_deployment("DELETED", create_deployment("app1", replicas=6))
+    queue.forget.assert_called_once_with("default/app1")
+    queue.add.assert_not_called()
+
+
+def test_event_handler_hpa():
+    queue = MagicMock()
+    handler = controller.EventHandler(queue)
+
+    handler.on_hpa("SYNC", create_hpa("app", "app"))
+    handler.on_deployment("SYNC", create_deployment("app", replicas=2))
+    handler.on_hpa("MODIFIED", create_hpa("app", "app"))
+    # replica changes of hpa managed deployments are ignored
+    handler.on_deployment("MODIFIED", create_deployment("app", replicas=8))
+    queue.add.assert_not_called()
+
+    handler.on_hpa("MODIFIED", create_hpa("app", "app", max_replicas=10))
+    queue.add.assert_called_once_with("default/app")
+    queue.add.reset_mock()
+
+    handler.on_hpa("DELETED", create_hpa("app", "app", max_replicas=10))
+    queue.add.assert_called_once_with("default/app")
+    queue.add.reset_mock()
+
+    handler.on_hpa("ADDED", create_hpa("app2", "app2"))
+    queue.add.assert_called_once_with("default/app2")
+
+
+def test_run_watch():
+    stop_event = threading.Event()
+    response = MagicMock()
+    response.items = [create_deployment("app1")]
+    response.metadata.resource_version = "1"
+    list_func = MagicMock(return_value=response)
+    events = []
+
+    def handle_event(event_type, obj):
+        events.append((event_type, obj.metadata.name))
+
+    def stream(func, **kwargs):
+        assert kwargs["resource_version"] == "1"
+        yield {"type": "ADDED", "object": create_deployment("app2")}
+        yield {"type": "BOOKMARK", "object": create_deployment("app2")}
+        stop_event.set()
+        yield {"type": "ADDED", "object": create_deployment("app3")}
+
+    with patch("k8soptimizer.controller.watch.Watch") as mock_watch:
+        mock_watch.return_value.stream.side_effect = stream
+        mock_watch.return_value.resource_version = "2"
+        controller.run_watch(list_func, handle_event, stop_event)
+
+    assert events == [("SYNC", "app1"), ("ADDED", "app2")]
+
+
+def test_run_watch_expired():
+    stop_event = threading.Event()
+    response = MagicMock()
+    response.items = []
+    response.metadata.resource_version = "1"
+    list_func = MagicMock(return_value=response)
+    calls = {"n": 0}
+
+    def stream(func, **kwargs):
+        calls["n"] += 1
+        if calls["n"] == 1:
+            raise ApiException(status=410)
+        stop_event.set()
+        return iter([])
+
+    with patch("k8soptimizer.controller.watch.Watch") as mock_watch:
+        mock_watch.return_value.stream.side_effect = stream
+        controller.run_watch(list_func, MagicMock(), stop_event)
+
+    assert list_func.call_count == 2
+
+
+def test_run_worker():
+    stop_event = threading.Event()
+    queue = controller.WorkQueue(
+        debounce_seconds=0, backoff_base_seconds=0.01, max_retries=1
+    )
+    processed = []
+
+    def process(key):
+        processed.append(key)
+        if key == "default/broken":
+            raise RuntimeError("No data found")
+
+    queue.add("default/app")
+    queue.add("default/broken")
+    thread = threading.Thread(
+        target=controller.run_worker,
+        args=(queue, process, stop_event),
+        kwargs={"poll_seconds": 0.01},
+    )
+    thread.start()
+    time.sleep(0.3)
+    stop_event.set()
+    thread.join()
+
+    assert sorted(processed) == ["default/app", "default/broken", "default/broken"]
+    assert len(queue) == 0
+    assert queue.processing == set()
+
+
+def test_run_worker_not_running():
+    stop_event = threading.Event()
+    queue = controller.WorkQueue(debounce_seconds=0)
+    process = MagicMock()
+
+    queue.add("default/app")
+    thread = threading.Thread(
+        target=controller.run_worker,
+        args=(queue, process, stop_event, lambda: False),
+        kwargs={"poll_seconds": 0.01},
+    )
+    thread.start()
+    time.sleep(0.1)
+    stop_event.set()
+    thread.join()
+
+    process.assert_not_called()
+    assert len(queue) == 0
@@ -0,0 +1,128 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from kubernetes import client
+from kubernetes.client.models import V1Lease, V1LeaseSpec, V1ObjectMeta
+from kubernetes.client.rest import ApiException
+
+import k8soptimizer.daemon as daemon
+
+__author__ = "Philipp Hellmich"
+__copyright__ = "Arvato Systems GmbH"
+__license__ = "MIT"
+
+
+def create_lease(holder, renew_time, annotations=None):
+    return V1Lease(
+        metadata=V1ObjectMeta(
+            name="k8soptimizer", namespace="default", annotations=annotations
+        ),
+        spec=V1LeaseSpec(
+            holder_identity=holder,
+            renew_time=renew_time,
+            lease_duration_seconds=60,
+        ),
+    )
+
+
+def test_next_run_time():
+    now = datetime(2023, 9, 7, 12, 0, tzinfo=timezone.utc)
+
+    assert daemon.next_run_time(None, 240, now) == now
+    assert daemon.next_run_time(now - timedelta(hours=1), 240, now) == now + timedelta(
+        hours=3
+    )
+    assert daemon.next_run_time(now - timedelta(hours=5), 240, now) == now
+
+
+def test_take_while():
+    counter = {"n": 0}
+
+    def is_running():
+        counter["n"] += 1
+        return counter["n"] <= 3
+
+    result = list(daemon.take_while(range(10), is_running))
+
+    assert result == [0, 1, 2]
+
+
+@patch.object(client.CoordinationV1Api, "create_namespaced_lease")
+@patch.object(client.CoordinationV1Api, "read_namespaced_lease")
+def test_leader_elector_create(mock_read, mock_create):
+    mock_read.side_effect = ApiException(status=404)
+    mock_create.side_effect = lambda namespace, lease: lease
+
+    elector = daemon.LeaderElector(client.ApiClient(), "default", identity="me")
+
+    assert elector.try_acquire_or_renew()
+    assert elector.is_leader
+    assert mock_create.call_args[0][1].spec.holder_identity == "me"
+
+    mock_create.side_effect = ApiException(status=409)
+    elector = daemon.LeaderElector(client.ApiClient(), "default", identity="other")
+
+    assert not elector.try_acquire_or_renew()
+    assert not elector.is_leader
+
+
+@patch.object(client.CoordinationV1Api, "replace_namespaced_lease")
+@patch.object(client.CoordinationV1Api, "read_namespaced_lease")
+def test_leader_elector_takeover(mock_read, mock_replace):
+    now = datetime.now(timezone.utc)
+    mock_replace.side_effect = lambda name, namespace, lease: lease
+
+    elector = daemon.LeaderElector(client.ApiClient(), "default", identity="me")
+
+    # another replica holds a valid lease
+    mock_read.return_value = create_lease("other", now)
+    assert not elector.try_acquire_or_renew()
+    mock_replace.assert_not_called()
+
+    # the lease of the other replica expired
+    last_run = now - timedelta(hours=1)
+    mock_read.return_value = create_lease(
+        "other",
+        now - timedelta(minutes=5),
+        {daemon.LeaderElector.last_run_annotation: last_run.isoformat()},
+    )
+    assert elector.try_acquire_or_renew()
+    lease = mock_replace.call_args[0][2]
+    assert lease.spec.holder_identity == "me"
+    assert lease.spec.lease_transitions == 1
+    assert elector.get_last_run() == last_run
+
+    # someone else won the race
+    mock_replace.side_effect = ApiException(status=409)
+    assert not elector.try_acquire_or_renew()
+    assert not elector.is_leader
+
+
+def test_run_daemon():
+    stop_event = threading.Event()
+    cycles = []
+
+    def run_cycle(is_running):
+        cycles.append(is_running())
+        if len(cycles) == 2:
+            stop_event.set()
+
+    with patch("k8soptimizer.daemon.next_run_time") as mock_func1:
+        mock_func1.side_effect = lambda last_run, interval, now: now
+        daemon.run_daemon(run_cycle, 240, None, stop_event, poll_seconds=0.01)
+
+    assert cycles == [True, True]
+
+
+def test_run_daemon_not_leader():
+    stop_event = threading.Event()
+    elector = daemon.LeaderElector(client.ApiClient(), "default", identity="me")
+    cycles = []
+
+    with patch.object(elector, "start"), patch.object(elector, "stop"):
+        timer = threading.Timer(0.1, stop_event.set)
+        timer.start()
+        daemon.run_daemon(cycles.append, 240, elector, stop_event, poll_seconds=0.01)
+
+    assert cycles == []
@@ -0,0 +1,201 @@
+import random
+
+import numpy as np
+from kubernetes.client.models import V1Container, V1ResourceRequirements
+
+import k8soptimizer.engine as engine
+import k8soptimizer.main as main
+
+__author__ = "Philipp Hellmich"
+__copyright__ = "Arvato Systems GmbH"
+__license__ = "MIT"
+
+
+def create_metrics(rng):
+    return {
+        "cpu_history": rng.choice([rng.uniform(0, 40), rng.randint(0, 4) / 8]),
+        "cpu_trend": rng.choice([1.0, rng.uniform(0.5, 1.5)]),
+        "runtime": rng.choice([None, "nodejs", "go"]),
+        "oom_killed": rng.choice([0, 0, 1, 3]),
+        "memory_history": rng.uniform(0, 32 * 1024**3),
+        "memory_trend": rng.uniform(0.5, 1.5),
+        "memory_limits_history": rng.choice(
+            [rng.randint(0, 32 * 1024**3), rng.uniform(0, 32 * 1024**3)]
+        ),
+    }
+
+
+def test_round_decimals():
+    values = [2.675, 0.0005, 0.0015, 1.0005, 0.1234, 16.0, 0.3335, 1e-9]
+    rounded = engine.round_decimals(np.array(values), 3)
+
+    assert rounded.tolist() == [round(value, 3) for value in values]
+
+    rng = random.Random(1)
+    values = [rng.randint(0, 100000) / 1000 + 0.0005 for _ in range(1000)]
+    rounded = engine.round_decimals(np.array(values), 3)
+
+    assert rounded.tolist() == [round(value, 3) for value in values]
+
+
+def test_compute_parity():
+    rng = random.Random(42)
+    metrics = [create_metrics(rng) for _ in range(2000)]
+    replicas = [rng.randint(1, 20) for _ in metrics]
+    oom_killed = np.array([m["oom_killed"] for m in metrics])
+    memory_trend = np.array([m["memory_trend"] for m in metrics])
+
+    cpu = engine.cpu_requests(
+        np.array([m["cpu_history"] for m in metrics]),
+        np.array([m["cpu_trend"] for m in metrics]),
+        np.array(replicas),
+        np.array([m["runtime"] == "nodejs" for m in metrics]),
+        main.MIN_CPU_REQUEST,
+        main.MAX_CPU_REQUEST,
+        main.CPU_REQUEST_RATIO,
+        main.MAX_CPU_REQUEST_NODEJS,
+    )
+    memory = engine.memory_bytes(
+        np.array([m["memory_history"] for m in metrics]),
+        memory_trend,
+        oom_killed,
+        1.5,
+        main.MIN_MEMORY_REQUEST,
+        main.MAX_MEMORY_REQUEST,
+        main.MEMORY_REQUEST_RATIO,
+    )
+    memory_limits = engine.memory_bytes(
+        np.array([m["memory_limits_history"] for m in metrics], dtype=np.float64),
+        memory_trend,
+        oom_killed,
+        2,
+        main.MIN_MEMORY_LIMIT,
+        main.MAX_MEMORY_LIMIT,
+        main.MEMORY_LIMIT_RATIO,
+    )
+
+    for i, m in enumerate(metrics):
+        expected = main.compute_container_resources(m, replicas[i])
+        assert cpu[i] == expected["cpu"]
+        assert memory[i] == expected["memory"]
+        assert memory_limits[i] == expected["memory_limits"]
+
+
+def test_significant_changes():
+    rng = random.Random(7)
+    old = [rng.choice([0.001, rng.uniform(0.01, 4)]) for _ in range(2000)]
+    new = [
+        value * rng.choice([1.0, 1.095, 1.105, rng.uniform(0.5, 1.5)]) for value in old
+    ]
+
+    changed = engine.significant_changes(np.array(old), np.array(new), 0.1)
+
+    assert changed.tolist() == [
+        main.is_significant_change(o, n, 0.1) for o, n in zip(old, new)
+    ]
+
+    values, changed = engine.apply_changes(
+        np.array([1.0, 1.0]), np.array([1.05, 2.0]), 0.1
+    )
+    assert values.tolist() == [1.0, 2.0]
+    assert changed.tolist() == [False, True]
+
+
+def test_compute_resources_batch():
+    rng = random.Random(3)
+    metrics = [create_metrics(rng) for _ in range(200)]
+    replicas = [rng.randint(1, 10) for _ in metrics]
+    containers = [
+        V1Container(
+            name="app",
+            resources=V1ResourceRequirements(
+                requests={"cpu": "500m", "memory": "1Gi"}, limits={"memory": "2Gi"}
+            ),
+        )
+        for _ in metrics
+    ]
+
+    result = main.compute_resources_batch(metrics, replicas, containers)
+
+    for i, container in enumerate(containers):
+        cpu, changed_cpu = main.optimize_container_cpu_requests(
+            "default", "app", container, "deployment", replicas[i], metrics=metrics[i]
+        )
+        memory, changed_memory = main.optimize_container_memory_requests(
+            "default", "app", container, "deployment", replicas[i], metrics=metrics[i]
+        )
+        memory_limits, changed_memory_limits = main.optimize_container_memory_limits(
+            "default", "app", container, "deployment", replicas[i], metrics=metrics[i]
+        )
+        assert result["cpu"][i] == cpu
+        assert result["changed_cpu"][i] == changed_cpu
+        assert result["memory"][i] == memory
+        assert result["changed_memory"][i] == changed_memory
+        assert result["memory_limits"][i] == memory_limits
+        assert result["changed_memory_limits"][i] == changed_memory_limits
+
+
+def test_seasonal_trend():
+    current = np.array([1.2, 3.0, 1.0, 1.0])
+    previous = np.array(
+        [[1.0, np.nan], [1.0, 1.0], [0.0, np.nan], [1.0, 0.99]],
+    )
+
+    trend = engine.seasonal_trend(current, previous, 0.5, 1.5)
+
+    assert trend[0] == 1.2
+    assert trend[1] == 1.5
+    assert np.isnan(trend[2])
+    assert trend[3] == round(np.median([1.0, 1 / 0.99]), 3)
+
+
+def test_holt_winters():
+    steps = np.arange(14 * 24)
+    daily = np.sin(2 * np.pi * steps / 24)
+    weekly = 0.5 * (steps % (7 * 24) >= 5 * 24)
+    series = np.vstack([10 + 0.01 * steps + daily + weekly, np.full(len(steps), 2.0)])
+    series[0, 100:110] = np.nan
+
+    forecast = engine.holt_winters(series, (24, 7 * 24), 4)
+
+    future = np.arange(len(steps), len(steps) + 4)
+    expected = 10 + 0.01 * future + np.sin(2 * np.pi * future / 24)
+    assert forecast.shape == (2, 4)
+    assert np.allclose(forecast[0], expected, atol=0.05)
+    assert np.allclose(forecast[1], 2.0)
+
+
+def test_hourly_profile():
+    # two weeks of hourly samples starting on Monday 1970-01-05 00:00 UTC
+    times = (4 * 24 + np.arange(14 * 24)) * 3600.0
+    values = np.vstack([np.arange(14 * 24) % 24, np.arange(14 * 24) // 24]) * 1.0
+    values[0, 0] = np.nan
+
+    profile = engine.hourly_profile(times, values)
+
+    assert profile.shape == (2, 7, 24)
+    assert profile[0, 0, 0] == 0
+    assert profile[0, 2, 13] == 13
+    # the highest sample of the same hour of both weeks
+    assert profile[1, 0, 5] == 7
+    assert np.isnan(engine.hourly_profile(times[:24], values[:, :24])[0, 1, 0])
+
+
+def test_peak_windows():
+    profiles = np.ones((2, engine.WEEK_HOURS))
+    profiles[0, [0, 1, 30, 31, 167]] = 2.0
+    profiles[1, 50] = np.nan
+
+    peaks = engine.peak_hours(profiles, 1.5)
+
+    assert peaks[0].sum() == 5
+    assert not peaks[1].any()
+    assert engine.peak_windows(peaks[0]) == [(30, 32), (167, 170)]
+    assert engine.peak_windows(peaks[1]) == []
+    assert engine.peak_windows(np.ones(engine.WEEK_HOURS, dtype=bool)) == [(0, 168)]
+
+
+def test_saturation_boost():
+    boost = engine.saturation_boost(np.array([0.0, 0.1, 0.3, 0.9]), 0.1, 1.5)
+
+    assert np.allclose(boost, [1.0, 1.0, 1.3, 1.5])
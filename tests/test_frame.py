@@ -0,0 +1,128 @@
+import pickle
+
+import numpy as np
+import pytest
+
+import k8soptimizer.frame as frame
+
+__author__ = "Philipp Hellmich"
+__copyright__ = "Arvato Systems GmbH"
+__license__ = "MIT"
+
+
+def test_container_key():
+    assert frame.container_key("default", "app", "nginx") == (
+        "default",
+        "app",
+        "deployment",
+        "nginx",
+    )
+
+
+def test_metric_frame():
+    metric_frame = frame.MetricFrame(["cpu"], capacity=2)
+
+    rows = [
+        metric_frame.intern(frame.container_key("default", "app{}".format(i), "nginx"))
+        for i in range(5)
+    ]
+    assert rows == [0, 1, 2, 3, 4]
+    assert metric_frame.intern(frame.container_key("default", "app1", "nginx")) == 1
+    assert len(metric_frame) == 5
+
+    metric_frame.set(1, "cpu", 0.5)
+    metric_frame.set(4, "memory", 1024)
+
+    assert metric_frame.get(1, "cpu") == 0.5
+    assert metric_frame.get(0, "cpu") is None
+    assert metric_frame.get(0, "unknown") is None
+    assert metric_frame.row(frame.container_key("default", "app4", "nginx")) == {
+        "memory": 1024.0
+    }
+    assert metric_frame.row(frame.container_key("default", "other", "nginx")) is None
+    assert frame.container_key("default", "app4", "nginx") in metric_frame
+
+    cpu = metric_frame.column("cpu")
+    assert cpu.shape == (5,)
+    assert np.isnan(cpu[0]) and cpu[1] == 0.5
+
+
+def test_metric_frame_add_results():
+    metric_frame = frame.MetricFrame()
+    results = [
+        {
+            "metric": {"workload": "app", "container": "nginx", "series": "cpu_today"},
+            "value": [1694006400, "0.5"],
+        },
+        {
+            "metric": {"workload": "app", "container": "nginx", "series": "cpu_0.95"},
+            "value": [1694006400, "0.75"],
+        },
+    ]
+
+    assert (
+        metric_frame.add_results(
+            results,
+            column_label="series",
+            namespace="default",
+            workload_type="deployment",
+        )
+        == 2
+    )
+    assert metric_frame.row(frame.container_key("default", "app", "nginx")) == {
+        "cpu_today": 0.5,
+        "cpu_0.95": 0.75,
+    }
+
+    metric_frame.add_results(
+        [
+            {
+                "metric": {
+                    "namespace": "other",
+                    "workload": "app",
+                    "container": "nginx",
+                },
+                "value": [0, "1"],
+            }
+        ],
+        column="usage",
+        workload_type="deployment",
+    )
+    assert metric_frame.column("usage").tolist()[1] == 1.0
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_metric_frame_share(tmp_path, mmap):
+    key1, key2, key3 = [
+        frame.container_key("default", "app{}".format(i), "nginx") for i in range(3)
+    ]
+    metric_frame = frame.MetricFrame(["cpu", "memory"])
+    metric_frame.set(metric_frame.intern(key1), "cpu", 0.5)
+    metric_frame.set(metric_frame.intern(key2), "memory", 1024)
+    path = str(tmp_path / "bounds") if mmap else None
+
+    shared = metric_frame.share(path)
+    try:
+        attached = pickle.loads(pickle.dumps(shared)).attach()
+
+        assert attached.row(key1) == {"cpu": 0.5}
+        assert attached.get(attached.id_of(key2), "memory") == 1024
+        assert list(attached.column("cpu")[:1]) == [0.5]
+        with pytest.raises(ValueError):
+            attached.set(0, "cpu", 1)
+
+        # new rows are copied out of the shared values
+        attached.set(attached.intern(key3), "cpu", 2)
+        assert attached.row(key3) == {"cpu": 2}
+        assert attached.row(key1) == {"cpu": 0.5}
+        del attached
+    finally:
+        shared.unlink()
+    if mmap:
+        assert not (tmp_path / "bounds").exists()
+
+
+def test_metric_frame_share_empty():
+    shared = frame.MetricFrame(["cpu"]).share()
+    assert len(shared.attach()) == 0
+    shared.unlink()
@@ -109,3 +109,30 @@ def test_valid_k8s_name_arg():
         helpers.valid_k8s_name_arg("(")
     assert str(exc_info.value).rfind("is not a valid k8s object name") > 0
     assert helpers.valid_k8s_name_arg("hallo") == "hallo"
+
+
+def test_get_shard():
+    keys = ["namespace{}".format(i) for i in range(200)]
+    shards = [helpers.get_shard(key, 4) for key in keys]
+
+    assert shards == [helpers.get_shard(key, 4) for key in keys]
+    assert set(shards) == {0, 1, 2, 3}
+    assert helpers.get_shard("namespace1", 1) == 0
+
+    # adding a shard only moves keys to the new shard
+    for key, shard in zip(keys, shards):
+        new_shard = helpers.get_shard(key, 5)
+        assert new_shard in [shard, 4]
+
+    with pytest.raises(ValueError):
+        helpers.get_shard("namespace1", 0)
+
+
+def test_shard_arg():
+    assert helpers.shard_arg("0") == 0
+    assert helpers.shard_arg("3") == 3
+
+    with pytest.raises(argparse.ArgumentTypeError):
+        helpers.shard_arg("-1")
+    with pytest.raises(argparse.ArgumentTypeError):
+        helpers.shard_arg("one")
@@ -1,22 +1,34 @@
+import copy
 import json
+import math
+import signal
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
 # Standard library imports...
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
+import numpy as np
 import pytest
 from kubernetes.client.models import (
     V1Container,
     V1Deployment,
     V1DeploymentList,
     V1DeploymentSpec,
+    V1EnvVar,
+    V1EnvVarSource,
     V1LabelSelector,
+    V1Lease,
+    V1LeaseSpec,
+    V1ListMeta,
     V1Namespace,
     V1NamespaceList,
     V1ObjectMeta,
     V1PodSpec,
     V1PodTemplateSpec,
+    V1ResourceFieldSelector,
     V1ResourceRequirements,
     V2CrossVersionObjectReference,
     V2HorizontalPodAutoscaler,
@@ -26,7 +38,11 @@ from kubernetes.client.models import (
     V2MetricTarget,
     V2ResourceMetricSource,
 )
+from kubernetes.client.rest import ApiException
 
+import k8soptimizer.checkpoint as checkpoint
+import k8soptimizer.daemon as daemon
+import k8soptimizer.frame as frame
 import k8soptimizer.main as main
 
 __author__ = "Philipp Hellmich"
@@ -449,9 +465,11 @@ test_data_cpu = [
 
 
 @pytest.mark.parametrize("test_case", test_data_cpu)
+@patch("k8soptimizer.main.get_usage_trend_history")
 @patch("k8soptimizer.main.discover_container_runtime")
 @patch("k8soptimizer.main.get_cpu_cores_usage_history")
-def test_calculate_cpu_requests(mock_func1, mock_func2, test_case):
+def test_calculate_cpu_requests(mock_func1, mock_func2, mock_func3, test_case):
+    mock_func3.return_value = np.ones(main.TREND_WEEKS + 1)
     namespace_name = "test_namespace"
     deployment_name = "test_deployment"
     input_params = test_case["input_params"]
@@ -550,10 +568,14 @@ test_data_memory = [
 
 
 @pytest.mark.parametrize("test_case", test_data_memory)
+@patch("k8soptimizer.main.get_usage_trend_history")
 @patch("k8soptimizer.main.get_oom_killed_history")
 @patch("k8soptimizer.main.discover_container_runtime")
 @patch("k8soptimizer.main.get_memory_bytes_usage_history")
-def test_calculate_memory_requests(mock_func1, mock_func2, mock_func3, test_case):
+def test_calculate_memory_requests(
+    mock_func1, mock_func2, mock_func3, mock_func4, test_case
+):
+    mock_func4.return_value = np.ones(main.TREND_WEEKS + 1)
     namespace_name = "test_namespace"
     deployment_name = "test_deployment"
     input_params = test_case["input_params"]
@@ -658,6 +680,119 @@ def test_optimize_container(mock_func1, mock_func2, mock_func3, test_case):
     assert changed
 
 
+@patch("k8soptimizer.main.RUNTIME_TUNING_MODE", True)
+@patch("k8soptimizer.main.discover_container_runtime")
+@patch("k8soptimizer.main.calculate_memory_limits")
+@patch("k8soptimizer.main.calculate_memory_requests")
+@patch("k8soptimizer.main.calculate_cpu_requests")
+def test_optimize_container_runtime_tuning(
+    mock_func1, mock_func2, mock_func3, mock_func4
+):
+    mock_func1.return_value = 1.5
+    mock_func2.return_value = 1024**3
+    mock_func3.return_value = 1024**3 * 2
+    mock_func4.return_value = "go"
+
+    container = V1Container(
+        name="app",
+        resources=V1ResourceRequirements(
+            requests={"cpu": "1", "memory": "1Gi"}, limits={"memory": "1Gi"}
+        ),
+    )
+
+    container, changed = main.optimize_container(
+        "default",
+        "deployment1",
+        container,
+        "deployment",
+        1.0,
+        1.0,
+        main.DEFAULT_LOOKBACK_MINUTES,
+    )
+
+    assert changed
+    assert main.get_container_env(container, "GOMAXPROCS") == "2"
+    assert main.get_container_env(container, "GOMEMLIMIT") == "1843MiB"
+
+
+def test_tune_container_runtime():
+    container = V1Container(name="app")
+    assert main.tune_container_runtime(container, "go", 0.5, 1024**3)
+    assert main.get_container_env(container, "GOMAXPROCS") == "1"
+    assert main.get_container_env(container, "GOMEMLIMIT") == "922MiB"
+    assert not main.tune_container_runtime(container, "go", 0.5, 1024**3)
+
+    container = V1Container(
+        name="app",
+        env=[V1EnvVar(name="NODE_OPTIONS", value="--max-old-space-size=4096 --trace")],
+    )
+    assert main.tune_container_runtime(container, "nodejs", 1, 1024**3)
+    assert (
+        main.get_container_env(container, "NODE_OPTIONS")
+        == "--trace --max-old-space-size=768"
+    )
+
+    container = V1Container(
+        name="app",
+        env=[V1EnvVar(name="JAVA_TOOL_OPTIONS", value="-XX:MaxRAMPercentage=80")],
+    )
+    assert main.tune_container_runtime(container, "jvm", 2.5, 1024**3)
+    assert (
+        main.get_container_env(container, "JAVA_TOOL_OPTIONS")
+        == "-Xmx768m -XX:ActiveProcessorCount=3"
+    )
+
+    # the initial heap must not exceed the new heap
+    container = V1Container(
+        name="app",
+        env=[V1EnvVar(name="JAVA_TOOL_OPTIONS", value="-Xms2g -Xss1m -Xmx2g")],
+    )
+    assert main.tune_container_runtime(container, "jvm", 1, 1024**3)
+    assert (
+        main.get_container_env(container, "JAVA_TOOL_OPTIONS")
+        == "-Xms768m -Xss1m -Xmx768m -XX:ActiveProcessorCount=1"
+    )
+    assert main.cap_jvm_initial_heap("-Xms256M -Xmx1g", 768) == "-Xms256M -Xmx1g"
+
+    container = V1Container(name="app")
+    assert not main.tune_container_runtime(container, None, 1, 1024**3)
+    assert container.env is None
+
+
+def test_convert_jvm_size_to_bytes():
+    assert main.convert_jvm_size_to_bytes("1024") == 1024
+    assert main.convert_jvm_size_to_bytes("512k") == 512 * 1024
+    assert main.convert_jvm_size_to_bytes("2G") == 2 * 1024**3
+    assert main.convert_jvm_size_to_bytes("1.5g") is None
+
+
+def test_set_container_env():
+    container = V1Container(
+        name="app",
+        env=[
+            V1EnvVar(
+                name="GOMAXPROCS",
+                value_from=V1EnvVarSource(
+                    resource_field_ref=V1ResourceFieldSelector(resource="limits.cpu")
+                ),
+            )
+        ],
+    )
+
+    assert not main.set_container_env(container, "GOMAXPROCS", "2")
+    assert container.env[0].value is None
+    assert main.set_container_env(container, "GOMEMLIMIT", "512MiB")
+    assert not main.set_container_env(container, "GOMEMLIMIT", "512MiB")
+
+
+def test_replace_options():
+    assert main.replace_options(None, ["-Xmx"], ["-Xmx512m"]) == "-Xmx512m"
+    assert (
+        main.replace_options("-Xmx1g -Dfoo=bar", ["-Xmx"], ["-Xmx512m"])
+        == "-Dfoo=bar -Xmx512m"
+    )
+
+
 def test_get_resources_from_deployment():
     # Define a list of V1Namespace objects
     deployment1 = V1Deployment(
@@ -803,12 +938,13 @@ def test_parse_args_version(capsys):
     assert excinfo.value.code == 0
 
 
+@patch("k8soptimizer.main.RuntimeIndex.load")
 @patch("k8soptimizer.main.optimize_deployment")
 @patch("k8soptimizer.main.verify_kubernetes_connection")
 @patch("k8soptimizer.main.verify_prometheus_connection")
 @patch("k8soptimizer.main.get_deployments")
 @patch("k8soptimizer.main.get_namespaces")
-def test_main(mock_func1, mock_func2, mock_func3, mock_func4, mock_func5):
+def test_main(mock_func1, mock_func2, mock_func3, mock_func4, mock_func5, mock_func6):
     # Define a list of V1Namespace objects
     namespace1 = V1Namespace(metadata=V1ObjectMeta(name="namespace1"))
     namespace2 = V1Namespace(metadata=V1ObjectMeta(name="namespace2"))
@@ -989,10 +1125,14 @@ test_data_memory = [
 
 
 @pytest.mark.parametrize("test_case", test_data_memory)
+@patch("k8soptimizer.main.get_usage_trend_history")
 @patch("k8soptimizer.main.get_oom_killed_history")
 @patch("k8soptimizer.main.discover_container_runtime")
 @patch("k8soptimizer.main.get_memory_bytes_usage_history")
-def test_calculate_memory_limits(mock_func1, mock_func2, mock_func3, test_case):
+def test_calculate_memory_limits(
+    mock_func1, mock_func2, mock_func3, mock_func4, test_case
+):
+    mock_func4.return_value = np.ones(main.TREND_WEEKS + 1)
     namespace_name = "test_namespace"
     deployment_name = "test_deployment"
     input_params = test_case["input_params"]
@@ -1018,3 +1158,1711 @@ def test_calculate_memory_limits(mock_func1, mock_func2, mock_func3, test_case):
     )
 
     assert result == pytest.approx(expected_output, rel=1e-2)
+
+
+def create_deployment(name, namespace="default", replicas=1, containers=None):
+    if containers is None:
+        containers = [
+            V1Container(
+                name="nginx",
+                resources=V1ResourceRequirements(
+                    requests={"cpu": "1", "memory": "1Gi"},
+                    limits={"cpu": "1", "memory": "2Gi"},
+                ),
+            )
+        ]
+    return V1Deployment(
+        metadata=V1ObjectMeta(name=name, namespace=namespace, annotations={}),
+        spec=V1DeploymentSpec(
+            replicas=replicas,
+            selector=V1LabelSelector(match_labels={"app": name}),
+            template=V1PodTemplateSpec(spec=V1PodSpec(containers=containers)),
+        ),
+    )
+
+
+def test_get_api_client():
+    main.reset_api_client()
+
+    api_client = main.get_api_client()
+
+    assert api_client is main.get_api_client()
+    assert isinstance(api_client.rest_client, main.RateLimitedRESTClient)
+    assert (
+        api_client.configuration.connection_pool_maxsize
+        == main.K8S_CONNECTION_POOL_MAXSIZE
+    )
+
+    main.reset_api_client()
+
+    assert api_client is not main.get_api_client()
+
+
+def test_rate_limited_rest_client():
+    rest_client = unittest.mock.Mock()
+    rate_limiter = unittest.mock.Mock()
+    rest_client_wrapper = main.RateLimitedRESTClient(rest_client, rate_limiter, (1, 2))
+
+    rest_client_wrapper.request("GET", "http://localhost")
+    rest_client.request.assert_called_with(
+        "GET", "http://localhost", _request_timeout=(1, 2)
+    )
+
+    rest_client_wrapper.request("GET", "http://localhost", _request_timeout=5)
+    rest_client.request.assert_called_with(
+        "GET", "http://localhost", _request_timeout=5
+    )
+
+    assert rate_limiter.acquire.call_count == 2
+    assert rest_client_wrapper.pool_manager is rest_client.pool_manager
+
+
+@patch("k8soptimizer.main.time.sleep")
+def test_rate_limiter(mock_func1):
+    rate_limiter = main.RateLimiter(qps=10, burst=3)
+    for _ in range(3):
+        rate_limiter.acquire()
+    mock_func1.assert_not_called()
+
+    rate_limiter = main.RateLimiter(qps=0, burst=1)
+    for _ in range(10):
+        rate_limiter.acquire()
+    mock_func1.assert_not_called()
+
+
+def test_stats():
+    stats = main.Stats()
+
+    with main.ThreadPoolExecutor(max_workers=8) as executor:
+        for _ in range(1000):
+            executor.submit(stats.add, "old_cpu_sum", 1)
+
+    assert stats["old_cpu_sum"] == 1000
+
+    stats.merge({"old_cpu_sum": 1, "new_cpu_sum": 2})
+
+    assert stats.as_dict()["old_cpu_sum"] == 1001
+    assert stats.as_dict()["new_cpu_sum"] == 2
+
+    stats.reset()
+
+    assert stats["old_cpu_sum"] == 0
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+@patch("k8soptimizer.main.optimize_deployment")
+def test_optimize_deployments(mock_func1, workers):
+    deployments = [create_deployment("deployment%s" % i) for i in range(20)]
+
+    def optimize_deployment(deployment, *args):
+        if deployment.metadata.name == "deployment5":
+            raise RuntimeError("Something went wrong")
+        return deployment
+
+    mock_func1.side_effect = optimize_deployment
+
+    errors = main.optimize_deployments(iter(deployments), workers=workers)
+
+    assert errors == 1
+    assert mock_func1.call_count == 20
+
+
+@patch("k8soptimizer.main.optimize_deployment")
+@patch("k8soptimizer.main.client.AppsV1Api.read_namespaced_deployment")
+def test_optimize_deployment_by_key(mock_func1, mock_func2):
+    deployment = create_deployment("deployment1", namespace="namespace1")
+    mock_func1.return_value = deployment
+
+    main.optimize_deployment_by_key("namespace1/deployment1", dry_run=True)
+
+    mock_func1.assert_called_once_with("deployment1", "namespace1")
+    assert mock_func2.call_args[0][0] == deployment
+
+    mock_func1.side_effect = ApiException(status=404)
+    mock_func2.reset_mock()
+    main.optimize_deployment_by_key("namespace1/deployment1")
+    mock_func2.assert_not_called()
+
+    mock_func1.side_effect = ApiException(status=500)
+    with pytest.raises(ApiException):
+        main.optimize_deployment_by_key("namespace1/deployment1")
+
+
+def test_set_log_context():
+    records = []
+
+    class Handler(main.logging.Handler):
+        def emit(self, record):
+            records.append(record)
+
+    handler = Handler()
+    main._logger.addHandler(handler)
+    main._logger.setLevel("INFO")
+
+    def log(name):
+        main.set_log_context({"deployment": name})
+        main._logger.info(name)
+
+    try:
+        with main.ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(log, ["deployment%s" % i for i in range(20)]))
+    finally:
+        main._logger.removeHandler(handler)
+
+    assert len(records) == 20
+    for record in records:
+        assert record.deployment == record.msg
+
+
+@patch("k8soptimizer.main.get_usage_trend_history")
+@patch("k8soptimizer.main.get_oom_killed_history")
+@patch("k8soptimizer.main.discover_container_runtime")
+@patch("k8soptimizer.main.get_memory_bytes_usage_history")
+@patch("k8soptimizer.main.get_cpu_cores_usage_history")
+def test_fetch_container_metrics(
+    mock_func1, mock_func2, mock_func3, mock_func4, mock_func5
+):
+    mock_func5.return_value = np.ones(main.TREND_WEEKS + 1)
+    mock_func1.return_value = 2.0
+    mock_func2.return_value = 1024**3
+    mock_func3.return_value = "nodejs"
+    mock_func4.return_value = 1
+
+    metrics = main.fetch_container_metrics(
+        "default", "deployment1", "deployment", "nginx"
+    )
+
+    assert metrics["cpu_trend"] == 1.0
+    assert metrics["memory_trend"] == 1.0
+    assert metrics["oom_killed"] == 1
+    assert metrics["runtime"] == "nodejs"
+
+    # one oom query instead of one for requests and one for limits
+    assert mock_func4.call_count == 1
+
+    resources = main.compute_container_resources(metrics, 2)
+
+    assert resources["cpu"] == main.calculate_cpu_requests(
+        "default", "deployment1", "deployment", "nginx", 2
+    )
+    assert resources["memory"] == main.calculate_memory_requests(
+        "default", "deployment1", "deployment", "nginx"
+    )
+    assert resources["memory_limits"] == main.calculate_memory_limits(
+        "default", "deployment1", "deployment", "nginx"
+    )
+
+
+@patch("k8soptimizer.main.client.AppsV1Api.patch_namespaced_deployment")
+@patch("k8soptimizer.main.fetch_container_metrics")
+@patch("k8soptimizer.main.calculate_quantile_over_time")
+@patch("k8soptimizer.main.calculate_target_replicas")
+@patch("k8soptimizer.main.get_deployments")
+@patch("k8soptimizer.main.get_namespaces")
+def test_optimize_deployments_pipeline(
+    mock_func1, mock_func2, mock_func3, mock_func4, mock_func5, mock_func6
+):
+    namespace1 = V1Namespace(metadata=V1ObjectMeta(name="namespace1"))
+    namespace2 = V1Namespace(metadata=V1ObjectMeta(name="namespace2"))
+
+    mock_func1.return_value = V1NamespaceList(items=[namespace1, namespace2])
+    mock_func2.side_effect = lambda namespace_name, pattern: V1DeploymentList(
+        items=[
+            create_deployment("deployment1", namespace_name),
+            create_deployment("deployment2", namespace_name, replicas=0),
+        ]
+    )
+    mock_func3.return_value = 1
+    mock_func4.return_value = {"cpu": 0.95, "memory": 0.95}
+    mock_func5.return_value = {
+        "cpu_history": 0.5,
+        "cpu_trend": 1.0,
+        "runtime": None,
+        "oom_killed": 0,
+        "memory_trend": 1.0,
+        "memory_history": 256 * 1024**2,
+        "memory_limits_history": 512 * 1024**2,
+    }
+
+    stage_stats = main.optimize_deployments_pipeline(dry_run=True)
+
+    assert [s.name for s in stage_stats] == ["discover", "fetch", "compute", "apply"]
+    assert [s.processed for s in stage_stats] == [2, 4, 2, 2]
+    assert mock_func6.call_count == 2
+    deployment = mock_func6.call_args[0][2]
+    assert deployment.spec.template.spec.containers[0].resources.requests == {
+        "cpu": "500m",
+        "memory": "384Mi",
+    }
+
+
+@pytest.mark.parametrize("shard_by", ["namespace", "deployment"])
+@patch("k8soptimizer.main.get_deployments")
+@patch("k8soptimizer.main.get_namespaces")
+def test_iter_deployments_shards(mock_func1, mock_func2, shard_by):
+    namespaces = [
+        V1Namespace(metadata=V1ObjectMeta(name="namespace%s" % i)) for i in range(8)
+    ]
+    mock_func1.return_value = V1NamespaceList(items=namespaces)
+    mock_func2.side_effect = lambda namespace_name, pattern: V1DeploymentList(
+        items=[create_deployment("deployment%s" % i, namespace_name) for i in range(4)]
+    )
+
+    all_keys = set()
+    for shard_index in range(3):
+        keys = {
+            (d.metadata.namespace, d.metadata.name)
+            for d in main.iter_deployments(".*", ".*", shard_index, 3, shard_by)
+        }
+        assert keys.isdisjoint(all_keys)
+        all_keys |= keys
+
+    assert len(all_keys) == 32
+    assert main.in_shard("namespace1", "deployment1", 0, 1, shard_by) is True
+
+    with pytest.raises(ValueError):
+        main.in_shard("namespace1", "deployment1", 0, 2, "pod")
+
+
+def test_merge_stats_files(tmp_path):
+    main.stats.reset()
+    main.stats["old_cpu_sum"] = 2
+    main.stats["new_cpu_sum"] = 1
+    main.write_stats_file(str(tmp_path / "stats-0.json"), 0, 2)
+    main.write_stats_file(str(tmp_path / "stats-1.json"), 1, 2)
+    main.stats.reset()
+
+    result = main.merge_stats_files(
+        [str(tmp_path / "stats-0.json"), str(tmp_path / "stats-1.json")]
+    )
+
+    assert result["old_cpu_sum"] == 4
+    assert result["new_cpu_sum"] == 2
+
+    with pytest.raises(ValueError):
+        main.merge_stats_files([str(tmp_path / "stats-0.json")] * 2)
+    main.stats.reset()
+
+
+def test_parse_args_shards():
+    args = main.parse_args(["--shard-index", "1", "--shard-count", "3"])
+    assert args.shard_index == 1
+    assert args.shard_count == 3
+
+    with pytest.raises(SystemExit):
+        main.parse_args(["--shard-index", "3", "--shard-count", "3"])
+
+
+@patch("k8soptimizer.main.optimize_deployment")
+def test_optimize_deployments_checkpoint(mock_func1):
+    deployments = [create_deployment("deployment%s" % i) for i in range(4)]
+    store = MagicMock()
+    progress = checkpoint.Checkpoint(store)
+    progress.completed = {"default/deployment1": "2023-09-07T12:00:00+00:00"}
+
+    errors = main.optimize_deployments(iter(deployments), progress=progress)
+
+    assert errors == 0
+    assert mock_func1.call_count == 3
+    assert sorted(progress.completed) == [
+        "default/deployment0",
+        "default/deployment1",
+        "default/deployment2",
+        "default/deployment3",
+    ]
+
+
+def test_create_checkpoint(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    args = main.parse_args(["--checkpoint-file", path])
+    progress = main.create_checkpoint(args)
+    progress.mark_done("default/deployment1")
+    progress.flush()
+
+    args = main.parse_args(["--checkpoint-file", path, "--resume"])
+    progress = main.create_checkpoint(args)
+    assert progress.is_done("default/deployment1")
+
+    args = main.parse_args(["--resume"])
+    assert main.create_checkpoint(args) is None
+    main.stats.reset()
+
+
+@patch("k8soptimizer.main.run_optimization")
+def test_run_once_checkpoint(mock_func1, tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    handler = signal.getsignal(signal.SIGTERM)
+
+    def run_optimization(args, ns, dep, ctr, is_running, progress):
+        progress.mark_done("default/deployment1")
+        # the handler only stops the run, the checkpoint is written afterwards
+        signal.getsignal(signal.SIGTERM)(signal.SIGTERM, None)
+        return is_running()
+
+    mock_func1.side_effect = run_optimization
+    try:
+        main.run_once(main.parse_args(["--checkpoint-file", path]), ".*", ".*", ".*")
+    finally:
+        signal.signal(signal.SIGTERM, handler)
+    args = main.parse_args(["--checkpoint-file", path, "--resume"])
+    assert main.create_checkpoint(args).is_done("default/deployment1")
+
+    # a finished run is not resumed
+    mock_func1.side_effect = None
+    mock_func1.return_value = True
+    try:
+        main.run_once(args, ".*", ".*", ".*")
+    finally:
+        signal.signal(signal.SIGTERM, handler)
+    assert not main.create_checkpoint(args).is_done("default/deployment1")
+    main.stats.reset()
+
+
+real_run_daemon = daemon.run_daemon
+
+
+def run_daemon_fast(run_cycle, interval_minutes, elector=None, stop_event=None):
+    return real_run_daemon(
+        run_cycle, interval_minutes, elector, stop_event, poll_seconds=0.01
+    )
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+@patch("k8soptimizer.main.daemon.run_daemon", side_effect=run_daemon_fast)
+@patch("k8soptimizer.main.LEADER_ELECTION_RENEW_SECONDS", 0.01)
+@patch("k8soptimizer.main.get_api_client")
+@patch("k8soptimizer.daemon.client.CoordinationV1Api")
+@patch("k8soptimizer.main.run_optimization")
+def test_run_daemon(mock_func1, mock_func2, mock_func3, mock_func4):
+    api = mock_func2.return_value
+    api.read_namespaced_lease.side_effect = ApiException(status=404)
+    api.create_namespaced_lease.side_effect = lambda namespace, lease: lease
+    api.replace_namespaced_lease.side_effect = lambda name, namespace, lease: lease
+    handlers = {
+        signum: signal.getsignal(signum) for signum in (signal.SIGTERM, signal.SIGINT)
+    }
+
+    def run_optimization(args, ns, dep, ctr, is_running):
+        assert is_running()
+        # another replica took over the lease
+        api.read_namespaced_lease.side_effect = None
+        api.read_namespaced_lease.return_value = V1Lease(
+            metadata=V1ObjectMeta(name="k8soptimizer", namespace="default"),
+            spec=V1LeaseSpec(
+                holder_identity="other",
+                renew_time=datetime.now(timezone.utc),
+                lease_duration_seconds=60,
+            ),
+        )
+        assert wait_for(lambda: not is_running())
+        signal.getsignal(signal.SIGTERM)(signal.SIGTERM, None)
+
+    mock_func1.side_effect = run_optimization
+    try:
+        main.run_daemon(main.parse_args(["--daemon"]), ".*", ".*", ".*")
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+
+    mock_func1.assert_called_once()
+    api.create_namespaced_lease.assert_called_once()
+    # the last run is recorded in the lease for the next leader
+    lease = api.replace_namespaced_lease.call_args_list[0][0][2]
+    assert "k8soptimizer" in str(lease.metadata.annotations)
+    main.stats.reset()
+
+
+@patch("k8soptimizer.main.daemon.run_daemon", side_effect=run_daemon_fast)
+@patch("k8soptimizer.main.WATCH_DEBOUNCE_SECONDS", 0)
+@patch("k8soptimizer.main.LEADER_ELECTION_ENABLED", False)
+@patch("k8soptimizer.main.get_api_client")
+@patch("k8soptimizer.controller.watch.Watch")
+@patch("k8soptimizer.main.client.AutoscalingV2Api")
+@patch("k8soptimizer.main.client.AppsV1Api")
+@patch("k8soptimizer.main.run_optimization")
+@patch("k8soptimizer.main.optimize_deployment")
+def test_run_daemon_watch(
+    mock_func1, mock_func2, mock_func3, mock_func4, mock_func5, mock_func6, mock_func7
+):
+    deployment = create_deployment("deployment1")
+    apps_api = mock_func3.return_value
+    apps_api.list_deployment_for_all_namespaces.return_value = V1DeploymentList(
+        items=[], metadata=V1ListMeta(resource_version="1")
+    )
+    apps_api.read_namespaced_deployment.return_value = deployment
+    autoscaling_api = mock_func4.return_value
+    autoscaling_api.list_horizontal_pod_autoscaler_for_all_namespaces.return_value = (
+        V2HorizontalPodAutoscalerList(
+            items=[], metadata=V1ListMeta(resource_version="1")
+        )
+    )
+    events = [{"type": "ADDED", "object": deployment}]
+
+    def stream(func, **kwargs):
+        if func == apps_api.list_deployment_for_all_namespaces and events:
+            return iter([events.pop()])
+        time.sleep(0.01)
+        return iter([])
+
+    mock_func5.return_value.stream.side_effect = stream
+    handlers = {
+        signum: signal.getsignal(signum) for signum in (signal.SIGTERM, signal.SIGINT)
+    }
+
+    def optimize_deployment(*args, **kwargs):
+        signal.getsignal(signal.SIGTERM)(signal.SIGTERM, None)
+
+    mock_func1.side_effect = optimize_deployment
+    try:
+        main.run_daemon(main.parse_args(["--daemon", "--watch"]), ".*", ".*", ".*")
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+
+    apps_api.read_namespaced_deployment.assert_called_once_with(
+        "deployment1", "default"
+    )
+    mock_func1.assert_called_once()
+    assert mock_func1.call_args[0][0] is deployment
+    main.stats.reset()
+
+
+@patch("k8soptimizer.main.query_prometheus")
+def test_get_usage_by_container(mock_func1):
+    mock_func1.return_value = {
+        "data": {
+            "result": [
+                {
+                    "metric": {
+                        "namespace": "default",
+                        "workload": "deployment1",
+                        "container": "nginx",
+                    },
+                    "value": [1694006400, "0.25"],
+                }
+            ]
+        }
+    }
+
+    usage = main.get_usage_by_container(
+        "kube_workload_container_resource_usage_cpu_cores_avg"
+    )
+
+    assert usage.row(("default", "deployment1", "deployment", "nginx")) == {
+        "usage": 0.25
+    }
+    assert 'workload_type="deployment"' in mock_func1.call_args[0][0]
+
+
+@patch("k8soptimizer.main.get_usage_by_container")
+def test_rank_deployments_by_savings(mock_func1):
+    deployments = [
+        create_deployment("deployment1", replicas=1),
+        create_deployment("deployment2", replicas=4),
+        create_deployment("deployment3", replicas=2),
+        create_deployment("deployment4", replicas=1),
+    ]
+    usage = frame.MetricFrame()
+    for name, cpu in [("deployment1", 0.5), ("deployment2", 0.5), ("deployment3", 1.5)]:
+        row = usage.intern(frame.container_key("default", name, "nginx"))
+        usage.set(row, "cpu", cpu)
+    usage.set(0, "memory", 0.5 * 1024**3)
+
+    def get_usage_by_container(metric, lookback_minutes, metric_frame, column):
+        for row, key in enumerate(usage.keys):
+            value = usage.get(row, column)
+            if value is not None:
+                metric_frame.set(metric_frame.intern(key), column, value)
+        return metric_frame
+
+    mock_func1.side_effect = get_usage_by_container
+
+    assert main.estimate_deployment_savings(
+        deployments[0], usage, 1.0
+    ) == pytest.approx(1.0)
+
+    ranked = main.rank_deployments_by_savings(iter(deployments))
+
+    assert [d.metadata.name for d in ranked] == [
+        "deployment2",
+        "deployment1",
+        "deployment4",
+        "deployment3",
+    ]
+
+
+@patch("k8soptimizer.main.time.monotonic")
+def test_within_time_budget(mock_func1):
+    mock_func1.return_value = 1000.0
+    is_running = main.within_time_budget(10)
+
+    assert is_running() is True
+
+    mock_func1.return_value = 1000.0 + 10 * 60
+    assert is_running() is False
+
+    mock_func1.return_value = 1000.0
+    assert main.within_time_budget(10, lambda: False)() is False
+
+
+@patch("k8soptimizer.main.query_prometheus")
+def test_get_namespace_usage_bounds(mock_func1):
+    mock_func1.return_value = {
+        "data": {
+            "result": [
+                {
+                    "metric": {
+                        "workload": "deployment1",
+                        "container": "nginx",
+                        "series": "cpu_today",
+                    },
+                    "value": [1694006400, "0.5"],
+                },
+                {
+                    "metric": {
+                        "workload": "deployment1",
+                        "container": "nginx",
+                        "series": "memory_limits",
+                    },
+                    "value": [1694006400, "1024"],
+                },
+            ]
+        }
+    }
+
+    bounds = main.get_namespace_usage_bounds("default")
+
+    assert len(bounds) == 1
+    assert bounds.row(frame.container_key("default", "deployment1", "nginx")) == {
+        "cpu_today": 0.5,
+        "memory_limits": 1024.0,
+    }
+    assert mock_func1.call_count == 1
+    assert mock_func1.call_args[0][0].count(" or ") == 15
+
+
+@patch("k8soptimizer.main.query_prometheus")
+def test_get_cpu_throttling(mock_func1):
+    mock_func1.return_value = {
+        "data": {
+            "result": [
+                {
+                    "metric": {
+                        "workload": "deployment1",
+                        "container": "nginx",
+                        "series": "cpu_throttling",
+                    },
+                    "value": [1694006400, "0.3"],
+                },
+            ]
+        }
+    }
+
+    assert main.get_cpu_throttling("default", "deployment1", "nginx") == 0.0
+    mock_func1.assert_not_called()
+
+    state = main.OptimizerState(main.Settings(CPU_THROTTLING_MODE=True))
+    with main.activate_state(state):
+        assert main.get_cpu_throttling("default", "deployment1", "nginx") == 0.3
+        assert main.get_cpu_throttling("default", "deployment1", "other") == 0.0
+
+    query = mock_func1.call_args[0][0]
+    assert query.count(" or ") == 16
+    assert "container_cpu_cfs_throttled_periods_total" in query
+    assert mock_func1.call_count == 1
+
+
+def test_compute_cpu_requests_throttling():
+    assert main.compute_cpu_requests(1.0, 1.0, 1, None, 0.05) == 1.0
+    assert main.compute_cpu_requests(1.0, 1.0, 1, None, 0.3) == 1.3
+    assert main.compute_cpu_requests(1.0, 1.0, 1, None, 0.9) == 1.5
+    assert main.compute_cpu_requests(1.0, 1.0, 1, "nodejs", 0.9) == 1.0
+
+    metrics = {
+        "cpu_history": 1.0,
+        "cpu_trend": 1.1,
+        "cpu_throttling": 0.3,
+        "memory_history": 1024**3,
+        "memory_trend": 1.0,
+        "memory_limits_history": 1024**3,
+        "oom_killed": 0,
+        "runtime": None,
+    }
+    container = V1Container(
+        name="nginx",
+        resources=V1ResourceRequirements(
+            requests={"cpu": "1", "memory": "1Gi"}, limits={"memory": "2Gi"}
+        ),
+    )
+    resources = main.compute_container_resources(metrics)
+    batch = main.compute_resources_batch([metrics], [1], [container])
+    assert resources["cpu"] == 1.43
+    assert batch["cpu"][0] == resources["cpu"]
+
+
+@pytest.mark.parametrize(
+    "policy, old_limits, expected_limits, expected_changed",
+    [
+        ("remove", {"cpu": "1", "memory": "1Gi"}, {"memory": "1024Mi"}, True),
+        ("remove", {"memory": "1Gi"}, {"memory": "1024Mi"}, False),
+        (
+            "keep",
+            {"cpu": "1", "memory": "1Gi"},
+            {"cpu": "1", "memory": "1024Mi"},
+            False,
+        ),
+        ("ratio", {"memory": "1Gi"}, {"cpu": "1000m", "memory": "1024Mi"}, True),
+        (
+            "ratio",
+            {"cpu": "1", "memory": "1Gi"},
+            {"cpu": "1", "memory": "1024Mi"},
+            False,
+        ),
+    ],
+)
+@patch("k8soptimizer.main.calculate_memory_limits")
+@patch("k8soptimizer.main.calculate_memory_requests")
+@patch("k8soptimizer.main.calculate_cpu_requests")
+def test_optimize_container_cpu_limits_policy(
+    mock_func1,
+    mock_func2,
+    mock_func3,
+    policy,
+    old_limits,
+    expected_limits,
+    expected_changed,
+):
+    mock_func1.return_value = 0.5
+    mock_func2.return_value = 512 * 1024**2
+    mock_func3.return_value = 1024**3
+
+    container = V1Container(
+        name="nginx",
+        resources=V1ResourceRequirements(
+            requests={"cpu": "500m", "memory": "512Mi"}, limits=old_limits
+        ),
+    )
+    state = main.OptimizerState(main.Settings(CPU_LIMITS_POLICY=policy))
+    with main.activate_state(state):
+        container, changed = main.optimize_container(
+            "default", "deployment1", container
+        )
+
+    assert container.resources.limits == expected_limits
+    assert changed is expected_changed
+
+    with main.activate_state(main.OptimizerState(main.Settings(CPU_LIMITS_POLICY="x"))):
+        with pytest.raises(ValueError):
+            main.get_cpu_limits(container, 0.5)
+
+
+@patch("k8soptimizer.main.query_prometheus")
+def test_get_container_pressure(mock_func1):
+    mock_func1.return_value = {
+        "data": {
+            "result": [
+                {
+                    "metric": {
+                        "workload": "deployment1",
+                        "container": "nginx",
+                        "series": "memory_pressure",
+                    },
+                    "value": [1694006400, "0.2"],
+                },
+            ]
+        }
+    }
+
+    assert main.get_container_pressure("default", "deployment1", "nginx") == 0.0
+    mock_func1.assert_not_called()
+
+    state = main.OptimizerState(main.Settings(PSI_MODE=True))
+    with main.activate_state(state):
+        assert main.get_container_pressure("default", "deployment1", "nginx") == 0.2
+        assert (
+            main.get_container_pressure(
+                "default", "deployment1", "nginx", "deployment", "cpu"
+            )
+            == 0.0
+        )
+
+    query = mock_func1.call_args[0][0]
+    assert query.count(" or ") == 17
+    assert "container_pressure_memory_waiting_seconds_total" in query
+    assert "container_pressure_cpu_waiting_seconds_total" in query
+    assert mock_func1.call_count == 1
+
+
+@patch("k8soptimizer.main.get_container_pressure")
+@patch("k8soptimizer.main.get_usage_trend_history")
+@patch("k8soptimizer.main.get_oom_killed_history")
+@patch("k8soptimizer.main.get_memory_bytes_usage_history")
+def test_calculate_memory_pressure(mock_func1, mock_func2, mock_func3, mock_func4):
+    mock_func1.return_value = 1024**3
+    mock_func2.return_value = 0
+    mock_func3.return_value = np.ones(main.TREND_WEEKS + 1)
+    mock_func4.return_value = 0.2
+
+    # the pressure boost is applied like the OOM ratio
+    assert main.calculate_memory_requests(
+        "default", "app", "deployment", "app"
+    ) == round(1024**3 * 1.2 * main.MEMORY_REQUEST_RATIO)
+    assert main.calculate_memory_limits("default", "app", "deployment", "app") == round(
+        1024**3 * 1.2 * main.MEMORY_LIMIT_RATIO
+    )
+    mock_func4.assert_called_with("default", "app", "app", "deployment", "memory")
+
+    assert main.compute_memory_requests(1024**3, 1.0, 0, 0.05) == round(
+        1024**3 * main.MEMORY_REQUEST_RATIO
+    )
+    assert main.compute_memory_limits(1024**3, 1.0, 1, 0.9) == round(
+        1024**3 * 1.5 * 2 * main.MEMORY_LIMIT_RATIO
+    )
+    # the higher of the throttling and the pressure boost
+    assert main.compute_cpu_requests(1.0, 1.0, 1, None, 0.3, 0.2) == 1.3
+    assert main.compute_cpu_requests(1.0, 1.0, 1, None, 0.0, 0.2) == 1.2
+
+    metrics = {
+        "cpu_history": 1.0,
+        "cpu_trend": 1.0,
+        "cpu_pressure": 0.2,
+        "memory_history": 1024**3,
+        "memory_trend": 1.1,
+        "memory_pressure": 0.3,
+        "memory_limits_history": 1024**3,
+        "oom_killed": 1,
+        "runtime": None,
+    }
+    container = V1Container(
+        name="nginx",
+        resources=V1ResourceRequirements(
+            requests={"cpu": "1", "memory": "1Gi"}, limits={"memory": "2Gi"}
+        ),
+    )
+    resources = main.compute_container_resources(metrics)
+    batch = main.compute_resources_batch([metrics], [1], [container])
+    for name in ["cpu", "memory", "memory_limits"]:
+        assert batch[name][0] == resources[name]
+
+
+def create_usage_series(cpu, memory, memory_limits):
+    series = {
+        "cpu_today": 1.0,
+        "cpu_weekago": 1.0,
+        "memory_today": 1.0,
+        "memory_weekago": 1.0,
+        "memory_0.99": memory,
+        "memory_limits": memory_limits,
+    }
+    for quantile in [
+        main.DEFAULT_QUANTILE_OVER_TIME_STATIC_CPU,
+        main.DEFAULT_QUANTILE_OVER_TIME_HPA_CPU,
+    ]:
+        series["cpu_{}".format(quantile)] = cpu
+    for quantile in [
+        main.DEFAULT_QUANTILE_OVER_TIME_STATIC_MEMORY,
+        main.DEFAULT_QUANTILE_OVER_TIME_HPA_MEMORY,
+    ]:
+        series["memory_{}".format(quantile)] = memory
+    return series
+
+
+def test_screen_container():
+    container = V1Container(
+        name="nginx",
+        resources=V1ResourceRequirements(
+            requests={"cpu": "500m", "memory": "512Mi"},
+            limits={"memory": "1Gi"},
+        ),
+    )
+    memory = 512 * 1024**2 / main.MEMORY_REQUEST_RATIO
+    memory_limits = 1024**3 / main.MEMORY_LIMIT_RATIO
+
+    # unchanged unless the container was OOM killed
+    series = create_usage_series(0.5, memory, memory_limits)
+    series["memory_0.99"] = memory
+    assert main.screen_container(container, series, 1) is True
+
+    series = create_usage_series(0.5, memory, memory_limits / 2)
+    assert main.screen_container(container, series, 1) is True
+
+    series = create_usage_series(1.0, memory, memory_limits)
+    assert main.screen_container(container, series, 1) is True
+
+    assert main.screen_container(container, None, 1) is True
+
+    container.resources.limits["cpu"] = "1"
+    assert main.screen_container(container, series, 2) is True
+
+
+def test_screen_container_skip():
+    container = V1Container(
+        name="nginx",
+        resources=V1ResourceRequirements(
+            requests={"cpu": "10m", "memory": "16Mi"},
+            limits={"memory": "32Mi"},
+        ),
+    )
+    # containers at the minimum requests can not change
+    series = create_usage_series(0.001, 1024**2, 1024**2)
+
+    assert main.screen_container(container, series, 1) is False
+
+
+def test_screen_container_trend():
+    container = V1Container(
+        name="nginx",
+        resources=V1ResourceRequirements(
+            requests={"cpu": "10m", "memory": "16Mi"},
+            limits={"memory": "32Mi"},
+        ),
+    )
+    series = create_usage_series(0.008, 1024**2, 1024**2)
+    assert main.screen_container(container, series, 1) is False
+
+    # the median over the previous weeks, not only the last week
+    for week in range(2, main.TREND_WEEKS + 1):
+        series[main.get_trend_series_name("cpu", week)] = 0.1
+    assert main.screen_container(container, series, 1) is True
+
+    series = create_usage_series(0.001, 1024**2, 1024**2)
+    series["cpu_weekago"] = 0.0
+    assert main.screen_container(container, series, 1) is True
+
+    series = create_usage_series(0.001, 1024**2, 1024**2)
+    with main.activate_state(main.OptimizerState(main.Settings(FORECAST_MODE=True))):
+        assert main.screen_container(container, series, 1) is True
+
+
+@patch("k8soptimizer.main.get_namespace_usage_bounds")
+@patch("k8soptimizer.main.calculate_quantile_over_time")
+@patch("k8soptimizer.main.calculate_target_replicas")
+def test_prepare_deployment_two_tier(mock_func1, mock_func2, mock_func3):
+    containers = [
+        V1Container(
+            name="idle",
+            resources=V1ResourceRequirements(
+                requests={"cpu": "10m", "memory": "16Mi"},
+                limits={"memory": "32Mi"},
+            ),
+        ),
+        V1Container(
+            name="busy",
+            resources=V1ResourceRequirements(
+                requests={"cpu": "10m", "memory": "16Mi"},
+                limits={"memory": "32Mi"},
+            ),
+        ),
+    ]
+    deployment = create_deployment("deployment1", containers=containers)
+    mock_func1.return_value = 2
+    mock_func2.return_value = {
+        "cpu": main.DEFAULT_QUANTILE_OVER_TIME_STATIC_CPU,
+        "memory": main.DEFAULT_QUANTILE_OVER_TIME_STATIC_MEMORY,
+    }
+
+    def get_namespace_usage_bounds(namespace_name, metric_frame):
+        for name, series in [
+            ("idle", create_usage_series(0.001, 1024**2, 1024**2)),
+            ("busy", create_usage_series(2.0, 1024**3, 1024**3)),
+        ]:
+            row = metric_frame.intern(
+                frame.container_key(namespace_name, "deployment1", name)
+            )
+            for column, value in series.items():
+                metric_frame.set(row, column, value)
+        return metric_frame
+
+    mock_func3.side_effect = get_namespace_usage_bounds
+    main.usage_bounds.reset()
+    main.stats.reset()
+
+    work = main.prepare_deployment(deployment, fetch_metrics=False, two_tier=True)
+
+    assert work["skipped"] == [0]
+    assert list(work["containers"]) == [1]
+
+    work["containers"] = {}
+    assert main.compute_deployment(work) is False
+    assert main.stats["old_cpu_sum"] == pytest.approx(0.02)
+    assert main.stats["new_cpu_sum"] == pytest.approx(0.02)
+    main.stats.reset()
+    main.usage_bounds.reset()
+
+
+@patch("k8soptimizer.main.compute_memory_limits")
+@patch("k8soptimizer.main.compute_memory_requests")
+@patch("k8soptimizer.main.compute_cpu_requests")
+def test_compute_deployment_batch(mock_func1, mock_func2, mock_func3):
+    containers = [
+        V1Container(
+            name=name,
+            resources=V1ResourceRequirements(
+                requests={"cpu": "1", "memory": "1Gi"}, limits={"memory": "2Gi"}
+            ),
+        )
+        for name in ["app", "sidecar"]
+    ]
+    deployment = create_deployment("deployment1", containers=containers)
+    metrics = [
+        {
+            "cpu_history": cpu,
+            "cpu_trend": 1.0,
+            "memory_history": memory,
+            "memory_trend": 1.0,
+            "memory_limits_history": memory,
+            "oom_killed": 0,
+            "runtime": None,
+        }
+        for cpu, memory in [(2.0, 2 * 1024**3), (0.9, 1024**3)]
+    ]
+    work = {
+        "deployment": deployment,
+        "old_resources": {},
+        "target_replicas": 1,
+        "quantile_over_time": {"cpu": 0.95, "memory": 0.95},
+        "lookback_minutes": main.DEFAULT_LOOKBACK_MINUTES,
+        "offset_minutes": main.DEFAULT_OFFSET_MINUTES,
+        "containers": {0: metrics[0], 1: metrics[1]},
+        "skipped": [],
+        "changed": False,
+    }
+    batch = main.compute_resources_batch(metrics, [1, 1], copy.deepcopy(containers))
+    main.stats.reset()
+
+    # the prefetched containers are computed by the vectorized engine
+    assert main.compute_deployment(work) is True
+    mock_func1.assert_not_called()
+    mock_func2.assert_not_called()
+    mock_func3.assert_not_called()
+    assert "resources" not in metrics[0]
+    for i, container in enumerate(deployment.spec.template.spec.containers):
+        assert container.resources.requests["cpu"] == "{}m".format(
+            round(batch["cpu"][i] * 1000)
+        )
+        assert container.resources.requests["memory"] == "{}Mi".format(
+            round(batch["memory"][i] / 1024 / 1024)
+        )
+    main.stats.reset()
+
+
+@patch("k8soptimizer.main.query_prometheus")
+def test_runtime_index(mock_func1):
+    labels = {
+        "namespace": "default",
+        "workload": "deployment1",
+        "workload_type": "deployment",
+    }
+
+    def create_result(*containers):
+        return {
+            "data": {
+                "result": [
+                    {"metric": dict(labels, container=container), "value": [0, 1]}
+                    for container in containers
+                ]
+            }
+        }
+
+    def query_prometheus(query):
+        if query.startswith("count("):
+            # the per container query of a container missing from the index
+            if "go_info" in query:
+                return create_result("new")
+            return create_result()
+        if "kube_pod_container_info" in query:
+            return create_result("app", "proxy", "sidecar")
+        if "nodejs_version_info" in query:
+            return create_result("app")
+        if "go_info" in query:
+            return create_result("app", "proxy")
+        if "jvm_info" in query and failing:
+            raise RuntimeError("Got invalid results from query: {}".format(query))
+        return create_result()
+
+    failing = False
+    mock_func1.side_effect = query_prometheus
+    index = main.RuntimeIndex(
+        main.parse_runtime_detectors(
+            "nodejs=nodejs_version_info,jvm=jvm_info,go=go_info"
+        )
+    )
+    index.load()
+
+    assert mock_func1.call_count == 4
+    assert index.loaded
+    assert index.get("default", "deployment1", "app") == "nodejs"
+    assert index.get("default", "deployment1", "proxy") == "go"
+    assert index.get("default", "deployment1", "sidecar") is None
+
+    with patch("k8soptimizer.main.runtime_index", index):
+        assert (
+            main.discover_container_runtime("default", "deployment1", "proxy") == "go"
+        )
+        assert (
+            main.discover_container_runtime("default", "deployment1", "sidecar") is None
+        )
+        assert mock_func1.call_count == 4
+
+        # containers missing from the index are detected and added
+        assert main.discover_container_runtime("default", "deployment1", "new") == "go"
+        assert mock_func1.call_count == 7
+        assert main.discover_container_runtime("default", "deployment1", "new") == "go"
+        assert mock_func1.call_count == 7
+
+    index.reset()
+    assert index.loaded is False
+
+    # a failed query does not mark the index as loaded
+    failing = True
+    index.load()
+    assert index.loaded is False
+
+
+def test_parse_runtime_detectors():
+    assert main.parse_runtime_detectors("nodejs=nodejs_version_info, go=go_info,") == [
+        ("nodejs", "nodejs_version_info"),
+        ("go", "go_info"),
+    ]
+
+    with pytest.raises(ValueError):
+        main.parse_runtime_detectors("nodejs")
+
+
+def test_parse_clusters():
+    assert main.parse_clusters("prod=http://prometheus.prod:9090, dev=http://dev,") == [
+        ("prod", "http://prometheus.prod:9090"),
+        ("dev", "http://dev"),
+    ]
+    assert main.parse_clusters("") == []
+
+    with pytest.raises(ValueError):
+        main.parse_clusters("prod")
+    with pytest.raises(ValueError):
+        main.parse_clusters("prod=http://a,prod=http://b")
+
+    args = main.parse_args(["--clusters", "prod=http://prometheus.prod:9090"])
+    assert args.clusters == [("prod", "http://prometheus.prod:9090")]
+
+    with pytest.raises(SystemExit):
+        main.parse_args(["--clusters", "prod=http://a", "--watch"])
+
+
+@patch("k8soptimizer.main.create_api_client")
+@patch("k8soptimizer.main.config.load_kube_config")
+def test_create_cluster_state(mock_func1, mock_func2):
+    state = main.create_cluster_state("prod", "http://prometheus.prod:9090")
+
+    assert mock_func1.call_args[1]["context"] == "prod"
+    assert state.api_client is mock_func2.return_value
+    assert state.settings.PROMETHEUS_URL == "http://prometheus.prod:9090"
+
+
+@patch("k8soptimizer.main.verify_prometheus_connection")
+@patch("k8soptimizer.main.client.ApisApi")
+@patch("k8soptimizer.main.run_optimization")
+def test_run_clusters(mock_func1, mock_func2, mock_func3, tmp_path):
+    def run_optimization(args, *patterns):
+        if main.settings().PROMETHEUS_URL == "http://broken":
+            raise RuntimeError("Connection refused")
+        main.stats.add("old_cpu_sum", 2)
+        main.stats.add("new_cpu_sum", 1)
+        main.usage_profiles.add_schedule({"workload": "app"})
+
+    mock_func1.side_effect = run_optimization
+    states = {
+        context: main.OptimizerState(
+            main.Settings(PROMETHEUS_URL=url), api_client=MagicMock()
+        )
+        for context, url in [
+            ("prod", "http://prod"),
+            ("dev", "http://dev"),
+            ("broken", "http://broken"),
+        ]
+    }
+    args = main.parse_args(
+        [
+            "--stats-file",
+            str(tmp_path / "stats.json"),
+            "--profile-file",
+            str(tmp_path / "profile.json"),
+        ]
+    )
+
+    results = main.run_clusters(args, states, ".*", ".*", ".*")
+
+    assert results["prod"]["old_cpu_sum"] == 2
+    assert results["dev"]["new_cpu_sum"] == 1
+    assert results["broken"] is None
+    assert mock_func1.call_args[0][0].stats_file == ""
+    assert mock_func1.call_args[0][0].profile_file == ""
+    with open(tmp_path / "stats.json") as f:
+        assert json.load(f)["stats"]["old_cpu_sum"] == 4
+    # one profile file with the schedules of all clusters
+    with open(tmp_path / "profile.json") as f:
+        assert sorted(schedule["cluster"] for schedule in json.load(f)) == [
+            "dev",
+            "prod",
+        ]
+    assert main.stats["old_cpu_sum"] == 0
+
+
+def test_parse_args_cpu_limits_policy():
+    with patch("k8soptimizer.main.CPU_LIMITS_POLICY", "drop"):
+        with pytest.raises(SystemExit):
+            main.parse_args([])
+    with patch("k8soptimizer.main.CPU_LIMIT_RATIO", 0.5):
+        with pytest.raises(SystemExit):
+            main.parse_args([])
+
+
+@patch("k8soptimizer.main.get_cpu_throttling")
+@patch("k8soptimizer.main.calculate_memory_limits")
+@patch("k8soptimizer.main.calculate_memory_requests")
+@patch("k8soptimizer.main.discover_container_runtime")
+@patch("k8soptimizer.main.get_usage_history")
+@patch("k8soptimizer.main.get_usage_trend_history")
+def test_optimize_container_keep_cpu_limits_throttled(
+    mock_func1, mock_func2, mock_func3, mock_func4, mock_func5, mock_func6
+):
+    mock_func1.return_value = np.ones(main.TREND_WEEKS + 1)
+    mock_func2.return_value = 0.45
+    mock_func3.return_value = None
+    mock_func4.return_value = 512 * 1024**2
+    mock_func5.return_value = 1024**3
+    mock_func6.return_value = 0.4
+
+    container = V1Container(
+        name="nginx",
+        resources=V1ResourceRequirements(
+            requests={"cpu": "400m", "memory": "512Mi"},
+            limits={"cpu": "500m", "memory": "1Gi"},
+        ),
+    )
+    state = main.OptimizerState(main.Settings(CPU_LIMITS_POLICY="keep"))
+    with main.activate_state(state):
+        container, changed = main.optimize_container(
+            "default", "deployment1", container
+        )
+
+    # the default path reads the throttling and the limits follow the requests
+    assert container.resources.requests["cpu"] == "630m"
+    assert container.resources.limits["cpu"] == "630m"
+    assert changed
+    mock_func6.assert_called_once_with("default", "deployment1", "nginx", "deployment")
+
+
+def test_parse_args_processes():
+    args = main.parse_args(["--processes", "4"])
+    assert args.processes == 4
+
+    with pytest.raises(SystemExit):
+        main.parse_args(["--processes", "0"])
+    with pytest.raises(SystemExit):
+        main.parse_args(["--processes", "2", "--clusters", "prod=http://prod"])
+
+
+@patch("k8soptimizer.main.optimize_deployments")
+@patch("k8soptimizer.main.iter_deployments")
+def test_optimize_namespace_process(mock_func1, mock_func2):
+    def optimize_deployments(deployments, *args, **kwargs):
+        main.stats.add("old_cpu_sum", 2)
+        main.usage_profiles.add_schedule({"namespace": "default.x"})
+        return 0
+
+    mock_func2.side_effect = optimize_deployments
+    main.stats.add("old_cpu_sum", 5)
+    main.usage_profiles.add_schedule({"namespace": "other"})
+    args = main.parse_args([])
+
+    values, schedules = main.optimize_namespace_process(args, "default.x", ".*", ".*")
+    assert values["old_cpu_sum"] == 2
+    assert schedules == [{"namespace": "default.x"}]
+    assert mock_func1.call_args[0][0] == "^default\\.x$"
+    main.usage_profiles.reset()
+
+
+@patch("k8soptimizer.main.setup_logging")
+@patch("k8soptimizer.main.verify_kubernetes_connection")
+@patch("k8soptimizer.main.optimize_namespace_process")
+@patch("k8soptimizer.main.get_namespaces")
+def test_optimize_namespaces_processes(mock_func1, mock_func2, mock_func3, mock_func4):
+    def executor(max_workers, mp_context, initializer, initargs):
+        initializer(*initargs)
+        return ThreadPoolExecutor(max_workers)
+
+    def optimize_namespace_process(args, namespace_name, *patterns):
+        if namespace_name == "namespace3":
+            raise RuntimeError("Connection refused")
+        return {"old_cpu_sum": 1, "new_cpu_sum": 0.5}, [{"namespace": namespace_name}]
+
+    mock_func1.return_value = V1NamespaceList(
+        items=[
+            V1Namespace(metadata=V1ObjectMeta(name="namespace%s" % i)) for i in range(4)
+        ]
+    )
+    mock_func2.side_effect = optimize_namespace_process
+    args = main.parse_args(["--processes", "2"])
+    main.stats.reset()
+    main.runtime_index.restore({("default", "app", "deployment", "app"): "go"})
+
+    with patch("k8soptimizer.main.ProcessPoolExecutor", side_effect=executor):
+        assert main.optimize_namespaces_processes(args, ".*", ".*", ".*") == 1
+
+    assert mock_func2.call_count == 4
+    assert main.stats["old_cpu_sum"] == 3
+    assert main.stats["new_cpu_sum"] == 1.5
+    assert main.runtime_index.get("default", "app", "app") == "go"
+    assert len(main.usage_profiles.get_schedules()) == 3
+    main.runtime_index.reset()
+    main.stats.reset()
+    main.usage_profiles.reset()
+
+
+@patch("k8soptimizer.main.setup_logging")
+@patch("k8soptimizer.main.verify_kubernetes_connection")
+@patch("k8soptimizer.main.optimize_namespace_process")
+@patch("k8soptimizer.main.get_namespaces")
+def test_optimize_namespaces_processes_runtime_index(
+    mock_func1, mock_func2, mock_func3, mock_func4
+):
+    def executor(max_workers, mp_context, initializer, initargs):
+        initializer(*initargs)
+        return ThreadPoolExecutor(max_workers)
+
+    loaded = []
+
+    def optimize_namespace_process(args, namespace_name, *patterns):
+        loaded.append(main.runtime_index.loaded)
+        return {}, []
+
+    mock_func1.return_value = V1NamespaceList(
+        items=[V1Namespace(metadata=V1ObjectMeta(name="default"))]
+    )
+    mock_func2.side_effect = optimize_namespace_process
+    args = main.parse_args(["--processes", "2"])
+    # the parent could not load the index completely
+    main.runtime_index.restore(
+        {("default", "app", "deployment", "app"): "go"}, loaded=False
+    )
+
+    with patch("k8soptimizer.main.ProcessPoolExecutor", side_effect=executor):
+        assert main.optimize_namespaces_processes(args, ".*", ".*", ".*") == 0
+
+    assert loaded == [False]
+    assert main.runtime_index.get("default", "app", "app") == "go"
+    main.runtime_index.reset()
+    main.stats.reset()
+
+
+@patch("k8soptimizer.main.get_namespace_usage_bounds")
+def test_share_usage_bounds(mock_func1):
+    def get_namespace_usage_bounds(namespace_name, metric_frame):
+        key = frame.container_key(namespace_name, "app", "app")
+        metric_frame.set(metric_frame.intern(key), "cpu_0.95", 0.5)
+
+    mock_func1.side_effect = get_namespace_usage_bounds
+    main.usage_bounds.reset()
+
+    assert main.share_usage_bounds(["default"], mode="none") is None
+    with pytest.raises(ValueError):
+        main.share_usage_bounds(["default"], mode="pickle")
+
+    # nothing reads the usage bounds
+    assert main.share_usage_bounds(["default"], 2, "shm", two_tier=False) is None
+    mock_func1.assert_not_called()
+
+    shared = main.share_usage_bounds(["default", "kube-system"], 2, "shm", True)
+    try:
+        cache = main.UsageBoundsCache()
+        cache.attach(shared, ["default", "kube-system"])
+        bounds = cache.get("kube-system")
+        assert bounds.row(frame.container_key("kube-system", "app", "app")) == {
+            "cpu_0.95": 0.5
+        }
+        assert mock_func1.call_count == 2
+        del bounds, cache
+    finally:
+        shared.unlink()
+        main.usage_bounds.reset()
+
+
+@patch("k8soptimizer.main.query_prometheus")
+@patch("k8soptimizer.main.query_prometheus_range")
+def test_sync_series_store(mock_func1, mock_func2, tmp_path):
+    def query_prometheus_range(metric, start, end, step_seconds):
+        values = [[t, "0.5"] for t in range(int(start) + 60, int(end) + 1, 60)]
+        labels = dict(zip(frame.KEY_LABELS, ["default", "app", "deployment", "app"]))
+        return {"data": {"result": [{"metric": labels, "values": values}]}}
+
+    mock_func1.side_effect = query_prometheus_range
+    mock_func2.return_value = {"data": {"result": [{"value": [0, "2"]}]}}
+    assert main.sync_series_store() == 0
+
+    now = float(int(time.time()))
+    state = main.OptimizerState(main.Settings(SERIES_STORE_DIR=str(tmp_path)))
+    with main.activate_state(state):
+        # the first sync fetches the retention in chunks
+        main.sync_series_store(now - 600)
+        chunks = math.ceil(main.SERIES_STORE_RETENTION_MINUTES / (6 * 60))
+        assert mock_func1.call_count == 3 * chunks
+
+        mock_func1.reset_mock()
+        assert main.sync_series_store(now) == 3 * 10
+        assert mock_func1.call_count == 3
+        assert mock_func1.call_args[0][1] == now - 600
+
+        assert (
+            main.get_cpu_cores_usage_history(
+                "default",
+                "app",
+                "app",
+                lookback_minutes=60,
+                offset_minutes=0,
+                metric="kube_workload_container_resource_usage_cpu_cores_sum",
+            )
+            == 0.5
+        )
+        mock_func2.assert_not_called()
+
+        # unknown containers and metrics are queried from prometheus
+        assert main.get_cpu_cores_usage_history("default", "db", "db") == 2
+        assert main.get_cpu_cores_usage_history("default", "app", "app") == 2
+        # the week-ago window is read from the store as well
+        assert main.get_memory_bytes_usage_history("default", "app", "app") == 0.5
+
+
+def test_get_namespace_selector():
+    assert main.get_namespace_selector() == ""
+    assert (
+        main.get_namespace_selector("^app\\.x") == '{namespace=~".*(?:^app\\\\.x).*"}'
+    )
+
+
+@patch("k8soptimizer.main.query_prometheus_range")
+def test_sync_series_store_shard(mock_func1, tmp_path):
+    def query_prometheus_range(query, start, end, step_seconds):
+        results = []
+        for namespace in ["app-1", "app-2", "app-3", "kube-system"]:
+            labels = [namespace, "app", "deployment", "app"]
+            results.append(
+                {
+                    "metric": dict(zip(frame.KEY_LABELS, labels)),
+                    "values": [[end, "0.5"]],
+                }
+            )
+        return {"data": {"result": results}}
+
+    mock_func1.side_effect = query_prometheus_range
+    now = float(int(time.time()))
+    state = main.OptimizerState(main.Settings(SERIES_STORE_DIR=str(tmp_path)))
+    with main.activate_state(state):
+        main.sync_series_store(now, "^app-", shard_index=1, shard_count=2)
+        series_store = main.get_series_store()
+        metric = main.SERIES_STORE_METRICS[0]
+
+        assert mock_func1.call_args[0][0].endswith('{namespace=~".*(?:^app-).*"}')
+        # only the matching namespaces of the shard are kept
+        keys = [tuple(key) for key in series_store._index(metric)["series"]]
+        assert keys == [
+            frame.container_key(namespace, "app", "app")
+            for namespace in ["app-1", "app-2", "app-3"]
+            if main.in_shard(namespace, None, 1, 2)
+        ]
+
+
+@patch("k8soptimizer.main.query_prometheus")
+@patch("k8soptimizer.main.query_prometheus_range")
+def test_update_sketches(mock_func1, mock_func2, tmp_path):
+    def query_prometheus_range(metric, start, end, step_seconds):
+        values = [[t, "0.5"] for t in range(int(start) + 60, int(end) + 1, 60)]
+        labels = dict(zip(frame.KEY_LABELS, ["default", "app", "deployment", "app"]))
+        return {"data": {"result": [{"metric": labels, "values": values}]}}
+
+    mock_func1.side_effect = query_prometheus_range
+    mock_func2.return_value = {"data": {"result": [{"value": [0, "2"]}]}}
+    assert main.update_sketches() == 0
+
+    now = float(int(time.time()))
+    path = str(tmp_path / "sketches.json")
+    state = main.OptimizerState(main.Settings(SKETCH_FILE=path))
+    with main.activate_state(state):
+        main.update_sketches(now - 600)
+        mock_func1.reset_mock()
+        # later updates only fetch the new samples
+        assert main.update_sketches(now) == 3 * 10
+        assert mock_func1.call_args[0][1] == now - 600
+
+        assert main.get_cpu_cores_usage_history(
+            "default",
+            "app",
+            "app",
+            offset_minutes=0,
+            metric="kube_workload_container_resource_usage_cpu_cores_sum",
+        ) == pytest.approx(0.5, rel=0.01)
+        mock_func2.assert_not_called()
+
+        # windows in the past are queried from prometheus
+        assert main.get_memory_bytes_usage_history("default", "app", "app") == 2
+
+    # the sketches are loaded from the file by a new optimizer
+    state = main.OptimizerState(main.Settings(SKETCH_FILE=path))
+    with main.activate_state(state):
+        main.update_sketches(now)
+        assert main.sketches.updated == now
+        assert len(main.sketches) == 3
+
+
+@patch("k8soptimizer.main.discover_container_runtime")
+@patch("k8soptimizer.main.calculate_cpu_trend")
+@patch("k8soptimizer.main.get_cpu_cores_usage_history")
+@patch("k8soptimizer.main.query_prometheus_range")
+def test_update_histograms(mock_func1, mock_func2, mock_func3, mock_func4, tmp_path):
+    def query_prometheus_range(metric, start, end, step_seconds):
+        values = [[t, "0.5"] for t in range(int(start) + 60, int(end) + 1, 60)]
+        labels = dict(zip(frame.KEY_LABELS, ["default", "app", "deployment", "app"]))
+        return {"data": {"result": [{"metric": labels, "values": values}]}}
+
+    mock_func1.side_effect = query_prometheus_range
+    mock_func2.return_value = 2.0
+    mock_func3.return_value = 1.0
+    mock_func4.return_value = None
+    assert main.update_histograms() == 0
+
+    now = float(int(time.time()))
+    state = main.OptimizerState(
+        main.Settings(HISTOGRAM_FILE=str(tmp_path / "histograms.json"))
+    )
+    with main.activate_state(state):
+        # the first update fetches four half-lives
+        samples = main.update_histograms(now)
+        assert samples == 3 * 4 * main.HISTOGRAM_HALF_LIFE_MINUTES
+
+        assert main.calculate_cpu_requests(
+            "default", "app", "deployment", "app"
+        ) == pytest.approx(0.5, rel=0.01)
+        mock_func2.assert_not_called()
+
+        # containers without a histogram use the window
+        assert main.calculate_cpu_requests("default", "db", "deployment", "db") == 2
+        mock_func2.assert_called_once()
+
+
+@patch("k8soptimizer.main.query_prometheus_range")
+def test_get_usage_trend_history(mock_func1):
+    def query_prometheus_range(query, start, end, step_seconds):
+        # no data two weeks ago
+        values = [[start, "1.0"], [start + step_seconds, "2.0"], [end, "1.5"]]
+        return {"data": {"result": [{"metric": {}, "values": values}]}}
+
+    mock_func1.side_effect = query_prometheus_range
+
+    history = main.get_usage_trend_history(
+        "default", "app", "app", "deployment", "my_metric", 240, 7 * 24 * 60, 0.8, 3
+    )
+
+    assert np.array_equal(history, [1.5, np.nan, 2.0, 1.0], equal_nan=True)
+    assert mock_func1.call_count == 1
+    query, start, end, step_seconds = mock_func1.call_args[0]
+    assert "quantile_over_time(0.8, my_metric{" in query
+    assert step_seconds == 7 * 24 * 3600
+    assert end - start == 3 * step_seconds
+
+    mock_func1.side_effect = None
+    mock_func1.return_value = {"data": {"result": []}}
+    with pytest.raises(RuntimeError):
+        main.get_usage_trend_history("default", "app", "app", "deployment", "m")
+
+
+@patch("k8soptimizer.main.query_prometheus_range")
+def test_forecast_container_usage(mock_func1):
+    def query_prometheus_range(query, start, end, step_seconds):
+        times = np.arange(start, end + 1, step_seconds)
+        hours = (times - start) / 3600
+        cpu = [
+            [t, str(1 + 0.5 * np.sin(2 * np.pi * h / 24))] for t, h in zip(times, hours)
+        ]
+        memory = [[t, "100"] for t in times]
+        return {
+            "data": {
+                "result": [
+                    {"metric": {"series": "0"}, "values": cpu},
+                    {"metric": {"series": "1"}, "values": memory},
+                ]
+            }
+        }
+
+    mock_func1.side_effect = query_prometheus_range
+    series = [("cpu_metric", 0.95), ("memory_metric", 0.9)]
+
+    cpu, memory = main.forecast_container_usage(
+        "default", "app", "app", "deployment", series, 2, 60, 24 * 60
+    )
+
+    # the peak of the next day is the daily peak
+    assert cpu == pytest.approx(1.5, abs=0.05)
+    assert memory == pytest.approx(100)
+    assert mock_func1.call_count == 1
+    query, start, end, step_seconds = mock_func1.call_args[0]
+    assert "quantile_over_time(0.95, cpu_metric{" in query
+    assert "quantile_over_time(0.9, memory_metric{" in query
+    assert step_seconds == 3600
+
+    mock_func1.side_effect = None
+    mock_func1.return_value = {
+        "data": {"result": [{"metric": {"series": "0"}, "values": [[end, "1"]]}]}
+    }
+    assert (
+        main.forecast_container_usage("default", "app", "app", "deployment", series)
+        is None
+    )
+
+
+@patch("k8soptimizer.main.forecast_container_usage")
+@patch("k8soptimizer.main.get_oom_killed_history")
+@patch("k8soptimizer.main.discover_container_runtime")
+@patch("k8soptimizer.main.get_usage_history")
+@patch("k8soptimizer.main.calculate_cpu_trend")
+def test_fetch_container_metrics_forecast(
+    mock_func1, mock_func2, mock_func3, mock_func4, mock_func5
+):
+    mock_func3.return_value = "java"
+    mock_func4.return_value = 0
+    mock_func5.return_value = [0.5, 200.0, 300.0]
+
+    with main.activate_state(main.OptimizerState(main.Settings(FORECAST_MODE=True))):
+        metrics = main.fetch_container_metrics("default", "app", "deployment", "app")
+
+    assert metrics["cpu_history"] == 0.5
+    assert metrics["memory_history"] == 200.0
+    assert metrics["memory_limits_history"] == 300.0
+    assert metrics["cpu_trend"] == 1.0
+    assert metrics["runtime"] == "java"
+    mock_func1.assert_not_called()
+    mock_func2.assert_not_called()
+
+
+@patch("k8soptimizer.main.query_prometheus_range")
+def test_get_namespace_usage_profiles(mock_func1):
+    def query_prometheus_range(query, start, end, step_seconds):
+        times = np.arange(start, end + 1, step_seconds)
+        return {
+            "data": {
+                "result": [
+                    {
+                        "metric": {"workload": "app", "container": "app", "series": s},
+                        "values": [[t, str(v * ((t // 3600) % 24))] for t in times],
+                    }
+                    for s, v in [("cpu", 0.1), ("memory", 1024)]
+                ]
+            }
+        }
+
+    mock_func1.side_effect = query_prometheus_range
+
+    profiles = main.get_namespace_usage_profiles("default", weeks=1)
+
+    profile = profiles[("default", "app", "deployment", "app")]
+    assert profile.shape == (2, 7, 24)
+    # the sample at 10:00 is the usage from 9:00 to 10:00
+    assert profile[0, 0, 9] == pytest.approx(1.0)
+    assert profile[1, 0, 9] == 10 * 1024
+    query, start, end, step_seconds = mock_func1.call_args[0]
+    assert mock_func1.call_count == 1
+    assert step_seconds == 3600
+    assert end - start == 7 * 24 * 3600
+    assert 'namespace="default"' in query
+
+    mock_func1.side_effect = None
+    mock_func1.return_value = {"data": {"result": []}}
+    assert main.get_namespace_usage_profiles("default") == {}
+
+
+@patch("k8soptimizer.main.get_namespace_usage_profiles")
+def test_recommend_schedule(mock_func1):
+    profile = np.ones((2, 7, 24))
+    profile[0, :5, 8:18] = 4.0
+    profile[1] *= 512 * 1024**2
+    profile[1, 6, :] = np.nan
+    mock_func1.return_value = {("default", "app", "deployment", "app"): profile}
+
+    state = main.OptimizerState(main.Settings(PROFILE_PEAK_RATIO=1.5))
+    with main.activate_state(state):
+        schedule = main.recommend_schedule("default", "app", "app", target_replicas=2)
+        main.report_schedule("default", "app", "app")
+        assert main.recommend_schedule("default", "other", "app") is None
+        assert len(main.usage_profiles.get_schedules()) == 1
+
+    assert schedule["peak"]["cpu"] == 2.0
+    assert schedule["off_peak"]["cpu"] == 0.5
+    assert schedule["peak"]["memory"] == schedule["off_peak"]["memory"]
+    assert len(schedule["windows"]) == 5
+    assert schedule["windows"][0] == {
+        "cpu": 2.0,
+        "memory": schedule["peak"]["memory"],
+        "start": "Mon 08:00",
+        "end": "Mon 18:00",
+    }
+    mock_func1.assert_called_once_with("default", "deployment")
+
+
+@patch("k8soptimizer.main.get_namespace_usage_profiles")
+def test_recommend_schedule_missing_samples(mock_func1):
+    profile = np.ones((2, 7, 24))
+    profile[0, 0, 10:12] = 4.0
+    profile[1] *= 512 * 1024**2
+    # a cpu peak window without memory samples
+    profile[1, 0, 10:12] = np.nan
+    mock_func1.return_value = {("default", "app", "deployment", "app"): profile}
+
+    state = main.OptimizerState(main.Settings(PROFILE_PEAK_RATIO=1.5))
+    with main.activate_state(state):
+        schedule = main.recommend_schedule("default", "app", "app")
+
+    assert schedule["peak"]["cpu"] == 4.0
+    assert schedule["windows"] == []
+
+
+@patch("k8soptimizer.main.client.AppsV1Api.patch_namespaced_deployment")
+@patch("k8soptimizer.main.forecast_container_usage")
+@patch("k8soptimizer.main.get_oom_killed_history")
+@patch("k8soptimizer.main.discover_container_runtime")
+@patch("k8soptimizer.main.calculate_target_replicas")
+@patch("k8soptimizer.main.calculate_quantile_over_time")
+@patch("k8soptimizer.main.calculate_cpu_requests")
+def test_optimize_deployment_forecast(
+    mock_func1, mock_func2, mock_func3, mock_func4, mock_func5, mock_func6, mock_func7
+):
+    mock_func2.return_value = {"cpu": 0.95, "memory": 0.95}
+    mock_func3.return_value = 1
+    mock_func4.return_value = None
+    mock_func5.return_value = 0
+    mock_func6.return_value = [0.5, 512 * 1024**2, 1024**3]
+
+    state = main.OptimizerState(main.Settings(FORECAST_MODE=True))
+    with main.activate_state(state):
+        deployment = main.optimize_deployment(create_deployment("app"), dry_run=True)
+
+    container = deployment.spec.template.spec.containers[0]
+    assert container.resources.requests["cpu"] == "500m"
+    assert container.resources.requests["memory"] == "768Mi"
+    mock_func6.assert_called_once()
+    mock_func1.assert_not_called()
+
+
+@patch("k8soptimizer.main.get_usage_trend_history")
+def test_calculate_trend(mock_func1):
+    # the anomalous week three weeks ago is ignored by the median
+    mock_func1.return_value = np.array([1.2, 1.0, 1.2, 0.1, 1.1])
+    assert main.calculate_cpu_trend("default", "app", "deployment", "app") == 1.145
+    assert main.calculate_memory_trend("default", "app", "deployment", "app") == 1.145
+
+    mock_func1.return_value = np.array([1.2, np.nan, 0])
+    with pytest.raises(RuntimeError):
+        main.calculate_cpu_trend("default", "app", "deployment", "app")
@@ -0,0 +1,108 @@
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import k8soptimizer.main as main
+from k8soptimizer.optimizer import Optimizer
+
+__author__ = "Philipp Hellmich"
+__copyright__ = "Arvato Systems GmbH"
+__license__ = "MIT"
+
+
+def test_settings():
+    settings = main.Settings(MIN_CPU_REQUEST=0.1)
+
+    assert settings.MIN_CPU_REQUEST == 0.1
+    assert settings.MAX_CPU_REQUEST == main.MAX_CPU_REQUEST
+    assert settings.as_dict()["CHANGE_THRESHOLD"] == main.CHANGE_THRESHOLD
+
+    with pytest.raises(ValueError) as exc_info:
+        main.Settings(MIN_CPU=0.1)
+    assert str(exc_info.value) == "Unknown settings: MIN_CPU"
+
+    with pytest.raises(AttributeError):
+        settings.WORKERS
+
+
+def test_optimizer_settings():
+    optimizer = Optimizer(main.Settings(MIN_CPU_REQUEST=0.5, CHANGE_THRESHOLD=0.5))
+
+    assert optimizer.call(main.compute_cpu_requests, 0.1) == 0.5
+    assert optimizer.call(main.is_significant_change, 1.0, 1.2) is False
+    assert main.compute_cpu_requests(0.1) == 0.1
+    assert main.is_significant_change(1.0, 1.2) is True
+
+
+@patch("k8soptimizer.main.get_hpa_for_deployment")
+def test_optimizer_quantile_and_sketch_settings(mock_func1):
+    mock_func1.return_value = None
+    optimizer = Optimizer(
+        main.Settings(
+            DEFAULT_QUANTILE_OVER_TIME_STATIC_CPU=0.9,
+            SKETCH_CONFIGMAP="sketches",
+            SKETCH_HALF_LIFE_MINUTES=60,
+            HISTOGRAM_HALF_LIFE_MINUTES=120,
+        )
+    )
+
+    quantiles = optimizer.call(main.calculate_quantile_over_time, "default", "app")
+    assert quantiles["cpu"] == 0.9
+    assert main.calculate_quantile_over_time("default", "app")["cpu"] == (
+        main.DEFAULT_QUANTILE_OVER_TIME_STATIC_CPU
+    )
+    assert optimizer.state.sketches.half_life_seconds == 3600
+    assert optimizer.state.histograms.half_life_seconds == 7200
+    with patch("k8soptimizer.main.get_api_client"):
+        assert optimizer.call(main.get_sketch_store).name == "sketches"
+    assert main.get_sketch_store() is None
+
+
+def test_optimizer_api_client():
+    api_client = MagicMock()
+    optimizer = Optimizer(api_client=api_client)
+
+    assert optimizer.call(main.get_api_client) is api_client
+
+
+@patch("k8soptimizer.main.optimize_deployment_safe")
+def test_optimizer_concurrent(mock_func1):
+    def optimize_deployment_safe(deployment, *args):
+        main.stats.add("old_cpu_sum", main.settings().MIN_CPU_REQUEST)
+        return True
+
+    mock_func1.side_effect = optimize_deployment_safe
+    optimizers = [Optimizer(main.Settings(MIN_CPU_REQUEST=value)) for value in [1, 2]]
+    main.stats.reset()
+
+    threads = [
+        threading.Thread(
+            target=optimizer.optimize_deployments,
+            args=(range(10),),
+            kwargs={"workers": 3},
+        )
+        for optimizer in optimizers
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert optimizers[0].stats["old_cpu_sum"] == 10
+    assert optimizers[1].stats["old_cpu_sum"] == 20
+    assert main.stats["old_cpu_sum"] == 0
+
+
+def test_optimizer_pipeline():
+    optimizer = Optimizer(main.Settings(MIN_CPU_REQUEST=2))
+
+    def compute(work):
+        main.stats.add("new_cpu_sum", main.settings().MIN_CPU_REQUEST)
+        return [work]
+
+    stages = [main.pipeline.Stage("compute", compute, 2)]
+    with optimizer.activate():
+        main.pipeline.Pipeline(stages).run(range(5))
+
+    assert optimizer.stats["new_cpu_sum"] == 10
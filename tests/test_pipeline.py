@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+import k8soptimizer.pipeline as pipeline
+
+__author__ = "Philipp Hellmich"
+__copyright__ = "Arvato Systems GmbH"
+__license__ = "MIT"
+
+
+def test_pipeline():
+    results = []
+    lock = threading.Lock()
+
+    def expand(item):
+        return [item * 10 + i for i in range(3)]
+
+    def drop_odd(item):
+        if item % 2:
+            return None
+        return item
+
+    def fail(item):
+        if item == 20:
+            raise RuntimeError("Something went wrong")
+        return item
+
+    def collect(item):
+        with lock:
+            results.append(item)
+        return item
+
+    stages = [
+        pipeline.Stage("expand", expand, 2, fan_out=True),
+        pipeline.Stage("drop", drop_odd, 3),
+        pipeline.Stage("fail", fail, 2),
+        pipeline.Stage("collect", collect, 1),
+    ]
+    stage_stats = pipeline.Pipeline(stages, queue_size=2).run(range(1, 4))
+
+    assert sorted(results) == [10, 12, 22, 30, 32]
+
+    assert [s.processed for s in stage_stats] == [3, 9, 6, 5]
+    assert [s.emitted for s in stage_stats] == [9, 6, 5, 5]
+    assert [s.errors for s in stage_stats] == [0, 0, 1, 0]
+    for s in stage_stats:
+        assert s.queue_depth_max <= 2
+        assert s.finished is not None
+
+
+def test_pipeline_overlaps_stages():
+    def slow(item):
+        time.sleep(0.05)
+        return item
+
+    stages = [
+        pipeline.Stage("first", slow, 4),
+        pipeline.Stage("second", slow, 4),
+    ]
+    start = time.monotonic()
+    pipeline.Pipeline(stages, queue_size=4).run(range(8))
+
+    # serial would take 16 * 0.05 seconds
+    assert time.monotonic() - start < 0.6
+
+
+def test_pipeline_without_stages():
+    with pytest.raises(ValueError):
+        pipeline.Pipeline([])
+
+
+def test_format_stage_stats():
+    stage = pipeline.Stage("fetch", lambda item: item)
+    pipeline.Pipeline([stage]).run([1, 2, 3])
+
+    result = pipeline.format_stage_stats(stage.stats)
+
+    assert "Stage fetch: 3 processed" in result
+    assert "queue depth max" in result
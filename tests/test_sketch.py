@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+import k8soptimizer.sketch as sketch
+
+__author__ = "Philipp Hellmich"
+__copyright__ = "Arvato Systems GmbH"
+__license__ = "MIT"
+
+KEY = ("default", "app", "deployment", "nginx")
+
+
+def test_ddsketch():
+    values = np.random.default_rng(42).lognormal(-2, 1, 5000)
+    ddsketch = sketch.DDSketch(0.01)
+    assert ddsketch.quantile(0.5) is None
+    for value in values:
+        ddsketch.add(float(value))
+
+    for quantile in [0.5, 0.7, 0.8, 0.95, 0.99]:
+        expected = np.sort(values)[int(quantile * len(values))]
+        assert ddsketch.quantile(quantile) == pytest.approx(expected, rel=0.011)
+
+    # zeros are counted
+    ddsketch = sketch.DDSketch()
+    for value in [0, 0, 0, 1]:
+        ddsketch.add(value)
+    assert ddsketch.quantile(0.5) == 0
+    assert ddsketch.quantile(1) == pytest.approx(1, rel=0.01)
+
+
+def test_ddsketch_merge_and_decay():
+    first = sketch.DDSketch()
+    second = sketch.DDSketch()
+    for i in range(100):
+        first.add(1.0)
+        second.add(10.0)
+
+    first.merge(second)
+    assert first.count == 200
+    assert first.quantile(0.4) == pytest.approx(1, rel=0.01)
+    assert first.quantile(0.6) == pytest.approx(10, rel=0.01)
+
+    # old values lose weight
+    first.decay(0.25)
+    first.add(10.0, 50)
+    assert first.count == pytest.approx(100)
+    assert first.quantile(0.3) == pytest.approx(10, rel=0.01)
+
+    restored = sketch.DDSketch.from_dict(first.as_dict())
+    assert restored.quantile(0.3) == first.quantile(0.3)
+
+
+def test_ddsketch_max_bins():
+    ddsketch = sketch.DDSketch(0.01, max_bins=16)
+    for i in range(1, 1000):
+        ddsketch.add(float(i))
+    assert len(ddsketch.bins) == 16
+    assert ddsketch.quantile(0.99) == pytest.approx(990, rel=0.011)
+
+
+def test_sketch_set():
+    sketches = sketch.SketchSet(half_life_seconds=3600)
+    labels = ("namespace", "workload", "workload_type", "container")
+    results = [
+        {"metric": dict(zip(labels, KEY)), "values": [[0, "1"], [3600, "3"]]},
+    ]
+
+    sketches.advance(3600)
+    sketches.add_results("cpu", results, labels, 3600)
+    assert len(sketches) == 1
+    # the older sample has half the weight
+    assert sketches.sketches["cpu"][KEY].count == pytest.approx(1.5)
+    assert sketches.quantile("cpu", KEY, 0.5) == pytest.approx(3, rel=0.01)
+    assert sketches.quantile("memory", KEY, 0.5) is None
+
+    sketches.advance(7200)
+    assert sketches.sketches["cpu"][KEY].count == pytest.approx(0.75)
+
+    restored = sketch.SketchSet(half_life_seconds=3600)
+    restored.restore(sketches.as_dict())
+    assert restored.loaded
+    assert restored.updated == 7200
+    assert restored.quantile("cpu", KEY, 0.5) == sketches.quantile("cpu", KEY, 0.5)
+
+    # sketches decayed to about zero are removed
+    sketches.advance(7200 + 20 * 3600)
+    assert len(sketches) == 0
+
+
+def test_decay_factor():
+    assert sketch.decay_factor(0, 3600) == 1
+    assert sketch.decay_factor(7200, 3600) == 0.25
+    assert sketch.decay_factor(-60, 3600) == 1
@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+
+import k8soptimizer.store as store
+
+__author__ = "Philipp Hellmich"
+__copyright__ = "Arvato Systems GmbH"
+__license__ = "MIT"
+
+KEY = ("default", "app", "deployment", "nginx")
+
+
+def create_results(start, end, step=60, value=lambda t: t):
+    return [
+        {
+            "metric": dict(zip(store.KEY_LABELS, KEY)),
+            "values": [[t, str(value(t))] for t in range(start, end + 1, step)],
+        },
+        {
+            "metric": dict(
+                zip(store.KEY_LABELS, ("default", "db", "deployment", "db"))
+            ),
+            "values": [[t, "1"] for t in range(start, end + 1, step)],
+        },
+    ]
+
+
+def test_series_store(tmp_path):
+    series_store = store.SeriesStore(str(tmp_path))
+    assert series_store.last_timestamp("cpu") is None
+    assert series_store.quantile("cpu", KEY, 0, 600, 0.5) is None
+
+    assert series_store.append("cpu", create_results(60, 600), 0, 600) == 20
+    # samples up to the last sync are skipped
+    assert series_store.append("cpu", create_results(540, 1200), 540, 1200) == 20
+
+    assert series_store.last_timestamp("cpu") == 1200
+    assert series_store.covers("cpu", 0, 1200)
+    assert not series_store.covers("cpu", 0, 1260)
+
+    times, values = series_store.samples("cpu", KEY, 0, 1200)
+    assert list(times) == list(range(60, 1201, 60))
+    assert series_store.quantile("cpu", KEY, 600, 1200, 0.5) == 930
+    assert series_store.quantile("cpu", KEY, 600, 1200, 1.0) == 1200
+    assert series_store.quantile("cpu", ("a", "b", "c", "d"), 0, 1200, 0.5) is None
+
+    # the store is read back from the files
+    series_store = store.SeriesStore(str(tmp_path))
+    assert series_store.quantile("cpu", KEY, 600, 1200, 0.5) == 930
+
+    # one segment per series and append
+    segments = np.fromfile(series_store.segments_path("cpu"), dtype=store.SEGMENT)
+    assert list(segments["count"]) == [10, 10, 10, 10]
+    assert list(segments["offset"]) == [0, 10, 20, 30]
+
+    # missing segments are rebuilt from the data file
+    os.remove(series_store.segments_path("cpu"))
+    series_store = store.SeriesStore(str(tmp_path))
+    assert series_store.quantile("cpu", KEY, 600, 1200, 0.5) == 930
+    assert os.path.exists(series_store.segments_path("cpu"))
+
+
+def test_find_segments():
+    segments = store.find_segments(np.array([0, 0, 1, 0, 2, 2]), 10)
+    assert list(segments["series"]) == [0, 1, 0, 2]
+    assert list(segments["offset"]) == [10, 12, 13, 14]
+    assert list(segments["count"]) == [2, 1, 1, 2]
+    assert len(store.find_segments(np.array([], dtype=np.int32))) == 0
+
+
+def test_series_store_compact(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "COMPACT_SLACK_SECONDS", 300)
+    series_store = store.SeriesStore(str(tmp_path))
+    series_store.append("cpu", create_results(60, 1200), 0, 1200)
+
+    assert series_store.compact("cpu", 200) == 0
+    assert series_store.compact("cpu", 600) == 20
+
+    times, _ = series_store.samples("cpu", KEY, 0, 1200)
+    assert list(times) == list(range(660, 1201, 60))
+    assert not series_store.covers("cpu", 0, 1200)
+    assert series_store.covers("cpu", 600, 1200)
+
+    series_store.append("cpu", create_results(1260, 1800), 1200, 1800)
+    assert series_store.quantile("cpu", KEY, 1200, 1800, 0) == 1260